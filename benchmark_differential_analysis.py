@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+差异分析基准测试：向量化实现 vs 逐列循环实现
+
+1. 生成含缺失值的模拟代谢组数据（样本 × 特征）
+2. 分别用旧的逐列循环（stats.ttest_ind / stats.ranksums）和新的 run_differential_analysis 计算
+3. 校验两者逐特征结果一致，并输出耗时对比
+
+用法:
+    python benchmark_differential_analysis.py [--features 5000 20000] [--samples 60] [--repeat 3]
+"""
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent))
+
+from gibh_agent.tools.metabolomics.statistics import run_differential_analysis
+
+
+def make_dataset(n_samples: int, n_features: int, missing_rate: float = 0.05, seed: int = 0) -> pd.DataFrame:
+    """生成两组模拟数据（Log2 尺度，约 10% 的特征有真实差异）"""
+    rng = np.random.default_rng(seed)
+    values = rng.normal(loc=15, scale=2, size=(n_samples, n_features))
+    groups = np.array(["Case"] * (n_samples // 2) + ["Control"] * (n_samples - n_samples // 2))
+    shifted = rng.random(n_features) < 0.1
+    values[np.ix_(groups == "Case", shifted)] += 1.0
+    values[rng.random(values.shape) < missing_rate] = np.nan
+    # 少量特征在一组中几乎全部缺失（应被跳过）
+    values[groups == "Case", :3] = np.nan
+    df = pd.DataFrame(values, columns=[f"M{i}" for i in range(n_features)])
+    df.index = [f"S{i}" for i in range(n_samples)]
+    df.insert(0, "Group", groups)
+    return df
+
+
+def loop_reference(df: pd.DataFrame, method: str) -> pd.DataFrame:
+    """旧实现：逐列 dropna + scipy 检验"""
+    case_mask = df["Group"] == "Case"
+    control_mask = df["Group"] == "Control"
+    rows = []
+    for metabolite in df.columns[1:]:
+        case_values = df.loc[case_mask, metabolite].dropna()
+        control_values = df.loc[control_mask, metabolite].dropna()
+        if len(case_values) < 2 or len(control_values) < 2:
+            continue
+        if method == "wilcoxon":
+            _, p_val = stats.ranksums(case_values, control_values)
+        else:
+            _, p_val = stats.ttest_ind(case_values, control_values)
+        rows.append({
+            "metabolite": metabolite,
+            "p_value": p_val,
+            "log2fc": case_values.mean() - control_values.mean()
+        })
+    return pd.DataFrame(rows)
+
+
+def timed(func, repeat: int):
+    """返回 (最短耗时, 最后一次结果)"""
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="差异分析基准测试")
+    parser.add_argument("--features", type=int, nargs="+", default=[500, 5000, 20000])
+    parser.add_argument("--samples", type=int, default=60)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("📊 差异分析基准测试（逐列循环 vs 向量化）")
+    print("=" * 80)
+    print(f"{'方法':<10}{'特征数':>8}{'循环(s)':>12}{'向量化(s)':>12}{'加速比':>10}{'最大|Δp|':>14}{'最大|ΔFC|':>14}")
+
+    all_match = True
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for n_features in args.features:
+            df = make_dataset(args.samples, n_features)
+            csv_path = Path(tmp_dir) / f"bench_{n_features}.csv"
+            df.to_csv(csv_path)
+
+            for method in ("t-test", "wilcoxon"):
+                # 两种实现都包含 CSV 读取，保证比较公平
+                loop_time, expected = timed(
+                    lambda: loop_reference(pd.read_csv(csv_path, index_col=0), method), args.repeat
+                )
+                vec_time, result = timed(
+                    lambda: run_differential_analysis(
+                        file_path=str(csv_path),
+                        group_column="Group",
+                        case_group="Case",
+                        control_group="Control",
+                        method=method,
+                        output_dir=tmp_dir
+                    ),
+                    args.repeat
+                )
+                if result.get("status") != "success":
+                    print(f"❌ 向量化实现失败: {result.get('error')}")
+                    return 1
+
+                actual = pd.DataFrame(result["results"])
+                same_features = list(actual["metabolite"]) == list(expected["metabolite"])
+                max_dp = float(np.max(np.abs(actual["p_value"].values - expected["p_value"].values))) if same_features else float("nan")
+                max_dfc = float(np.max(np.abs(actual["log2fc"].values - expected["log2fc"].values))) if same_features else float("nan")
+                match = same_features and max_dp < 1e-9 and max_dfc < 1e-9
+                all_match &= match
+
+                print(
+                    f"{method:<10}{n_features:>8}{loop_time:>12.3f}{vec_time:>12.3f}"
+                    f"{loop_time / vec_time:>9.1f}x{max_dp:>14.2e}{max_dfc:>14.2e}"
+                    f"  {'✅' if match else '❌'}"
+                )
+
+    print()
+    print("✅ 所有结果与逐列实现一致" if all_match else "❌ 存在结果不一致的特征")
+    return 0 if all_match else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
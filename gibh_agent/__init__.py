@@ -1,7 +1,15 @@
 """
 GIBH-AGENT-V2 主模块
+
+GIBHAgent / create_agent 在首次访问时才导入（.main 会间接导入 scanpy 等重型依赖），
+只用到 gibh_agent.core 中轻量模块的进程（如文件检查）不需要承担这部分导入耗时。
 """
-from .main import GIBHAgent, create_agent
 
 __all__ = ["GIBHAgent", "create_agent"]
 
+
+def __getattr__(name):
+    if name in __all__:
+        from . import main
+        return getattr(main, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -9,6 +9,7 @@ from openai import AuthenticationError, APIError
 from ..core.llm_client import LLMClient
 from ..core.prompt_manager import PromptManager, DATA_DIAGNOSIS_PROMPT
 from ..core.data_diagnostician import DataDiagnostician
+from ..core.result_payload import artifact_records
 
 logger = logging.getLogger(__name__)
 
@@ -699,7 +700,7 @@ Use Simplified Chinese for all content."""
                     step_info["case_group"] = summary.get("case_group", "N/A")
                     step_info["control_group"] = summary.get("control_group", "N/A")
                     # 提取结果列表，用于识别关键标记物
-                    results_list = step_data.get("results", [])
+                    results_list = artifact_records(step_data.get("results", []))
                     if results_list:
                         # 按 |log2fc| 排序，获取top标记物
                         sorted_results = sorted(results_list, key=lambda x: abs(x.get("log2fc", 0)), reverse=True)
@@ -714,7 +715,7 @@ Use Simplified Chinese for all content."""
                 
                 elif "plsda" in step_name.lower() or "pls-da" in step_name.lower():
                     # PLS-DA 分析结果
-                    vip_scores = step_data.get("vip_scores", [])
+                    vip_scores = artifact_records(step_data.get("vip_scores", []))
                     if vip_scores:
                         # 提取top VIP标记物
                         if isinstance(vip_scores, list):
@@ -729,7 +730,7 @@ Use Simplified Chinese for all content."""
                 
                 elif "pathway" in step_name.lower() or "enrichment" in step_name.lower():
                     # 通路富集分析结果
-                    enriched_pathways = step_data.get("enriched_pathways", [])
+                    enriched_pathways = artifact_records(step_data.get("enriched_pathways", []))
                     if enriched_pathways:
                         step_info["enriched_pathway_count"] = len(enriched_pathways)
                         step_info["top_pathways"] = [
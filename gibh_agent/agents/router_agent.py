@@ -331,7 +331,7 @@ Return JSON:
         ]
         
         try:
-            completion = await self.llm_client.achat(messages, temperature=0.1, max_tokens=256)
+            completion = await self.llm_client.achat(messages, temperature=0.1, max_tokens=256, cache="router.route")
             # 提取 think 过程和实际内容
             think_content, response = self.llm_client.extract_think_and_content(completion)
             # 如果有 think 内容，记录日志（可选）
@@ -312,7 +312,7 @@ Uploaded Files: {file_names_str}
         ]
         
         try:
-            completion = await self.llm_client.achat(messages, temperature=0.1, max_tokens=128)
+            completion = await self.llm_client.achat(messages, temperature=0.1, max_tokens=128, cache="metabolomics.detect_intent")
             think_content, response = self.llm_client.extract_think_and_content(completion)
             
             # 解析 JSON
@@ -469,11 +469,8 @@ File Path: {file_path}
                 file_metadata = None
                 if file_paths:
                     try:
-                        from ...core.file_inspector import FileInspector
-                        import os
-                        upload_dir = os.getenv("UPLOAD_DIR", "/app/uploads")
-                        inspector = FileInspector(upload_dir)
-                        file_metadata = inspector.inspect_file(file_paths[0])
+                        from ...core.file_inspector import get_file_inspector
+                        file_metadata = get_file_inspector().inspect_file(file_paths[0])
                         
                         if file_metadata.get("status") != "success":
                             logger.warning(f"⚠️ 文件检查失败: {file_metadata.get('error')}")
@@ -543,12 +540,9 @@ File Path: {file_path}
         
         try:
             # 🔥 使用 FileInspector 立即检查文件
-            from ...core.file_inspector import FileInspector
-            import os
-            upload_dir = os.getenv("UPLOAD_DIR", "/app/uploads")
-            inspector = FileInspector(upload_dir)
+            from ...core.file_inspector import get_file_inspector
             
-            file_metadata = inspector.inspect_file(current_file)
+            file_metadata = get_file_inspector().inspect_file(current_file)
             
             if file_metadata.get("status") != "success" or not file_metadata.get("success", True):
                 error_msg = file_metadata.get("error", "未知错误")
@@ -955,7 +949,7 @@ Return JSON only (single step_id string or null):
         
         try:
             logger.info(f"🔍 [CHECKPOINT] Calling LLM to extract target end step...")
-            completion = await self.llm_client.achat(messages, temperature=0.1, max_tokens=64)
+            completion = await self.llm_client.achat(messages, temperature=0.1, max_tokens=64, cache="metabolomics.extract_target_end_step")
             think_content, response = self.llm_client.extract_think_and_content(completion)
             logger.info(f"✅ [CHECKPOINT] LLM response received: {response[:100]}...")
             
@@ -1048,7 +1042,7 @@ Return JSON only:
         
         try:
             logger.info(f"🔍 [CHECKPOINT] Calling LLM to extract workflow parameters...")
-            completion = await self.llm_client.achat(messages, temperature=0.1, max_tokens=256)
+            completion = await self.llm_client.achat(messages, temperature=0.1, max_tokens=256, cache="metabolomics.extract_workflow_params")
             think_content, response = self.llm_client.extract_think_and_content(completion)
             logger.info(f"✅ [CHECKPOINT] LLM response received: {response[:200]}...")
             
@@ -1082,12 +1076,10 @@ Return JSON only:
         """
         try:
             # 🔧 使用 FileInspector（Universal Eyes）
-            from ...core.file_inspector import FileInspector
-            upload_dir = os.getenv("UPLOAD_DIR", "/app/uploads")
-            inspector = FileInspector(upload_dir)
+            from ...core.file_inspector import get_file_inspector
             
-            # 使用通用检查器
-            result = inspector.inspect_file(file_path)
+            # 使用通用检查器（共享实例 + 元数据缓存）
+            result = get_file_inspector().inspect_file(file_path)
             
             if result.get("status") == "success" and result.get("file_type") == "tabular":
                 # 转换为兼容格式
@@ -1671,10 +1663,8 @@ You have access to:
                     
                     # 如果路径不是绝对路径或文件不存在，尝试智能路径解析
                     if not os.path.isabs(file_path_to_preprocess) or not os.path.exists(file_path_to_preprocess):
-                        from ...core.file_inspector import FileInspector
-                        upload_dir = os.getenv("UPLOAD_DIR", "/app/uploads")
-                        inspector = FileInspector(upload_dir)
-                        resolved_path, _ = inspector._resolve_actual_path(file_path_to_preprocess)
+                        from ...core.file_inspector import get_file_inspector
+                        resolved_path, _ = get_file_inspector()._resolve_actual_path(file_path_to_preprocess)
                         if resolved_path:
                             file_path_to_preprocess = resolved_path
                             logger.info(f"✅ [CHECKPOINT] preprocess_data: Resolved path to: {file_path_to_preprocess}")
@@ -1691,15 +1681,15 @@ You have access to:
                         file_path=file_path_to_preprocess,
                         missing_imputation=missing_imputation,
                         log_transform=(params.get("normalization", "log2") == "log2"),
-                        standardize=params.get("scale", "true").lower() == "true"
+                        standardize=params.get("scale", "true").lower() == "true",
+                        output_dir=output_dir
                     )
                     
-                    # 适配返回格式（保存预处理后的文件）
+                    # 适配返回格式（后续步骤读取 output_dir/preprocessed_data.csv）
                     if result.get("status") == "success" and output_dir:
-                        import pandas as pd
-                        preprocessed_df = pd.DataFrame(result.get("preprocessed_data", {}))
+                        from ...core.table_io import read_table
                         output_path = os.path.join(output_dir, "preprocessed_data.csv")
-                        preprocessed_df.to_csv(output_path)
+                        read_table(result["output_path"]).to_csv(output_path)
                         result["output_path"] = output_path
                     logger.info(f"✅ [CHECKPOINT] preprocess_data completed: {result.get('status', 'unknown')}")
                     step_result = {
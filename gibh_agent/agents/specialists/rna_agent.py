@@ -194,12 +194,12 @@ class RNAAgent(BaseAgent):
                     # 其他文件类型，读取文件内容并使用 LLM 解释
                     try:
                         # 使用 file_inspector 读取文件元数据和内容
-                        from ..core.file_inspector import FileInspector
+                        from ...core.file_inspector import get_file_inspector
                         import os
                         
                         # 获取上传目录
                         upload_dir = os.getenv("UPLOAD_DIR", "/app/uploads")
-                        file_inspector = FileInspector(upload_dir)
+                        file_inspector = get_file_inspector(upload_dir)
                         
                         # 获取文件元数据
                         file_name = os.path.basename(input_path)
@@ -378,7 +378,7 @@ Uploaded Files: {file_names_str}
         ]
         
         try:
-            completion = await self.llm_client.achat(messages, temperature=0.1, max_tokens=128)
+            completion = await self.llm_client.achat(messages, temperature=0.1, max_tokens=128, cache="rna.detect_intent")
             think_content, response = self.llm_client.extract_think_and_content(completion)
             
             # 解析 JSON
@@ -517,11 +517,8 @@ File Path: {file_path}
                 file_metadata = None
                 if file_paths:
                     try:
-                        from ...core.file_inspector import FileInspector
-                        import os
-                        upload_dir = os.getenv("UPLOAD_DIR", "/app/uploads")
-                        inspector = FileInspector(upload_dir)
-                        file_metadata = inspector.inspect_file(file_paths[0])
+                        from ...core.file_inspector import get_file_inspector
+                        file_metadata = get_file_inspector().inspect_file(file_paths[0])
                         
                         if file_metadata.get("status") != "success":
                             logger.warning(f"⚠️ 文件检查失败: {file_metadata.get('error')}")
@@ -751,7 +748,7 @@ Return JSON only:
         ]
         
         try:
-            completion = await self.llm_client.achat(messages, temperature=0.1, max_tokens=256)
+            completion = await self.llm_client.achat(messages, temperature=0.1, max_tokens=256, cache="rna.extract_workflow_params")
             # 提取 think 过程和实际内容
             think_content, response = self.llm_client.extract_think_and_content(completion)
             # 如果有 think 内容，记录日志（可选）
@@ -0,0 +1,381 @@
+"""
+内容寻址的上传存储 - 按 SHA-256 去重上传文件，检查结果和派生缓存按内容复用
+
+同一批测试数据（PBMC、代谢组学示例表）会被反复上传。上传时已经边写边计算 SHA-256，
+文件内容只在 <upload_dir>/.blobs/sha256/ab/<digest> 保存一份，每次上传的路径
+（包括每次新建的 10x_data_* 目录）都是指向它的硬链接：
+- 引用计数即 blob 文件的硬链接数（st_nlink - 1），删除上传路径不需要额外登记；
+  gc() 删除没有任何上传路径引用的 blob 以及它们的派生缓存
+- blob 设为只读：多个上传路径共享同一份内容（同一个 inode），不能被原地修改。
+  只读权限挡不住 root 进程，因此工具必须把结果写到 output_dir，绝不能改写输入路径；
+  blob 创建时记录 mtime，去重前核对，被原地改写过的 blob 不再复用（用新上传的内容替换）
+- 索引（SQLite，与 blob 同目录）记录 上传路径 -> digest，content_key() 据此在不读取
+  内容的情况下得到文件的内容键；10x 目录的内容键由各文件的 (相对路径, digest) 组合而成
+- 派生缓存（如 10x 目录转换出的 .h5ad）按内容键保存在 .blobs/derived/ 下
+
+内容键被 FileInspector（元数据缓存）和 read_10x_data（.h5ad 转换缓存）使用：
+重复上传同一内容不占用额外磁盘空间，也不会重新检查和转换。无法创建硬链接时
+（例如文件系统不支持）回退为复制，此时该文件不去重。
+
+并发：所有 worker 共享 .blobs/store.lock。store() 在"检查 blob -> 链接到上传路径"期间持有
+共享锁，gc() 持有排他锁，gc 不会在去重检查之后、链接之前删除 blob。
+
+环境变量：
+- BLOB_STORE_ENABLED: 是否启用（默认 true）
+- UPLOAD_DIR: 上传目录（blob 存储位于其下的 .blobs/）
+"""
+import os
+import json
+import time
+import fcntl
+import shutil
+import sqlite3
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+BLOB_DIRNAME = ".blobs"
+LOCK_FILENAME = "store.lock"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blob_links (
+    path TEXT PRIMARY KEY,
+    digest TEXT NOT NULL,
+    linked_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    digest TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS derived (
+    content_key TEXT NOT NULL,
+    name TEXT NOT NULL,
+    sources TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (content_key, name)
+);
+"""
+
+
+class BlobStore:
+    """
+    内容寻址存储（blob 硬链接到各上传路径）
+
+    - store(): 把已计算好 SHA-256 的临时文件存入 blob 并链接到目标路径
+    - content_key(): 上传路径（文件或目录）的内容键
+    - get_derived()/put_derived(): 按内容键读写派生缓存文件
+    - gc(): 清理未被引用的 blob 和派生缓存
+    """
+
+    def __init__(self, root: str):
+        """
+        Args:
+            root: 存储根目录（需与上传目录在同一文件系统上才能硬链接）
+        """
+        self.root = Path(root)
+        (self.root / "sha256").mkdir(parents=True, exist_ok=True)
+        (self.root / "derived").mkdir(parents=True, exist_ok=True)
+        self.db_path = str(self.root / "index.sqlite")
+        self._local = threading.local()
+        self._connect().executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _locked(self, operation: int):
+        """跨进程的存储锁（fcntl.LOCK_SH: store；fcntl.LOCK_EX: gc）"""
+        with open(self.root / LOCK_FILENAME, "a") as lock_file:
+            fcntl.flock(lock_file, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def blob_path(self, digest: str) -> Path:
+        return self.root / "sha256" / digest[:2] / digest
+
+    def refcount(self, digest: str) -> int:
+        """引用该 blob 的上传路径数量"""
+        try:
+            return self.blob_path(digest).stat().st_nlink - 1
+        except OSError:
+            return 0
+
+    def store(self, tmp_path: Path, dest: Path, digest: str) -> bool:
+        """
+        把临时文件存入 blob 存储并链接到目标路径（覆盖已存在的目标）
+
+        Args:
+            tmp_path: 已写完的临时文件（调用后被删除）
+            dest: 上传路径
+            digest: 临时文件内容的 SHA-256
+
+        Returns:
+            内容是否已存在（True 表示本次上传没有占用新的磁盘空间）
+        """
+        blob = self.blob_path(digest)
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        size = tmp_path.stat().st_size
+        try:
+            # 🔥 共享锁：gc 不能在去重检查和链接之间删除 blob
+            with self._locked(fcntl.LOCK_SH):
+                deduplicated = self._blob_intact(blob, digest, size)
+                if not deduplicated:
+                    os.chmod(tmp_path, 0o444)
+                    # 并发上传同一内容时只有一个能占用 blob 路径（损坏或被改写的旧 blob 直接替换，
+                    # 仍链接着旧 inode 的上传路径不再属于该 digest）
+                    if blob.exists():
+                        os.replace(tmp_path, blob)
+                    else:
+                        try:
+                            os.link(tmp_path, blob)
+                        except FileExistsError:
+                            deduplicated = True
+                    if not deduplicated:
+                        self._record_blob(blob, digest)
+                self._link(blob, dest)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+        self._connect().execute(
+            "INSERT OR REPLACE INTO blob_links (path, digest, linked_at) VALUES (?, ?, ?)",
+            (str(dest.resolve()), digest, time.time())
+        )
+        if deduplicated:
+            logger.info(f"♻️ [BlobStore] 内容已存在，复用 blob: {dest.name} ({digest[:12]}, 引用 {self.refcount(digest)})")
+        return deduplicated
+
+    def _blob_intact(self, blob: Path, digest: str, size: int) -> bool:
+        """blob 存在、大小一致且创建后未被原地改写（mtime 与登记的一致）"""
+        try:
+            stat = blob.stat()
+        except OSError:
+            return False
+        if stat.st_size != size:
+            return False
+        row = self._connect().execute("SELECT mtime_ns FROM blobs WHERE digest = ?", (digest,)).fetchone()
+        if row is None:
+            # 旧版本创建的 blob 没有登记：按当前状态补登
+            self._record_blob(blob, digest)
+            return True
+        if row[0] != stat.st_mtime_ns:
+            logger.warning(f"⚠️ [BlobStore] blob 创建后被原地改写，不再复用: {digest[:12]}")
+            return False
+        return True
+
+    def _record_blob(self, blob: Path, digest: str) -> None:
+        stat = blob.stat()
+        self._connect().execute(
+            "INSERT OR REPLACE INTO blobs (digest, size, mtime_ns) VALUES (?, ?, ?)",
+            (digest, stat.st_size, stat.st_mtime_ns)
+        )
+
+    def _link(self, blob: Path, dest: Path) -> None:
+        """原子地把目标路径替换为指向 blob 的硬链接（无法硬链接时复制）"""
+        tmp_link = dest.parent / f".{dest.name}.{os.urandom(4).hex()}.link"
+        try:
+            os.link(blob, tmp_link)
+        except OSError as e:
+            logger.warning(f"⚠️ [BlobStore] 无法创建硬链接，复制文件（不去重）: {e}")
+            shutil.copyfile(blob, tmp_link)
+        try:
+            os.replace(tmp_link, dest)
+        except BaseException:
+            tmp_link.unlink(missing_ok=True)
+            raise
+
+    def digest_of(self, path: str) -> Optional[str]:
+        """
+        上传文件的 SHA-256（只查索引，不读取内容）
+
+        Returns:
+            digest；文件不在索引中或已被替换为其他内容时返回 None
+        """
+        resolved = str(Path(path).resolve())
+        try:
+            row = self._connect().execute(
+                "SELECT digest FROM blob_links WHERE path = ?", (resolved,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ [BlobStore] 索引读取失败: {e}")
+            return None
+        if row is None:
+            return None
+        try:
+            if os.path.samefile(resolved, self.blob_path(row[0])):
+                return row[0]
+        except OSError:
+            pass
+        return None
+
+    def _dataset_sources(self, directory: Path) -> Optional[Dict[str, str]]:
+        """目录中各文件的 相对路径 -> digest（任一文件不在存储中时返回 None）"""
+        sources = {}
+        for child in sorted(directory.rglob("*")):
+            relative = child.relative_to(directory)
+            if not child.is_file() or any(part.startswith(".") for part in relative.parts):
+                continue
+            digest = self.digest_of(str(child))
+            if digest is None:
+                return None
+            sources[relative.as_posix()] = digest
+        return sources or None
+
+    def content_key(self, path: str) -> Optional[str]:
+        """
+        上传文件或目录（如 10x 数据目录）的内容键
+
+        Returns:
+            "sha256:<digest>"；内容不完全来自 blob 存储时返回 None
+        """
+        p = Path(path)
+        if p.is_file():
+            digest = self.digest_of(path)
+            return f"sha256:{digest}" if digest else None
+        if p.is_dir():
+            sources = self._dataset_sources(p)
+            if sources:
+                manifest = "".join(f"{name}\0{digest}\n" for name, digest in sources.items())
+                return f"sha256-dir:{hashlib.sha256(manifest.encode()).hexdigest()}"
+        return None
+
+    def _sources_of(self, path: str) -> List[str]:
+        p = Path(path)
+        if p.is_dir():
+            return sorted(set((self._dataset_sources(p) or {}).values()))
+        digest = self.digest_of(path)
+        return [digest] if digest else []
+
+    def _derived_path(self, content_key: str, name: str) -> Path:
+        return self.root / "derived" / content_key.split(":", 1)[-1] / name
+
+    def get_derived(self, content_key: str, name: str) -> Optional[Path]:
+        """派生缓存文件路径（不存在时返回 None）"""
+        path = self._derived_path(content_key, name)
+        return path if path.is_file() else None
+
+    def put_derived(self, content_key: str, name: str, file_path: str, source_path: str) -> Path:
+        """
+        登记派生缓存文件（移动到存储中）
+
+        Args:
+            content_key: 源数据的内容键
+            name: 派生文件名（同一内容可有多个派生文件，如不同参数的转换结果）
+            file_path: 已生成的派生文件（移动后不再存在）
+            source_path: 源数据路径（记录其 blob，源 blob 被清理时派生缓存一并删除）
+
+        Returns:
+            派生缓存文件路径
+        """
+        target = self._derived_path(content_key, name)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.move(file_path, target)
+        self._connect().execute(
+            "INSERT OR REPLACE INTO derived (content_key, name, sources, created_at) VALUES (?, ?, ?, ?)",
+            (content_key, name, json.dumps(self._sources_of(source_path)), time.time())
+        )
+        logger.info(f"💾 [BlobStore] 派生缓存: {name} ({content_key[:24]})")
+        return target
+
+    def gc(self) -> Dict[str, Any]:
+        """
+        删除没有上传路径引用的 blob、失效的索引条目和源 blob 已删除的派生缓存
+
+        持有排他锁（多个 worker 启动时各自调用，依次执行；期间的上传等待清理结束）。
+
+        Returns:
+            {"blobs_removed", "bytes_freed", "links_removed", "derived_removed"}
+        """
+        with self._locked(fcntl.LOCK_EX):
+            return self._gc()
+
+    def _gc(self) -> Dict[str, Any]:
+        stats = {"blobs_removed": 0, "bytes_freed": 0, "links_removed": 0, "derived_removed": 0}
+        for blob in (self.root / "sha256").glob("*/*"):
+            try:
+                stat = blob.stat()
+                if stat.st_nlink <= 1:
+                    blob.unlink()
+                    self._connect().execute("DELETE FROM blobs WHERE digest = ?", (blob.name,))
+                    stats["blobs_removed"] += 1
+                    stats["bytes_freed"] += stat.st_size
+            except OSError:
+                continue
+
+        conn = self._connect()
+        for path, digest in conn.execute("SELECT path, digest FROM blob_links").fetchall():
+            try:
+                alive = os.path.samefile(path, self.blob_path(digest))
+            except OSError:
+                alive = False
+            if not alive:
+                conn.execute("DELETE FROM blob_links WHERE path = ?", (path,))
+                stats["links_removed"] += 1
+
+        for content_key, name, sources in conn.execute("SELECT content_key, name, sources FROM derived").fetchall():
+            if all(self.blob_path(digest).exists() for digest in json.loads(sources)):
+                continue
+            self._derived_path(content_key, name).unlink(missing_ok=True)
+            conn.execute("DELETE FROM derived WHERE content_key = ? AND name = ?", (content_key, name))
+            stats["derived_removed"] += 1
+
+        if any(stats.values()):
+            logger.info(f"🗑️ [BlobStore] 清理完成: {stats}")
+        return stats
+
+    def stats(self) -> Dict[str, Any]:
+        """存储统计（blob 数量与大小、上传路径引用数）"""
+        blobs, size, links = 0, 0, 0
+        for blob in (self.root / "sha256").glob("*/*"):
+            try:
+                stat = blob.stat()
+            except OSError:
+                continue
+            blobs += 1
+            size += stat.st_size
+            links += stat.st_nlink - 1
+        return {"root": str(self.root), "blobs": blobs, "size_bytes": size, "links": links}
+
+
+_blob_stores: Dict[str, Optional[BlobStore]] = {}
+_blob_stores_lock = threading.Lock()
+
+
+def get_blob_store(upload_dir: Optional[str] = None) -> Optional[BlobStore]:
+    """
+    获取上传目录的 blob 存储（由环境变量配置）
+
+    Args:
+        upload_dir: 上传目录（默认环境变量 UPLOAD_DIR，未设置时为 /app/uploads）
+
+    Returns:
+        BlobStore 实例；禁用、上传目录不存在或初始化失败时返回 None
+    """
+    if os.getenv("BLOB_STORE_ENABLED", "true").lower() not in ("1", "true", "yes"):
+        return None
+    upload_dir = Path(upload_dir or os.getenv("UPLOAD_DIR", "/app/uploads"))
+    if not upload_dir.is_dir():
+        return None
+    root = str(upload_dir / BLOB_DIRNAME)
+    with _blob_stores_lock:
+        if root not in _blob_stores:
+            try:
+                _blob_stores[root] = BlobStore(root)
+            except (sqlite3.Error, OSError) as e:
+                # 记住失败，避免每次调用都重试并刷日志
+                logger.warning(f"⚠️ [BlobStore] 初始化失败，上传不去重: {e}")
+                _blob_stores[root] = None
+        return _blob_stores[root]
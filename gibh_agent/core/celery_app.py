@@ -1,11 +1,19 @@
 """
 Celery 任务配置
 用于异步执行耗时的生信分析任务
+
+Celery 对未知的任务 ID 和已提交但尚未开始的任务都报告 PENDING。提交任务时
+（after_task_publish）在 Redis 中登记任务 ID，状态接口据此区分两者（见 was_submitted）。
 """
 import os
+import logging
+from typing import Optional
 from celery import Celery
+from celery.signals import after_task_publish
 from pathlib import Path
 
+logger = logging.getLogger(__name__)
+
 # 从环境变量获取 Redis URL
 redis_url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 
@@ -33,3 +41,44 @@ celery_app.conf.update(
 # 自动发现任务
 celery_app.autodiscover_tasks(["gibh_agent.core"])
 
+SUBMITTED_KEY_PREFIX = "gibh:celery:submitted:"
+
+_redis_client = None
+
+
+def _submitted_client():
+    global _redis_client
+    if _redis_client is None:
+        import redis
+        _redis_client = redis.Redis.from_url(redis_url, socket_timeout=1.0, socket_connect_timeout=1.0)
+    return _redis_client
+
+
+@after_task_publish.connect
+def record_submitted_task(sender=None, headers=None, body=None, **kwargs):
+    """登记已提交的任务 ID（与任务结果同样的有效期）"""
+    # 消息协议 2 的任务 ID 在 headers 中，协议 1 在 body 中
+    task_id = (headers or {}).get("id") or (body.get("id") if isinstance(body, dict) else None)
+    if not task_id:
+        return
+    try:
+        expires = celery_app.conf.result_expires
+        seconds = int(expires.total_seconds()) if hasattr(expires, "total_seconds") else int(expires or 86400)
+        _submitted_client().set(SUBMITTED_KEY_PREFIX + task_id, 1, ex=max(1, seconds))
+    except Exception as e:
+        logger.warning(f"⚠️ [Celery] 无法登记已提交的任务 {task_id}: {e}")
+
+
+def was_submitted(task_id: str) -> Optional[bool]:
+    """
+    任务 ID 是否经由本应用提交过
+
+    Returns:
+        True / False；Redis 不可用时返回 None（无法判断）
+    """
+    try:
+        return bool(_submitted_client().exists(SUBMITTED_KEY_PREFIX + task_id))
+    except Exception as e:
+        logger.warning(f"⚠️ [Celery] 无法查询已提交的任务 {task_id}: {e}")
+        return None
+
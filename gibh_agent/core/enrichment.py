@@ -0,0 +1,295 @@
+"""
+本地通路富集引擎 - 离线的过表达分析（ORA）与秩检验
+
+通路集合从 GMT / JSON 文件加载为倒排索引（特征 -> 通路编号），所有通路的重叠计数、
+背景大小和秩和通过 np.bincount 一次性计算，不需要访问远程服务（Enrichr）。
+已解析的通路库在每个工作进程中按 LRU 缓存。
+
+通路库文件格式：
+- GMT: 每行 "通路名<TAB>描述<TAB>成员1<TAB>成员2..."
+- JSON: {"通路ID": {"name": "通路名", "members": [...]}} 或 {"通路名": [成员...]}
+
+通路库名称（如 "KEGG_2021_Human"）在 PATHWAY_LIBRARY_DIR（默认 gibh_agent/data/pathways）
+中查找 <名称>.gmt / <名称>.json。
+"""
+import os
+import json
+import logging
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Sequence
+
+import numpy as np
+from scipy import stats
+from statsmodels.stats.multitest import multipletests
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIBRARY_DIR = Path(__file__).resolve().parent.parent / "data" / "pathways"
+
+_LIBRARY_SUFFIXES = (".gmt", ".json")
+
+
+def normalize_feature(name: Any) -> str:
+    """特征名标准化（忽略大小写和首尾空白），用于匹配数据列名与通路成员"""
+    return str(name).strip().lower()
+
+
+class PathwayLibrary:
+    """
+    通路库（倒排索引）
+
+    Attributes:
+        name: 通路库名称
+        pathway_ids / pathway_names: 通路 ID 与名称（按编号排列）
+        index: 标准化特征名 -> 所属通路编号数组
+    """
+
+    def __init__(self, name: str, pathways: Dict[str, Dict[str, Any]]):
+        """
+        Args:
+            name: 通路库名称
+            pathways: {通路ID: {"name": 通路名, "members": [成员...]}}
+        """
+        self.name = name
+        self.pathway_ids: List[str] = []
+        self.pathway_names: List[str] = []
+        members_by_feature: Dict[str, List[int]] = {}
+        self.display_names: Dict[str, str] = {}
+
+        for pathway_id, pathway in pathways.items():
+            members = {normalize_feature(m): m for m in pathway.get("members", []) if str(m).strip()}
+            if not members:
+                continue
+            number = len(self.pathway_ids)
+            self.pathway_ids.append(str(pathway_id))
+            self.pathway_names.append(str(pathway.get("name") or pathway_id))
+            for feature, original in members.items():
+                members_by_feature.setdefault(feature, []).append(number)
+                self.display_names.setdefault(feature, str(original).strip())
+
+        self.index: Dict[str, np.ndarray] = {
+            feature: np.asarray(numbers, dtype=np.int64) for feature, numbers in members_by_feature.items()
+        }
+
+    @property
+    def n_pathways(self) -> int:
+        return len(self.pathway_ids)
+
+    def pathway_counts(self, features: Sequence[str], weights: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        统计每个通路包含的给定特征数（或权重之和）
+
+        Args:
+            features: 标准化后的特征名（必须都在索引中）
+            weights: 每个特征的权重（可选，如秩）
+
+        Returns:
+            长度为通路数的数组
+        """
+        if len(features) == 0:
+            return np.zeros(self.n_pathways)
+        numbers = [self.index[f] for f in features]
+        flat = np.concatenate(numbers)
+        if weights is not None:
+            weights = np.repeat(np.asarray(weights, dtype=float), [len(n) for n in numbers])
+        return np.bincount(flat, weights=weights, minlength=self.n_pathways)
+
+    def pathway_members(self, number: int, features: Sequence[str]) -> List[str]:
+        """返回给定特征中属于某个通路的特征（原始名称）"""
+        return [self.display_names.get(f, f) for f in features if number in self.index[f]]
+
+
+def _parse_gmt(path: Path) -> Dict[str, Dict[str, Any]]:
+    pathways = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            fields = line.rstrip("\n\r").split("\t")
+            if len(fields) < 3 or not fields[0]:
+                continue
+            pathways[fields[0]] = {"name": fields[0], "description": fields[1], "members": fields[2:]}
+    return pathways
+
+
+def _parse_json(path: Path) -> Dict[str, Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    pathways = {}
+    for pathway_id, value in data.items():
+        if isinstance(value, dict):
+            pathways[pathway_id] = {"name": value.get("name", pathway_id), "members": value.get("members", [])}
+        else:
+            pathways[pathway_id] = {"name": pathway_id, "members": list(value)}
+    return pathways
+
+
+@lru_cache(maxsize=int(os.getenv("PATHWAY_LIBRARY_CACHE_SIZE", "8")))
+def _load_library_cached(path: str, mtime_ns: int) -> PathwayLibrary:
+    """解析通路库文件（按路径 + mtime 缓存，文件更新后自动重新解析）"""
+    p = Path(path)
+    pathways = _parse_json(p) if p.suffix.lower() == ".json" else _parse_gmt(p)
+    library = PathwayLibrary(p.stem, pathways)
+    logger.info(f"✅ [Enrichment] 通路库已加载: {p.name} ({library.n_pathways} 个通路, {len(library.index)} 个特征)")
+    return library
+
+
+def resolve_library_path(library: str) -> Optional[Path]:
+    """
+    解析通路库路径
+
+    Args:
+        library: 文件路径，或通路库名称（在 PATHWAY_LIBRARY_DIR 中查找 <名称>.gmt / <名称>.json）
+
+    Returns:
+        通路库文件路径；找不到时返回 None
+    """
+    candidate = Path(library)
+    if candidate.is_file():
+        return candidate
+    library_dir = Path(os.getenv("PATHWAY_LIBRARY_DIR", str(DEFAULT_LIBRARY_DIR)))
+    for suffix in ("",) + _LIBRARY_SUFFIXES:
+        path = library_dir / f"{library}{suffix}"
+        if path.is_file():
+            return path
+    return None
+
+
+def load_pathway_library(library: str) -> PathwayLibrary:
+    """
+    加载通路库（进程内 LRU 缓存）
+
+    Args:
+        library: 通路库文件路径或名称
+
+    Returns:
+        PathwayLibrary 实例
+
+    Raises:
+        FileNotFoundError: 找不到通路库文件
+    """
+    path = resolve_library_path(library)
+    if path is None:
+        raise FileNotFoundError(
+            f"通路库不存在: {library}（请提供 GMT/JSON 文件路径，或将 {library}.gmt 放入 "
+            f"{os.getenv('PATHWAY_LIBRARY_DIR', str(DEFAULT_LIBRARY_DIR))}）"
+        )
+    return _load_library_cached(str(path.resolve()), path.stat().st_mtime_ns)
+
+
+def run_ora(
+    library: PathwayLibrary,
+    query: Sequence[str],
+    background: Sequence[str],
+    min_size: int = 3,
+    max_size: int = 500,
+    fdr_method: str = "fdr_bh"
+) -> List[Dict[str, Any]]:
+    """
+    超几何检验的过表达分析（所有通路向量化计算）
+
+    背景为已检测且被通路库注释的特征；通路大小按背景内的成员数计算。
+
+    Args:
+        library: 通路库
+        query: 目标特征（如显著差异代谢物）
+        background: 背景特征（所有已检测的代谢物）
+        min_size / max_size: 背景内通路大小的范围
+        fdr_method: 多重检验校正方法
+
+    Returns:
+        按 P 值排序的通路结果列表
+    """
+    universe = list(dict.fromkeys(f for f in map(normalize_feature, background) if f in library.index))
+    universe_set = set(universe)
+    hits = list(dict.fromkeys(f for f in map(normalize_feature, query) if f in universe_set))
+
+    sizes = library.pathway_counts(universe)
+    overlaps = library.pathway_counts(hits)
+    n_universe, n_hits = len(universe), len(hits)
+
+    tested = np.flatnonzero((sizes >= min_size) & (sizes <= max_size) & (overlaps > 0))
+    if n_hits == 0 or len(tested) == 0:
+        return []
+
+    k, size = overlaps[tested], sizes[tested]
+    p_values = stats.hypergeom.sf(k - 1, n_universe, size, n_hits)
+    fdr = multipletests(p_values, method=fdr_method)[1]
+    expected = size * n_hits / n_universe
+
+    results = []
+    for pos in np.argsort(p_values, kind="stable"):
+        number = tested[pos]
+        results.append({
+            "pathway_id": library.pathway_ids[number],
+            "pathway": library.pathway_names[number],
+            "overlap": int(k[pos]),
+            "pathway_size": int(size[pos]),
+            "p_value": float(p_values[pos]),
+            "fdr": float(fdr[pos]),
+            "enrichment_score": float(k[pos] / expected[pos]),
+            "metabolites": library.pathway_members(number, hits)
+        })
+    return results
+
+
+def run_rank_test(
+    library: PathwayLibrary,
+    features: Sequence[str],
+    scores: Sequence[float],
+    min_size: int = 3,
+    max_size: int = 500,
+    fdr_method: str = "fdr_bh"
+) -> List[Dict[str, Any]]:
+    """
+    基于秩的通路检验（所有通路向量化计算）
+
+    对所有已注释特征按得分（如 t 统计量）排秩，比较每个通路成员与非成员的秩
+    （Wilcoxon 秩和检验的正态近似）。正的 z 表示通路成员整体上调。
+
+    Args:
+        library: 通路库
+        features: 特征名
+        scores: 对应的得分（NaN 会被忽略）
+        min_size / max_size: 通路大小范围
+        fdr_method: 多重检验校正方法
+
+    Returns:
+        按 P 值排序的通路结果列表
+    """
+    scored = {}
+    for feature, score in zip(map(normalize_feature, features), scores):
+        if feature in library.index and np.isfinite(score):
+            scored.setdefault(feature, float(score))
+    if not scored:
+        return []
+
+    universe = list(scored)
+    n = len(universe)
+    ranks = stats.rankdata([scored[f] for f in universe])
+    sizes = library.pathway_counts(universe)
+    rank_sums = library.pathway_counts(universe, weights=ranks)
+
+    tested = np.flatnonzero((sizes >= min_size) & (sizes <= max_size) & (sizes < n))
+    if len(tested) == 0:
+        return []
+
+    size = sizes[tested]
+    mean_rank = rank_sums[tested] / size
+    z = (rank_sums[tested] - size * (n + 1) / 2.0) / np.sqrt(size * (n - size) * (n + 1) / 12.0)
+    p_values = 2 * stats.norm.sf(np.abs(z))
+    fdr = multipletests(p_values, method=fdr_method)[1]
+
+    results = []
+    for pos in np.argsort(p_values, kind="stable"):
+        number = tested[pos]
+        results.append({
+            "pathway_id": library.pathway_ids[number],
+            "pathway": library.pathway_names[number],
+            "pathway_size": int(size[pos]),
+            "z_score": float(z[pos]),
+            "direction": "up" if z[pos] > 0 else "down",
+            "mean_rank": float(mean_rank[pos]),
+            "p_value": float(p_values[pos]),
+            "fdr": float(fdr[pos])
+        })
+    return results
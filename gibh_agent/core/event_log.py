@@ -0,0 +1,249 @@
+"""
+结构化事件日志 - 请求处理中的调试事件（JSON Lines）
+
+emit() 只把事件放入有界内存队列（不做文件 I/O，可在事件循环中直接调用）；后台线程
+批量写入文件，超过大小上限时轮转（events.log -> events.log.1 -> ...）。队列满时丢弃
+新事件并计数，不阻塞请求。
+
+事件格式（每行一个 JSON 对象）：
+    {"ts": "2024-12-01T12:00:00.123456", "event": "chat.process_query.done",
+     "request_id": "3f2a9c1b7e4d", "run_id": "run_20241201_120000_ab12cd",
+     "elapsed_ms": 812.4, "duration_ms": 790.2, "pid": 12, "data": {...}}
+
+- request_id / run_id 来自当前上下文（bind_event_context()，asyncio 任务和
+  asyncio.to_thread 会继承），也可在 emit() 中显式传入
+- elapsed_ms 为距绑定 request_id 时的耗时；duration_ms 由调用方传入（如某个阶段的耗时）
+
+环境变量：
+- EVENT_LOG_ENABLED: 是否启用（默认 true）
+- EVENT_LOG_PATH: 日志文件路径（默认 /app/debug.log）
+- EVENT_LOG_MAX_BYTES: 单个文件大小上限（默认 10MB）
+- EVENT_LOG_BACKUP_COUNT: 轮转保留的旧文件数（默认 3）
+"""
+import os
+import json
+import time
+import uuid
+import queue
+import atexit
+import logging
+import threading
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_event_context: ContextVar[Dict[str, Any]] = ContextVar("event_context", default={})
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+def bind_event_context(request_id: Optional[str] = None, run_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    在当前上下文中绑定 request_id / run_id（之后的 emit() 自动带上）
+
+    每个请求运行在独立的 asyncio 任务中（上下文是复制的），绑定不会影响其他请求。
+
+    Args:
+        request_id: 请求 ID（传入时重新开始计算 elapsed_ms）
+        run_id: 工作流运行 ID
+
+    Returns:
+        当前上下文
+    """
+    context = dict(_event_context.get())
+    if request_id is not None:
+        context["request_id"] = request_id
+        context["started"] = time.perf_counter()
+    if run_id is not None:
+        context["run_id"] = run_id
+    _event_context.set(context)
+    return context
+
+
+class EventLog:
+    """
+    后台批量写入的事件日志
+
+    - emit(): 入队（非阻塞）
+    - flush(): 等待已入队的事件写入文件（测试和退出时使用）
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = 10 * 1024 * 1024,
+        backup_count: int = 3,
+        queue_size: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 1.0
+    ):
+        """
+        Args:
+            path: 日志文件路径
+            max_bytes: 单个文件大小上限（0 表示不轮转）
+            backup_count: 轮转保留的旧文件数
+            queue_size: 内存队列上限（超出时丢弃新事件）
+            batch_size: 每批最多写入的事件数
+            flush_interval: 攒批的最长等待时间（秒）
+        """
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.written = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._write_failed = False
+        self._thread = threading.Thread(target=self._run, name="event-log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def emit(
+        self,
+        event: str,
+        data: Optional[Dict[str, Any]] = None,
+        duration_ms: Optional[float] = None,
+        request_id: Optional[str] = None,
+        run_id: Optional[str] = None
+    ) -> None:
+        """
+        记录事件（只入队，不做文件 I/O）
+
+        Args:
+            event: 事件名（如 "chat.entry"）
+            data: 事件数据（需可 JSON 序列化，无法序列化的值转为字符串）
+            duration_ms: 阶段耗时（毫秒）
+            request_id: 请求 ID（默认取当前上下文）
+            run_id: 运行 ID（默认取当前上下文）
+        """
+        context = _event_context.get()
+        started = context.get("started")
+        record = {
+            "ts": datetime.now().isoformat(),
+            "event": event,
+            "request_id": request_id or context.get("request_id"),
+            "run_id": run_id or context.get("run_id"),
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1) if started else None,
+            "duration_ms": round(duration_ms, 1) if duration_ms is not None else None,
+            "pid": os.getpid(),
+            "data": data or {}
+        }
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout: float = 5.0) -> None:
+        """等待已入队的事件写入文件"""
+        marker = threading.Event()
+        try:
+            self._queue.put(marker, timeout=timeout)
+        except queue.Full:
+            return
+        marker.wait(timeout)
+
+    def _run(self) -> None:
+        """后台写入线程：攒批后一次写入"""
+        while True:
+            batch: List[Any] = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and not isinstance(batch[-1], threading.Event):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            records = [item for item in batch if not isinstance(item, threading.Event)]
+            if records:
+                self._write(records)
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+
+    def _write(self, records: List[Dict[str, Any]]) -> None:
+        lines = "".join(json.dumps(record, ensure_ascii=False, default=str) + "\n" for record in records)
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            if self.max_bytes and self.path.exists() and self.path.stat().st_size + len(lines) > self.max_bytes:
+                self._rotate()
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(lines)
+            self.written += len(records)
+            self._write_failed = False
+        except OSError as e:
+            self.dropped += len(records)
+            if not self._write_failed:
+                # 只在首次失败时记录，避免刷屏
+                logger.warning(f"⚠️ [EventLog] 写入失败，事件被丢弃: {self.path}: {e}")
+                self._write_failed = True
+
+    def _rotate(self) -> None:
+        """events.log -> events.log.1 -> ... -> events.log.N（最旧的删除）"""
+        if self.backup_count <= 0:
+            self.path.unlink(missing_ok=True)
+            return
+        for i in range(self.backup_count - 1, 0, -1):
+            src = self.path.with_name(f"{self.path.name}.{i}")
+            if src.exists():
+                os.replace(src, self.path.with_name(f"{self.path.name}.{i + 1}"))
+        os.replace(self.path, self.path.with_name(f"{self.path.name}.1"))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": str(self.path),
+            "pending": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped
+        }
+
+
+class _NullEventLog:
+    """禁用时的空实现"""
+
+    def emit(self, *args, **kwargs) -> None:
+        pass
+
+    def flush(self, timeout: float = 5.0) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"enabled": False}
+
+
+_event_log = None
+_event_log_lock = threading.Lock()
+
+
+def get_event_log():
+    """
+    获取全局事件日志（由环境变量配置）
+
+    Returns:
+        EventLog 实例；禁用时返回空实现（emit() 不做任何事）
+    """
+    global _event_log
+    if _event_log is None:
+        with _event_log_lock:
+            if _event_log is None:
+                if os.getenv("EVENT_LOG_ENABLED", "true").lower() not in ("1", "true", "yes"):
+                    _event_log = _NullEventLog()
+                else:
+                    _event_log = EventLog(
+                        os.getenv("EVENT_LOG_PATH", "/app/debug.log"),
+                        max_bytes=int(os.getenv("EVENT_LOG_MAX_BYTES", str(10 * 1024 * 1024))),
+                        backup_count=int(os.getenv("EVENT_LOG_BACKUP_COUNT", "3"))
+                    )
+    return _event_log
+
+
+def emit_event(event: str, data: Optional[Dict[str, Any]] = None, **kwargs) -> None:
+    """get_event_log().emit() 的简写"""
+    get_event_log().emit(event, data, **kwargs)
@@ -5,16 +5,29 @@
 使用 ToolRegistry 查找和执行工具。
 """
 import os
+import copy
+import json
+import time
 import logging
-from typing import Dict, Any, List, Optional
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, Any, List, Optional, Callable
 from pathlib import Path
 from datetime import datetime
 
 from .tool_registry import registry
 from .utils import sanitize_for_json
+from .result_payload import ARTIFACT_DIRNAME, compact_result, enforce_report_budget, expand_result
+from .rna_utils import AnnDataSession, use_adata_session
+from .step_cache import get_step_cache
+from .profiling import StepProfiler, mark_exclusive_process, write_run_profile
 
 logger = logging.getLogger(__name__)
 
+# 运行清单文件名（位于每次运行的 output_dir 中，用于断点续跑）
+MANIFEST_FILENAME = "run_manifest.json"
+
 
 class WorkflowExecutor:
     """
@@ -37,6 +50,7 @@ class WorkflowExecutor:
         """
         self.output_dir = output_dir
         self.step_results: Dict[str, Any] = {}  # 存储步骤结果，用于数据流传递
+        self.step_cache = get_step_cache()  # 步骤结果缓存（禁用时为 None）
     
     def execute_step(
         self,
@@ -148,7 +162,7 @@ class WorkflowExecutor:
                     logger.error(f"❌ [Executor] 无法找到 differential_analysis 结果，visualize_volcano 将失败")
             
             # 过滤掉工具不接受的参数（保留 diff_results）
-            allowed_params = {"diff_results", "output_path", "fdr_threshold", "log2fc_threshold"}
+            allowed_params = {"diff_results", "output_path", "fdr_threshold", "log2fc_threshold", "contrast"}
             filtered_params = {k: v for k, v in processed_params.items() if k in allowed_params}
             if len(filtered_params) < len(processed_params):
                 removed = set(processed_params.keys()) - allowed_params
@@ -157,25 +171,28 @@ class WorkflowExecutor:
         
         # 🔥 ARCHITECTURAL UPGRADE: Phase 3 - Pre-Flight Check & Auto-Correction
         # 对于需要 group_column 的工具，验证列是否存在，如果不存在则使用 semantic_map 自动修正
-        tools_requiring_group_column = ["differential_analysis", "metabolomics_plsda", "metabolomics_pathway_enrichment"]
+        tools_requiring_group_column = [
+            "differential_analysis", "multigroup_differential_analysis",
+            "metabolomics_plsda", "metabolomics_pathway_enrichment"
+        ]
         if tool_id in tools_requiring_group_column and "group_column" in processed_params:
             group_column = processed_params.get("group_column")
             file_path = processed_params.get("file_path")
             
             if file_path and os.path.exists(file_path):
                 try:
-                    import pandas as pd
-                    # Pre-Flight Check: 读取文件检查列是否存在
-                    df = pd.read_csv(file_path, index_col=0, nrows=1)  # 只读第一行检查列名
+                    from .table_io import read_table_columns
+                    # Pre-Flight Check: 只读取列名检查列是否存在（列式格式只读 schema）
+                    columns = read_table_columns(file_path)
                     
                     # 🔥 修复：先尝试精确匹配，如果失败则尝试模糊匹配（忽略大小写、空格、下划线）
-                    group_column_found = group_column in df.columns
+                    group_column_found = group_column in columns
                     matched_column = None
                     
                     if not group_column_found:
                         # 尝试模糊匹配：忽略大小写、空格、下划线
                         group_column_normalized = group_column.lower().replace(' ', '').replace('_', '').replace('-', '')
-                        for col in df.columns:
+                        for col in columns:
                             col_normalized = col.lower().replace(' ', '').replace('_', '').replace('-', '')
                             if col_normalized == group_column_normalized:
                                 matched_column = col
@@ -202,11 +219,9 @@ class WorkflowExecutor:
                         # 方法2: 如果未找到，重新读取文件元数据（使用 FileInspector）
                         if not semantic_map:
                             try:
-                                from .file_inspector import FileInspector
-                                # os 已在文件顶部导入，无需重复导入
-                                upload_dir = os.getenv("UPLOAD_DIR", "/app/uploads")
-                                inspector = FileInspector(upload_dir)
-                                file_metadata = inspector.inspect_file(file_path)
+                                from .file_inspector import get_file_inspector
+                                # 共享实例 + 元数据缓存：同一文件不重复检查
+                                file_metadata = get_file_inspector().inspect_file(file_path)
                                 if file_metadata.get("status") == "success":
                                     semantic_map = file_metadata.get("semantic_map", {})
                                     logger.info(f"✅ [Executor] 重新读取 file_metadata 获取 semantic_map")
@@ -238,16 +253,51 @@ class WorkflowExecutor:
                                 processed_params["group_column"] = detected_group_column
                             else:
                                 # 列出所有可用的列名
-                                available_cols = list(df.columns)
+                                available_cols = columns
                                 logger.error(f"❌ [Executor] 无法自动检测分组列。可用列: {available_cols[:10]}")
                                 # 不立即失败，让工具自己处理错误（工具会返回友好的错误信息）
                 except Exception as e:
                     logger.warning(f"⚠️ [Executor] Pre-Flight Check 失败: {e}，继续执行")
         
         # 执行工具
+        profiler = None
         try:
-            logger.info(f"🚀 调用工具: {tool_id} with params: {list(processed_params.keys())}")
-            result = tool_func(**processed_params)
+            adata_session = step_context.get("adata_session") if step_context else None
+            
+            # 🔥 步骤结果缓存：相同工具 + 相同参数 + 相同输入内容 → 直接复用结果
+            # 融合模式下输入/输出可能只存在于内存中，无法按内容寻址，跳过缓存
+            cache_key = None
+            cache_hit = False
+            use_cache = (
+                self.step_cache is not None and
+                adata_session is None and
+                step_data.get("cache", True) and
+                (step_context or {}).get("use_cache", True)
+            )
+            if use_cache:
+                try:
+                    cache_key = self.step_cache.make_key(tool_id, processed_params)
+                except Exception as e:
+                    logger.warning(f"⚠️ [StepCache] 计算缓存键失败，跳过缓存: {e}")
+            
+            result = None
+            # 🔥 资源画像：耗时、CPU、峰值内存增量、磁盘 IO
+            with StepProfiler(processed_params) as profiler:
+                if cache_key:
+                    result = self.step_cache.get(
+                        cache_key,
+                        processed_params.get("output_dir") or self.output_dir,
+                        output_path=processed_params.get("output_path")
+                    )
+                    cache_hit = result is not None
+                    if cache_hit:
+                        logger.info(f"⚡ [StepCache] 命中缓存: {step_id} ({tool_id})")
+                
+                if not cache_hit:
+                    logger.info(f"🚀 调用工具: {tool_id} with params: {list(processed_params.keys())}")
+                    # 🔥 融合模式：在工具调用期间启用 AnnData 内存交接会话
+                    with use_adata_session(adata_session):
+                        result = tool_func(**processed_params)
             
             # 确保结果是字典格式
             if not isinstance(result, dict):
@@ -261,6 +311,24 @@ class WorkflowExecutor:
             if "status" not in result:
                 result["status"] = "success"
             
+            profile = profiler.finish(result)
+            logger.info(
+                f"⏱️ [Profile] {step_id}: wall={profile['wall_time_s']}s cpu={profile['cpu_time_s']}s "
+                f"peakΔ={'~' if profile['peak_rss_approximate'] else ''}{profile['peak_rss_delta_mb']}MB out={profile['output_size_mb']}MB"
+            )
+            
+            if cache_key and not cache_hit:
+                # output_dir / output_path 在工具执行后才存在，不是输入
+                input_paths = {
+                    v for k, v in processed_params.items()
+                    if k not in ("output_dir", "output_path") and isinstance(v, str) and v and os.path.exists(v)
+                }
+                self.step_cache.put(
+                    cache_key, tool_id, result, input_paths=input_paths,
+                    output_dir=processed_params.get("output_dir") or self.output_dir,
+                    output_path=processed_params.get("output_path")
+                )
+            
             # 🔥 根据工具返回的状态记录正确的日志和消息
             tool_status = result.get("status", "success")
             if tool_status == "error":
@@ -274,6 +342,7 @@ class WorkflowExecutor:
                     "step_name": step_name,
                     "tool_id": tool_id,
                     "result": result,
+                    "profile": profile,
                     "error": error_msg,
                     "message": error_msg  # 🔥 使用错误消息，而不是"执行完成"
                 }
@@ -287,6 +356,8 @@ class WorkflowExecutor:
                     "step_name": step_name,
                     "tool_id": tool_id,
                     "result": result,
+                    "cache_hit": cache_hit,
+                    "profile": profile,
                     "message": result.get("message", f"步骤 {step_name} 执行完成")
                 }
         
@@ -299,6 +370,8 @@ class WorkflowExecutor:
                 "step_id": step_id,
                 "step_name": step_name,
                 "tool_id": tool_id,
+                # 失败的步骤同样记录画像（OOM、超时前的耗时和内存正是最需要的数据）
+                "profile": profiler.finish() if profiler is not None and profiler.profile else None,
                 "error": str(e),
                 "message": error_msg
             }
@@ -417,7 +490,10 @@ class WorkflowExecutor:
                     else:
                         logger.warning(f"⚠️ 未找到 differential_analysis 步骤结果，无法提取 {placeholder}")
                 
-                # 尝试从 step_results 中获取
+                # 尝试从 step_results 中获取（支持 <step_id> 和 <step_id_output> 两种写法）
+                if placeholder not in self.step_results and placeholder.endswith("_output"):
+                    if placeholder[:-len("_output")] in self.step_results:
+                        placeholder = placeholder[:-len("_output")]
                 if placeholder in self.step_results:
                     step_result = self.step_results[placeholder]
                     # 🔥 CRITICAL FIX: 对于 scRNA-seq 工具，优先提取 output_h5ad
@@ -497,9 +573,10 @@ class WorkflowExecutor:
         """
         try:
             import pandas as pd
+            from .table_io import read_table
             
             # 读取文件（采样读取，避免大文件问题）
-            df = pd.read_csv(file_path, index_col=0, nrows=1000)
+            df = read_table(file_path, nrows=1000)
             
             # 优先级关键词列表（支持部分匹配，如"Muscle loss"会匹配包含"Muscle"或"Loss"的列）
             priority_keywords = ['Diet', 'diet', 'Group', 'group', 'Condition', 'condition', 
@@ -571,25 +648,89 @@ class WorkflowExecutor:
         workflow_data: Dict[str, Any],
         file_paths: List[str] = None,
         output_dir: Optional[str] = None,
-        agent: Optional[Any] = None  # 可选的 Agent 实例，用于生成诊断
+        agent: Optional[Any] = None,  # 可选的 Agent 实例，用于生成诊断
+        fused: Optional[bool] = None,
+        max_workers: Optional[int] = None,
+        resume: bool = False,
+        on_event: Optional[Callable[[Dict[str, Any]], None]] = None,
+        isolate_steps: bool = False
     ) -> Dict[str, Any]:
         """
         执行整个工作流
         
+        步骤按依赖图（DAG）调度：依赖来自参数中的 <step_id> 占位符，以及
+        未显式指定输入文件的步骤对 current_file_path 链的依赖。设置 max_workers > 1
+        时互不依赖的步骤在共享的步骤进程池中并发执行，报告中的 steps_details
+        仍按计划顺序排列。
+        
         Args:
             workflow_data: 工作流配置（包含 workflow_name 和 steps）
             file_paths: 输入文件路径列表
             output_dir: 输出目录（如果为 None，将自动创建）
+            fused: 是否启用融合模式（None 时读取 workflow_data["fused"]）。
+                融合模式下 scRNA-seq 步骤之间直接在内存中传递 AnnData，
+                仅在检查点步骤（workflow_data["checkpoints"] 或步骤的
+                "checkpoint": true）和工作流结束时写出 .h5ad
+            max_workers: 并发执行的最大步骤数（None 时依次读取
+                workflow_data["max_workers"]、环境变量 WORKFLOW_MAX_WORKERS，
+                默认 1 即顺序执行；实际并发还受步骤进程池大小限制）
+            resume: 是否从 output_dir 中的运行清单恢复已完成的步骤（见 resume_workflow）
+            on_event: 进度回调，接收 workflow_started / step_started / step_finished
+                事件字典（在调用 execute_workflow 的线程中触发）
+            isolate_steps: 是否所有步骤都在子进程中执行（调用方运行在服务进程的线程中时
+                使用，避免工具计算占用服务进程的 GIL；融合模式下无效）
         
         Returns:
             执行报告（符合前端 analysis_report 格式）
         """
         workflow_name = workflow_data.get("workflow_name", "Unknown Workflow")
-        steps = workflow_data.get("steps", [])
+        
+        # 🔥 CRITICAL FIX: 完全移除 visualize_pca 步骤（不在流程中显示）
+        steps = []
+        for step in workflow_data.get("steps", []):
+            if step.get("tool_id") == "visualize_pca" or step.get("step_id") == "visualize_pca":
+                logger.warning(f"⚠️ [Executor] 完全移除 visualize_pca 步骤（pca_analysis 已包含可视化）")
+                continue
+            steps.append(step)
+        for i, step in enumerate(steps, 1):
+            step.setdefault("step_id", f"step{i}")
+        
+        # 运行清单保存原始计划（参数注入之前），续跑时据此重建依赖图
+        manifest = {
+            "workflow_name": workflow_name,
+            "workflow_data": {**copy.deepcopy(workflow_data), "steps": copy.deepcopy(steps)},
+            "file_paths": file_paths or [],
+            "created_at": time.time(),
+            "status": "running",
+            "steps": {}
+        }
+        
+        # 🔥 融合模式：构建 AnnData 内存交接会话
+        if fused is None:
+            fused = bool(workflow_data.get("fused", False))
+        adata_session = None
+        if fused:
+            checkpoints = set(workflow_data.get("checkpoints") or [])
+            checkpoints.update(
+                step.get("step_id") for step in steps if step.get("checkpoint")
+            )
+            adata_session = AnnDataSession(checkpoints=checkpoints)
+            logger.info(f"⚡ [FusedMode] 已启用，检查点: {sorted(checkpoints) or '无（仅结束时落盘）'}")
+        
+        # 并发度：融合模式的内存对象无法跨进程共享，强制顺序执行
+        if max_workers is None:
+            max_workers = workflow_data.get("max_workers") or os.getenv("WORKFLOW_MAX_WORKERS")
+        try:
+            max_workers = int(max_workers) if max_workers else 1
+        except (TypeError, ValueError):
+            max_workers = 1
+        if adata_session:
+            max_workers = 1
+        max_workers = max(1, max_workers)
         
         logger.info("=" * 80)
         logger.info(f"🚀 开始执行工作流: {workflow_name}")
-        logger.info(f"📋 步骤数: {len(steps)}")
+        logger.info(f"📋 步骤数: {len(steps)}, 最大并发: {max_workers}")
         logger.info("=" * 80)
         
         # 设置输出目录
@@ -603,28 +744,80 @@ class WorkflowExecutor:
         
         logger.info(f"📂 输出目录: {self.output_dir}")
         
-        # 初始化步骤结果列表
-        steps_details = []
-        steps_results = []
+        # 构建依赖图
+        dependencies = self._build_step_dependencies(steps)
         
-        # 🔥 上下文链：跟踪当前文件路径，用于自动传递给下一个步骤
-        current_file_path = file_paths[0] if file_paths else None
+        def emit(event: Dict[str, Any]) -> None:
+            if on_event is None:
+                return
+            try:
+                on_event(sanitize_for_json({**event, "timestamp": time.time()}))
+            except Exception as e:
+                logger.warning(f"⚠️ [Executor] 进度回调失败: {e}")
         
-        # 执行每个步骤
-        for i, step in enumerate(steps, 1):
-            step_id = step.get("step_id", f"step{i}")
-            step_name = step.get("name", step.get("step_name", step_id))
+        emit({
+            "type": "workflow_started",
+            "workflow_name": workflow_name,
+            "output_dir": self.output_dir,
+            "steps": [
+                {
+                    "step_id": step["step_id"],
+                    "tool_id": step.get("tool_id"),
+                    "name": step.get("name", step.get("step_name", step["step_id"]))
+                }
+                for step in steps
+            ]
+        })
+        
+        # 🔥 上下文链：每个步骤完成后产生的文件路径（按计划顺序回放得到 current_file_path）
+        initial_file_path = file_paths[0] if file_paths else None
+        produced_paths: Dict[int, Optional[str]] = {}
+        step_outcomes: Dict[int, Dict[str, Any]] = {}
+        
+        # 🔥 断点续跑：恢复清单中已成功、产物仍存在且依赖均已恢复的步骤
+        if resume:
+            previous_manifest = self.load_manifest(self.output_dir)
+            if previous_manifest:
+                manifest["created_at"] = previous_manifest.get("created_at", manifest["created_at"])
+                self._restore_from_manifest(previous_manifest, steps, dependencies, step_outcomes, produced_paths)
+                manifest["steps"] = {
+                    steps[i]["step_id"]: previous_manifest["steps"][steps[i]["step_id"]]
+                    for i in step_outcomes
+                }
+            else:
+                logger.warning(f"⚠️ [Executor] 未找到运行清单，将从头执行: {self.output_dir}")
+            for index in sorted(step_outcomes):
+                emit({
+                    "type": "step_finished",
+                    "step_id": steps[index]["step_id"],
+                    "status": step_outcomes[index].get("status", "error"),
+                    "step_detail": self._build_step_detail(steps[index], step_outcomes[index])
+                })
+        
+        def current_file_path_for(index: int) -> Optional[str]:
+            current_file_path = initial_file_path
+            for j in range(index):
+                if produced_paths.get(j):
+                    current_file_path = produced_paths[j]
+            return current_file_path
+        
+        def prepare(index: int) -> Dict[str, Any]:
+            step = steps[index]
+            step_id = step["step_id"]
             tool_id = step.get("tool_id", step_id)
             params = step.get("params", {})
-            
-            # 🔥 CRITICAL FIX: 完全移除 visualize_pca 步骤（不在流程中显示）
-            if tool_id == "visualize_pca" or step_id == "visualize_pca":
-                logger.warning(f"⚠️ [Executor] 完全移除 visualize_pca 步骤（pca_analysis 已包含可视化）")
-                continue  # 直接跳过，不添加到步骤详情中
+            current_file_path = current_file_path_for(index)
             
             logger.info(f"\n{'=' * 80}")
-            logger.info(f"📌 步骤 {i}/{len(steps)}: {step_name} ({step_id})")
+            logger.info(f"📌 步骤 {index + 1}/{len(steps)}: {step.get('name', step.get('step_name', step_id))} ({step_id})")
             logger.info(f"{'=' * 80}")
+            emit({
+                "type": "step_started",
+                "step_id": step_id,
+                "tool_id": tool_id,
+                "name": step.get("name", step.get("step_name", step_id)),
+                "index": index
+            })
             
             # 🔥 智能参数映射：根据工具类型自动映射文件路径参数
             tool_metadata = registry.get_metadata(tool_id)
@@ -655,92 +848,141 @@ class WorkflowExecutor:
             # 更新步骤的 params
             step["params"] = params
             
+            # 🔥 融合模式：非 scRNA-seq 工具只认磁盘文件，执行前先落盘
+            if adata_session and tool_category != "scRNA-seq":
+                adata_session.flush()
+            
             # 构建步骤上下文（包含文件路径等）
-            step_context = {
+            return {
                 "file_paths": file_paths or [],
                 "output_dir": self.output_dir,
                 "workflow_name": workflow_name,
-                "current_file_path": current_file_path  # 传递当前文件路径
+                "current_file_path": current_file_path,  # 传递当前文件路径
+                "adata_session": adata_session,  # 融合模式下的内存 AnnData（否则为 None）
+                "use_cache": workflow_data.get("cache", True)  # 是否使用步骤结果缓存
             }
+        
+        def complete(index: int, step_result: Dict[str, Any]) -> None:
+            # 🔥 载荷策略：大表落盘为产物引用，清单/事件/报告中只传递引用和预览
+            step_result = self._compact_step_result(steps[index]["step_id"], step_result)
+            step_outcomes[index] = step_result
+            produced_paths[index] = self._extract_output_path(steps[index], step_result)
+            manifest["steps"][steps[index]["step_id"]] = {
+                "index": index,
+                "tool_id": steps[index].get("tool_id"),
+                "status": step_result.get("status", "error"),
+                "output_path": produced_paths[index],
+                "completed_at": time.time(),
+                "step_result": step_result
+            }
+            self._write_manifest(manifest)
+            emit({
+                "type": "step_finished",
+                "step_id": steps[index]["step_id"],
+                "status": step_result.get("status", "error"),
+                "step_detail": self._build_step_detail(steps[index], step_result)
+            })
+            next_file_path = produced_paths[index]
+            if next_file_path:
+                # 🔥 修复：即使文件不存在也更新路径（文件可能稍后创建）
+                if os.path.exists(next_file_path) or (adata_session and adata_session.holds(next_file_path)):
+                    logger.info(f"✅ 更新当前文件路径: {next_file_path}")
+                else:
+                    logger.warning(f"⚠️ 输出路径不存在，但会使用: {next_file_path} (文件可能稍后创建)")
             
-            # 执行步骤
-            step_result = self.execute_step(step, step_context)
+            if step_result.get("status") == "error":
+                logger.error(f"❌ 步骤 {steps[index]['step_id']} 失败，停止工作流执行")
+            elif adata_session and steps[index]["step_id"] in adata_session.checkpoints:
+                # 🔥 融合模式：检查点步骤落盘
+                adata_session.flush()
+        
+        # 按依赖图调度执行；任一步骤失败后不再启动新步骤（已在运行的步骤执行完毕）
+        pending = [i for i in range(len(steps)) if i not in step_outcomes]
+        running: Dict[Any, int] = {}
+        failed = False
+        # 守护进程（如 Celery prefork worker）不允许创建子进程，此时退化为顺序执行
+        use_pool = (
+            (max_workers > 1 and len(steps) > 1) or (isolate_steps and adata_session is None)
+        ) and not multiprocessing.current_process().daemon
+        pool = _get_step_pool() if use_pool else None
+        
+        while pending or running:
+            if not failed:
+                ready = [i for i in pending if dependencies[i].issubset(step_outcomes)]
+            else:
+                ready = []
+                pending = []
             
-            # 🔥 CRITICAL FIX: 更新 current_file_path 供下一个步骤使用
-            # 对于 scRNA-seq 工具，优先使用 output_h5ad
-            result_data = step_result.get("result", {})
-            if isinstance(result_data, dict):
-                # 🔥 对于 scRNA-seq 工具，优先查找 output_h5ad
-                tool_metadata = registry.get_metadata(step.get("tool_id", ""))
-                tool_category = tool_metadata.category if tool_metadata else None
-                
-                if tool_category == "scRNA-seq":
-                    # scRNA-seq 工具优先使用 output_h5ad
-                    next_file_path = (
-                        result_data.get("output_h5ad") or  # 🔥 优先使用 output_h5ad
-                        result_data.get("output_file") or
-                        result_data.get("output_path") or
-                        result_data.get("file_path")
-                    )
-                else:
-                    # 其他工具使用标准字段
-                    next_file_path = (
-                        result_data.get("output_file") or
-                        result_data.get("output_path") or
-                        result_data.get("file_path") or
-                        result_data.get("preprocessed_file")
-                    )
-                
-                if next_file_path:
-                    # 🔥 修复：即使文件不存在也更新路径（文件可能稍后创建）
-                    current_file_path = next_file_path
-                    if os.path.exists(next_file_path):
-                        logger.info(f"✅ 更新当前文件路径: {current_file_path}")
-                    else:
-                        logger.warning(f"⚠️ 输出路径不存在，但会使用: {next_file_path} (文件可能稍后创建)")
+            if ready and not running and (pool is None or (len(ready) == 1 and not isolate_steps)):
+                # 只有一个可执行步骤（或顺序模式）时直接在当前进程执行，避免进程间传输开销
+                index = ready[0]
+                pending.remove(index)
+                step_context = prepare(index)
+                complete(index, self.execute_step(steps[index], step_context))
+                failed = failed or step_outcomes[index].get("status") == "error"
+                continue
             
-            # 构建步骤详情（符合前端格式）
-            step_detail = {
-                "step_id": step_id,
-                "tool_id": step.get("tool_id"),
-                "name": step_name,
-                "status": step_result.get("status", "error"),
-                "summary": step_result.get("message", ""),
-                "step_result": {
-                    "step_name": step_name,
-                    "status": step_result.get("status", "error"),
-                    "logs": step_result.get("message", ""),
-                    "data": step_result.get("result", {})
-                }
-            }
+            if pool is not None:
+                # 进程池在多个运行之间共享，本次运行最多同时占用 max_workers 个槽位
+                for index in ready[:max(0, max_workers - len(running))]:
+                    pending.remove(index)
+                    step_context = prepare(index)
+                    step_context.pop("adata_session", None)
+                    # 只传递该步骤会读取的前序结果，避免把所有步骤结果序列化到子进程
+                    step_ids = {steps[j]["step_id"] for j in self._result_dependencies(steps, index)}
+                    future = pool.submit(
+                        _execute_step_in_worker,
+                        self.output_dir,
+                        {k: v for k, v in self.step_results.items() if k in step_ids},
+                        steps[index],
+                        step_context
+                    )
+                    running[future] = index
             
-            # 🔥 提取图片路径（如果有）- 严格检查文件类型
-            result_data = step_result.get("result", {})
-            if isinstance(result_data, dict):
-                # 优先检查明确的图片路径字段
-                plot_path = result_data.get("plot_path") or result_data.get("image_path")
-                
-                # 如果没有明确的图片路径字段，检查 output_path 的文件扩展名
-                if not plot_path:
-                    output_path = result_data.get("output_path") or result_data.get("output_file") or result_data.get("file_path")
-                    if output_path and self._is_image_file(output_path):
-                        plot_path = output_path
-                
-                # 只有确认是图片文件才添加到 plot 字段
-                if plot_path and self._is_image_file(plot_path):
-                    step_detail["plot"] = plot_path
-                    logger.info(f"🖼️ 检测到图片文件: {plot_path}")
-                elif plot_path:
-                    # 如果不是图片文件（如 CSV），记录到 data 字段而不是 plot
-                    logger.debug(f"📄 检测到非图片文件: {plot_path}，不添加到 plot 字段")
+            if not running:
+                if pending and not failed:
+                    # 依赖无法满足（理论上不会发生，依赖只指向前序步骤）
+                    logger.error(f"❌ [Executor] 存在无法调度的步骤: {[steps[i]['step_id'] for i in pending]}")
+                break
             
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                index = running.pop(future)
+                try:
+                    step_result, log_records = future.result()
+                    for record in log_records:
+                        logging.getLogger(record.name).handle(record)
+                except Exception as e:
+                    logger.error(f"❌ 步骤 {steps[index]['step_id']} 子进程执行失败: {e}", exc_info=True)
+                    step_result = {
+                        "status": "error",
+                        "step_id": steps[index]["step_id"],
+                        "step_name": steps[index].get("name", steps[index].get("tool_id")),
+                        "tool_id": steps[index].get("tool_id"),
+                        "error": str(e),
+                        "message": f"步骤 {steps[index]['step_id']} 执行失败: {str(e)}"
+                    }
+                if "result" in step_result:
+                    self.step_results[steps[index]["step_id"]] = step_result["result"]
+                complete(index, step_result)
+                failed = failed or step_result.get("status") == "error"
+        
+        # 初始化步骤结果列表（按计划顺序）
+        steps_details = []
+        steps_results = []
+        for index in sorted(step_outcomes):
+            step_detail = self._build_step_detail(steps[index], step_outcomes[index])
             steps_details.append(step_detail)
             steps_results.append(step_detail["step_result"])
-            
-            # 如果步骤失败，停止执行
-            if step_result.get("status") == "error":
-                logger.error(f"❌ 步骤 {step_id} 失败，停止工作流执行")
-                break
+        
+        # 🔥 融合模式：工作流结束时落盘最终结果并释放内存
+        # 失败的步骤可能已原地修改了内存对象，此时不再写盘，避免写出不完整的数据
+        if adata_session:
+            if all(detail.get("status") == "success" for detail in steps_details):
+                adata_session.flush()
+            else:
+                logger.warning("⚠️ [FusedMode] 工作流失败，跳过最终落盘（仅保留已写出的检查点）")
+            adata_session.clear()
         
         # 确定最终状态
         all_success = all(
@@ -768,6 +1010,29 @@ class WorkflowExecutor:
         if final_plot:
             report_data["final_plot"] = final_plot
         
+        resumed_steps = [d["step_id"] for d in steps_details if d.get("resumed")]
+        if resumed_steps:
+            report_data["resumed_steps"] = resumed_steps
+        
+        cache_hits = [d["step_id"] for d in steps_details if d.get("cache_hit")]
+        if cache_hits:
+            report_data["cache_hits"] = cache_hits
+            logger.info(f"⚡ [StepCache] 复用缓存的步骤: {cache_hits}")
+        
+        if adata_session:
+            report_data["fused"] = {
+                "checkpoints": sorted(adata_session.checkpoints),
+                "written_files": list(adata_session.written_paths.keys())
+            }
+        
+        manifest["status"] = workflow_status
+        self._write_manifest(manifest)
+        
+        # 🔥 资源画像：写入 profile.json（机器可读，供 /api/profiles/tools 汇总）
+        profile_path = write_run_profile(self.output_dir, workflow_name, steps_details)
+        if profile_path:
+            report_data["profile_path"] = profile_path
+        
         logger.info("=" * 80)
         logger.info(f"✅ 工作流执行完成: {workflow_name} (状态: {workflow_status})")
         logger.info(f"📊 成功步骤: {sum(1 for d in steps_details if d.get('status') == 'success')}/{len(steps_details)}")
@@ -785,5 +1050,571 @@ class WorkflowExecutor:
         sanitized_report = sanitize_for_json(report_data)
         logger.info("✅ 数据清理完成")
         
+        # 🔥 报告大小上限：超过 REPORT_MAX_BYTES 时严格压缩步骤结果
+        sanitized_report = enforce_report_budget(sanitized_report, os.path.join(self.output_dir, ARTIFACT_DIRNAME))
+        
         return sanitized_report
+    
+    def execute_batch(
+        self,
+        workflow_data: Dict[str, Any],
+        file_paths: List[str],
+        output_dir: Optional[str] = None,
+        max_concurrent_runs: Optional[int] = None,
+        template_file_path: Optional[str] = None,
+        on_event: Optional[Callable[[Dict[str, Any]], None]] = None,
+        **kwargs
+    ) -> Dict[str, Any]:
+        """
+        批量模式：用同一个工作流计划处理多个输入文件
+        
+        每个输入文件是一次独立的运行（独立的 WorkflowExecutor 和子目录），运行的编排
+        在有界线程池中并发进行，步骤统一分发到共享的子进程步骤池执行。子进程在运行之间
+        复用，已导入的库和进程内缓存的模型（如 CellTypist）因此在运行之间共享。
+        
+        Args:
+            workflow_data: 已验证的工作流计划
+            file_paths: 输入文件（或 10x 目录）路径列表，每个路径一次运行
+            output_dir: 批次输出目录（为 None 时自动创建 ./results/batch_{时间戳}）
+            max_concurrent_runs: 同时进行的运行数上限（None 时读取环境变量
+                BATCH_MAX_CONCURRENT_RUNS，默认 4）
+            template_file_path: 计划中代表输入文件的路径，会被替换为每次运行的输入文件
+                （None 时自动识别计划中唯一的显式 file_path/adata_path 参数值）
+            on_event: 进度回调（batch 级事件 + 各运行的 run_event 事件）
+            **kwargs: 透传给 execute_workflow 的其他参数（如 fused、max_workers）
+        
+        Returns:
+            批次汇总（包含每个文件的执行报告）
+        """
+        if output_dir is None:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            output_dir = f"./results/batch_{timestamp}"
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+        
+        if max_concurrent_runs is None:
+            max_concurrent_runs = int(os.getenv("BATCH_MAX_CONCURRENT_RUNS", "4"))
+        max_concurrent_runs = max(1, min(max_concurrent_runs, len(file_paths) or 1))
+        
+        # 计划中显式引用的输入文件（替换为每次运行的输入文件）
+        if template_file_path is None:
+            explicit_inputs = {
+                step.get("params", {}).get(name)
+                for step in workflow_data.get("steps", [])
+                for name in ("file_path", "adata_path")
+                if isinstance(step.get("params", {}).get(name), str)
+                and not step.get("params", {}).get(name).startswith("<")
+            }
+            if len(explicit_inputs) == 1:
+                template_file_path = explicit_inputs.pop()
+            elif explicit_inputs:
+                logger.warning(f"⚠️ [Batch] 计划中存在多个显式输入文件，无法自动替换: {explicit_inputs}")
+        
+        def replace_input(value: Any, file_path: str) -> Any:
+            if isinstance(value, str):
+                return file_path if template_file_path and value == template_file_path else value
+            if isinstance(value, dict):
+                return {k: replace_input(v, file_path) for k, v in value.items()}
+            if isinstance(value, list):
+                return [replace_input(v, file_path) for v in value]
+            return value
+        
+        run_names = [
+            f"{index:03d}_{Path(file_path.rstrip('/')).stem or 'input'}"
+            for index, file_path in enumerate(file_paths, 1)
+        ]
+        
+        def emit(event: Dict[str, Any]) -> None:
+            if on_event is None:
+                return
+            try:
+                on_event({**event, "timestamp": time.time()})
+            except Exception as e:
+                logger.warning(f"⚠️ [Batch] 进度回调失败: {e}")
+        
+        logger.info("=" * 80)
+        logger.info(f"📦 [Batch] 开始批量执行: {workflow_data.get('workflow_name', 'Unknown Workflow')}")
+        logger.info(f"📋 文件数: {len(file_paths)}, 并发运行数: {max_concurrent_runs}")
+        logger.info("=" * 80)
+        
+        # 批次进度以"每个文件一个步骤"的形式上报，便于复用单次运行的进度展示
+        emit({
+            "type": "workflow_started",
+            "workflow_name": workflow_data.get("workflow_name", "Unknown Workflow"),
+            "output_dir": output_dir,
+            "steps": [
+                {"step_id": run_name, "name": os.path.basename(file_path.rstrip("/")), "file_path": file_path}
+                for run_name, file_path in zip(run_names, file_paths)
+            ]
+        })
+        
+        def run_one(index: int) -> Dict[str, Any]:
+            file_path = file_paths[index]
+            run_name = run_names[index]
+            run_dir = os.path.join(output_dir, run_name)
+            emit({"type": "step_started", "step_id": run_name, "file_path": file_path})
+            
+            started = time.perf_counter()
+            try:
+                run_workflow = copy.deepcopy(workflow_data)
+                run_workflow["steps"] = replace_input(run_workflow.get("steps", []), file_path)
+                report = WorkflowExecutor(output_dir=run_dir).execute_workflow(
+                    workflow_data=run_workflow,
+                    file_paths=[file_path],
+                    output_dir=run_dir,
+                    on_event=lambda event: emit({"type": "run_event", "step_id": run_name, "event": event}),
+                    **kwargs
+                )
+            except Exception as e:
+                logger.error(f"❌ [Batch] {file_path} 执行失败: {e}", exc_info=True)
+                report = {
+                    "status": "error",
+                    "workflow_name": workflow_data.get("workflow_name"),
+                    "steps_details": [],
+                    "steps_results": [],
+                    "output_dir": run_dir,
+                    "error": str(e)
+                }
+            
+            failed_step = next(
+                (d for d in report.get("steps_details", []) if d.get("status") == "error"),
+                None
+            )
+            summary = {
+                "file_path": file_path,
+                "run_name": run_name,
+                "output_dir": run_dir,
+                "status": report.get("status", "error"),
+                "wall_time_s": round(time.perf_counter() - started, 3),
+                "steps_succeeded": sum(1 for d in report.get("steps_details", []) if d.get("status") == "success"),
+                "failed_step": failed_step.get("step_id") if failed_step else None,
+                "error": (failed_step.get("summary") if failed_step else None) or report.get("error"),
+                "final_plot": report.get("final_plot")
+            }
+            emit({"type": "step_finished", "step_id": run_name, "status": summary["status"], "summary": summary})
+            return {"summary": summary, "report": report}
+        
+        with ThreadPoolExecutor(max_workers=max_concurrent_runs, thread_name_prefix="batch-run") as pool:
+            outcomes = list(pool.map(run_one, range(len(file_paths))))
+        
+        runs = [outcome["summary"] for outcome in outcomes]
+        succeeded = sum(1 for run in runs if run["status"] == "success")
+        if succeeded == len(runs):
+            batch_status = "success"
+        elif succeeded > 0:
+            batch_status = "partial"
+        else:
+            batch_status = "error"
+        
+        batch_summary = {
+            "status": batch_status,
+            "workflow_name": workflow_data.get("workflow_name", "Unknown Workflow"),
+            "output_dir": output_dir,
+            "total": len(runs),
+            "succeeded": succeeded,
+            "failed": len(runs) - succeeded,
+            "total_wall_time_s": round(max((run["wall_time_s"] for run in runs), default=0), 3),
+            "runs": runs
+        }
+        
+        # 批次汇总（不含完整报告）写入批次目录，完整报告在各运行子目录的 run_manifest.json 中
+        try:
+            with open(os.path.join(output_dir, "batch_summary.json"), "w", encoding="utf-8") as f:
+                json.dump(sanitize_for_json(batch_summary), f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            logger.warning(f"⚠️ [Batch] 写入 batch_summary.json 失败: {e}")
+        
+        logger.info(f"📦 [Batch] 批量执行完成: 成功 {succeeded}/{len(runs)}")
+        
+        batch_summary["reports"] = [outcome["report"] for outcome in outcomes]
+        return sanitize_for_json(batch_summary)
+    
+    def resume_workflow(
+        self,
+        output_dir: str,
+        agent: Optional[Any] = None,
+        **kwargs
+    ) -> Dict[str, Any]:
+        """
+        从运行清单续跑失败或中断的工作流
+        
+        重新加载已完成步骤的结果（step_results），从第一个未完成的步骤继续执行，
+        产物写入原来的 output_dir。
+        
+        Args:
+            output_dir: 原运行的输出目录（包含 run_manifest.json）
+            agent: 可选的 Agent 实例
+            **kwargs: 透传给 execute_workflow 的其他参数（如 max_workers）
+        
+        Returns:
+            执行报告（符合前端 analysis_report 格式）
+        
+        Raises:
+            FileNotFoundError: 如果 output_dir 中没有运行清单
+        """
+        manifest = self.load_manifest(output_dir)
+        if manifest is None:
+            raise FileNotFoundError(f"运行清单不存在: {os.path.join(output_dir, MANIFEST_FILENAME)}")
+        
+        logger.info(f"🔁 [Executor] 续跑工作流: {manifest.get('workflow_name')} ({output_dir})")
+        return self.execute_workflow(
+            workflow_data=manifest["workflow_data"],
+            file_paths=manifest.get("file_paths") or [],
+            output_dir=output_dir,
+            agent=agent,
+            resume=True,
+            **kwargs
+        )
+    
+    @staticmethod
+    def load_manifest(output_dir: str) -> Optional[Dict[str, Any]]:
+        """
+        读取运行清单
+        
+        Args:
+            output_dir: 运行输出目录
+        
+        Returns:
+            清单字典；不存在或损坏时返回 None
+        """
+        manifest_path = os.path.join(output_dir, MANIFEST_FILENAME)
+        if not os.path.exists(manifest_path):
+            return None
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"❌ [Executor] 读取运行清单失败: {e}")
+            return None
+    
+    def _write_manifest(self, manifest: Dict[str, Any]) -> None:
+        """原子写入运行清单（先写临时文件再替换，避免中断时留下半个文件）"""
+        if not self.output_dir:
+            return
+        manifest["updated_at"] = time.time()
+        manifest["output_dir"] = self.output_dir
+        manifest_path = os.path.join(self.output_dir, MANIFEST_FILENAME)
+        tmp_path = f"{manifest_path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(sanitize_for_json(manifest), f, ensure_ascii=False, default=str)
+            os.replace(tmp_path, manifest_path)
+        except Exception as e:
+            logger.warning(f"⚠️ [Executor] 写入运行清单失败: {e}")
+    
+    def _restore_from_manifest(
+        self,
+        manifest: Dict[str, Any],
+        steps: List[Dict[str, Any]],
+        dependencies: Dict[int, set],
+        step_outcomes: Dict[int, Dict[str, Any]],
+        produced_paths: Dict[int, Optional[str]]
+    ) -> None:
+        """
+        从运行清单恢复已完成的步骤（原地填充 step_outcomes / produced_paths / step_results）
+        
+        步骤可恢复的条件：清单中状态为 success、工具未变、输出文件和表格产物仍存在，且其依赖均已恢复。
+        step_results 中放入还原产物引用后的完整结果，step_outcomes 中保留压缩后的结果。
+        融合模式下未落盘的中间结果不满足条件，会从最近的检查点之后重新执行。
+        """
+        recorded_steps = manifest.get("steps", {})
+        for index, step in enumerate(steps):
+            entry = recorded_steps.get(step["step_id"])
+            if not entry or entry.get("status") != "success":
+                continue
+            if entry.get("tool_id") != step.get("tool_id"):
+                continue
+            output_path = entry.get("output_path")
+            if output_path and not os.path.exists(output_path):
+                continue
+            if not dependencies[index].issubset(step_outcomes):
+                continue
+            
+            step_result = dict(entry.get("step_result") or {})
+            if "result" in step_result:
+                # 🔥 清单中保存的是压缩后的结果：下游步骤需要完整数据，产物引用读回原始形态
+                try:
+                    full_result = expand_result(step_result["result"])
+                except Exception as e:
+                    logger.warning(f"⚠️ [Executor] 无法读取步骤 {step['step_id']} 的产物，重新执行: {e}")
+                    continue
+                self.step_results[step["step_id"]] = full_result
+            step_result["resumed"] = True
+            step_outcomes[index] = step_result
+            produced_paths[index] = output_path
+        
+        if step_outcomes:
+            logger.info(f"✅ [Executor] 从运行清单恢复 {len(step_outcomes)} 个已完成步骤: {[steps[i]['step_id'] for i in sorted(step_outcomes)]}")
+    
+    def _build_step_dependencies(self, steps: List[Dict[str, Any]]) -> Dict[int, set]:
+        """
+        构建步骤依赖图（只会指向前序步骤，因此不会成环）
+        
+        依赖来源：
+        1. 参数中的占位符：<step_id>、<step_id_output>，以及 differential_analysis 相关占位符
+        2. visualize_volcano 隐式依赖前序的差异分析步骤（diff_results 自动注入）
+        3. 未显式指定输入文件的步骤依赖所有前序步骤（current_file_path 链）
+        
+        Args:
+            steps: 步骤列表
+        
+        Returns:
+            步骤索引 -> 依赖的步骤索引集合
+        """
+        dependencies: Dict[int, set] = {}
+        for index, step in enumerate(steps):
+            deps = self._result_dependencies(steps, index)
+            params = step.get("params", {}) or {}
+            
+            if "file_path" not in params and "adata_path" not in params:
+                deps.update(range(index))
+            
+            dependencies[index] = deps
+            if deps:
+                logger.debug(f"🔗 [Executor] {step['step_id']} 依赖: {[steps[j]['step_id'] for j in sorted(deps)]}")
+        
+        return dependencies
+    
+    def _result_dependencies(self, steps: List[Dict[str, Any]], index: int) -> set:
+        """
+        步骤会从 step_results 中读取结果的前序步骤（依赖来源 1 和 2）
+        
+        Args:
+            steps: 步骤列表
+            index: 步骤索引
+        
+        Returns:
+            前序步骤索引集合
+        """
+        step = steps[index]
+        deps = set()
+        previous_ids = [(j, steps[j]["step_id"]) for j in range(index)]
+        
+        for placeholder in self._collect_placeholders(step.get("params", {}) or {}):
+            for j, previous_id in previous_ids:
+                if (
+                    placeholder == previous_id or
+                    placeholder == f"{previous_id}_output" or
+                    ("differential_analysis" in placeholder.lower() and "differential" in previous_id.lower())
+                ):
+                    deps.add(j)
+        
+        if step.get("tool_id") == "visualize_volcano":
+            deps.update(j for j, previous_id in previous_ids if "differential" in previous_id.lower())
+        
+        return deps
+    
+    def _collect_placeholders(self, value: Any) -> List[str]:
+        """递归收集参数中的 <placeholder> 名称"""
+        if isinstance(value, str):
+            if value.startswith("<") and value.endswith(">"):
+                return [value[1:-1]]
+            return []
+        if isinstance(value, dict):
+            return [p for v in value.values() for p in self._collect_placeholders(v)]
+        if isinstance(value, (list, tuple)):
+            return [p for v in value for p in self._collect_placeholders(v)]
+        return []
+    
+    def _extract_output_path(self, step: Dict[str, Any], step_result: Dict[str, Any]) -> Optional[str]:
+        """
+        从步骤结果中提取供下一个步骤使用的文件路径
+        
+        Args:
+            step: 步骤数据
+            step_result: execute_step 的返回值
+        
+        Returns:
+            输出文件路径（没有时返回 None）
+        """
+        # 🔥 CRITICAL FIX: 更新 current_file_path 供下一个步骤使用
+        # 对于 scRNA-seq 工具，优先使用 output_h5ad
+        result_data = step_result.get("result", {})
+        if not isinstance(result_data, dict):
+            return None
+        
+        tool_metadata = registry.get_metadata(step.get("tool_id", ""))
+        tool_category = tool_metadata.category if tool_metadata else None
+        
+        if tool_category == "scRNA-seq":
+            # scRNA-seq 工具优先使用 output_h5ad
+            return (
+                result_data.get("output_h5ad") or  # 🔥 优先使用 output_h5ad
+                result_data.get("output_file") or
+                result_data.get("output_path") or
+                result_data.get("file_path")
+            )
+        # 其他工具使用标准字段
+        return (
+            result_data.get("output_file") or
+            result_data.get("output_path") or
+            result_data.get("file_path") or
+            result_data.get("preprocessed_file")
+        )
+    
+    def _compact_step_result(self, step_id: str, step_result: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        将步骤结果中的大表替换为产物引用（self.step_results 中的完整结果不受影响）
+        
+        Args:
+            step_id: 步骤 ID（用作产物文件名前缀）
+            step_result: execute_step 的返回值
+        
+        Returns:
+            压缩后的步骤结果（新字典）
+        """
+        result = step_result.get("result")
+        if not isinstance(result, dict) or not self.output_dir:
+            return step_result
+        try:
+            compacted = compact_result(result, os.path.join(self.output_dir, ARTIFACT_DIRNAME), step_id)
+        except Exception as e:
+            logger.warning(f"⚠️ [Payload] 压缩步骤结果失败，保留原结果: {step_id}: {e}")
+            return step_result
+        return {**step_result, "result": compacted}
+    
+    def _build_step_detail(self, step: Dict[str, Any], step_result: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        构建步骤详情（符合前端格式）
+        
+        Args:
+            step: 步骤数据
+            step_result: execute_step 的返回值
+        
+        Returns:
+            steps_details 中的一项
+        """
+        step_id = step["step_id"]
+        step_name = step.get("name", step.get("step_name", step_id))
+        step_detail = {
+            "step_id": step_id,
+            "tool_id": step.get("tool_id"),
+            "name": step_name,
+            "status": step_result.get("status", "error"),
+            "summary": step_result.get("message", ""),
+            "cache_hit": bool(step_result.get("cache_hit")),
+            "resumed": bool(step_result.get("resumed")),
+            "profile": step_result.get("profile"),
+            "step_result": {
+                "step_name": step_name,
+                "status": step_result.get("status", "error"),
+                "logs": step_result.get("message", ""),
+                "data": step_result.get("result", {})
+            }
+        }
+        
+        # 🔥 提取图片路径（如果有）- 严格检查文件类型
+        result_data = step_result.get("result", {})
+        if isinstance(result_data, dict):
+            # 优先检查明确的图片路径字段
+            plot_path = result_data.get("plot_path") or result_data.get("image_path")
+            
+            # 如果没有明确的图片路径字段，检查 output_path 的文件扩展名
+            if not plot_path:
+                output_path = result_data.get("output_path") or result_data.get("output_file") or result_data.get("file_path")
+                if output_path and self._is_image_file(output_path):
+                    plot_path = output_path
+            
+            # 只有确认是图片文件才添加到 plot 字段
+            if plot_path and self._is_image_file(plot_path):
+                step_detail["plot"] = plot_path
+                logger.info(f"🖼️ 检测到图片文件: {plot_path}")
+            elif plot_path:
+                # 如果不是图片文件（如 CSV），记录到 data 字段而不是 plot
+                logger.debug(f"📄 检测到非图片文件: {plot_path}，不添加到 plot 字段")
+        
+        return step_detail
+
+
+# ---------------------------------------------------------------------------
+# 并发执行：子进程步骤池
+# ---------------------------------------------------------------------------
+# matplotlib.pyplot 的"当前图像"是进程级全局状态，绘图工具在线程中并发执行会互相
+# 覆盖，因此独立步骤放在进程池中执行。使用 spawn 避免在多线程的服务进程中 fork。
+#
+# 进程池大小固定（STEP_POOL_SIZE，默认 min(4, CPU 核数)），进程内所有运行（后台运行、
+# 批量运行）共享；创建后不再调整大小或关闭，避免关闭其他运行正在提交任务的池。
+# 池中的步骤可能同时运行，每个子进程的环境变量 STEP_WORKER_CPUS 为它可用的核数
+# （CPU 核数 / 池大小），自带并行的工具（如 PLS-DA 置换检验）据此限制进程数。
+
+_step_pool: Optional[ProcessPoolExecutor] = None
+_step_pool_lock = threading.Lock()
+
+
+def step_pool_size() -> int:
+    return max(1, int(os.getenv("STEP_POOL_SIZE", str(min(4, os.cpu_count() or 1)))))
+
+
+def step_worker_cpus() -> int:
+    """池中每个子进程可用的核数"""
+    return max(1, (os.cpu_count() or 1) // step_pool_size())
 
+
+def _get_step_pool() -> ProcessPoolExecutor:
+    """获取（首次调用时创建）共享的步骤进程池"""
+    global _step_pool
+    with _step_pool_lock:
+        if _step_pool is None:
+            _step_pool = ProcessPoolExecutor(
+                max_workers=step_pool_size(),
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_step_worker,
+                initargs=(logging.getLogger().getEffectiveLevel(), step_worker_cpus())
+            )
+            logger.info(f"🧵 [Executor] 创建步骤进程池: {step_pool_size()} workers")
+        return _step_pool
+
+
+def init_step_pool() -> None:
+    """服务启动时预先创建步骤进程池（守护进程中不允许创建子进程，跳过）"""
+    if not multiprocessing.current_process().daemon:
+        _get_step_pool()
+
+
+class _BufferingLogHandler(logging.Handler):
+    """缓存子进程中的日志记录，随步骤结果一起返回主进程重新分发"""
+    
+    def __init__(self):
+        super().__init__()
+        self.records: List[logging.LogRecord] = []
+    
+    def emit(self, record: logging.LogRecord) -> None:
+        # LogRecord 需要可 pickle：提前格式化消息和异常信息
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        self.records.append(record)
+
+
+def _init_step_worker(log_level: int, cpus: int = 1) -> None:
+    """子进程初始化：对齐日志级别、登记可用核数并加载所有工具"""
+    logging.getLogger().setLevel(log_level)
+    os.environ["STEP_WORKER_CPUS"] = str(cpus)
+    # 池中的子进程同一时间只执行一个步骤，画像可以报告准确的峰值内存
+    mark_exclusive_process()
+    from .. import tools  # noqa: F401  导入即触发 load_all_tools()
+
+
+def _execute_step_in_worker(
+    output_dir: str,
+    step_results: Dict[str, Any],
+    step: Dict[str, Any],
+    step_context: Dict[str, Any]
+):
+    """
+    在子进程中执行单个步骤
+    
+    Returns:
+        (execute_step 的返回值, 日志记录列表)
+    """
+    handler = _BufferingLogHandler()
+    root_logger = logging.getLogger()
+    root_logger.addHandler(handler)
+    try:
+        worker = WorkflowExecutor(output_dir=output_dir)
+        worker.step_results = step_results
+        step_result = worker.execute_step(step, step_context)
+    finally:
+        root_logger.removeHandler(handler)
+    return step_result, handler.records
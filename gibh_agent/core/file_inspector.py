@@ -7,18 +7,31 @@
 - BaseFileHandler: 抽象基类
 - 具体策略：TenXDirectoryHandler, AnnDataHandler, TabularHandler
 - FileInspector: 门面类
+
+检查结果经 metadata_cache（SQLite，按路径 + 文件指纹 + INSPECTOR_VERSION）在进程间共享；
+上传目录中来自 blob_store 的文件和 10x 目录还按内容键缓存，重复上传的同一内容不再检查；
+同一进程内对同一文件的并发检查只执行一次（后到的调用等待进行中的检查）。
+调用方通过 get_file_inspector() 获取共享实例。
 """
 import os
 import json
 import gzip
 import logging
+import threading
+from concurrent.futures import Future
 from pathlib import Path
 from typing import Dict, Optional, Any, List, Tuple
 from abc import ABC, abstractmethod
 import numpy as np
 
+from .metadata_cache import get_metadata_cache, file_fingerprint, CONTENT_FINGERPRINT
+from .blob_store import get_blob_store
+
 logger = logging.getLogger(__name__)
 
+# 检查器版本：任何检查器的输出格式或检查逻辑变化时递增，使已缓存的元数据全部失效
+INSPECTOR_VERSION = "5"
+
 
 # ============================================
 # Part 1: Registry & Base Class
@@ -126,8 +139,18 @@ class TenXDirectoryHandler(BaseFileHandler):
     
     检查包含 matrix.mtx, barcodes.tsv, features.tsv 的目录
     支持递归搜索嵌套目录
+    
+    只读取文件头：细胞数、基因数和非零元素数来自 matrix.mtx 的尺寸行，基因名来自
+    features.tsv 的前 FEATURE_PREVIEW_LINES 行，检查耗时与数据规模无关。
+    
+    特征类型按块排列（Gene Expression 在前，Antibody Capture / CRISPR Guide Capture 等在
+    文件末尾），因此未压缩的 features.tsv 还会读取末尾 FEATURE_TAIL_BYTES 字节；gzip
+    文件无法定位到末尾，只读取开头。没有读完整个文件时 feature_types_sampled 为 True。
     """
     
+    FEATURE_PREVIEW_LINES = 100
+    FEATURE_TAIL_BYTES = 64 * 1024
+    
     def _find_10x_data_path(self, root_path: Path) -> Optional[Path]:
         """
         递归搜索 10x 数据目录
@@ -247,6 +270,56 @@ class TenXDirectoryHandler(BaseFileHandler):
             # 返回 0 而不是抛出异常，让调用者决定如何处理
         return count
     
+    def _read_head_lines(self, file_path: Path, n_lines: int) -> List[str]:
+        """读取文件开头的 n_lines 个非注释行（gzip 只解压需要的部分）"""
+        lines = []
+        with self._smart_open(file_path) as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('%') and not line.startswith('#'):
+                    lines.append(line)
+                    if len(lines) >= n_lines:
+                        break
+        return lines
+    
+    def _read_tail_lines(self, file_path: Path, n_bytes: int) -> Tuple[List[str], bool]:
+        """
+        读取未压缩文件末尾 n_bytes 字节中的完整行
+        
+        Returns:
+            (行列表, 是否读到了整个文件)
+        """
+        with open(file_path, 'rb') as f:
+            size = f.seek(0, os.SEEK_END)
+            start = max(0, size - n_bytes)
+            f.seek(start)
+            data = f.read().decode('utf-8', errors='replace')
+        lines = data.splitlines()
+        if start > 0 and lines:
+            # 第一行可能不完整
+            lines = lines[1:]
+        return [line.strip() for line in lines if line.strip()], start == 0
+    
+    def _read_mtx_header(self, matrix_path: Path) -> Optional[Tuple[int, int, int]]:
+        """
+        读取 MatrixMarket 文件的尺寸行（注释之后的第一行: 行数 列数 非零元素数）
+        
+        10x 的 matrix.mtx 中行为特征（基因），列为细胞条形码。
+        
+        Returns:
+            (n_genes, n_cells, nnz)；尺寸行缺失或格式异常时返回 None
+        """
+        try:
+            head = self._read_head_lines(matrix_path, 1)
+            parts = head[0].split() if head else []
+            if len(parts) != 3:
+                return None
+            n_rows, n_cols, nnz = (int(x) for x in parts)
+            return n_rows, n_cols, nnz
+        except (OSError, ValueError, EOFError) as e:
+            logger.warning(f"⚠️ Failed to read MTX header {matrix_path}: {e}")
+            return None
+    
     def inspect(self, path: Path) -> Dict[str, Any]:
         """
         检查 10x Genomics 目录（支持嵌套目录）
@@ -377,144 +450,60 @@ class TenXDirectoryHandler(BaseFileHandler):
                     "debug_trace": debug_trace  # 🔥 返回调试跟踪
                 }
             
-            # Step C: 统计细胞数（barcodes.tsv 的行数，跳过注释）
-            debug_logs.append(f"Attempting to read barcodes file: {barcodes_path}")
-            logger.debug(f"DEBUG: Counting cells from: {barcodes_path}")
-            print(f"DEBUG: Counting cells from: {barcodes_path}")  # 🔥 Loud logging
-            try:
+            # Step C: 从 matrix.mtx 的尺寸行读取 基因数 × 细胞数 × 非零元素数（只读文件头）
+            debug_logs.append(f"Reading MatrixMarket header: {matrix_path}")
+            header = self._read_mtx_header(matrix_path)
+            nnz = None
+            if header is not None:
+                n_genes, n_cells, nnz = header
+                debug_logs.append(f"MTX header: {n_genes} genes x {n_cells} cells, nnz={nnz}")
+            else:
+                # 尺寸行缺失或格式异常：回退为统计 barcodes / features 行数
+                debug_logs.append("WARNING: MTX header unreadable, falling back to line counting")
+                logger.warning(f"⚠️ 无法解析 MTX 尺寸行，回退为统计行数: {matrix_path}")
                 n_cells = self._count_lines_skip_comments(barcodes_path)
-                debug_logs.append(f"Successfully counted {n_cells} cells from barcodes.tsv")
-            except Exception as e:
-                debug_logs.append(f"Error reading barcodes file: {str(e)}")
-                logger.error(f"❌ Error reading barcodes: {e}", exc_info=True)
-                n_cells = 0
-            
-            # 🔥 CRITICAL FIX: 如果行数统计失败（返回0），回退到 scanpy.read_10x_mtx
-            if n_cells == 0:
-                debug_logs.append(f"WARNING: Line counting returned 0 cells, falling back to scanpy.read_10x_mtx")
-                logger.warning(f"⚠️ Line counting returned 0, falling back to scanpy.read_10x_mtx")
-                try:
-                    import scanpy as sc
-                    from .rna_utils import read_10x_data
-                    debug_logs.append(f"Attempting scanpy.read_10x_mtx fallback...")
-                    logger.info(f"🔄 Using scanpy.read_10x_mtx as fallback...")
-                    adata = read_10x_data(str(real_data_path), var_names='gene_symbols', cache=False)
-                    n_cells = adata.n_obs
-                    n_genes = adata.n_vars
-                    debug_logs.append(f"Fallback successful: {n_cells} cells, {n_genes} genes")
-                    logger.info(f"✅ Fallback successful: {n_cells} cells, {n_genes} genes")
-                    print(f"DEBUG: Detected {n_cells} cells (via scanpy fallback)")  # 🔥 Loud logging
-                    
-                    # 使用 scanpy 的结果，跳过手动统计
-                    feature_types = ['Gene Expression']  # 默认值
-                    columns = list(adata.var_names[:20]) if hasattr(adata, 'var_names') else []
-                    
-                    if n_cells == 0 or n_genes == 0:
-                        debug_logs.append(f"ERROR: Fallback also returned 0 cells or genes")
-                        debug_trace = "\n".join(debug_logs)
-                        return {
-                            "status": "error",
-                            "error": f"10x数据为空: {n_cells} 个细胞, {n_genes} 个基因",
-                            "file_type": "directory",
-                            "n_obs": n_cells,
-                            "n_vars": n_genes,
-                            "n_samples": n_cells,
-                            "n_features": n_genes,
-                            "debug_trace": debug_trace  # 🔥 返回调试跟踪
-                        }
-                    
-                    # 构建预览
-                    preview = {
-                        "n_cells": n_cells,
-                        "n_genes": n_genes,
-                        "feature_types": feature_types,
-                        "sample_genes": columns[:10]
-                    }
-                    
-                    debug_trace = "\n".join(debug_logs)  # 🔥 生成调试跟踪
-                    
-                    # 直接返回结果（跳过下面的手动统计逻辑）
-                    result = {
-                        "status": "success",
-                        "file_path": str(path.resolve()),
-                        "real_data_path": str(real_data_path.resolve()),
-                        "file_type": "anndata",
-                        "shape": {
-                            "rows": n_cells,
-                            "cols": n_genes
-                        },
-                        "n_obs": n_cells,
-                        "n_vars": n_genes,
-                        "n_samples": n_cells,  # 🔥 关键：确保存在
-                        "n_features": n_genes,  # 🔥 关键：确保存在
-                        "columns": columns[:20] if columns else None,
-                        "head": {
-                            "markdown": f"10x Genomics 数据\n- 细胞数: {n_cells}\n- 基因数: {n_genes}\n- 数据路径: {real_data_path}",
-                            "json": preview
-                        },
-                        "feature_types": feature_types,
-                        "debug_trace": debug_trace,  # 🔥 返回调试跟踪
-                        "data": {
-                            "summary": {
-                                "n_samples": n_cells,
-                                "n_features": n_genes,
-                                "feature_types": feature_types
-                            }
-                        }
-                    }
-                    
-                    logger.info(f"✅ [TenXDirectoryHandler] Success (fallback): {n_cells} cells, {n_genes} genes")
-                    return result
-                    
-                except Exception as fallback_error:
-                    debug_logs.append(f"EXCEPTION in fallback: {str(fallback_error)}")
-                    debug_trace = "\n".join(debug_logs)
-                    logger.error(f"❌ Fallback to scanpy also failed: {fallback_error}", exc_info=True)
-                    return {
-                        "status": "error",
-                        "error": f"无法读取10x数据: {str(fallback_error)}",
-                        "file_type": "directory",
-                        "debug_trace": debug_trace  # 🔥 返回调试跟踪
-                    }
+                n_genes = self._count_lines_skip_comments(features_path)
             
             print(f"DEBUG: Detected {n_cells} cells.")  # 🔥 Loud logging
             
-            # 读取 features.tsv 获取基因信息（使用 _smart_open）
+            # 读取 features.tsv 开头的若干行获取基因名和特征类型（使用 _smart_open）
             debug_logs.append(f"Attempting to read features file: {features_path}")
-            n_genes = 0
             feature_types = []
+            feature_types_sampled = True
             columns = []
             
+            def add_feature_type(parts: List[str]) -> None:
+                feature_type = parts[2] if len(parts) > 2 else 'Gene Expression'
+                if feature_type not in feature_types:
+                    feature_types.append(feature_type)
+            
             try:
                 logger.debug(f"DEBUG: Reading features from: {features_path}")
-                with self._smart_open(features_path) as f:
-                    for line in f:
-                        line = line.strip()
-                        if line and not line.startswith('%') and not line.startswith('#'):
-                            n_genes += 1
-                            parts = line.split('\t')
-                            if len(parts) >= 1:
-                                gene_id = parts[0]
-                                gene_symbol = parts[1] if len(parts) > 1 else gene_id
-                                feature_type = parts[2] if len(parts) > 2 else 'Gene Expression'
-                                
-                                if feature_type not in feature_types:
-                                    feature_types.append(feature_type)
-                                
-                                # 只保存前100个基因名（避免返回过多数据）
-                                if len(columns) < 100:
-                                    columns.append(gene_symbol or gene_id)
-                debug_logs.append(f"Successfully read {n_genes} genes from features.tsv")
+                head_lines = self._read_head_lines(features_path, self.FEATURE_PREVIEW_LINES)
+                for line in head_lines:
+                    parts = line.split('\t')
+                    gene_id = parts[0]
+                    gene_symbol = parts[1] if len(parts) > 1 else gene_id
+                    add_feature_type(parts)
+                    columns.append(gene_symbol or gene_id)
+                debug_logs.append(f"Read {len(columns)} feature names from features.tsv head")
+                
+                if len(head_lines) < self.FEATURE_PREVIEW_LINES:
+                    feature_types_sampled = False
+                elif not str(features_path).endswith('.gz'):
+                    # Antibody / CRISPR 等特征位于文件末尾
+                    tail_lines, whole_file = self._read_tail_lines(features_path, self.FEATURE_TAIL_BYTES)
+                    for line in tail_lines:
+                        add_feature_type(line.split('\t'))
+                    feature_types_sampled = not whole_file
+                    debug_logs.append(f"Read {len(tail_lines)} lines from features.tsv tail")
             except Exception as e:
                 debug_logs.append(f"Error reading features file: {str(e)}")
                 logger.warning(f"⚠️ Failed to read features.tsv: {e}")
-                # 如果读取失败，至少统计行数
-                try:
-                    n_genes = self._count_lines_skip_comments(features_path)
-                    debug_logs.append(f"Fallback: counted {n_genes} genes using line counting")
-                except Exception as count_err:
-                    debug_logs.append(f"Error counting lines in features file: {str(count_err)}")
-                    n_genes = 0
+            
+            sparsity = None
+            if nnz is not None and n_cells and n_genes:
+                sparsity = (1 - nnz / (n_cells * n_genes)) * 100
             
             print(f"DEBUG: Detected {n_genes} genes.")  # 🔥 Loud logging
             debug_logs.append(f"Final counts: {n_cells} cells, {n_genes} genes")
@@ -532,7 +521,10 @@ class TenXDirectoryHandler(BaseFileHandler):
             preview = {
                 "n_cells": n_cells,
                 "n_genes": n_genes,
+                "nnz": nnz,
+                "sparsity": round(sparsity, 2) if sparsity is not None else None,
                 "feature_types": feature_types,
+                "feature_types_sampled": feature_types_sampled,
                 "sample_genes": columns[:10]
             }
             
@@ -557,15 +549,20 @@ class TenXDirectoryHandler(BaseFileHandler):
                 "n_features": n_genes,  # 🔥 关键：确保存在
                 "columns": columns[:20] if columns else None,  # 前20个基因名
                 "head": {
-                    "markdown": f"10x Genomics 数据\n- 细胞数: {n_cells}\n- 基因数: {n_genes}\n- 特征类型: {', '.join(feature_types)}\n- 数据路径: {real_data_path}",
+                    "markdown": f"10x Genomics 数据\n- 细胞数: {n_cells}\n- 基因数: {n_genes}\n- 非零元素: {nnz if nnz is not None else '未知'}\n- 稀疏度: {f'{sparsity:.2f}%' if sparsity is not None else '未知'}\n- 特征类型: {', '.join(feature_types)}{'（抽样）' if feature_types_sampled else ''}\n- 数据路径: {real_data_path}",
                     "json": preview
                 },
+                "nnz": nnz,
+                "sparsity": sparsity,
                 "feature_types": feature_types,
+                "feature_types_sampled": feature_types_sampled,
                 "debug_trace": debug_trace,  # 🔥 返回调试跟踪
                 "data": {
                     "summary": {
                         "n_samples": n_cells,  # 🔥 确保嵌套字典中也存在
                         "n_features": n_genes,  # 🔥 确保嵌套字典中也存在
+                        "nnz": nnz,
+                        "sparsity": round(sparsity, 2) if sparsity is not None else None,
                         "feature_types": feature_types
                     }
                 }
@@ -592,9 +589,16 @@ class AnnDataHandler(BaseFileHandler):
     """
     AnnData (H5AD) 文件检查器（优先级：5）
     
-    检查 .h5ad 文件，使用 backed='r' 模式避免加载全部数据
+    只用 h5py 读取 HDF5 结构，不导入 scanpy/anndata、不构造 AnnData 对象：
+    - 形状、nnz、存储格式来自 X 的属性（稀疏矩阵的 shape 属性和 data 数组长度）
+    - obs/var 列名来自 column-order 属性，基因名只读取 var 索引的前 20 个
+    - obsm/layers 只列出键名
+    - 数值范围从 X 中均匀分布的 VALUE_SAMPLE_CHUNKS 个存储块采样估计
     """
     
+    VALUE_SAMPLE_CHUNKS = 8
+    VALUE_SAMPLE_CHUNK_SIZE = 65536
+    
     def can_handle(self, path: Path) -> bool:
         """检查是否为 H5AD 文件"""
         if not path.is_file():
@@ -614,73 +618,172 @@ class AnnDataHandler(BaseFileHandler):
         except Exception:
             return False
     
+    @staticmethod
+    def _decode(values) -> List[str]:
+        """HDF5 字符串数组 -> Python 字符串列表"""
+        return [v.decode('utf-8', errors='replace') if isinstance(v, bytes) else str(v) for v in values]
+    
+    @staticmethod
+    def _encoding(node) -> str:
+        value = node.attrs.get('encoding-type', node.attrs.get('h5sparse_format', ''))
+        value = value.decode() if isinstance(value, bytes) else str(value)
+        # 旧版 h5sparse 格式只写 "csr" / "csc"
+        return {'csr': 'csr_matrix', 'csc': 'csc_matrix'}.get(value, value)
+    
+    def _dataframe_info(self, node, n_names: int = 0) -> Tuple[Optional[int], List[str], List[str]]:
+        """
+        读取 obs/var 的行数、列名和前 n_names 个索引名（不读取列数据）
+        
+        Returns:
+            (行数, 列名, 索引名)
+        """
+        import h5py
+        
+        if node is None:
+            return None, [], []
+        if isinstance(node, h5py.Dataset):
+            # anndata < 0.7：复合类型数据集，索引为 "index" 字段
+            fields = list(node.dtype.names or [])
+            index_field = next((f for f in ('index', '_index') if f in fields), None)
+            names = self._decode(node[:n_names][index_field]) if index_field and n_names else []
+            return node.shape[0], [f for f in fields if f != index_field], names
+        
+        index_key = node.attrs.get('_index', '_index')
+        index_key = index_key.decode() if isinstance(index_key, bytes) else str(index_key)
+        columns = node.attrs.get('column-order')
+        columns = self._decode(columns) if columns is not None else [k for k in node.keys() if k != index_key]
+        n_rows, names = None, []
+        if index_key in node:
+            index = node[index_key]
+            n_rows = index.shape[0]
+            if n_names:
+                names = self._decode(index[:n_names])
+        return n_rows, columns, names
+    
+    @staticmethod
+    def _chunk_starts(length: int, window: int, n_windows: int) -> List[int]:
+        """在 [0, length) 中均匀分布的窗口起点"""
+        if length <= window * n_windows:
+            return list(range(0, length, max(window, 1)))
+        span = length - window
+        return sorted({span * i // max(n_windows - 1, 1) for i in range(n_windows)})
+    
+    def _sample_values(self, x, encoding: str, shape: Tuple[int, int]) -> Optional[Tuple[np.ndarray, float]]:
+        """
+        从 X 的若干存储块采样数值
+        
+        Returns:
+            (采样值, 采样值代表的比例)；稀疏矩阵只采样非零值，比例为密度 nnz / 总元素数
+        """
+        import h5py
+        
+        n_obs, n_vars = shape
+        if encoding in ('csr_matrix', 'csc_matrix') and isinstance(x, h5py.Group):
+            data = x['data']
+            nnz = data.shape[0]
+            if nnz == 0:
+                return np.zeros(0), 0.0
+            window = (data.chunks[0] if data.chunks else None) or self.VALUE_SAMPLE_CHUNK_SIZE
+            window = min(window, self.VALUE_SAMPLE_CHUNK_SIZE)
+            values = np.concatenate([
+                data[start:start + window] for start in self._chunk_starts(nnz, window, self.VALUE_SAMPLE_CHUNKS)
+            ])
+            return values.astype(float, copy=False), nnz / (n_obs * n_vars)
+        
+        if isinstance(x, h5py.Dataset) and x.ndim == 2:
+            rows, cols = x.chunks or (min(100, n_obs), min(1000, n_vars))
+            rows, cols = max(1, min(rows, 1000)), max(1, min(cols, 1000))
+            blocks = [
+                x[start:start + rows, :cols]
+                for start in self._chunk_starts(n_obs, rows, self.VALUE_SAMPLE_CHUNKS)
+            ]
+            return np.concatenate([b.reshape(-1) for b in blocks]).astype(float, copy=False), 1.0
+        return None
+    
+    @staticmethod
+    def _value_range(values: np.ndarray, density: float) -> Dict[str, Any]:
+        """
+        采样值的 min/max/mean/median（稀疏矩阵按密度把隐含的 0 计入）
+        """
+        values = values[np.isfinite(values)]
+        if density <= 0 or values.size == 0:
+            return {"min": 0.0, "max": 0.0, "mean": 0.0, "median": 0.0, "sampled": True}
+        zero_weight = max(0.0, 1.0 - density)
+        points = np.append(values, 0.0)
+        weights = np.append(np.full(values.size, density / values.size), zero_weight)
+        order = np.argsort(points, kind="stable")
+        median = points[order][min(np.searchsorted(np.cumsum(weights[order]), 0.5), points.size - 1)]
+        has_zeros = zero_weight > 0
+        return {
+            "min": float(min(values.min(), 0.0) if has_zeros else values.min()),
+            "max": float(max(values.max(), 0.0) if has_zeros else values.max()),
+            "mean": float(values.mean() * density),
+            "median": float(median),
+            "sampled": True
+        }
+    
     def inspect(self, path: Path) -> Dict[str, Any]:
         """检查 H5AD 文件"""
         try:
-            import scanpy as sc
-            
-            logger.info(f"🔍 [AnnDataHandler] Loading H5AD: {path}")
-            
-            # 使用 backed='r' 模式（只读，不加载全部数据）
-            try:
-                adata = sc.read_h5ad(str(path), backed='r')
-            except Exception as e:
-                logger.warning(f"⚠️ Backed mode failed: {e}, using normal mode")
-                adata = sc.read_h5ad(str(path))
-            
-            if adata is None:
-                return {
-                    "status": "error",
-                    "error": "数据读取失败：返回了空对象",
-                    "file_type": "anndata"
-                }
-            
-            if adata.n_obs == 0 or adata.n_vars == 0:
-                return {
-                    "status": "error",
-                    "error": f"数据为空: {adata.n_obs} 个细胞, {adata.n_vars} 个基因",
-                    "file_type": "anndata",
-                    "n_obs": adata.n_obs,
-                    "n_vars": adata.n_vars
-                }
-            
-            # 提取基本信息
-            n_obs = adata.n_obs
-            n_vars = adata.n_vars
-            obs_keys = list(adata.obs.columns) if hasattr(adata.obs, 'columns') else []
-            var_keys = list(adata.var.columns) if hasattr(adata.var, 'columns') else []
-            
-            # 获取基因名（前20个）
-            columns = list(adata.var_names[:20]) if hasattr(adata, 'var_names') else []
+            import h5py
             
-            # 计算稀疏度
-            sparsity = 0
-            if hasattr(adata.X, 'nnz'):
-                total_cells = n_obs * n_vars
-                sparsity = (1 - adata.X.nnz / total_cells) * 100 if total_cells > 0 else 0
+            logger.info(f"🔍 [AnnDataHandler] Reading H5AD structure: {path}")
             
-            # 检查数据值范围（采样）
-            data_range = {}
-            try:
-                sample_size = min(1000, n_obs * n_vars)
-                if sample_size > 0:
-                    if hasattr(adata.X, 'toarray'):
-                        sample_data = adata.X[:min(100, n_obs), :min(100, n_vars)].toarray()
-                    else:
-                        sample_data = adata.X[:min(100, n_obs), :min(100, n_vars)]
-                    
-                    data_range = {
-                        "min": float(np.min(sample_data)),
-                        "max": float(np.max(sample_data)),
-                        "mean": float(np.mean(sample_data)),
-                        "median": float(np.median(sample_data))
+            with h5py.File(str(path), 'r') as f:
+                x = f.get('X')
+                encoding = self._encoding(x) if x is not None else ''
+                
+                n_obs_index, obs_keys, _ = self._dataframe_info(f.get('obs'))
+                n_vars_index, var_keys, columns = self._dataframe_info(f.get('var'), n_names=20)
+                
+                # 形状：稀疏矩阵读 shape 属性，稠密矩阵读数据集形状，没有 X 时用 obs/var 索引长度
+                shape = None
+                nnz = None
+                if isinstance(x, h5py.Group):
+                    shape_attr = x.attrs.get('shape', x.attrs.get('h5sparse_shape'))
+                    if shape_attr is not None:
+                        shape = tuple(int(v) for v in shape_attr)
+                    if 'data' in x:
+                        nnz = int(x['data'].shape[0])
+                elif isinstance(x, h5py.Dataset) and x.ndim == 2:
+                    shape = tuple(int(v) for v in x.shape)
+                n_obs, n_vars = shape if shape else (n_obs_index or 0, n_vars_index or 0)
+                
+                obsm = f.get('obsm')
+                if isinstance(obsm, h5py.Group):
+                    obsm_keys = list(obsm.keys())
+                else:
+                    obsm_keys = list(obsm.dtype.names or []) if obsm is not None else []
+                layers = f.get('layers')
+                layer_keys = list(layers.keys()) if isinstance(layers, h5py.Group) else []
+                
+                if n_obs == 0 or n_vars == 0:
+                    return {
+                        "status": "error",
+                        "error": f"数据为空: {n_obs} 个细胞, {n_vars} 个基因",
+                        "file_type": "anndata",
+                        "n_obs": n_obs,
+                        "n_vars": n_vars
                     }
-            except Exception as e:
-                logger.warning(f"⚠️ Could not calculate data range: {e}")
+                
+                # 计算稀疏度
+                sparsity = 0
+                if nnz is not None:
+                    total_cells = n_obs * n_vars
+                    sparsity = (1 - nnz / total_cells) * 100 if total_cells > 0 else 0
+                
+                # 检查数据值范围（按存储块采样）
+                data_range = {}
+                try:
+                    sampled = self._sample_values(x, encoding, (n_obs, n_vars)) if x is not None else None
+                    if sampled is not None:
+                        data_range = self._value_range(*sampled)
+                except Exception as e:
+                    logger.warning(f"⚠️ Could not calculate data range: {e}")
             
             # 检查是否有聚类结果
             has_clusters = 'leiden' in obs_keys or 'louvain' in obs_keys
-            has_umap = 'X_umap' in adata.obsm_keys() if hasattr(adata, 'obsm_keys') else False
+            has_umap = 'X_umap' in obsm_keys
             
             # 构建预览
             preview = {
@@ -688,6 +791,7 @@ class AnnDataHandler(BaseFileHandler):
                 "n_vars": n_vars,
                 "obs_keys": obs_keys[:10],
                 "var_keys": var_keys[:10],
+                "obsm_keys": obsm_keys[:10],
                 "sparsity": round(sparsity, 2),
                 "has_clusters": has_clusters,
                 "has_umap": has_umap
@@ -712,6 +816,10 @@ class AnnDataHandler(BaseFileHandler):
                 },
                 "obs_keys": obs_keys,
                 "var_keys": var_keys,
+                "obsm_keys": obsm_keys,
+                "layers": layer_keys,
+                "x_encoding": encoding or ("array" if x is not None else None),
+                "nnz": nnz,
                 "sparsity": sparsity,
                 "has_clusters": has_clusters,
                 "has_umap": has_umap,
@@ -728,7 +836,7 @@ class AnnDataHandler(BaseFileHandler):
         except ImportError:
             return {
                 "status": "error",
-                "error": "scanpy not installed. Please install: pip install scanpy",
+                "error": "h5py not installed. Please install: pip install h5py",
                 "file_type": "anndata"
             }
         except Exception as e:
@@ -746,30 +854,176 @@ class TabularHandler(BaseFileHandler):
     表格文件检查器（优先级：1）
     
     支持 CSV, TSV, TXT, XLSX 文件
+
+    文本表格不整体加载：
+    - 行数：按块统计换行符（不解析内容）
+    - 列类型与预览：从文件开头的样本（最多 SAMPLE_ROWS 行）推断
+    - 数值统计：不超过 TABULAR_FULL_SCAN_MAX_MB（默认 64MB）的文件用 pyarrow 多线程
+      CSV 读取器流式扫描全部数值列，缺失数、最小/最大值和均值是精确的；更大的文件从
+      均匀分布在整个文件中的 TABULAR_SAMPLE_BLOCKS 个字节块（共 TABULAR_SAMPLE_MB，
+      默认 8MB）估计（is_sampled=True）
+    - 中位数和分位数由按行数比例抽取的值样本近似
     """
     
     # 支持的文件扩展名
     SUPPORTED_EXTENSIONS = {'.csv', '.tsv', '.txt', '.xlsx', '.xls'}
+    EXCEL_EXTENSIONS = {'.xlsx', '.xls'}
+
+    SAMPLE_ROWS = 1000
+    PREVIEW_ROWS = 10
+    # 预览只渲染全部元数据列 + 前 PREVIEW_COLUMNS 列（数千列的宽表渲染本身就要数秒）
+    PREVIEW_COLUMNS = 50
+    MIN_ROWS_PER_BLOCK = 64
+    HEAD_BYTES = 2 * 1024 * 1024
+    SCAN_BLOCK_BYTES = 8 * 1024 * 1024
+    QUANTILE_SAMPLE_SIZE = 100_000
+    QUANTILES = (0.01, 0.25, 0.5, 0.75, 0.99)
     
     def can_handle(self, path: Path) -> bool:
         """检查是否为支持的表格文件"""
         if not path.is_file():
             return False
         return path.suffix.lower() in self.SUPPORTED_EXTENSIONS
-    
-    def _count_csv_lines(self, file_path: Path, separator: str = ',') -> Optional[int]:
-        """统计 CSV/TSV 文件行数（避免加载全部数据）"""
+
+    @staticmethod
+    def _env_float(name: str, default: float) -> float:
         try:
-            count = 0
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                # 跳过第一行（表头）
-                next(f, None)
-                for _ in f:
-                    count += 1
-            return count
-        except Exception:
-            return None
-    
+            return float(os.getenv(name, str(default)))
+        except ValueError:
+            return default
+
+    def _count_rows_fast(self, file_path: Path) -> int:
+        """按块统计换行符得到数据行数（不含表头，不解码、不解析）"""
+        newlines = 0
+        last_byte = b"\n"
+        with open(file_path, 'rb') as f:
+            while True:
+                block = f.read(self.SCAN_BLOCK_BYTES)
+                if not block:
+                    break
+                newlines += block.count(b"\n")
+                last_byte = block[-1:]
+        # 最后一行没有换行符时也算一行
+        lines = newlines + (0 if last_byte == b"\n" else 1)
+        return max(0, lines - 1)
+
+    def _read_sample(self, file_path: Path, separator: str):
+        """
+        读取文件开头的样本（最多 SAMPLE_ROWS 行，按字节上限截断到完整行）
+
+        Returns:
+            (样本 DataFrame, 样本是否覆盖了整个文件, 样本字节数)
+        """
+        import io
+        import pandas as pd
+
+        with open(file_path, 'rb') as f:
+            data = f.read(self.HEAD_BYTES)
+            # 超宽表：保证至少有表头 + 预览行
+            while data.count(b"\n") <= self.PREVIEW_ROWS and len(data) < 16 * self.HEAD_BYTES:
+                more = f.read(self.HEAD_BYTES)
+                if not more:
+                    break
+                data += more
+            at_eof = not f.read(1)
+        if not at_eof and b"\n" in data:
+            data = data[:data.rindex(b"\n") + 1]
+        df = pd.read_csv(io.BytesIO(data), sep=separator, nrows=self.SAMPLE_ROWS, encoding_errors='ignore')
+        return df, at_eof and len(df) < self.SAMPLE_ROWS, len(data)
+
+    def _scan_full(self, file_path: Path, separator: str, names: List[str],
+                   numeric_names: List[str], total_rows: int) -> "_NumericSummary":
+        """流式扫描全部数值列（pyarrow 多线程 CSV 读取器；失败时回退为 pandas 分块读取）"""
+        try:
+            import pyarrow as pa
+            import pyarrow.csv as pacsv
+            reader = pacsv.open_csv(
+                str(file_path),
+                read_options=pacsv.ReadOptions(
+                    column_names=names, skip_rows=1, block_size=16 * 1024 * 1024, use_threads=True
+                ),
+                parse_options=pacsv.ParseOptions(delimiter=separator),
+                convert_options=pacsv.ConvertOptions(
+                    include_columns=numeric_names,
+                    column_types={name: pa.float64() for name in numeric_names}
+                )
+            )
+            summary = _NumericSummary(self.QUANTILE_SAMPLE_SIZE)
+            for batch in reader:
+                summary.update(self._batch_to_array(batch), total_rows)
+            return summary
+        except ImportError:
+            pass
+        except Exception as e:
+            # 样本之后才出现的类型冲突（如 "n.d."）、引号内换行等
+            logger.info(f"ℹ️ [TabularHandler] pyarrow 流式读取失败，回退为 pandas 分块读取: {e}")
+
+        import pandas as pd
+        summary = _NumericSummary(self.QUANTILE_SAMPLE_SIZE)
+        positions = [names.index(name) for name in numeric_names]
+        for chunk in pd.read_csv(
+            file_path, sep=separator, header=0, names=names, usecols=positions,
+            chunksize=200_000, encoding_errors='ignore'
+        ):
+            summary.update(chunk.apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float), total_rows)
+        return summary
+
+    def _iter_block_samples(self, file_path: Path, separator: str, names: List[str],
+                            numeric_names: List[str], start: int, file_size: int, row_bytes: float):
+        """从均匀分布在文件中的字节块解析数值列（不完整的首尾行丢弃，坏行跳过）"""
+        import io
+        import pyarrow as pa
+        import pyarrow.csv as pacsv
+
+        budget = int(self._env_float("TABULAR_SAMPLE_MB", 8) * 1024 * 1024)
+        n_blocks = max(1, int(self._env_float("TABULAR_SAMPLE_BLOCKS", 16)))
+        # 宽表每块至少包含 MIN_ROWS_PER_BLOCK 行，减少块数（每块的解析开销与列数成正比）
+        block_bytes = max(budget // n_blocks, int(row_bytes * self.MIN_ROWS_PER_BLOCK))
+        n_blocks = max(1, min(n_blocks, budget // max(block_bytes, 1)))
+        span = max(0, file_size - start - block_bytes)
+        parse_options = pacsv.ParseOptions(delimiter=separator, invalid_row_handler=lambda row: "skip")
+        convert_options = pacsv.ConvertOptions(
+            include_columns=numeric_names,
+            column_types={name: pa.float64() for name in numeric_names}
+        )
+
+        with open(file_path, 'rb') as f:
+            for i in range(n_blocks):
+                f.seek(start + (span * i // max(1, n_blocks - 1) if n_blocks > 1 else 0))
+                block = f.read(block_bytes)
+                first, last = block.find(b"\n"), block.rfind(b"\n")
+                if first < 0 or last <= first:
+                    continue
+                chunk = block[first + 1:last + 1]
+                try:
+                    table = pacsv.read_csv(
+                        io.BytesIO(chunk),
+                        # 整块作为一个批次解析（每个批次的开销与列数成正比）
+                        read_options=pacsv.ReadOptions(
+                            column_names=names, use_threads=True, block_size=len(chunk) + 1
+                        ), parse_options=parse_options,
+                        convert_options=convert_options
+                    )
+                except Exception as e:
+                    logger.debug(f"[TabularHandler] 跳过无法解析的采样块 {i}: {e}")
+                    continue
+                for batch in table.combine_chunks().to_batches():
+                    yield self._batch_to_array(batch)
+
+    @staticmethod
+    def _batch_to_array(batch) -> np.ndarray:
+        """RecordBatch -> 二维 float 数组（行 × 数值列）"""
+        if batch.num_columns == 0:
+            return np.empty((batch.num_rows, 0))
+        try:
+            return batch.to_tensor(null_to_nan=True, row_major=False).to_numpy()
+        except (AttributeError, TypeError, NotImplementedError):
+            # pyarrow < 16 没有 RecordBatch.to_tensor(null_to_nan=...)
+            pass
+        return np.column_stack([
+            column.to_numpy(zero_copy_only=False).astype(float, copy=False) for column in batch.columns
+        ])
+
     def inspect(self, path: Path) -> Dict[str, Any]:
         """检查表格文件"""
         try:
@@ -778,81 +1032,97 @@ class TabularHandler(BaseFileHandler):
             logger.info(f"🔍 [TabularHandler] Loading: {path}")
             
             absolute_path = str(path.resolve())
-            file_size_mb = path.stat().st_size / (1024 * 1024)
+            file_size = path.stat().st_size
+            file_size_mb = file_size / (1024 * 1024)
+            is_excel = path.suffix.lower() in self.EXCEL_EXTENSIONS
             
             # 检测分隔符
             separator = ','
-            try:
-                with open(absolute_path, 'r', encoding='utf-8', errors='ignore') as f:
-                    first_line = f.readline()
-                    if '\t' in first_line:
-                        separator = '\t'
-                    elif ',' in first_line:
-                        separator = ','
-                    elif ';' in first_line:
-                        separator = ';'
-            except Exception:
-                pass
-            
-            # 读取预览（前10行）
-            LARGE_FILE_THRESHOLD_MB = 200
-            preview_rows = 10
-            
-            if file_size_mb < LARGE_FILE_THRESHOLD_MB:
-                # 小文件：完整读取
-                df = pd.read_csv(absolute_path, sep=separator)
-                is_sampled = False
-                total_rows = len(df)
+            if not is_excel:
+                try:
+                    with open(absolute_path, 'r', encoding='utf-8', errors='ignore') as f:
+                        first_line = f.readline()
+                        if '\t' in first_line:
+                            separator = '\t'
+                        elif ',' in first_line:
+                            separator = ','
+                        elif ';' in first_line:
+                            separator = ';'
+                except Exception:
+                    pass
+            
+            preview_rows = self.PREVIEW_ROWS
+            
+            if is_excel:
+                # Excel 无法流式读取：整表读取（此类文件通常很小）
+                df = pd.read_excel(absolute_path)
+                sample_is_complete, sample_bytes = True, file_size
             else:
-                # 大文件：采样读取
-                df = pd.read_csv(absolute_path, sep=separator, nrows=preview_rows)
-                is_sampled = True
-                # 尝试统计总行数
-                total_rows = self._count_csv_lines(path, separator)
-                if total_rows is None:
-                    total_rows = len(df)  # 回退到采样行数
+                df, sample_is_complete, sample_bytes = self._read_sample(path, separator)
             
-            # 识别列类型
+            # 识别列类型（从样本推断）
             metadata_cols = []
             numeric_cols = []
             
-            for col in df.columns:
-                if pd.api.types.is_numeric_dtype(df[col]):
+            numeric_positions = []
+            
+            for i, (col, dtype) in enumerate(df.dtypes.items()):
+                if pd.api.types.is_numeric_dtype(dtype):
                     numeric_cols.append(col)
+                    numeric_positions.append(i)
                 else:
                     metadata_cols.append(col)
+            sample_values = df.iloc[:, numeric_positions].to_numpy(dtype=float)
+
+            full_scan_max_mb = self._env_float("TABULAR_FULL_SCAN_MAX_MB", 64)
+            if sample_is_complete or not numeric_cols:
+                total_rows = len(df) if sample_is_complete else self._count_rows_fast(path)
+                is_sampled = not sample_is_complete
+                summary = _NumericSummary(self.QUANTILE_SAMPLE_SIZE)
+                summary.update(sample_values, total_rows)
+            else:
+                total_rows = self._count_rows_fast(path)
+                # pyarrow 按位置命名列，避免重复或空列名
+                names = [f"c{i}" for i in range(len(df.columns))]
+                numeric_names = [names[i] for i in numeric_positions]
+                is_sampled = file_size_mb > full_scan_max_mb
+                if is_sampled:
+                    summary = _NumericSummary(self.QUANTILE_SAMPLE_SIZE)
+                    summary.update(sample_values, total_rows)
+                    try:
+                        for values in self._iter_block_samples(
+                            path, separator, names, numeric_names, sample_bytes, file_size,
+                            row_bytes=sample_bytes / max(len(df), 1)
+                        ):
+                            summary.update(values, total_rows)
+                    except ImportError:
+                        logger.info("ℹ️ [TabularHandler] pyarrow 未安装，数值统计仅基于开头样本")
+                else:
+                    summary = self._scan_full(path, separator, names, numeric_names, total_rows)
             
-            n_samples = total_rows if not is_sampled else (total_rows if total_rows else len(df))
+            n_samples = total_rows
             n_features = len(numeric_cols)
             
             # 缺失值统计
-            missing_rate = 0
-            if len(numeric_cols) > 0:
-                numeric_data = df[numeric_cols]
-                total_cells = numeric_data.size
-                missing_cells = numeric_data.isnull().sum().sum()
-                missing_rate = (missing_cells / total_cells * 100) if total_cells > 0 else 0
+            missing_rate = summary.missing_rate()
             
             # 数据范围
-            data_range = {}
-            if len(numeric_cols) > 0:
-                numeric_data = df[numeric_cols]
-                data_range = {
-                    "min": float(numeric_data.min().min()),
-                    "max": float(numeric_data.max().max()),
-                    "mean": float(numeric_data.mean().mean()),
-                    "median": float(numeric_data.median().median())
-                }
+            data_range = summary.data_range(self.QUANTILES) if numeric_cols else {}
             
             # 构建预览
+            metadata_set = set(metadata_cols)
+            preview_positions = [
+                i for i, col in enumerate(df.columns) if i < self.PREVIEW_COLUMNS or col in metadata_set
+            ]
+            preview_df = df.iloc[:preview_rows, preview_positions]
             try:
                 from tabulate import tabulate
-                head_markdown = tabulate(df.head(preview_rows), headers='keys', tablefmt='grid', showindex=False)
+                head_markdown = tabulate(preview_df, headers='keys', tablefmt='grid', showindex=False)
             except ImportError:
                 # 回退到 CSV 格式
-                head_markdown = df.head(preview_rows).to_csv(index=False)
+                head_markdown = preview_df.to_csv(index=False)
             
-            head_json = df.head(preview_rows).to_dict(orient='records')
+            head_json = preview_df.to_dict(orient='records')
             
             return {
                 "status": "success",
@@ -883,7 +1153,8 @@ class TabularHandler(BaseFileHandler):
                         "n_features": n_features,
                         "missing_rate": round(missing_rate, 2),
                         "data_range": data_range,
-                        "is_sampled": is_sampled
+                        "is_sampled": is_sampled,
+                        "rows_scanned": summary.rows
                     }
                 }
             }
@@ -904,6 +1175,70 @@ class TabularHandler(BaseFileHandler):
             }
 
 
+class _NumericSummary:
+    """
+    数值列的流式统计
+
+    缺失数、最小/最大值、和（均值）逐批精确累加；中位数和分位数从按行数比例抽取的
+    值样本（总量约 sample_size）近似计算。
+    """
+
+    def __init__(self, sample_size: int, seed: int = 0):
+        self.sample_size = sample_size
+        self.rng = np.random.default_rng(seed)
+        self.rows = 0
+        self.cells = 0
+        self.missing = 0
+        self.count = 0
+        self.total = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.samples: List[np.ndarray] = []
+
+    def update(self, values: np.ndarray, total_rows: int) -> None:
+        """
+        累加一批数据
+
+        Args:
+            values: 二维数组（行 × 数值列），缺失值为 NaN
+            total_rows: 文件总行数（用于分配每批的抽样量）
+        """
+        if values.size == 0:
+            self.rows += values.shape[0]
+            return
+        finite = np.isfinite(values)
+        valid = values[finite]
+        self.rows += values.shape[0]
+        self.cells += values.size
+        self.missing += int(np.isnan(values).sum())
+        if valid.size == 0:
+            return
+        self.count += valid.size
+        self.total += float(valid.sum())
+        self.min = min(self.min, float(valid.min()))
+        self.max = max(self.max, float(valid.max()))
+        k = min(valid.size, int(np.ceil(self.sample_size * values.shape[0] / max(total_rows, 1))))
+        self.samples.append(valid if k >= valid.size else self.rng.choice(valid, k, replace=False))
+
+    def missing_rate(self) -> float:
+        """缺失值百分比"""
+        return self.missing / self.cells * 100 if self.cells else 0
+
+    def data_range(self, quantiles: Tuple[float, ...]) -> Dict[str, Any]:
+        """min / max / mean / median，以及近似分位数"""
+        if self.count == 0:
+            return {"min": None, "max": None, "mean": None, "median": None, "quantiles": {}}
+        sample = np.concatenate(self.samples)
+        values = np.quantile(sample, quantiles)
+        return {
+            "min": self.min,
+            "max": self.max,
+            "mean": self.total / self.count,
+            "median": float(np.median(sample)),
+            "quantiles": {f"p{int(round(q * 100))}": float(v) for q, v in zip(quantiles, values)}
+        }
+
+
 # ============================================
 # Part 3: The Facade (FileInspector)
 # ============================================
@@ -937,6 +1272,9 @@ class FileInspector:
             "./uploads",
             "./data"
         ]
+        # 配置的上传目录优先
+        if str(self.upload_dir) not in self.common_mount_paths:
+            self.common_mount_paths.insert(0, str(self.upload_dir))
         
         # 获取所有已注册的检查器
         self.handlers = [handler_class() for handler_class in _registry.get_handlers()]
@@ -1033,6 +1371,64 @@ class FileInspector:
         # Step 2: 转换为 Path 对象
         path = Path(actual_path)
         
+        # 🔥 元数据缓存：同一文件（路径 + 大小 + mtime + 检查器版本）不重复检查
+        cache = get_metadata_cache()
+        cache_key = str(path.resolve())
+        fingerprint = file_fingerprint(cache_key) if cache else None
+        if fingerprint:
+            cached = cache.get(cache_key, fingerprint, INSPECTOR_VERSION)
+            if cached is not None:
+                logger.info(f"⚡ [FileInspector] 元数据缓存命中: {path.name}")
+                return cached
+        
+        # 🔥 内容缓存：重复上传的同一内容（blob 存储中的硬链接）直接复用已有的检查结果
+        content_key = self._content_key(path) if fingerprint else None
+        if content_key:
+            cached = cache.get(content_key, CONTENT_FINGERPRINT, INSPECTOR_VERSION)
+            if cached is not None:
+                logger.info(f"⚡ [FileInspector] 内容缓存命中（重复上传）: {path.name}")
+                result = _rebase_paths(cached, cached.get("file_path"), cache_key)
+                cache.put(cache_key, fingerprint, INSPECTOR_VERSION, result)
+                return result
+        
+        # 🔥 同一文件的并发检查只执行一次：后台上传检查进行中时，对话请求直接等待其结果
+        with _inflight_lock:
+            future = _inflight.get(cache_key)
+            is_owner = future is None
+            if is_owner:
+                future = Future()
+                _inflight[cache_key] = future
+        if not is_owner:
+            logger.info(f"⏳ [FileInspector] 等待进行中的检查: {path.name}")
+            return dict(future.result())
+        
+        try:
+            result = self._run_handlers(path)
+            if result.get("status") == "success" and fingerprint:
+                cache.put(cache_key, fingerprint, INSPECTOR_VERSION, result)
+                if content_key:
+                    cache.put(content_key, CONTENT_FINGERPRINT, INSPECTOR_VERSION, result)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with _inflight_lock:
+                _inflight.pop(cache_key, None)
+    
+    def _content_key(self, path: Path) -> Optional[str]:
+        """上传目录中文件或目录的内容键（内容不完全来自 blob 存储时返回 None）"""
+        try:
+            if not path.resolve().is_relative_to(self.upload_dir.resolve()):
+                return None
+        except OSError:
+            return None
+        blob_store = get_blob_store(str(self.upload_dir))
+        return blob_store.content_key(str(path)) if blob_store else None
+    
+    def _run_handlers(self, path: Path) -> Dict[str, Any]:
+        """按优先级尝试各检查器（不经缓存）"""
         # Step 3: 遍历所有检查器，找到第一个可以处理的
         for handler in self.handlers:
             try:
@@ -1083,3 +1479,108 @@ class FileInspector:
             "file_type": "unknown",
             "file_path": str(path.resolve())
         }
+    
+    def invalidate(self, file_path: str) -> None:
+        """
+        删除文件的缓存元数据（文件被原地修改但大小和 mtime 未变时使用）
+        
+        Args:
+            file_path: 文件路径（相对或绝对）
+        """
+        cache = get_metadata_cache()
+        actual_path, _ = self._resolve_actual_path(file_path)
+        if cache and actual_path:
+            cache.invalidate(str(Path(actual_path).resolve()))
+    
+    def generate_metadata(self, file_path: str) -> Optional[Dict[str, Any]]:
+        """
+        生成上传文件的元数据（上传接口与 Agent 使用，经元数据缓存）
+        
+        Args:
+            file_path: 文件路径（相对 upload_dir 或绝对路径）
+        
+        Returns:
+            inspect_file 的结果，附加 size_mb / estimated_cells / estimated_genes；
+            检查失败时返回 None
+        """
+        path = Path(file_path)
+        if not path.is_absolute() and (self.upload_dir / path).exists():
+            path = self.upload_dir / path
+        
+        result = self.inspect_file(str(path))
+        if result.get("status") != "success":
+            logger.warning(f"⚠️ [FileInspector] 无法生成元数据: {file_path}: {result.get('error', '')[:200]}")
+            return None
+        
+        metadata = dict(result)
+        resolved = Path(metadata.get("file_path", str(path)))
+        if resolved.is_dir():
+            size_bytes = sum(c.stat().st_size for c in resolved.rglob("*") if c.is_file())
+        else:
+            size_bytes = resolved.stat().st_size if resolved.exists() else 0
+        metadata["size_mb"] = round(size_bytes / (1024 * 1024), 2)
+        if metadata.get("n_obs") is not None:
+            metadata["estimated_cells"] = metadata["n_obs"]
+        if metadata.get("n_vars") is not None:
+            metadata["estimated_genes"] = metadata["n_vars"]
+        return metadata
+    
+    def _read_head(self, path: Path, n_lines: int = 10) -> List[str]:
+        """
+        读取文本文件的前 N 行（自动处理 gzip）
+        
+        Args:
+            path: 文件路径
+            n_lines: 行数
+        
+        Returns:
+            行列表（不含换行符）
+        """
+        opener = gzip.open if str(path).endswith(".gz") else open
+        lines = []
+        with opener(path, "rt", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                lines.append(line.rstrip("\n\r"))
+                if len(lines) >= n_lines:
+                    break
+        return lines
+
+
+# 进行中的检查（按解析后的绝对路径），进程内所有 FileInspector 实例共享
+def _rebase_paths(value: Any, old_root: Optional[str], new_root: str) -> Any:
+    """把检查结果中以 old_root 开头的路径替换为 new_root（内容缓存命中时用于新的上传路径）"""
+    if not old_root or old_root == new_root:
+        return value
+    if isinstance(value, dict):
+        return {k: _rebase_paths(v, old_root, new_root) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_rebase_paths(v, old_root, new_root) for v in value]
+    if isinstance(value, str):
+        return value.replace(old_root, new_root)
+    return value
+
+
+_inflight: Dict[str, Future] = {}
+_inflight_lock = threading.Lock()
+
+_inspectors: Dict[str, FileInspector] = {}
+_inspectors_lock = threading.Lock()
+
+
+def get_file_inspector(upload_dir: Optional[str] = None) -> FileInspector:
+    """
+    获取共享的 FileInspector 实例（按上传目录复用，避免每次调用都重新构造检查器）
+    
+    Args:
+        upload_dir: 上传目录（默认环境变量 UPLOAD_DIR，未设置时为 /app/uploads）
+    
+    Returns:
+        FileInspector 实例
+    """
+    upload_dir = upload_dir or os.getenv("UPLOAD_DIR", "/app/uploads")
+    with _inspectors_lock:
+        inspector = _inspectors.get(upload_dir)
+        if inspector is None:
+            inspector = FileInspector(upload_dir)
+            _inspectors[upload_dir] = inspector
+        return inspector
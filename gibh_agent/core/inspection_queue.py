@@ -0,0 +1,275 @@
+"""
+后台文件检查队列 - 上传后异步生成文件元数据
+
+上传接口在文件落盘后立即返回批次 ID，检查任务提交到有界线程池并行执行（检查主要是
+文件 I/O 和 pyarrow / h5py 调用）。线程池与对话请求在同一进程内：FileInspector 对同一
+文件的并发检查只执行一次，对话请求会直接等待进行中的后台检查，完成后经元数据缓存复用。
+
+结果获取：
+- 轮询：InspectionQueue.get_status() -> GET /api/inspections/{batch_id}
+- 推送：InspectionQueue.subscribe() -> GET /api/inspections/{batch_id}/events（SSE）
+  事件类型：inspection_finished（每个文件）/ batch_finished（批次全部完成）
+
+批次状态同时写入上传目录的 .inspections/<batch_id>.json（多 worker 共享）：上传请求和
+后续的轮询 / SSE 请求可能落到不同的 gunicorn worker，其他 worker 通过 load_status() /
+follow_events() 读取该文件。
+
+环境变量：
+- INSPECTION_WORKERS: 检查线程数（默认 4）
+"""
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
+
+from .file_inspector import get_file_inspector
+from .run_manager import _put_or_drop
+
+logger = logging.getLogger(__name__)
+
+STATE_DIRNAME = ".inspections"
+
+
+class InspectionBatch:
+    """一次上传对应的检查批次"""
+
+    def __init__(self, batch_id: str, file_paths: List[str]):
+        self.batch_id = batch_id
+        self.jobs: List[Dict[str, Any]] = [
+            {
+                "job_id": f"{batch_id}-{i}",
+                "file_path": file_path,
+                "status": "pending",  # pending / running / success / error
+                "metadata": None,
+                "error": None,
+                "elapsed_ms": None
+            }
+            for i, file_path in enumerate(file_paths)
+        ]
+        self.events: List[Dict[str, Any]] = []
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+
+    @property
+    def completed(self) -> bool:
+        return all(job["status"] in ("success", "error") for job in self.jobs)
+
+    def to_status(self) -> Dict[str, Any]:
+        """转换为 /api/inspections/{batch_id} 响应格式"""
+        return {
+            "batch_id": self.batch_id,
+            "completed": self.completed,
+            "total": len(self.jobs),
+            "finished": sum(job["status"] in ("success", "error") for job in self.jobs),
+            "jobs": [dict(job) for job in self.jobs],
+            "created_at": self.created_at,
+            "finished_at": self.finished_at
+        }
+
+
+class InspectionQueue:
+    """
+    后台检查队列
+
+    - submit(): 登记批次并把每个文件的检查提交到线程池
+    - get_batch(): 本进程中的批次
+    - get_status()/follow_events(): 查询任意进程中的批次（读取共享的状态文件）
+    - subscribe()/unsubscribe(): 本进程批次的 SSE 订阅（新订阅者先收到历史事件）
+    """
+
+    def __init__(self, upload_dir: str, max_workers: int = 4, max_batches: int = 500):
+        """
+        Args:
+            upload_dir: 上传目录（相对路径相对于它解析）
+            max_workers: 检查线程数
+            max_batches: 内存中保留的批次数量（超出时淘汰最旧的已完成批次）
+        """
+        self.upload_dir = upload_dir
+        self.max_batches = max_batches
+        self.state_dir = Path(upload_dir) / STATE_DIRNAME
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="inspect")
+        self._batches: Dict[str, InspectionBatch] = {}
+        self._listeners: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, file_paths: List[str]) -> InspectionBatch:
+        """
+        提交一批文件（或 10x 目录）的检查
+
+        Args:
+            file_paths: 文件路径（相对 upload_dir 或绝对路径）
+
+        Returns:
+            检查批次
+        """
+        batch = InspectionBatch(uuid.uuid4().hex[:12], file_paths)
+        with self._lock:
+            self._batches[batch.batch_id] = batch
+            self._prune()
+            self._persist(batch)
+        for job in batch.jobs:
+            self._pool.submit(self._run_job, batch, job)
+        logger.info(f"🔍 [Inspection] 批次 {batch.batch_id}: {len(file_paths)} 个检查任务已提交")
+        return batch
+
+    def get_batch(self, batch_id: str) -> Optional[InspectionBatch]:
+        """本进程中的批次（其他进程的批次见 load_status）"""
+        return self._batches.get(batch_id)
+
+    def get_status(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        """
+        查询批次状态：先查本进程，再读取共享的状态文件
+
+        Returns:
+            /api/inspections/{batch_id} 响应；批次不存在时返回 None
+        """
+        with self._lock:
+            batch = self._batches.get(batch_id)
+            if batch is not None:
+                return batch.to_status()
+        return self.load_status(batch_id)
+
+    def load_status(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        """读取持久化的批次状态（任意进程写入）；不存在或无法解析时返回 None"""
+        if not batch_id or batch_id.startswith(".") or os.path.basename(batch_id) != batch_id:
+            return None
+        try:
+            with open(self.state_dir / f"{batch_id}.json", "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    async def follow_events(
+        self,
+        batch_id: str,
+        poll_interval: float = 0.5,
+        heartbeat_interval: float = 15.0
+    ) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """
+        轮询状态文件生成批次事件（用于在其他进程中检查的批次），直到 batch_finished
+
+        Args:
+            batch_id: 批次 ID
+            poll_interval: 轮询间隔（秒）
+            heartbeat_interval: 空闲多久产出一次 None（心跳）
+
+        Returns:
+            事件迭代器（已完成的文件先各产出一个 inspection_finished）
+        """
+        reported = set()
+        idle = 0.0
+        while True:
+            status = self.load_status(batch_id)
+            if status is None:
+                return
+            new_events = [
+                {"type": "inspection_finished", "batch_id": batch_id, **job}
+                for job in status["jobs"]
+                if job["status"] in ("success", "error") and job["job_id"] not in reported
+            ]
+            for event in new_events:
+                reported.add(event["job_id"])
+                yield event
+            if status["completed"]:
+                yield {"type": "batch_finished", **status}
+                return
+            if new_events:
+                idle = 0.0
+            elif idle >= heartbeat_interval:
+                idle = 0.0
+                yield None
+            await asyncio.sleep(poll_interval)
+            idle += poll_interval
+
+    def _persist(self, batch: InspectionBatch) -> None:
+        """原子写入批次状态（调用方持有锁）"""
+        path = self.state_dir / f"{batch.batch_id}.json"
+        tmp_path = self.state_dir / f".{batch.batch_id}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(batch.to_status(), f, ensure_ascii=False, default=str)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"⚠️ [Inspection] 写入批次状态失败 {batch.batch_id}: {e}")
+
+    def _run_job(self, batch: InspectionBatch, job: Dict[str, Any]) -> None:
+        """在检查线程中执行单个文件的检查"""
+        with self._lock:
+            job["status"] = "running"
+            self._persist(batch)
+        start = time.perf_counter()
+        try:
+            metadata = get_file_inspector(self.upload_dir).generate_metadata(job["file_path"])
+            status = "success" if metadata else "error"
+            error = None if metadata else "无法识别或读取文件"
+        except Exception as e:
+            logger.error(f"❌ [Inspection] 检查失败: {job['file_path']}: {e}", exc_info=True)
+            metadata, status, error = None, "error", str(e)
+
+        with self._lock:
+            job.update({
+                "status": status,
+                "metadata": metadata,
+                "error": error,
+                "elapsed_ms": round((time.perf_counter() - start) * 1000, 1)
+            })
+            event = {"type": "inspection_finished", "batch_id": batch.batch_id, **job}
+            events = [event]
+            if batch.completed and batch.finished_at is None:
+                batch.finished_at = time.time()
+                events.append({"type": "batch_finished", **batch.to_status()})
+            self._persist(batch)
+        for event in events:
+            self._publish(batch, event)
+
+    def _publish(self, batch: InspectionBatch, event: Dict[str, Any]) -> None:
+        """记录事件并推送给订阅者（可在任意线程调用）"""
+        with self._lock:
+            batch.events.append(event)
+            listeners = list(self._listeners.get(batch.batch_id, []))
+        for loop, queue in listeners:
+            try:
+                loop.call_soon_threadsafe(_put_or_drop, queue, event)
+            except RuntimeError:
+                # 事件循环已关闭
+                pass
+
+    def subscribe(self, batch_id: str, maxsize: int = 100) -> asyncio.Queue:
+        """
+        订阅批次事件（需在事件循环中调用）；队列中会先放入历史事件
+
+        Returns:
+            事件队列
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        with self._lock:
+            batch = self._batches.get(batch_id)
+            for event in (batch.events[-maxsize:] if batch else []):
+                queue.put_nowait(event)
+            self._listeners.setdefault(batch_id, []).append((loop, queue))
+        return queue
+
+    def unsubscribe(self, batch_id: str, queue: asyncio.Queue) -> None:
+        with self._lock:
+            listeners = self._listeners.get(batch_id, [])
+            self._listeners[batch_id] = [(l, q) for l, q in listeners if q is not queue]
+            if not self._listeners[batch_id]:
+                del self._listeners[batch_id]
+
+    def _prune(self) -> None:
+        """淘汰最旧的已完成批次（调用方持有锁）"""
+        finished = sorted(
+            (batch for batch in self._batches.values() if batch.completed),
+            key=lambda batch: batch.finished_at or batch.created_at
+        )
+        for batch in finished[: max(0, len(self._batches) - self.max_batches)]:
+            self._batches.pop(batch.batch_id, None)
+            (self.state_dir / f"{batch.batch_id}.json").unlink(missing_ok=True)
@@ -0,0 +1,242 @@
+"""
+LLM 响应缓存 - 确定性调用点（意图识别、路由、参数提取、SOP 规划）的结果复用
+
+这些调用温度低、max_tokens 小、提示词高度重复，每次却要花 1-10 秒。调用点通过
+LLMClient.achat(..., cache="<调用点名称>") 显式开启缓存；未传 cache 的调用不受影响。
+
+缓存键 = SHA-256(base_url, model, 归一化的 messages, 采样参数)：
+- messages 只保留 role / content，content 中的连续空白折叠为一个空格并去掉首尾空白
+  （提示词模板的缩进、换行差异不影响命中）
+- 采样参数为除 messages / stream 外的所有请求参数（temperature、max_tokens 等）
+
+只缓存正常结束（finish_reason 为 stop）且有内容的非流式响应。
+
+后端：
+- memory（默认）：进程内 LRU，条目数超过上限时淘汰最久未使用的条目，过期条目在读取时删除
+- redis：所有 gunicorn worker 和 Celery worker 共享；条目带 TTL，总大小由 Redis 的
+  maxmemory 策略约束。Redis 不可用时按未命中处理（只记录一次警告），不影响调用
+
+环境变量：
+- LLM_CACHE_ENABLED: 是否启用（默认 true）
+- LLM_CACHE_BACKEND: memory / redis（默认 memory）
+- LLM_CACHE_TTL: 条目有效期（秒，默认 3600）
+- LLM_CACHE_MAX_ENTRIES: memory 后端的条目数上限（默认 1000）
+- LLM_CACHE_REDIS_URL: Redis 地址（默认 REDIS_URL，再默认 redis://localhost:6379/0）
+"""
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "gibh:llm_cache:"
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _normalize_content(content: Any) -> Any:
+    if isinstance(content, str):
+        return _WHITESPACE.sub(" ", content).strip()
+    if isinstance(content, list):
+        # 多模态消息：只归一化文本部分
+        return [
+            {**part, "text": _normalize_content(part["text"])} if isinstance(part, dict) and isinstance(part.get("text"), str) else part
+            for part in content
+        ]
+    return content
+
+
+def make_cache_key(base_url: str, params: Dict[str, Any]) -> str:
+    """
+    计算缓存键
+
+    Args:
+        base_url: provider 地址（不同 provider 的同名模型不共享缓存）
+        params: chat.completions.create 的请求参数（含 model、messages）
+
+    Returns:
+        缓存键（带 KEY_PREFIX 前缀）
+    """
+    messages = [
+        {"role": message.get("role"), "content": _normalize_content(message.get("content"))}
+        for message in params.get("messages", [])
+    ]
+    sampling = {k: v for k, v in params.items() if k not in ("messages", "stream")}
+    payload = json.dumps(
+        {"base_url": (base_url or "").rstrip("/"), "messages": messages, "params": sampling},
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str
+    )
+    return KEY_PREFIX + hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class MemoryBackend:
+    """进程内 LRU + TTL"""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    async def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    async def set(self, key: str, value: str, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def size(self) -> Optional[int]:
+        return len(self._entries)
+
+
+class RedisBackend:
+    """Redis（多进程共享）；同步客户端在线程中调用，不受事件循环切换影响"""
+
+    name = "redis"
+
+    def __init__(self, url: str):
+        import redis
+        self.url = url
+        self._client = redis.Redis.from_url(url, socket_timeout=1.0, socket_connect_timeout=1.0)
+
+    async def get(self, key: str) -> Optional[str]:
+        value = await asyncio.to_thread(self._client.get, key)
+        return value.decode("utf-8") if value is not None else None
+
+    async def set(self, key: str, value: str, ttl: float) -> None:
+        await asyncio.to_thread(self._client.set, key, value, ex=max(1, int(ttl)))
+
+    def size(self) -> Optional[int]:
+        return None
+
+
+class LLMResponseCache:
+    """
+    LLM 响应缓存（后端无关的统计和容错）
+
+    - get(): 命中时返回缓存的响应 JSON，未命中或后端出错时返回 None
+    - set(): 写入响应 JSON（后端出错时忽略）
+    - stats(): 按调用点统计命中率
+    """
+
+    def __init__(self, backend, ttl: float = 3600):
+        """
+        Args:
+            backend: MemoryBackend 或 RedisBackend
+            ttl: 条目有效期（秒）
+        """
+        self.backend = backend
+        self.ttl = ttl
+        self.errors = 0
+        self._error_logged = False
+        self._counters: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, site: str, field: str) -> None:
+        counters = self._counters.setdefault(site, {"hits": 0, "misses": 0, "stores": 0})
+        counters[field] += 1
+
+    def _on_error(self, action: str, e: Exception) -> None:
+        self.errors += 1
+        if not self._error_logged:
+            # 只在首次失败时记录，避免刷屏
+            logger.warning(f"⚠️ [LLMCache] {self.backend.name} 后端{action}失败，按未命中处理: {e}")
+            self._error_logged = True
+
+    async def get(self, key: str, site: str) -> Optional[str]:
+        try:
+            value = await self.backend.get(key)
+        except Exception as e:
+            self._on_error("读取", e)
+            value = None
+        self._count(site, "hits" if value is not None else "misses")
+        return value
+
+    async def set(self, key: str, value: str, site: str) -> None:
+        try:
+            await self.backend.set(key, value, self.ttl)
+            self._count(site, "stores")
+            self._error_logged = False
+        except Exception as e:
+            self._on_error("写入", e)
+
+    def stats(self) -> Dict[str, Any]:
+        sites = {}
+        for site, counters in self._counters.items():
+            lookups = counters["hits"] + counters["misses"]
+            sites[site] = {**counters, "hit_rate": round(counters["hits"] / lookups, 3) if lookups else None}
+        hits = sum(c["hits"] for c in self._counters.values())
+        lookups = hits + sum(c["misses"] for c in self._counters.values())
+        return {
+            "enabled": True,
+            "backend": self.backend.name,
+            "ttl": self.ttl,
+            "entries": self.backend.size(),
+            "evictions": getattr(self.backend, "evictions", None),
+            "errors": self.errors,
+            "hits": hits,
+            "lookups": lookups,
+            "hit_rate": round(hits / lookups, 3) if lookups else None,
+            "sites": sites
+        }
+
+
+_llm_cache = None
+_llm_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> Optional[LLMResponseCache]:
+    """
+    获取全局 LLM 响应缓存（由环境变量配置）
+
+    Returns:
+        LLMResponseCache 实例；禁用或初始化失败时返回 None
+    """
+    global _llm_cache
+    if _llm_cache is None:
+        with _llm_cache_lock:
+            if _llm_cache is None:
+                _llm_cache = False
+                if os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes"):
+                    backend_name = os.getenv("LLM_CACHE_BACKEND", "memory").lower()
+                    try:
+                        if backend_name == "redis":
+                            backend = RedisBackend(
+                                os.getenv("LLM_CACHE_REDIS_URL") or os.getenv("REDIS_URL", "redis://localhost:6379/0")
+                            )
+                        else:
+                            backend = MemoryBackend(int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1000")))
+                        _llm_cache = LLMResponseCache(backend, ttl=float(os.getenv("LLM_CACHE_TTL", "3600")))
+                        logger.info(f"✅ [LLMCache] 已启用: {backend.name} 后端, TTL {_llm_cache.ttl:.0f}s")
+                    except Exception as e:
+                        logger.warning(f"⚠️ [LLMCache] 初始化失败，禁用缓存: {e}")
+    return _llm_cache or None
+
+
+def llm_cache_stats() -> Dict[str, Any]:
+    """缓存统计（禁用时只返回 enabled=False）"""
+    cache = get_llm_cache()
+    return cache.stats() if cache is not None else {"enabled": False}
@@ -2,12 +2,20 @@
 统一 LLM 客户端
 支持本地（vLLM/Ollama）和云端（DeepSeek-V3/SiliconFlow）无缝切换
 使用 OpenAI SDK 标准接口
+
+同一 base_url 的所有客户端共享连接池、并发上限和速率限制（见 llm_transport）；
+确定性调用点可通过 achat(..., cache="<调用点名称>") 复用缓存的响应（见 llm_cache）
 """
 from typing import Optional, AsyncIterator, Dict, Any
 from openai import OpenAI, AsyncOpenAI
 from openai.types.chat import ChatCompletion, ChatCompletionChunk
 import os
 import re
+import asyncio
+import weakref
+
+from .llm_transport import get_transport
+from .llm_cache import get_llm_cache, make_cache_key
 
 
 class LLMClient:
@@ -37,7 +45,10 @@ class LLMClient:
         model: str = "gpt-3.5-turbo",
         temperature: float = 0.7,
         max_tokens: int = 2048,
-        timeout: float = 60.0
+        timeout: float = 60.0,
+        max_concurrency: Optional[int] = None,
+        rate_limit_rps: Optional[float] = None,
+        rate_limit_burst: Optional[float] = None
     ):
         """
         初始化 LLM 客户端
@@ -49,6 +60,9 @@ class LLMClient:
             temperature: 温度参数
             max_tokens: 最大 token 数
             timeout: 超时时间（秒）
+            max_concurrency: 该 provider 的并发上限（默认 LLM_MAX_CONCURRENCY，首个客户端的设置生效）
+            rate_limit_rps: 该 provider 每秒请求数（默认 LLM_RATE_LIMIT_RPS）
+            rate_limit_burst: 令牌桶容量（默认 LLM_RATE_LIMIT_BURST）
         """
         self.base_url = base_url
         self.api_key = api_key
@@ -57,17 +71,36 @@ class LLMClient:
         self.max_tokens = max_tokens
         self.timeout = timeout
         
-        # 初始化同步和异步客户端
-        self._sync_client = OpenAI(
-            base_url=base_url,
-            api_key=api_key,
-            timeout=timeout
+        # 🔥 按 base_url 共享连接池和限流器（所有 Agent / Planner 共用）
+        self.transport = get_transport(
+            base_url,
+            max_concurrency=max_concurrency,
+            rate_limit_rps=rate_limit_rps,
+            rate_limit_burst=rate_limit_burst
         )
-        self._async_client = AsyncOpenAI(
+        self._sync_client = OpenAI(
             base_url=base_url,
             api_key=api_key,
-            timeout=timeout
+            timeout=timeout,
+            http_client=self.transport.sync_http_client()
         )
+        # 异步客户端按事件循环创建（连接不能跨事件循环复用）
+        self._async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]" = weakref.WeakKeyDictionary()
+    
+    @property
+    def _async_client(self) -> AsyncOpenAI:
+        """当前事件循环的异步客户端（使用共享的异步连接池）"""
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = AsyncOpenAI(
+                base_url=self.base_url,
+                api_key=self.api_key,
+                timeout=self.timeout,
+                http_client=self.transport.async_http_client()
+            )
+            self._async_clients[loop] = client
+        return client
     
     def chat(
         self,
@@ -99,7 +132,8 @@ class LLMClient:
         }
         params.update(kwargs)
         
-        completion = self._sync_client.chat.completions.create(**params)
+        with self.transport.sync_slot():
+            completion = self._sync_client.chat.completions.create(**params)
         
         # 🔥 Task 2: 强制记录原始 JSON 响应
         try:
@@ -142,6 +176,7 @@ class LLMClient:
         self,
         messages: list,
         stream: bool = False,
+        cache: Optional[str] = None,
         **kwargs
     ) -> ChatCompletion:
         """
@@ -150,6 +185,8 @@ class LLMClient:
         Args:
             messages: 消息列表
             stream: 是否流式输出
+            cache: 调用点名称（如 "router.route"）；提供时开启响应缓存（仅适用于结果
+                只由提示词决定的确定性调用），并按该名称统计命中率
             **kwargs: 其他参数
         
         Returns:
@@ -169,7 +206,18 @@ class LLMClient:
         
         import json
         
-        completion = await self._async_client.chat.completions.create(**params)
+        # 🔥 响应缓存（调用点显式开启，流式调用不缓存）
+        response_cache = get_llm_cache() if cache and not stream else None
+        cache_key = None
+        if response_cache is not None:
+            cache_key = make_cache_key(self.base_url, params)
+            cached = await response_cache.get(cache_key, cache)
+            if cached is not None:
+                logger.info(f"⚡ [LLMCache] 命中缓存: {cache}")
+                return ChatCompletion.model_validate_json(cached)
+        
+        async with self.transport.slot():
+            completion = await self._async_client.chat.completions.create(**params)
         
         # 🔥 Task 2: 强制记录原始 JSON 响应
         try:
@@ -206,6 +254,11 @@ class LLMClient:
             logger.info(f"🔥 [LLM_RAW_DUMP] {str(completion)}")
             logger.warning(f"⚠️ 无法序列化响应对象: {e}")
         
+        # 只缓存正常结束且有内容的响应（截断或空响应下次重新请求）
+        if cache_key is not None and completion.choices and completion.choices[0].finish_reason == "stop" \
+                and completion.choices[0].message.content:
+            await response_cache.set(cache_key, completion.model_dump_json(), cache)
+        
         return completion
     
     async def astream(
@@ -240,12 +293,14 @@ class LLMClient:
         # 🔥 Task 2: 收集流式响应并记录完整 JSON
         collected_content = []
         collected_chunks = []
-        async for chunk in await self._async_client.chat.completions.create(**params):
-            if chunk.choices and chunk.choices[0].delta.content:
-                collected_content.append(chunk.choices[0].delta.content)
-            # 收集完整的 chunk 对象用于 JSON 序列化
-            collected_chunks.append(chunk)
-            yield chunk
+        # 流式响应在读完之前一直占用连接，因此整个读取过程都占用并发名额
+        async with self.transport.slot():
+            async for chunk in await self._async_client.chat.completions.create(**params):
+                if chunk.choices and chunk.choices[0].delta.content:
+                    collected_content.append(chunk.choices[0].delta.content)
+                # 收集完整的 chunk 对象用于 JSON 序列化
+                collected_chunks.append(chunk)
+                yield chunk
         
         # 记录完整的流式响应内容（JSON 格式）
         if collected_chunks:
@@ -348,6 +403,7 @@ class LLMClientFactory:
         
         Args:
             config: 配置字典，包含 base_url, api_key, model 等
+                （可选 max_concurrency / rate_limit_rps / rate_limit_burst）
         
         Returns:
             LLMClient 实例
@@ -358,7 +414,10 @@ class LLMClientFactory:
             model=config.get("model", "gpt-3.5-turbo"),
             temperature=config.get("temperature", 0.7),
             max_tokens=config.get("max_tokens", 2048),
-            timeout=config.get("timeout", 60.0)
+            timeout=config.get("timeout", 60.0),
+            max_concurrency=config.get("max_concurrency"),
+            rate_limit_rps=config.get("rate_limit_rps"),
+            rate_limit_burst=config.get("rate_limit_burst")
         )
     
     @staticmethod
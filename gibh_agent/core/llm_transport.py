@@ -0,0 +1,290 @@
+"""
+LLM HTTP 传输层 - 按 provider（base_url）共享的连接池与限流
+
+所有 LLMClient（各 Agent、WorkflowPlanner、SOPPlanner 共用 Agent 的客户端）按 base_url
+共享同一个 ProviderTransport：
+- 连接池：同步调用共用一个 httpx 客户端；异步调用每个事件循环一个（httpx 的异步连接
+  绑定事件循环，Celery 任务会为每个任务新建事件循环）。保持长连接，安装了 h2 时启用 HTTP/2
+- 并发上限：进程内同时进行的请求数超过上限时在本地排队。名额计数在所有事件循环
+  （包括 Celery 任务各自新建的事件循环）和同步调用之间共享，按先来先得的顺序分配
+- 速率限制：令牌桶（每秒请求数 + 突发量，进程内所有调用共享）。突发请求在本地等待，
+  而不是触发 provider 的 429 后再由 SDK 退避重试
+
+限流参数取自 LLM 配置（settings.yaml 中的 max_concurrency / rate_limit_rps / rate_limit_burst），
+未配置时使用环境变量：
+- LLM_MAX_CONCURRENCY: 每个 provider 同时进行的请求数（默认 8）
+- LLM_RATE_LIMIT_RPS: 每个 provider 每秒请求数（默认 0，不限速）
+- LLM_RATE_LIMIT_BURST: 令牌桶容量（默认等于每秒请求数，至少 1）
+- LLM_MAX_CONNECTIONS / LLM_MAX_KEEPALIVE_CONNECTIONS / LLM_KEEPALIVE_EXPIRY:
+  连接池大小（默认 100 / 20 / 30 秒）
+- LLM_HTTP2: auto / true / false（默认 auto：安装了 h2 时启用）
+"""
+import os
+import time
+import asyncio
+import logging
+import threading
+import importlib.util
+import weakref
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _http2_enabled() -> bool:
+    setting = os.getenv("LLM_HTTP2", "auto").lower()
+    if setting == "auto":
+        return importlib.util.find_spec("h2") is not None
+    return setting in ("1", "true", "yes")
+
+
+class _SlotWaiter:
+    """排队等待并发名额的请求（异步请求持有所在事件循环的 future，同步请求持有 Event）"""
+
+    __slots__ = ("loop", "future", "event", "granted")
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.loop = loop
+        self.future = loop.create_future() if loop is not None else None
+        self.event = threading.Event() if loop is None else None
+        self.granted = False
+
+    def grant(self) -> None:
+        """把名额交给该请求（调用方持有锁；可在任意线程中调用）"""
+        self.granted = True
+        if self.loop is None:
+            self.event.set()
+        else:
+            try:
+                self.loop.call_soon_threadsafe(_resolve, self.future)
+            except RuntimeError:
+                # 事件循环已关闭：请求已不存在，名额在 _release 中交给下一个
+                self.granted = False
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class ProviderTransport:
+    """
+    一个 provider 的共享连接池与限流器
+
+    - sync_http_client() / async_http_client(): 共享的 httpx 客户端（传给 OpenAI SDK）
+    - slot() / sync_slot(): 占用一个请求名额（并发上限 + 令牌桶）
+    """
+
+    def __init__(self, base_url: str, max_concurrency: int, rate_limit_rps: float, rate_limit_burst: Optional[float] = None):
+        """
+        Args:
+            base_url: provider 的 API 地址
+            max_concurrency: 同时进行的请求数上限
+            rate_limit_rps: 每秒请求数（0 表示不限速）
+            rate_limit_burst: 令牌桶容量（默认等于每秒请求数，至少 1）
+        """
+        self.base_url = base_url
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.rate_limit_rps = max(0.0, float(rate_limit_rps))
+        self.rate_limit_burst = max(1.0, float(rate_limit_burst or self.rate_limit_rps or 1))
+        self.http2 = _http2_enabled()
+
+        self._lock = threading.Lock()
+        self._tokens = self.rate_limit_burst
+        self._refilled_at = time.monotonic()
+        # 并发名额：进程内所有事件循环和线程共享的计数 + 先来先得的等待队列（均由 _lock 保护）
+        self._active = 0
+        self._waiters: "deque[_SlotWaiter]" = deque()
+        self._sync_client = None
+        self._async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = weakref.WeakKeyDictionary()
+
+        self.requests = 0
+        self.in_flight = 0
+        self.waiting = 0
+        self.throttled_seconds = 0.0
+
+    # ---------------------------------------------------------------- 连接池
+
+    def _client_kwargs(self) -> Dict[str, Any]:
+        from openai import DEFAULT_CONNECTION_LIMITS
+        # 与 OpenAI SDK 使用同一个 httpx 实现的 Limits 类
+        limits = type(DEFAULT_CONNECTION_LIMITS)(
+            max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "100")),
+            max_keepalive_connections=int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20")),
+            keepalive_expiry=float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))
+        )
+        return {"limits": limits, "http2": self.http2}
+
+    def sync_http_client(self):
+        """同步 httpx 客户端（线程安全，进程内共享）"""
+        if self._sync_client is None:
+            with self._lock:
+                if self._sync_client is None:
+                    from openai import DefaultHttpxClient
+                    self._sync_client = DefaultHttpxClient(**self._client_kwargs())
+        return self._sync_client
+
+    def async_http_client(self):
+        """当前事件循环的异步 httpx 客户端（需在事件循环中调用）"""
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            from openai import DefaultAsyncHttpxClient
+            client = DefaultAsyncHttpxClient(**self._client_kwargs())
+            self._async_clients[loop] = client
+        return client
+
+    # ---------------------------------------------------------------- 限流
+
+    def _reserve(self) -> float:
+        """取一个令牌，返回需要等待的秒数（令牌不足时预支，按欠额计算等待时间）"""
+        if self.rate_limit_rps <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.rate_limit_burst, self._tokens + (now - self._refilled_at) * self.rate_limit_rps)
+            self._refilled_at = now
+            self._tokens -= 1.0
+            return max(0.0, -self._tokens / self.rate_limit_rps)
+
+    def _try_acquire(self, loop: Optional[asyncio.AbstractEventLoop] = None) -> Optional[_SlotWaiter]:
+        """有空闲名额（且没有排队的请求）时直接占用并返回 None，否则排队并返回等待对象"""
+        with self._lock:
+            if self._active < self.max_concurrency and not self._waiters:
+                self._active += 1
+                return None
+            waiter = _SlotWaiter(loop)
+            self._waiters.append(waiter)
+            return waiter
+
+    def _release(self) -> None:
+        """归还名额：有排队的请求时直接转交，否则空闲名额加一"""
+        with self._lock:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                waiter.grant()
+                if waiter.granted:
+                    return
+            self._active -= 1
+
+    async def _acquire_async(self) -> None:
+        waiter = self._try_acquire(asyncio.get_running_loop())
+        if waiter is None:
+            return
+        try:
+            await waiter.future
+        except BaseException:
+            # 取消：已分到的名额交给下一个请求，否则退出队列
+            with self._lock:
+                granted = waiter.granted
+                if not granted:
+                    self._waiters.remove(waiter)
+            if granted:
+                self._release()
+            raise
+
+    @asynccontextmanager
+    async def slot(self):
+        """异步请求名额：先等待并发名额，再等待令牌"""
+        self.waiting += 1
+        try:
+            await self._acquire_async()
+        finally:
+            self.waiting -= 1
+        try:
+            delay = self._reserve()
+            if delay > 0:
+                self.throttled_seconds += delay
+                logger.debug(f"⏳ [LLMTransport] {self.base_url} 限速等待 {delay:.2f}s")
+                await asyncio.sleep(delay)
+            self.requests += 1
+            self.in_flight += 1
+            try:
+                yield
+            finally:
+                self.in_flight -= 1
+        finally:
+            self._release()
+
+    @contextmanager
+    def sync_slot(self):
+        """同步请求名额（阻塞当前线程）"""
+        self.waiting += 1
+        try:
+            waiter = self._try_acquire()
+            if waiter is not None:
+                waiter.event.wait()
+        finally:
+            self.waiting -= 1
+        try:
+            delay = self._reserve()
+            if delay > 0:
+                self.throttled_seconds += delay
+                time.sleep(delay)
+            self.requests += 1
+            self.in_flight += 1
+            try:
+                yield
+            finally:
+                self.in_flight -= 1
+        finally:
+            self._release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "base_url": self.base_url,
+            "http2": self.http2,
+            "max_concurrency": self.max_concurrency,
+            "rate_limit_rps": self.rate_limit_rps,
+            "requests": self.requests,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "throttled_seconds": round(self.throttled_seconds, 2)
+        }
+
+
+_transports: Dict[str, ProviderTransport] = {}
+_transports_lock = threading.Lock()
+
+
+def get_transport(
+    base_url: str,
+    max_concurrency: Optional[int] = None,
+    rate_limit_rps: Optional[float] = None,
+    rate_limit_burst: Optional[float] = None
+) -> ProviderTransport:
+    """
+    获取 base_url 对应的共享传输层（首次创建时确定限流参数）
+
+    Args:
+        base_url: provider 的 API 地址
+        max_concurrency: 并发上限（默认 LLM_MAX_CONCURRENCY）
+        rate_limit_rps: 每秒请求数（默认 LLM_RATE_LIMIT_RPS）
+        rate_limit_burst: 令牌桶容量（默认 LLM_RATE_LIMIT_BURST）
+
+    Returns:
+        ProviderTransport 实例
+    """
+    key = (base_url or "").rstrip("/")
+    with _transports_lock:
+        transport = _transports.get(key)
+        if transport is None:
+            transport = ProviderTransport(
+                key,
+                max_concurrency=max_concurrency or int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+                rate_limit_rps=rate_limit_rps if rate_limit_rps is not None else float(os.getenv("LLM_RATE_LIMIT_RPS", "0")),
+                rate_limit_burst=rate_limit_burst or (float(os.getenv("LLM_RATE_LIMIT_BURST")) if os.getenv("LLM_RATE_LIMIT_BURST") else None)
+            )
+            _transports[key] = transport
+            logger.info(
+                f"✅ [LLMTransport] {key}: 并发上限 {transport.max_concurrency}, "
+                f"限速 {transport.rate_limit_rps or '不限'} 次/秒, HTTP/2 {'启用' if transport.http2 else '未启用'}"
+            )
+        return transport
+
+
+def transport_stats() -> Dict[str, Any]:
+    """所有 provider 的传输层统计"""
+    return {key: transport.stats() for key, transport in list(_transports.items())}
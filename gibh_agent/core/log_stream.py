@@ -0,0 +1,373 @@
+"""
+日志流水线 - 为 /api/logs 与 /api/logs/stream 收集日志并分发给订阅者
+
+根日志记录器上只挂一个入队处理器：日志调用线程只做级别判断、限流过滤和一次入队
+（不格式化、不遍历订阅者）。后台线程（logging.handlers.QueueListener）负责组装日志条目、
+写入最近日志缓冲区并分发给各订阅者：
+- 每个订阅者有自己的级别和模块过滤（按 logger 名前缀匹配）
+- 订阅者的待发送条目有上限：慢客户端只丢弃它自己的条目并记录丢弃数，不阻塞日志调用方
+  和其他订阅者；分发线程只在订阅者从空变为非空时唤醒一次事件循环
+- 订阅者列表写时复制，分发时无需加锁
+- 高频的第三方 DEBUG/INFO 日志按 logger 前缀限流（令牌桶，WARNING 及以上不受限）；
+  限额为 0 的 logger 直接把级别提高到 WARNING，连日志记录都不会创建
+
+环境变量：
+- LOG_STREAM_LEVEL: 采集级别（默认 DEBUG）
+- LOG_STREAM_BUFFER_SIZE: 最近日志缓冲区条数（默认 1000）
+- LOG_STREAM_MAX_MESSAGE_CHARS: 单条消息的最大字符数，超出截断（默认 4000）
+- LOG_STREAM_RATE_LIMITS: "logger前缀=每秒条数,..."（默认 DEFAULT_RATE_LIMITS）
+"""
+import os
+import json
+import time
+import queue
+import atexit
+import asyncio
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RATE_LIMITS = "numba=0,matplotlib=0,PIL=0,h5py=0,httpcore=5,httpx=10,urllib3=5,openai=5"
+
+
+def parse_level(level: Any) -> int:
+    """
+    解析日志级别（名称或数字）
+
+    Raises:
+        ValueError: 无效的级别名称
+    """
+    if isinstance(level, int):
+        return level
+    value = logging.getLevelName(str(level).strip().upper())
+    if not isinstance(value, int):
+        raise ValueError(f"无效的日志级别: {level}（可用: DEBUG, INFO, WARNING, ERROR, CRITICAL）")
+    return value
+
+
+def parse_rate_limits(spec: str) -> Dict[str, float]:
+    """解析 "logger前缀=每秒条数,..."（忽略格式错误的项）"""
+    limits = {}
+    for item in (spec or "").split(","):
+        name, _, rate = item.partition("=")
+        try:
+            if name.strip():
+                limits[name.strip()] = float(rate)
+        except ValueError:
+            continue
+    return limits
+
+
+def _split_names(names: Optional[Any]) -> Tuple[str, ...]:
+    if not names:
+        return ()
+    if isinstance(names, str):
+        names = names.split(",")
+    return tuple(n.strip() for n in names if n and n.strip())
+
+
+def _matches(name: str, prefixes: Tuple[str, ...]) -> bool:
+    return any(name == p or name.startswith(p + ".") for p in prefixes)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    按 logger 前缀限流（令牌桶，只作用于 WARNING 以下的日志）
+
+    在日志调用线程中执行，不加锁：并发时计数可能有少量偏差，但不会阻塞调用方。
+    """
+
+    def __init__(self, limits: Dict[str, float]):
+        super().__init__()
+        # 最长前缀优先
+        self.limits = dict(sorted(limits.items(), key=lambda kv: -len(kv[0])))
+        self._buckets: Dict[str, List[float]] = {p: [max(rate, 1.0), time.monotonic()] for p, rate in self.limits.items()}
+        self._prefix_of: Dict[str, Optional[str]] = {}
+        self.suppressed: Dict[str, int] = {}
+
+    def _prefix(self, name: str) -> Optional[str]:
+        prefix = self._prefix_of.get(name, "")
+        if prefix == "":
+            prefix = next((p for p in self.limits if name == p or name.startswith(p + ".")), None)
+            self._prefix_of[name] = prefix
+        return prefix
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self.limits:
+            return True
+        prefix = self._prefix(record.name)
+        if prefix is None:
+            return True
+        rate = self.limits[prefix]
+        bucket = self._buckets[prefix]
+        now = time.monotonic()
+        bucket[0] = min(max(rate, 1.0), bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        if rate > 0 and bucket[0] >= 1.0:
+            bucket[0] -= 1.0
+            return True
+        self.suppressed[prefix] = self.suppressed.get(prefix, 0) + 1
+        return False
+
+
+class _EnqueueHandler(QueueHandler):
+    """只入队的日志处理器：不格式化，留给后台线程处理"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 参数可能在之后被修改，这里先合并消息（f-string 消息没有参数，几乎无开销）
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+class _DispatchHandler(logging.Handler):
+    """后台线程中的分发处理器"""
+
+    def __init__(self, hub: "LogHub"):
+        super().__init__()
+        self.hub = hub
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            self.hub._dispatch(record)
+        except Exception:
+            self.handleError(record)
+
+
+class LogSubscription:
+    """
+    一个日志流订阅者（由 LogHub.subscribe() 创建）
+
+    分发线程调用 offer() 追加条目；事件循环中用 get() 批量取出。
+    """
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        level: int,
+        modules: Tuple[str, ...],
+        exclude: Tuple[str, ...],
+        maxsize: int
+    ):
+        self.level = level
+        self.modules = modules
+        self.exclude = exclude
+        self.maxsize = maxsize
+        self.dropped = 0
+        self._reported_dropped = 0
+        self._loop = loop
+        self._entries: deque = deque()
+        self._event = asyncio.Event()
+        self._notified = False
+
+    def accepts(self, levelno: int, name: str) -> bool:
+        if levelno < self.level:
+            return False
+        if self.modules and not _matches(name, self.modules):
+            return False
+        return not (self.exclude and _matches(name, self.exclude))
+
+    def offer(self, entry: Dict[str, Any]) -> None:
+        """追加条目（分发线程中调用；超过上限时丢弃本条）"""
+        if len(self._entries) >= self.maxsize:
+            self.dropped += 1
+            return
+        self._entries.append(entry)
+        if not self._notified:
+            self._notified = True
+            try:
+                self._loop.call_soon_threadsafe(self._event.set)
+            except RuntimeError:
+                # 事件循环已关闭
+                pass
+
+    async def get(self, timeout: float) -> List[Dict[str, Any]]:
+        """
+        等待并取出所有待发送条目
+
+        Returns:
+            条目列表（超时时为空列表）
+        """
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return []
+        self._event.clear()
+        self._notified = False
+        entries = []
+        while self._entries:
+            entries.append(self._entries.popleft())
+        return entries
+
+    def take_dropped(self) -> int:
+        """自上次调用以来丢弃的条目数"""
+        dropped = self.dropped - self._reported_dropped
+        self._reported_dropped += dropped
+        return dropped
+
+
+class LogHub:
+    """
+    日志收集与分发
+
+    - install(): 把入队处理器挂到根日志记录器并启动后台分发线程
+    - subscribe()/unsubscribe(): SSE 订阅（需在事件循环中调用）
+    - recent(): 最近的日志（/api/logs）
+    """
+
+    def __init__(
+        self,
+        buffer_size: int = 1000,
+        capture_level: Any = logging.DEBUG,
+        rate_limits: Optional[Dict[str, float]] = None,
+        max_message_chars: int = 4000
+    ):
+        """
+        Args:
+            buffer_size: 最近日志缓冲区条数
+            capture_level: 采集级别
+            rate_limits: logger 前缀 -> 每秒条数（WARNING 以下）
+            max_message_chars: 单条消息的最大字符数
+        """
+        self.buffer: deque = deque(maxlen=buffer_size)
+        self.max_message_chars = max_message_chars
+        self._subscribers: Tuple[LogSubscription, ...] = ()
+        self._lock = threading.Lock()  # 只保护订阅者的增删
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self.rate_limit = RateLimitFilter(rate_limits or {})
+        self.handler = _EnqueueHandler(self._queue)
+        self.handler.setLevel(parse_level(capture_level))
+        self.handler.addFilter(self.rate_limit)
+        self._listener = QueueListener(self._queue, _DispatchHandler(self))
+        self._started = False
+
+    @classmethod
+    def from_env(cls) -> "LogHub":
+        """按环境变量创建"""
+        return cls(
+            buffer_size=int(os.getenv("LOG_STREAM_BUFFER_SIZE", "1000")),
+            capture_level=os.getenv("LOG_STREAM_LEVEL", "DEBUG"),
+            rate_limits=parse_rate_limits(os.getenv("LOG_STREAM_RATE_LIMITS", DEFAULT_RATE_LIMITS)),
+            max_message_chars=int(os.getenv("LOG_STREAM_MAX_MESSAGE_CHARS", "4000"))
+        )
+
+    def install(self, target: Optional[logging.Logger] = None) -> None:
+        """
+        挂到日志记录器（默认根日志记录器）并启动后台分发线程
+
+        Args:
+            target: 日志记录器
+        """
+        target = target or logging.getLogger()
+        target.setLevel(self.handler.level)
+        if self.handler not in target.handlers:
+            target.addHandler(self.handler)
+        # 限额为 0 的 logger 的 DEBUG/INFO 全部丢弃：直接提高级别，连记录都不创建
+        for prefix, rate in self.rate_limit.limits.items():
+            if rate <= 0:
+                logging.getLogger(prefix).setLevel(logging.WARNING)
+        if not self._started:
+            self._listener.start()
+            self._started = True
+            atexit.register(self.stop)
+
+    def stop(self) -> None:
+        """停止后台分发线程（处理完已入队的日志）"""
+        if self._started:
+            self._started = False
+            self._listener.stop()
+
+    def _dispatch(self, record: logging.LogRecord) -> None:
+        """组装日志条目并分发（后台线程中执行）"""
+        message = record.getMessage()
+        if len(message) > self.max_message_chars:
+            message = f"{message[:self.max_message_chars]}…（已截断，共 {len(message)} 字符）"
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created).isoformat(),
+            "level": record.levelname,
+            "message": message,
+            "module": record.name
+        }
+        self.buffer.append(entry)
+        for subscription in self._subscribers:
+            if subscription.accepts(record.levelno, record.name):
+                subscription.offer(entry)
+
+    def subscribe(
+        self,
+        level: Any = logging.DEBUG,
+        modules: Optional[Any] = None,
+        exclude: Optional[Any] = None,
+        maxsize: int = 1000
+    ) -> LogSubscription:
+        """
+        订阅日志（需在事件循环中调用）
+
+        Args:
+            level: 最低级别
+            modules: 只接收这些 logger 前缀的日志（逗号分隔或列表，默认全部）
+            exclude: 排除这些 logger 前缀
+            maxsize: 待发送条目上限（超出时丢弃新条目）
+
+        Returns:
+            订阅者
+
+        Raises:
+            ValueError: 无效的日志级别
+        """
+        subscription = LogSubscription(
+            asyncio.get_running_loop(), parse_level(level),
+            _split_names(modules), _split_names(exclude), maxsize
+        )
+        with self._lock:
+            self._subscribers = self._subscribers + (subscription,)
+        return subscription
+
+    def unsubscribe(self, subscription: LogSubscription) -> None:
+        with self._lock:
+            self._subscribers = tuple(s for s in self._subscribers if s is not subscription)
+
+    def recent(
+        self,
+        limit: int = 100,
+        level: Any = logging.DEBUG,
+        modules: Optional[Any] = None,
+        exclude: Optional[Any] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        最近的日志（按级别和模块过滤）
+
+        Raises:
+            ValueError: 无效的日志级别
+        """
+        levelno = parse_level(level)
+        modules, exclude = _split_names(modules), _split_names(exclude)
+        entries = [
+            entry for entry in list(self.buffer)
+            if logging.getLevelName(entry["level"]) >= levelno
+            and (not modules or _matches(entry["module"], modules))
+            and not (exclude and _matches(entry["module"], exclude))
+        ]
+        return entries[-limit:] if limit > 0 else []
+
+    def stats(self) -> Dict[str, Any]:
+        """订阅者、丢弃与限流统计"""
+        subscribers = self._subscribers
+        return {
+            "buffered": len(self.buffer),
+            "pending": self._queue.qsize(),
+            "subscribers": len(subscribers),
+            "dropped": sum(s.dropped for s in subscribers),
+            "rate_limited": dict(self.rate_limit.suppressed)
+        }
+
+
+def sse_lines(entries: Sequence[Dict[str, Any]]) -> str:
+    """把日志条目编码为 SSE data 行"""
+    return "".join(f"data: {json.dumps(entry, ensure_ascii=False)}\n\n" for entry in entries)
@@ -0,0 +1,227 @@
+"""
+文件元数据缓存 - FileInspector 检查结果的进程间共享缓存（SQLite）
+
+同一个文件会在上传、Agent 生成计划、对话和执行器的 Pre-Flight 检查中被反复检查。
+检查结果按解析后的绝对路径缓存在 SQLite 中（WAL 模式，服务进程、步骤子进程和
+Celery worker 共享同一个数据库文件），命中条件：
+
+- 文件指纹一致：文件为 (大小, mtime_ns)；目录（如 10x 数据目录）为所有文件的
+  (总大小, 最大 mtime_ns, 文件数)
+- 检查器版本一致（file_inspector.INSPECTOR_VERSION，检查逻辑变化时递增）
+
+上传目录中来自 blob_store 的文件（以及完全由这类文件组成的 10x 目录）另外按内容键
+（"sha256:<digest>"，指纹固定为 CONTENT_FINGERPRINT）缓存一份：同一内容重复上传到
+新路径时直接复用检查结果，不依赖路径和 mtime。
+
+条目数超过上限时按最近访问时间（LRU）淘汰。
+
+环境变量：
+- FILE_METADATA_CACHE_ENABLED: 是否启用（默认 true）
+- FILE_METADATA_CACHE_PATH: 数据库路径（默认 $RESULTS_DIR/.metadata_cache.sqlite）
+- FILE_METADATA_CACHE_MAX_ENTRIES: 条目数上限（默认 5000）
+"""
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+from .utils import sanitize_for_json
+
+logger = logging.getLogger(__name__)
+
+# 内容键条目的指纹（内容键本身就标识了内容）
+CONTENT_FINGERPRINT = "content"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS file_metadata (
+    path TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    version TEXT NOT NULL,
+    metadata TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+
+def file_fingerprint(path: str) -> Optional[str]:
+    """
+    计算文件或目录的指纹（不读取内容）
+
+    Args:
+        path: 文件或目录路径
+
+    Returns:
+        指纹字符串；路径不存在时返回 None
+    """
+    p = Path(path)
+    try:
+        if p.is_file():
+            stat = p.stat()
+            return f"{stat.st_size}:{stat.st_mtime_ns}"
+        if p.is_dir():
+            total_size, latest_mtime, count = 0, p.stat().st_mtime_ns, 0
+            for child in p.rglob("*"):
+                if child.is_file():
+                    stat = child.stat()
+                    total_size += stat.st_size
+                    latest_mtime = max(latest_mtime, stat.st_mtime_ns)
+                    count += 1
+            return f"dir:{total_size}:{latest_mtime}:{count}"
+    except OSError:
+        pass
+    return None
+
+
+class FileMetadataCache:
+    """
+    文件元数据缓存（SQLite）
+
+    每个线程使用独立连接；写入冲突由 SQLite 的文件锁处理。
+    """
+
+    def __init__(self, db_path: str, max_entries: int = 5000):
+        """
+        Args:
+            db_path: SQLite 数据库路径
+            max_entries: 条目数上限
+        """
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, path: str, fingerprint: str, version: str) -> Optional[Dict[str, Any]]:
+        """
+        读取缓存的元数据（指纹或版本不一致时视为未命中并删除旧条目）
+
+        Args:
+            path: 解析后的绝对路径
+            fingerprint: 当前文件指纹
+            version: 检查器版本
+
+        Returns:
+            元数据字典；未命中时返回 None
+        """
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT fingerprint, version, metadata FROM file_metadata WHERE path = ?", (path,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            if row[0] != fingerprint or row[1] != version:
+                conn.execute("DELETE FROM file_metadata WHERE path = ?", (path,))
+                self.misses += 1
+                return None
+            conn.execute(
+                "UPDATE file_metadata SET accessed_at = ?, hits = hits + 1 WHERE path = ?",
+                (time.time(), path)
+            )
+            self.hits += 1
+            return json.loads(row[2])
+        except (sqlite3.Error, ValueError) as e:
+            logger.warning(f"⚠️ [MetadataCache] 读取失败: {e}")
+            return None
+
+    def put(self, path: str, fingerprint: str, version: str, metadata: Dict[str, Any]) -> None:
+        """写入元数据（超过条目上限时淘汰最久未访问的条目）"""
+        try:
+            payload = json.dumps(sanitize_for_json(metadata), ensure_ascii=False, default=str)
+            now = time.time()
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO file_metadata "
+                "(path, fingerprint, version, metadata, created_at, accessed_at, hits) VALUES (?, ?, ?, ?, ?, ?, 0)",
+                (path, fingerprint, version, payload, now, now)
+            )
+            overflow = conn.execute("SELECT COUNT(*) FROM file_metadata").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                conn.execute(
+                    "DELETE FROM file_metadata WHERE path IN "
+                    "(SELECT path FROM file_metadata ORDER BY accessed_at ASC LIMIT ?)",
+                    (overflow,)
+                )
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.warning(f"⚠️ [MetadataCache] 写入失败: {e}")
+
+    def invalidate(self, path: str) -> None:
+        """删除某个路径的缓存条目"""
+        try:
+            self._connect().execute("DELETE FROM file_metadata WHERE path = ?", (path,))
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ [MetadataCache] 删除失败: {e}")
+
+    def clear(self) -> None:
+        """清空缓存"""
+        try:
+            self._connect().execute("DELETE FROM file_metadata")
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ [MetadataCache] 清空失败: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计（条目数为全部进程共享，命中率为当前进程）"""
+        try:
+            entries = self._connect().execute("SELECT COUNT(*) FROM file_metadata").fetchone()[0]
+        except sqlite3.Error:
+            entries = None
+        lookups = self.hits + self.misses
+        return {
+            "db_path": self.db_path,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None
+        }
+
+
+_metadata_cache: Optional[FileMetadataCache] = None
+_metadata_cache_lock = threading.Lock()
+
+
+def get_metadata_cache() -> Optional[FileMetadataCache]:
+    """
+    获取全局文件元数据缓存（由环境变量配置）
+
+    Returns:
+        FileMetadataCache 实例；禁用或初始化失败时返回 None
+    """
+    global _metadata_cache
+    if os.getenv("FILE_METADATA_CACHE_ENABLED", "true").lower() not in ("1", "true", "yes"):
+        return None
+    if _metadata_cache is None:
+        with _metadata_cache_lock:
+            if _metadata_cache is None:
+                db_path = os.getenv(
+                    "FILE_METADATA_CACHE_PATH",
+                    os.path.join(os.getenv("RESULTS_DIR", "./results"), ".metadata_cache.sqlite")
+                )
+                max_entries = int(os.getenv("FILE_METADATA_CACHE_MAX_ENTRIES", "5000"))
+                try:
+                    _metadata_cache = FileMetadataCache(db_path, max_entries)
+                    logger.info(f"✅ [MetadataCache] 缓存数据库: {db_path} (上限 {max_entries} 条)")
+                except (sqlite3.Error, OSError) as e:
+                    logger.warning(f"⚠️ [MetadataCache] 初始化失败，禁用元数据缓存: {e}")
+                    return None
+    return _metadata_cache
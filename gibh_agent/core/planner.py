@@ -519,7 +519,8 @@ class SOPPlanner:
             response = await self.llm_client.achat(
                 messages=messages,
                 temperature=0.1,  # 低温度确保遵循 SOP 规则
-                max_tokens=2048
+                max_tokens=2048,
+                cache="sop_planner.generate_plan"
             )
             
             # Step 4: 解析 LLM 响应
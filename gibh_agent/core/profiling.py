@@ -0,0 +1,313 @@
+"""
+步骤资源画像 - 记录每个工作流步骤的耗时、内存与 IO
+
+指标来源（Linux 优先使用 /proc，其他平台退化为 resource 模块）：
+- wall_time_s / cpu_time_s: time.perf_counter / time.process_time
+- peak_rss_delta_mb: 峰值 RSS 减去起始 RSS（见下）
+- io_read_mb / io_write_mb: /proc/self/io 的 read_bytes / write_bytes（实际落盘的字节数）
+- input_size_mb / output_size_mb: 输入参数与结果中引用的文件大小
+
+注意：指标是进程级的。步骤在步骤进程池的子进程中执行时（DAG 并发或 isolate_steps），
+子进程同一时间只执行这一个步骤，数值准确：步骤开始前重置 VmHWM（/proc/self/clear_refs），
+结束后读取峰值。在服务进程（或 Celery worker）中直接执行时，重置 VmHWM 会影响同进程中
+并发执行的其他步骤，因此不重置，只能观察到超过进程历史峰值的部分；这类画像标记
+peak_rss_approximate=True，汇总内存分布时不计入。耗时和 IO 同样会混入同进程其他线程的开销。
+"""
+import os
+import json
+import time
+import logging
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PROFILE_FILENAME = "profile.json"
+
+# 直方图的耗时分桶边界（秒）
+WALL_TIME_BUCKETS = [1, 5, 15, 60, 300, 900, 3600]
+
+_MB = 1024 * 1024
+
+# 当前进程是否为步骤进程池的子进程（同一时间只执行一个步骤，可以重置 VmHWM）
+_exclusive_process = False
+
+
+def mark_exclusive_process() -> None:
+    """在步骤进程池子进程的初始化函数中调用：之后的画像报告准确的峰值内存"""
+    global _exclusive_process
+    _exclusive_process = True
+
+
+def _read_proc_status() -> Dict[str, int]:
+    """读取 /proc/self/status 中的内存字段（单位 KB）"""
+    values = {}
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith(("VmRSS:", "VmHWM:")):
+                    key, value = line.split(":", 1)
+                    values[key] = int(value.split()[0])
+    except OSError:
+        pass
+    return values
+
+
+def _read_proc_io() -> Optional[Dict[str, int]]:
+    """读取 /proc/self/io（不可用时返回 None）"""
+    try:
+        with open("/proc/self/io", "r") as f:
+            return {
+                key.strip(): int(value)
+                for key, value in (line.split(":", 1) for line in f if ":" in line)
+            }
+    except OSError:
+        return None
+
+
+def _reset_peak_rss() -> bool:
+    """重置进程的 RSS 峰值（VmHWM），成功返回 True"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _max_rss_kb() -> int:
+    """resource 模块提供的历史峰值 RSS（KB），用于无 /proc 的平台"""
+    try:
+        import resource
+        import sys
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS 返回字节，Linux 返回 KB
+        return max_rss // 1024 if sys.platform == "darwin" else max_rss
+    except Exception:
+        return 0
+
+
+def path_size(path: str) -> int:
+    """文件或目录的总大小（字节），不存在时返回 0"""
+    try:
+        p = Path(path)
+        if p.is_file():
+            return p.stat().st_size
+        if p.is_dir():
+            return sum(c.stat().st_size for c in p.rglob("*") if c.is_file())
+    except OSError:
+        pass
+    return 0
+
+
+def referenced_paths(value: Any) -> List[str]:
+    """递归收集字典/列表中引用的已存在文件或目录路径（去重，保持顺序）"""
+    found: List[str] = []
+
+    def walk(v):
+        if isinstance(v, str):
+            if v and len(v) < 4096 and os.path.exists(v) and v not in found:
+                found.append(v)
+        elif isinstance(v, dict):
+            for item in v.values():
+                walk(item)
+        elif isinstance(v, (list, tuple)):
+            for item in v:
+                walk(item)
+
+    walk(value)
+    return found
+
+
+class StepProfiler:
+    """
+    步骤资源画像上下文管理器
+
+    用法:
+        with StepProfiler(params) as profiler:
+            result = tool_func(**params)
+        profile = profiler.finish(result)
+    """
+
+    def __init__(self, params: Optional[Dict[str, Any]] = None):
+        self.params = params or {}
+        self.profile: Dict[str, Any] = {}
+
+    def __enter__(self) -> "StepProfiler":
+        # VmHWM 是进程级的，只在独占的子进程中重置
+        self._peak_reset = _exclusive_process and _reset_peak_rss()
+        status = _read_proc_status()
+        self._rss_start_kb = status.get("VmRSS", 0)
+        self._max_rss_start_kb = _max_rss_kb()
+        self._io_start = _read_proc_io()
+        self._cpu_start = time.process_time()
+        self._wall_start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        wall = time.perf_counter() - self._wall_start
+        cpu = time.process_time() - self._cpu_start
+
+        status = _read_proc_status()
+        if self._peak_reset and "VmHWM" in status:
+            peak_delta_kb = max(0, status["VmHWM"] - self._rss_start_kb)
+        else:
+            # 只能观察到超过历史峰值的部分
+            peak_delta_kb = max(0, _max_rss_kb() - self._max_rss_start_kb)
+
+        io_end = _read_proc_io()
+        if self._io_start is not None and io_end is not None:
+            io_read = io_end.get("read_bytes", 0) - self._io_start.get("read_bytes", 0)
+            io_write = io_end.get("write_bytes", 0) - self._io_start.get("write_bytes", 0)
+        else:
+            io_read = io_write = None
+
+        self.profile = {
+            "wall_time_s": round(wall, 3),
+            "cpu_time_s": round(cpu, 3),
+            "peak_rss_delta_mb": round(peak_delta_kb / 1024, 1),
+            "peak_rss_approximate": not self._peak_reset,
+            "rss_end_mb": round(status.get("VmRSS", 0) / 1024, 1),
+            "io_read_mb": round(io_read / _MB, 2) if io_read is not None else None,
+            "io_write_mb": round(io_write / _MB, 2) if io_write is not None else None,
+            "pid": os.getpid()
+        }
+        return False
+
+    def finish(self, result: Any = None) -> Dict[str, Any]:
+        """
+        补充输入/输出产物大小并返回完整画像
+
+        Args:
+            result: 工具返回结果（工具抛出异常时为 None）
+
+        Returns:
+            画像字典
+        """
+        input_paths = referenced_paths(self.params)
+        output_paths = [
+            p for p in referenced_paths(result)
+            if p not in input_paths and os.path.isfile(p)
+        ]
+        self.profile["input_size_mb"] = round(sum(path_size(p) for p in input_paths) / _MB, 2)
+        self.profile["output_size_mb"] = round(sum(path_size(p) for p in output_paths) / _MB, 2)
+        self.profile["output_files"] = len(output_paths)
+        return self.profile
+
+
+def write_run_profile(output_dir: str, workflow_name: str, steps_details: List[Dict[str, Any]]) -> Optional[str]:
+    """
+    将运行中各步骤的画像写入 output_dir/profile.json
+
+    Args:
+        output_dir: 运行输出目录
+        workflow_name: 工作流名称
+        steps_details: 执行报告中的步骤详情
+
+    Returns:
+        profile.json 路径（失败时返回 None）
+    """
+    steps = [
+        {
+            "step_id": d.get("step_id"),
+            "tool_id": d.get("tool_id"),
+            "status": d.get("status"),
+            "cache_hit": d.get("cache_hit", False),
+            "resumed": d.get("resumed", False),
+            **(d.get("profile") or {})
+        }
+        for d in steps_details
+        if d.get("profile")
+    ]
+    profile = {
+        "workflow_name": workflow_name,
+        "created_at": time.time(),
+        "total_wall_time_s": round(sum(s.get("wall_time_s", 0) for s in steps), 3),
+        "total_cpu_time_s": round(sum(s.get("cpu_time_s", 0) for s in steps), 3),
+        "max_peak_rss_delta_mb": max(
+            (s.get("peak_rss_delta_mb", 0) for s in steps if not s.get("peak_rss_approximate")),
+            default=None
+        ),
+        "steps": steps
+    }
+    profile_path = os.path.join(output_dir, PROFILE_FILENAME)
+    try:
+        with open(profile_path, "w", encoding="utf-8") as f:
+            json.dump(profile, f, ensure_ascii=False, indent=2)
+        return profile_path
+    except Exception as e:
+        logger.warning(f"⚠️ [Profiling] 写入 profile.json 失败: {e}")
+        return None
+
+
+def aggregate_tool_profiles(results_dir: str, max_runs: int = 500) -> Dict[str, Any]:
+    """
+    汇总最近若干次运行的 profile.json，按工具统计耗时/内存分布
+
+    缓存命中和续跑恢复的步骤不计入统计；失败的步骤计入耗时统计和 errors。
+    峰值内存分布只使用准确的画像（peak_rss_approximate 为 False）。
+
+    Args:
+        results_dir: 结果根目录（包含 run_*/profile.json 和批量运行的 batch_*/NNN_*/profile.json）
+        max_runs: 最多读取的运行数（按修改时间取最新）
+
+    Returns:
+        {"runs": N, "buckets": [...], "tools": {tool_id: {...}}}
+    """
+    root = Path(results_dir)
+    profile_files = sorted(
+        [*root.glob(f"*/{PROFILE_FILENAME}"), *root.glob(f"batch_*/*/{PROFILE_FILENAME}")],
+        key=lambda p: p.stat().st_mtime,
+        reverse=True
+    )[:max_runs]
+
+    samples: Dict[str, List[Dict[str, Any]]] = {}
+    for profile_file in profile_files:
+        try:
+            with open(profile_file, "r", encoding="utf-8") as f:
+                profile = json.load(f)
+        except Exception:
+            continue
+        for step in profile.get("steps", []):
+            if step.get("cache_hit") or step.get("resumed") or step.get("wall_time_s") is None:
+                continue
+            samples.setdefault(step.get("tool_id") or "unknown", []).append(step)
+
+    def percentile(values: List[float], q: float) -> float:
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+    labels = [f"<{b}s" for b in WALL_TIME_BUCKETS] + [f">={WALL_TIME_BUCKETS[-1]}s"]
+    tools = {}
+    for tool_id, steps in samples.items():
+        wall = [s["wall_time_s"] for s in steps]
+        rss = [s.get("peak_rss_delta_mb") or 0 for s in steps if not s.get("peak_rss_approximate")]
+        histogram = [0] * len(labels)
+        for w in wall:
+            histogram[next((i for i, b in enumerate(WALL_TIME_BUCKETS) if w < b), len(WALL_TIME_BUCKETS))] += 1
+        tools[tool_id] = {
+            "count": len(steps),
+            "errors": sum(1 for s in steps if s.get("status") == "error"),
+            "wall_time_s": {
+                "mean": round(sum(wall) / len(wall), 3),
+                "p50": percentile(wall, 0.5),
+                "p90": percentile(wall, 0.9),
+                "max": max(wall)
+            },
+            "cpu_time_s_mean": round(sum(s.get("cpu_time_s") or 0 for s in steps) / len(steps), 3),
+            "peak_rss_delta_mb": {
+                "samples": len(rss),
+                "p50": percentile(rss, 0.5),
+                "p90": percentile(rss, 0.9),
+                "max": max(rss)
+            } if rss else None,
+            "io_write_mb_mean": round(sum(s.get("io_write_mb") or 0 for s in steps) / len(steps), 2),
+            "output_size_mb_mean": round(sum(s.get("output_size_mb") or 0 for s in steps) / len(steps), 2),
+            "wall_time_histogram": dict(zip(labels, histogram))
+        }
+
+    return {
+        "runs": len(profile_files),
+        "buckets": labels,
+        "tools": dict(sorted(tools.items(), key=lambda kv: -kv[1]["wall_time_s"]["p90"]))
+    }
@@ -0,0 +1,356 @@
+"""
+结果载荷策略 - 大型表格输出转为产物引用（artifact reference）
+
+工具结果中的大表（记录列表、orient='index' 的嵌套字典、DataFrame）原本会完整地经过
+运行清单、进度事件、sanitize_for_json、Celery 结果后端和 HTTP 响应。执行器在步骤结果
+离开执行器之前应用本策略：
+
+- 行数超过 RESULT_INLINE_MAX_ROWS（默认 200）的表落盘到 <output_dir>/artifacts/
+  （table_io.write_table，默认 Arrow IPC），结果中替换为引用：
+  {"artifact": "table", "path", "format", "orient", "rows", "columns", "preview"}
+- 预览只保留前 RESULT_PREVIEW_ROWS（默认 20）行、前 RESULT_PREVIEW_COLUMNS（默认 50）列
+- 报告序列化后超过 REPORT_MAX_BYTES（默认 5MB）时逐级缩减，直到不超过上限：
+  用更严格的阈值重新压缩 -> 从最大的步骤开始把 data 缩减为其中的产物引用 ->
+  省略 steps_results（与 steps_details 重复）-> 从最大的步骤开始省略整个 step_result
+
+完整数据通过 GET /api/results/table 分页读取；进程内的数据流（step_results）不受影响。
+"""
+import os
+import re
+import json
+import time
+import logging
+from typing import Dict, Any, List, Optional
+
+import pandas as pd
+
+from .table_io import read_table, write_table
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_DIRNAME = "artifacts"
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def inline_max_rows() -> int:
+    return _env_int("RESULT_INLINE_MAX_ROWS", 200)
+
+
+def preview_rows() -> int:
+    return _env_int("RESULT_PREVIEW_ROWS", 20)
+
+
+def preview_columns() -> int:
+    return _env_int("RESULT_PREVIEW_COLUMNS", 50)
+
+
+def report_max_bytes() -> int:
+    return _env_int("REPORT_MAX_BYTES", 5 * 1024 * 1024)
+
+
+def is_artifact_ref(value: Any) -> bool:
+    """是否为表格产物引用"""
+    return isinstance(value, dict) and value.get("artifact") == "table" and "path" in value
+
+
+def _as_table(value: Any) -> Optional[tuple]:
+    """
+    识别表格型的值
+
+    Returns:
+        (DataFrame, orient) 或 None；orient 为 "records" / "index" / "frame"
+    """
+    if isinstance(value, pd.DataFrame):
+        return value, "frame"
+    if isinstance(value, list) and value and all(isinstance(v, dict) for v in value):
+        return pd.DataFrame.from_records(value), "records"
+    if isinstance(value, dict) and value and all(isinstance(v, dict) for v in value.values()):
+        return pd.DataFrame.from_dict(value, orient="index"), "index"
+    return None
+
+
+def _table_rows(value: Any) -> int:
+    """不构造 DataFrame 的行数估计（用于判断是否需要落盘）"""
+    if isinstance(value, pd.DataFrame):
+        return len(value)
+    if isinstance(value, (list, dict)):
+        return len(value)
+    return 0
+
+
+def _preview(df: pd.DataFrame, orient: str, n_rows: int, n_columns: int) -> List[Dict[str, Any]]:
+    head = df.iloc[:n_rows, :n_columns]
+    if orient != "records":
+        head = head.reset_index()
+    return head.to_dict(orient="records")
+
+
+def make_artifact_ref(
+    df: pd.DataFrame,
+    output_stem: str,
+    orient: str = "frame",
+    n_preview_rows: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    将表写为产物文件并返回引用
+
+    Args:
+        df: 要落盘的表
+        output_stem: 不含扩展名的输出路径
+        orient: 原始形态（records / index / frame），用于 load_artifact 还原
+        n_preview_rows: 预览行数（默认 RESULT_PREVIEW_ROWS）
+
+    Returns:
+        产物引用字典
+    """
+    n_preview_rows = preview_rows() if n_preview_rows is None else n_preview_rows
+    saved = write_table(df, output_stem)
+    return {
+        "artifact": "table",
+        "path": saved["path"],
+        "format": saved["format"],
+        "orient": orient,
+        "rows": len(df),
+        "columns": [str(c) for c in df.columns],
+        "preview": _preview(df, orient, n_preview_rows, preview_columns()),
+        "truncated": len(df) > n_preview_rows
+    }
+
+
+def compact_result(
+    result: Any,
+    artifact_dir: str,
+    prefix: str,
+    max_rows: Optional[int] = None,
+    n_preview_rows: Optional[int] = None,
+    _depth: int = 0
+) -> Any:
+    """
+    将结果中的大表替换为产物引用（返回新对象，不修改原结果）
+
+    Args:
+        result: 工具结果（通常是字典）
+        artifact_dir: 产物目录
+        prefix: 产物文件名前缀（通常为 step_id）
+        max_rows: 内联的最大行数（默认 RESULT_INLINE_MAX_ROWS）
+        n_preview_rows: 引用中的预览行数（默认 RESULT_PREVIEW_ROWS）
+
+    Returns:
+        压缩后的结果
+    """
+    max_rows = inline_max_rows() if max_rows is None else max_rows
+
+    if isinstance(result, dict) and not is_artifact_ref(result):
+        compacted = {}
+        for key, value in result.items():
+            name = f"{prefix}.{key}" if _depth else f"{prefix}__{key}"
+            if is_artifact_ref(value):
+                # 已是引用：只按需缩短预览
+                if n_preview_rows is not None and len(value.get("preview") or []) > n_preview_rows:
+                    value = {**value, "preview": value["preview"][:n_preview_rows], "truncated": True}
+                compacted[key] = value
+                continue
+            if _table_rows(value) > max_rows:
+                table = _as_table(value)
+                if table is not None:
+                    df, orient = table
+                    stem = os.path.join(artifact_dir, re.sub(r"[^\w.\-]+", "_", name))
+                    try:
+                        compacted[key] = make_artifact_ref(df, stem, orient, n_preview_rows)
+                        logger.info(f"💾 [Payload] {name}: {len(df)} 行 -> {compacted[key]['path']}")
+                        continue
+                    except Exception as e:
+                        logger.warning(f"⚠️ [Payload] 产物落盘失败，保留内联数据: {name}: {e}")
+            if isinstance(value, dict) and _depth < 3:
+                value = compact_result(value, artifact_dir, name, max_rows, n_preview_rows, _depth + 1)
+            compacted[key] = value
+        return compacted
+
+    return result
+
+
+def load_artifact(ref: Dict[str, Any]) -> Any:
+    """将产物引用还原为原始形态（记录列表 / 嵌套字典 / DataFrame）"""
+    df = read_table(ref["path"])
+    orient = ref.get("orient", "frame")
+    if orient == "records":
+        return df.to_dict(orient="records")
+    if orient == "index":
+        return df.to_dict(orient="index")
+    return df
+
+
+def expand_result(result: Any, _depth: int = 0) -> Any:
+    """
+    将 compact_result 生成的产物引用还原为原始数据（返回新对象，不修改原结果）
+
+    Args:
+        result: 压缩后的结果
+
+    Returns:
+        还原后的结果
+
+    Raises:
+        OSError / ValueError: 产物文件缺失或无法读取
+    """
+    if is_artifact_ref(result):
+        return load_artifact(result)
+    if isinstance(result, dict) and _depth <= 3:
+        return {key: expand_result(value, _depth + 1) for key, value in result.items()}
+    return result
+
+
+def artifact_records(value: Any) -> List[Dict[str, Any]]:
+    """
+    读取记录列表（兼容内联列表和产物引用）
+
+    Args:
+        value: 记录列表或产物引用
+
+    Returns:
+        记录列表；无法读取时返回空列表
+    """
+    if is_artifact_ref(value):
+        try:
+            df = read_table(value["path"])
+            if value.get("orient") != "records":
+                df = df.reset_index()
+            return df.to_dict(orient="records")
+        except Exception as e:
+            logger.warning(f"⚠️ [Payload] 读取产物失败: {value.get('path')}: {e}")
+            return list(value.get("preview") or [])
+    return value if isinstance(value, list) else []
+
+
+def _json_size(value: Any) -> int:
+    return len(json.dumps(value, ensure_ascii=False, default=str).encode("utf-8"))
+
+
+def _artifact_refs(value: Any, _depth: int = 0) -> Dict[str, Any]:
+    """收集结果中的产物引用（键为字段路径，去掉预览）"""
+    refs: Dict[str, Any] = {}
+    if isinstance(value, dict) and _depth < 4:
+        for key, item in value.items():
+            if is_artifact_ref(item):
+                refs[str(key)] = {k: v for k, v in item.items() if k != "preview"}
+            elif isinstance(item, dict):
+                refs.update({f"{key}.{k}": v for k, v in _artifact_refs(item, _depth + 1).items()})
+    return refs
+
+
+def _shrink_largest(details: List[Dict[str, Any]], excess: int, shrink) -> List[str]:
+    """
+    从 JSON 最大的步骤开始依次调用 shrink(detail)，直到估计缩减量超过 excess
+
+    Returns:
+        被缩减的步骤 ID
+    """
+    sizes = sorted(((_json_size(d.get("step_result")), d) for d in details), key=lambda x: -x[0])
+    shrunk = []
+    for size, detail in sizes:
+        if excess <= 0:
+            break
+        if shrink(detail):
+            excess -= size - _json_size(detail.get("step_result"))
+            shrunk.append(detail.get("step_id"))
+    return shrunk
+
+
+def enforce_report_budget(report: Dict[str, Any], artifact_dir: str) -> Dict[str, Any]:
+    """
+    检查报告的 JSON 大小与序列化耗时；超过 REPORT_MAX_BYTES 时逐级缩减步骤结果直到不超过上限
+
+    缩减顺序：严格压缩（更小的内联行数和预览）-> 从最大的步骤开始把 data 缩减为其中的
+    产物引用 -> 省略 steps_results -> 从最大的步骤开始省略整个 step_result。
+    被缩减的内容记录在 payload.omitted 中，完整数据仍可通过产物文件读取。
+
+    Args:
+        report: 已经过 sanitize_for_json 的报告
+        artifact_dir: 产物目录
+
+    Returns:
+        报告（附带 payload 统计）
+    """
+    start = time.perf_counter()
+    size = _json_size(report)
+    serialize_ms = (time.perf_counter() - start) * 1000
+    budget = report_max_bytes()
+    # 为 payload 统计本身预留空间
+    target = max(0, budget - 4096)
+    compacted = False
+    omitted: Dict[str, Any] = {}
+    details = report.get("steps_details", [])
+
+    if size > budget:
+        logger.warning(f"⚠️ [Payload] 报告 {size / 1024:.0f}KB 超过上限 {budget / 1024:.0f}KB，严格压缩步骤结果")
+        compacted = True
+        strict_rows = min(5, preview_rows())
+        for detail in details:
+            step_result = detail.get("step_result") or {}
+            if isinstance(step_result.get("data"), dict):
+                step_result["data"] = compact_result(
+                    step_result["data"], artifact_dir, f"{detail.get('step_id')}_strict",
+                    max_rows=strict_rows, n_preview_rows=strict_rows
+                )
+        # steps_results 与 steps_details[*].step_result 内容相同
+        report["steps_results"] = [d.get("step_result") for d in details]
+        size = _json_size(report)
+
+        if size > target:
+            def drop_data(detail: Dict[str, Any]) -> bool:
+                step_result = detail.get("step_result")
+                if not isinstance(step_result, dict) or "data" not in step_result:
+                    return False
+                step_result["data"] = {"data_omitted": True, "artifacts": _artifact_refs(step_result["data"])}
+                return True
+
+            # steps_results 与 steps_details 共享同一个 step_result，缩减量按两份计算
+            dropped = _shrink_largest(details, (size - target + 1) // 2, drop_data)
+            if dropped:
+                omitted["data"] = dropped
+                size = _json_size(report)
+
+        if size > target and report.get("steps_results"):
+            report["steps_results"] = []
+            omitted["steps_results"] = True
+            size = _json_size(report)
+
+        if size > target:
+            def drop_step_result(detail: Dict[str, Any]) -> bool:
+                step_result = detail.get("step_result")
+                if not isinstance(step_result, dict) or step_result.get("step_result_omitted"):
+                    return False
+                detail["step_result"] = {
+                    "step_name": step_result.get("step_name"),
+                    "status": step_result.get("status"),
+                    "step_result_omitted": True
+                }
+                detail["summary"] = str(detail.get("summary") or "")[:500]
+                return True
+
+            dropped = _shrink_largest(details, size - target, drop_step_result)
+            if dropped:
+                omitted["step_result"] = dropped
+
+        start = time.perf_counter()
+        size = _json_size(report)
+        serialize_ms = (time.perf_counter() - start) * 1000
+        if omitted:
+            logger.warning(f"⚠️ [Payload] 严格压缩后仍超过上限，已省略: {omitted}")
+        if size > budget:
+            logger.error(f"❌ [Payload] 缩减步骤结果后报告仍有 {size / 1024:.0f}KB（步骤结果之外的字段过大）")
+
+    report["payload"] = {
+        "json_bytes": size,
+        "serialize_ms": round(serialize_ms, 1),
+        "max_bytes": budget,
+        "compacted": compacted,
+        "omitted": omitted or None
+    }
+    return report
@@ -0,0 +1,268 @@
+"""
+结果表查询服务 - 服务端分页、排序、阈值过滤与列投影
+
+步骤产生的表格产物（差异分析结果、VIP 分数、Marker 基因、细胞元数据等）统一从
+列式文件读取：
+- Arrow IPC 文件直接内存映射；CSV / TSV 首次查询时转换为同名 .arrow（之后源文件未更新
+  就一直复用），Parquet 读取后按文件缓存。转换先写临时文件再原子替换，同一文件的并发
+  查询在进程内只转换一次（其他请求等待转换完成）
+- 已加载的表按 (路径, mtime) 进行 LRU 缓存，排序索引按 (路径, mtime, 列, 方向) 缓存，
+  翻页和改变过滤条件时不重新排序
+- 只物化当前页的行
+
+过滤条件格式为 "列:操作符:值"，操作符见 FILTER_OPS。例如
+"fdr:lt:0.05"、"log2fc:abs_ge:1"、"cluster:in:0,3,5"、"metabolite:contains:acid"。
+"""
+import os
+import uuid
+import logging
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from .table_io import (
+    ARROW_SUFFIXES, PARQUET_SUFFIXES, read_table, resolve_table_path, write_table
+)
+
+logger = logging.getLogger(__name__)
+
+TABLE_SUFFIXES = (".csv", ".tsv") + ARROW_SUFFIXES + PARQUET_SUFFIXES
+
+FILTER_OPS = (
+    "eq", "ne", "lt", "le", "gt", "ge",
+    "abs_lt", "abs_le", "abs_gt", "abs_ge",
+    "in", "contains"
+)
+
+_CACHE_SIZE = int(os.getenv("RESULTS_TABLE_CACHE_SIZE", "16"))
+
+
+# 按路径分段的转换锁（数量固定，不随表格数量增长）
+_conversion_locks = [threading.Lock() for _ in range(64)]
+
+
+def columnar_path(file_path: str) -> str:
+    """
+    返回表格的列式文件路径（CSV / TSV 首次查询时转换为同名 .arrow）
+
+    Args:
+        file_path: 表格文件路径
+
+    Returns:
+        Arrow / Parquet 文件路径
+    """
+    resolved = Path(resolve_table_path(file_path))
+    suffix = resolved.suffix.lower()
+    if suffix in ARROW_SUFFIXES + PARQUET_SUFFIXES:
+        return str(resolved)
+
+    sibling = resolved.with_suffix(".arrow")
+    with _conversion_locks[hash(str(resolved)) % len(_conversion_locks)]:
+        # 等待锁期间其他请求可能已完成转换
+        if sibling.is_file() and sibling.stat().st_mtime >= resolved.stat().st_mtime:
+            return str(sibling)
+        if suffix == ".tsv":
+            df = pd.read_csv(resolved, sep="\t", index_col=0)
+        else:
+            df = read_table(str(resolved))
+        # 先写入临时文件再原子替换：并发读取者（包括其他 worker）不会读到写了一半的文件
+        tmp_stem = resolved.parent / f".{resolved.stem}.{os.getpid()}.{uuid.uuid4().hex[:8]}"
+        try:
+            saved = write_table(df, str(tmp_stem), fmt="arrow")
+            if saved["format"] != "arrow":
+                # 无法转换为列式文件（如 pyarrow 不可用）时 write_table 已回退为 CSV
+                raise ValueError(f"无法将 {resolved.name} 转换为列式文件")
+            os.replace(saved["path"], sibling)
+        except BaseException:
+            for leftover in resolved.parent.glob(f"{tmp_stem.name}.*"):
+                leftover.unlink(missing_ok=True)
+            raise
+    logger.info(f"💾 [Results] 已将 {resolved.name} 转换为列式文件: {sibling}")
+    return str(sibling)
+
+
+@lru_cache(maxsize=_CACHE_SIZE)
+def _load_table(path: str, mtime_ns: int):
+    """加载列式表（Arrow IPC 内存映射；按路径 + mtime 缓存）"""
+    if Path(path).suffix.lower() in PARQUET_SUFFIXES:
+        import pyarrow.parquet as pq
+        table = pq.read_table(path, memory_map=True)
+    else:
+        import pyarrow.feather as feather
+        table = feather.read_table(path, memory_map=True)
+    # 去掉 pandas 元数据：索引列（如 metabolite、细胞条形码）作为普通首列参与排序和过滤
+    index_columns = [c for c in (table.schema.pandas_metadata or {}).get("index_columns", []) if isinstance(c, str)]
+    table = table.select(index_columns + [c for c in table.column_names if c not in index_columns])
+    table = table.replace_schema_metadata(None)
+    return table.rename_columns(
+        ["index" if name.startswith("__index_level_") else name for name in table.column_names]
+    )
+
+
+@lru_cache(maxsize=_CACHE_SIZE * 4)
+def _sort_order(path: str, mtime_ns: int, column: str, descending: bool) -> np.ndarray:
+    """列的排序索引（稳定排序，缺失值排在最后）"""
+    series = _load_table(path, mtime_ns).column(column).to_pandas()
+    ordered = series.reset_index(drop=True).sort_values(
+        ascending=not descending, na_position="last", kind="mergesort"
+    )
+    return ordered.index.to_numpy()
+
+
+def parse_filter(expression: str) -> tuple:
+    """
+    解析过滤条件 "列:操作符:值"（列名中可以包含冒号）
+
+    Raises:
+        ValueError: 格式或操作符无效
+    """
+    parts = expression.rsplit(":", 2)
+    if len(parts) != 3 or not parts[0]:
+        raise ValueError(f"无效的过滤条件: {expression}（格式应为 列:操作符:值）")
+    column, op, value = parts
+    if op not in FILTER_OPS:
+        raise ValueError(f"不支持的过滤操作符: {op}（可用: {', '.join(FILTER_OPS)}）")
+    return column, op, value
+
+
+def _filter_mask(series: pd.Series, op: str, raw_value: str) -> np.ndarray:
+    """单个过滤条件的布尔掩码（缺失值不匹配）"""
+    if op == "contains":
+        return series.astype(str).str.contains(raw_value, case=False, regex=False).to_numpy() & series.notna().to_numpy()
+    if op == "in":
+        values = [v.strip() for v in raw_value.split(",")]
+        if pd.api.types.is_numeric_dtype(series):
+            return series.isin([float(v) for v in values]).to_numpy()
+        return series.astype(str).isin(values).to_numpy() & series.notna().to_numpy()
+
+    numeric = pd.api.types.is_numeric_dtype(series)
+    if op.startswith("abs_") or op in ("lt", "le", "gt", "ge") or numeric:
+        if not numeric:
+            raise ValueError(f"列 '{series.name}' 不是数值列，不支持操作符 {op}")
+        try:
+            value = float(raw_value)
+        except ValueError:
+            raise ValueError(f"过滤值不是数值: {raw_value}")
+        data = series.to_numpy(dtype=float, na_value=np.nan)
+    else:
+        data, value = series.astype(str).to_numpy(), raw_value
+
+    if op.startswith("abs_"):
+        data, op = np.abs(data), op[4:]
+    with np.errstate(invalid="ignore"):
+        mask = {
+            "eq": lambda: data == value,
+            "ne": lambda: data != value,
+            "lt": lambda: data < value,
+            "le": lambda: data <= value,
+            "gt": lambda: data > value,
+            "ge": lambda: data >= value,
+        }[op]()
+    return np.asarray(mask, dtype=bool) & series.notna().to_numpy()
+
+
+def query_table(
+    file_path: str,
+    offset: int = 0,
+    limit: int = 100,
+    columns: Optional[Sequence[str]] = None,
+    sort_by: Optional[str] = None,
+    descending: bool = False,
+    filters: Optional[Sequence[str]] = None
+) -> Dict[str, Any]:
+    """
+    查询表格产物
+
+    Args:
+        file_path: 表格文件路径（CSV / TSV / Arrow / Parquet）
+        offset: 起始行（过滤、排序之后）
+        limit: 行数
+        columns: 返回的列（默认全部）
+        sort_by: 排序列
+        descending: 是否降序
+        filters: 过滤条件列表（"列:操作符:值"，多个条件取交集）
+
+    Returns:
+        {"total_rows", "matched_rows", "offset", "limit", "columns", "schema", "rows"}
+
+    Raises:
+        ValueError: 列名、过滤条件等参数无效
+    """
+    path = columnar_path(file_path)
+    mtime_ns = os.stat(path).st_mtime_ns
+    table = _load_table(path, mtime_ns)
+    available = table.column_names
+
+    requested = [c for c in (columns or []) if c]
+    parsed = [parse_filter(f) for f in (filters or []) if f]
+    unknown = [c for c in requested + [f[0] for f in parsed] + ([sort_by] if sort_by else []) if c not in available]
+    if unknown:
+        raise ValueError(f"列不存在: {sorted(set(unknown))}（可用列: {available[:50]}）")
+
+    mask = None
+    for column, op, value in parsed:
+        column_mask = _filter_mask(table.column(column).to_pandas(), op, value)
+        mask = column_mask if mask is None else mask & column_mask
+
+    if sort_by:
+        order = _sort_order(path, mtime_ns, sort_by, bool(descending))
+        if mask is not None:
+            order = order[mask[order]]
+    else:
+        order = np.flatnonzero(mask) if mask is not None else None
+
+    matched_rows = table.num_rows if order is None else len(order)
+    if order is None:
+        page = table.slice(offset, limit)
+    else:
+        page = table.take(order[offset:offset + limit])
+    if requested:
+        page = page.select(requested)
+
+    return {
+        "total_rows": table.num_rows,
+        "matched_rows": matched_rows,
+        "offset": offset,
+        "limit": limit,
+        "columns": page.column_names,
+        "schema": [{"name": field.name, "type": str(field.type)} for field in table.schema],
+        "rows": page.to_pandas().to_dict(orient="records")
+    }
+
+
+def list_tables(run_dir: str) -> List[Dict[str, Any]]:
+    """
+    列出运行目录中的表格产物（CSV 转换出的同名 .arrow 不重复列出）
+
+    Args:
+        run_dir: 运行输出目录
+
+    Returns:
+        [{"path", "name", "format", "size_bytes", "modified_at"}]
+    """
+    root = Path(run_dir)
+    # 以 "." 开头的是转换中的临时文件
+    files = sorted(
+        p for p in root.rglob("*")
+        if p.is_file() and p.suffix.lower() in TABLE_SUFFIXES and not p.name.startswith(".")
+    )
+    names = {str(p) for p in files}
+    tables = []
+    for p in files:
+        if p.suffix.lower() in ARROW_SUFFIXES and any(
+            str(p.with_suffix(s)) in names for s in (".csv", ".tsv")
+        ):
+            continue
+        stat = p.stat()
+        tables.append({
+            "path": str(p),
+            "name": str(p.relative_to(root)),
+            "format": p.suffix.lower().lstrip("."),
+            "size_bytes": stat.st_size,
+            "modified_at": stat.st_mtime
+        })
+    return tables
@@ -4,8 +4,10 @@
 """
 import os
 import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Any, Dict, Iterable, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
@@ -23,6 +25,8 @@ def read_10x_data(
     - 未压缩格式
     - 自动检测和多重尝试策略
     - 手动读取作为后备方案
+    - 上传目录中的数据集按内容缓存转换结果（.h5ad）：重复上传的同一数据集直接读取缓存，
+      不再解析 MatrixMarket 文件（见 blob_store）
     
     Args:
         data_path: 10x数据目录路径
@@ -36,6 +40,39 @@ def read_10x_data(
         FileNotFoundError: 如果找不到必需的文件
         Exception: 如果所有读取方法都失败
     """
+    from .blob_store import get_blob_store
+    
+    blob_store = get_blob_store()
+    content_key = blob_store.content_key(str(data_path)) if blob_store else None
+    derived_name = f"10x_{var_names}.h5ad"
+    if content_key:
+        derived = blob_store.get_derived(content_key, derived_name)
+        if derived is not None:
+            import scanpy as sc
+            adata = sc.read_h5ad(str(derived))
+            logger.info(f"⚡ 复用同一数据集的转换缓存: {adata.n_obs} cells, {adata.n_vars} genes ({content_key[:24]})")
+            return adata
+    
+    adata = _read_10x_data_uncached(data_path, var_names=var_names, cache=cache)
+    
+    if content_key:
+        tmp_path = blob_store.root / "derived" / f".{os.getpid()}.{os.urandom(4).hex()}.h5ad"
+        try:
+            adata.write(str(tmp_path))
+            blob_store.put_derived(content_key, derived_name, str(tmp_path), str(data_path))
+        except Exception as e:
+            logger.warning(f"⚠️ 保存转换缓存失败（不影响本次读取）: {e}")
+        finally:
+            tmp_path.unlink(missing_ok=True)
+    return adata
+
+
+def _read_10x_data_uncached(
+    data_path: str,
+    var_names: str = 'gene_symbols',
+    cache: bool = False
+):
+    """读取10x数据（多重尝试策略，不经内容缓存；参数同 read_10x_data）"""
     import scanpy as sc
     import pandas as pd
     
@@ -176,3 +213,125 @@ def read_10x_data(
         logger.error(f"❌ 手动读取也失败: {e4}")
         raise Exception(f"所有10x数据读取方法都失败。最后错误: {str(e4)}。原始错误: {str(last_error)}")
 
+
+
+# ---------------------------------------------------------------------------
+# 融合执行模式（Fused Mode）：步骤间内存交接 AnnData
+# ---------------------------------------------------------------------------
+
+class AnnDataSession:
+    """
+    融合执行模式下的 AnnData 内存交接区
+    
+    工具仍然返回 output_h5ad 路径（前端和 _process_data_flow 的契约不变），
+    但对象只保存在内存中，由执行器在检查点或工作流结束时统一落盘。
+    只保留最新的一个对象：后续步骤会原地修改它，旧的中间态不再可用。
+    """
+    
+    def __init__(self, checkpoints: Optional[Iterable[str]] = None):
+        """
+        Args:
+            checkpoints: 需要落盘的步骤 ID 列表
+        """
+        self.checkpoints = set(checkpoints or [])
+        self._path: Optional[str] = None
+        self._adata: Any = None
+        self._dirty = False
+        self.written_paths: Dict[str, float] = {}  # 已落盘路径 -> 写入耗时（秒）
+    
+    def holds(self, path: Optional[str]) -> bool:
+        """检查指定路径的数据是否在内存中"""
+        return bool(path) and self._adata is not None and os.path.abspath(path) == self._path
+    
+    def get(self, path: str) -> Any:
+        """获取内存中的 AnnData 对象（不存在时返回 None）"""
+        return self._adata if self.holds(path) else None
+    
+    def put(self, path: str, adata: Any) -> None:
+        """登记步骤输出（不写盘）"""
+        # AnnData 视图在后续原地修改时会触发隐式拷贝，这里先实体化
+        if getattr(adata, "is_view", False):
+            adata = adata.copy()
+        self._path = os.path.abspath(path)
+        self._adata = adata
+        self._dirty = True
+    
+    def flush(self) -> Optional[str]:
+        """
+        将内存中的对象写入其 output_h5ad 路径
+        
+        Returns:
+            写入的路径（无待写入数据时返回 None）
+        """
+        if self._adata is None or not self._dirty:
+            return None
+        import time
+        os.makedirs(os.path.dirname(self._path) or ".", exist_ok=True)
+        start = time.time()
+        self._adata.write(self._path)
+        self._dirty = False
+        self.written_paths[self._path] = time.time() - start
+        logger.info(f"💾 [FusedMode] 落盘: {self._path} ({self.written_paths[self._path]:.2f}s)")
+        return self._path
+    
+    def clear(self) -> None:
+        """释放内存中的对象"""
+        self._path = None
+        self._adata = None
+        self._dirty = False
+
+
+_active_adata_session: ContextVar[Optional[AnnDataSession]] = ContextVar(
+    "active_adata_session", default=None
+)
+
+
+@contextmanager
+def use_adata_session(session: Optional[AnnDataSession]):
+    """在当前上下文中启用融合执行会话（session 为 None 时不做任何事）"""
+    if session is None:
+        yield None
+        return
+    token = _active_adata_session.set(session)
+    try:
+        yield session
+    finally:
+        _active_adata_session.reset(token)
+
+
+def load_adata(adata_path: str):
+    """
+    读取 AnnData：融合模式下优先使用内存中的对象，否则从磁盘读取 .h5ad
+    
+    Args:
+        adata_path: AnnData 文件路径（.h5ad）
+    
+    Returns:
+        AnnData对象
+    """
+    session = _active_adata_session.get()
+    if session is not None and session.holds(adata_path):
+        logger.info(f"⚡ [FusedMode] 复用内存中的 AnnData: {adata_path}")
+        return session.get(adata_path)
+    import scanpy as sc
+    return sc.read_h5ad(adata_path)
+
+
+def save_adata(adata, output_h5ad: str) -> str:
+    """
+    保存 AnnData：融合模式下只登记到内存，否则直接写入 .h5ad
+    
+    Args:
+        adata: AnnData对象
+        output_h5ad: 输出文件路径
+    
+    Returns:
+        输出文件路径（与 output_h5ad 相同）
+    """
+    session = _active_adata_session.get()
+    if session is not None:
+        session.put(output_h5ad, adata)
+        logger.info(f"⚡ [FusedMode] 延迟写盘: {output_h5ad}")
+    else:
+        adata.write(output_h5ad)
+    return output_h5ad
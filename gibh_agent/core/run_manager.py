@@ -0,0 +1,315 @@
+"""
+工作流运行管理器 - 后台执行与进度推送
+
+工作流在有界线程池中编排（步骤本身由 WorkflowExecutor 分发到子进程池执行），
+不阻塞 FastAPI 事件循环；执行器的进度事件被记录到运行状态中，并推送给
+SSE 订阅者（asyncio.Queue）。
+
+运行状态和事件日志同时写入运行输出目录（run_status.json / run_events.jsonl）：
+gunicorn 多 worker 部署时，状态轮询和 SSE 请求可能落到没有执行该运行的 worker，
+这些请求通过 load_status() / follow_events() 从共享的结果目录读取。
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, AsyncIterator, List, Optional, Callable, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 每个运行保留的最大事件数（新订阅者会先收到历史事件）
+MAX_EVENTS_PER_RUN = 500
+
+STATUS_FILENAME = "run_status.json"
+EVENTS_FILENAME = "run_events.jsonl"
+
+
+class WorkflowRun:
+    """单次工作流运行的状态"""
+
+    def __init__(self, run_id: str, output_dir: str, workflow_name: str = ""):
+        self.run_id = run_id
+        self.output_dir = output_dir
+        self.workflow_name = workflow_name
+        self.status = "queued"  # queued / running / success / error
+        self.steps: List[Dict[str, Any]] = []  # [{step_id, name, status}]
+        self.events: List[Dict[str, Any]] = []
+        self.report: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+
+    @property
+    def completed(self) -> bool:
+        return self.status in ("success", "error")
+
+    def to_status(self) -> Dict[str, Any]:
+        """
+        转换为 /api/workflow/status 响应格式（与前端轮询逻辑保持一致）
+
+        前端步骤状态取值：pending / running / success / failed
+        """
+        return {
+            "run_id": self.run_id,
+            "status": "failed" if self.status == "error" else self.status,
+            "completed": self.completed,
+            "workflow_name": self.workflow_name,
+            "steps_status": [
+                {**step, "status": "failed" if step["status"] == "error" else step["status"]}
+                for step in self.steps
+            ],
+            "report_data": self.report,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at
+        }
+
+
+class WorkflowRunManager:
+    """
+    工作流运行管理器
+
+    - run_in_background(): 在有界线程池中执行同步的工作流函数（不阻塞事件循环）
+    - publish(): 线程安全地记录、持久化并推送进度事件
+    - subscribe()/unsubscribe(): 本进程运行的 SSE 订阅
+    - get_status()/follow_events(): 查询任意进程中的运行（读取结果目录中的状态和事件日志）
+    """
+
+    def __init__(
+        self,
+        max_concurrent_runs: int = 2,
+        max_finished_runs: int = 200,
+        results_dir: Optional[str] = None
+    ):
+        """
+        Args:
+            max_concurrent_runs: 同时执行的工作流数量上限（超出的排队等待）
+            max_finished_runs: 内存中保留的已结束运行数量（超出时淘汰最旧的）
+            results_dir: 结果根目录（运行 ID 为其下的目录名），用于读取其他进程的运行状态
+        """
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_concurrent_runs,
+            thread_name_prefix="workflow-run"
+        )
+        self.max_concurrent_runs = max_concurrent_runs
+        self.max_finished_runs = max_finished_runs
+        self.results_dir = Path(results_dir) if results_dir else None
+        self._runs: Dict[str, WorkflowRun] = {}
+        self._listeners: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+        self._lock = threading.Lock()
+
+    def create_run(self, run_id: str, output_dir: str, workflow_name: str = "") -> WorkflowRun:
+        """登记新的运行（同时在输出目录中写入初始状态，其他进程可立即查询）"""
+        with self._lock:
+            run = WorkflowRun(run_id, output_dir, workflow_name)
+            self._runs[run_id] = run
+            self._prune()
+            os.makedirs(output_dir, exist_ok=True)
+            # 续跑复用输出目录：清空上一次运行的事件日志
+            open(os.path.join(output_dir, EVENTS_FILENAME), "w").close()
+            self._persist_status(run)
+            return run
+
+    def get_run(self, run_id: str) -> Optional[WorkflowRun]:
+        """本进程中的运行（其他进程的运行见 load_status）"""
+        return self._runs.get(run_id)
+
+    def get_status(self, run_id: str) -> Optional[Dict[str, Any]]:
+        """
+        查询运行状态：先查本进程，再读取结果目录中持久化的状态
+
+        Returns:
+            /api/workflow/status 响应；运行不存在时返回 None
+        """
+        run = self._runs.get(run_id)
+        if run is not None:
+            return run.to_status()
+        return self.load_status(run_id)
+
+    def load_status(self, run_id: str) -> Optional[Dict[str, Any]]:
+        """读取持久化的运行状态（任意进程写入）；不存在或无法解析时返回 None"""
+        run_dir = self._run_dir(run_id)
+        if run_dir is None:
+            return None
+        try:
+            with open(run_dir / STATUS_FILENAME, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    async def follow_events(
+        self,
+        run_id: str,
+        poll_interval: float = 0.5,
+        heartbeat_interval: float = 15.0
+    ) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """
+        从事件日志读取运行事件（用于在其他进程中执行的运行），直到 workflow_finished
+
+        Args:
+            run_id: 运行 ID
+            poll_interval: 没有新事件时的轮询间隔（秒）
+            heartbeat_interval: 空闲多久产出一次 None（心跳）
+
+        Returns:
+            事件迭代器（先返回已有的全部事件）
+        """
+        run_dir = self._run_dir(run_id)
+        if run_dir is None:
+            return
+        path = run_dir / EVENTS_FILENAME
+        offset = 0
+        idle = 0.0
+        while True:
+            events, offset = _read_new_events(path, offset)
+            for event in events:
+                yield event
+                if event.get("type") == "workflow_finished":
+                    return
+            if events:
+                idle = 0.0
+                continue
+            if idle >= heartbeat_interval:
+                idle = 0.0
+                yield None
+            await asyncio.sleep(poll_interval)
+            idle += poll_interval
+
+    def _run_dir(self, run_id: str) -> Optional[Path]:
+        """运行 ID 对应的输出目录（只接受结果根目录下的目录名）"""
+        if self.results_dir is None or not run_id or run_id.startswith(".") or os.path.basename(run_id) != run_id:
+            return None
+        return self.results_dir / run_id
+
+    def _persist_status(self, run: WorkflowRun) -> None:
+        """原子写入运行状态（调用方持有锁）"""
+        path = os.path.join(run.output_dir, STATUS_FILENAME)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(run.to_status(), f, ensure_ascii=False, default=str)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"⚠️ [RunManager] 写入运行状态失败 {run.run_id}: {e}")
+
+    def _persist_event(self, run: WorkflowRun, event: Dict[str, Any]) -> None:
+        """追加事件日志（调用方持有锁；每个事件一行，完整写入后才会被读取）"""
+        try:
+            line = json.dumps(event, ensure_ascii=False, default=str) + "\n"
+            with open(os.path.join(run.output_dir, EVENTS_FILENAME), "a", encoding="utf-8") as f:
+                f.write(line)
+        except OSError as e:
+            logger.warning(f"⚠️ [RunManager] 写入运行事件失败 {run.run_id}: {e}")
+
+    def publish(self, run_id: str, event: Dict[str, Any]) -> None:
+        """
+        记录事件、更新步骤状态并推送给订阅者（可在任意线程调用）
+
+        Args:
+            run_id: 运行 ID
+            event: 事件字典（至少包含 type）
+        """
+        run = self._runs.get(run_id)
+        if run is None:
+            return
+
+        event = {**event, "run_id": run_id}
+        event_type = event.get("type")
+        with self._lock:
+            if event_type == "workflow_started":
+                run.status = "running"
+                run.steps = [{**step, "status": "pending"} for step in event.get("steps", [])]
+            elif event_type in ("step_started", "step_finished"):
+                new_status = "running" if event_type == "step_started" else event.get("status", "error")
+                for step in run.steps:
+                    if step["step_id"] == event.get("step_id"):
+                        step["status"] = new_status
+            elif event_type == "workflow_finished":
+                run.status = event.get("status", "error")
+                run.report = event.get("report_data")
+                run.error = event.get("error")
+                run.finished_at = time.time()
+
+            run.events.append(event)
+            if len(run.events) > MAX_EVENTS_PER_RUN:
+                del run.events[: len(run.events) - MAX_EVENTS_PER_RUN]
+            # 先追加事件再更新状态：状态显示已结束时，事件日志中一定有 workflow_finished
+            self._persist_event(run, event)
+            self._persist_status(run)
+            listeners = list(self._listeners.get(run_id, []))
+
+        for loop, queue in listeners:
+            try:
+                loop.call_soon_threadsafe(_put_or_drop, queue, event)
+            except RuntimeError:
+                # 事件循环已关闭
+                pass
+
+    def subscribe(self, run_id: str, maxsize: int = 200) -> asyncio.Queue:
+        """
+        订阅运行事件（需在事件循环中调用）；队列中会先放入历史事件
+
+        Returns:
+            事件队列
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        with self._lock:
+            run = self._runs.get(run_id)
+            for event in (run.events[-maxsize:] if run else []):
+                queue.put_nowait(event)
+            self._listeners.setdefault(run_id, []).append((loop, queue))
+        return queue
+
+    def unsubscribe(self, run_id: str, queue: asyncio.Queue) -> None:
+        with self._lock:
+            listeners = self._listeners.get(run_id, [])
+            self._listeners[run_id] = [(l, q) for l, q in listeners if q is not queue]
+            if not self._listeners[run_id]:
+                del self._listeners[run_id]
+
+    async def run_in_background(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """在运行线程池中执行同步函数并等待结果（不阻塞事件循环）"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, lambda: func(*args, **kwargs))
+
+    def _prune(self) -> None:
+        """淘汰最旧的已结束运行（调用方持有锁）"""
+        finished = sorted(
+            (run for run in self._runs.values() if run.completed),
+            key=lambda run: run.finished_at or run.created_at
+        )
+        for run in finished[: max(0, len(finished) - self.max_finished_runs)]:
+            self._runs.pop(run.run_id, None)
+
+
+def _put_or_drop(queue: asyncio.Queue, event: Dict[str, Any]) -> None:
+    """队列满时丢弃最旧的事件，保证慢订阅者不会阻塞推送"""
+    if queue.full():
+        try:
+            queue.get_nowait()
+        except asyncio.QueueEmpty:
+            pass
+    queue.put_nowait(event)
+
+
+def _read_new_events(path: Path, offset: int) -> Tuple[List[Dict[str, Any]], int]:
+    """从 offset 开始读取完整的事件行，返回 (事件列表, 新的 offset)"""
+    try:
+        with open(path, "rb") as f:
+            f.seek(offset)
+            data = f.read()
+    except OSError:
+        return [], offset
+    end = data.rfind(b"\n") + 1
+    events = []
+    for line in data[:end].splitlines():
+        try:
+            events.append(json.loads(line))
+        except ValueError:
+            continue
+    return events, offset + end
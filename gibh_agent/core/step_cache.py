@@ -0,0 +1,556 @@
+"""
+步骤结果缓存 - 内容寻址的工作流步骤记忆化
+
+缓存键 = tool_id + 参数（输入文件路径替换为内容哈希）+ 缓存版本。
+缓存项保存在磁盘上：result.json（工具返回的结果字典）+ artifacts/（结果引用的产物文件）。
+
+- 产物以硬链接（跨文件系统时尝试 reflink）的方式放入缓存和取出到运行目录，不复制
+  文件内容；两者都不可用时，写入缓存的复制在后台线程中完成（不占用步骤的执行时间），
+  缓存项在复制完成后才可见
+- 缓存项与运行目录中的产物共享同一份文件：工具不得原地改写输入或已有的产物文件
+  （应写到新路径）。读取时校验产物的 (大小, mtime)，被改写过的缓存项视为失效并删除
+- 命中时产物保持相对于原运行 output_dir 的路径（子目录结构不变）；原步骤的 output_path
+  对应的产物放到当前步骤请求的 output_path。目标位置已有其他文件时不覆盖，按未命中处理
+- 索引（SQLite，cache_dir/index.sqlite）记录各缓存项的大小和最近访问时间，
+  总大小超过上限时按 LRU 淘汰，不需要扫描缓存目录；同一个数据库按
+  (设备, inode, 大小, mtime) 记录文件哈希，多个进程（包括步骤子进程）共享，
+  上传目录中来自 blob_store 的文件直接使用上传时计算的 SHA-256
+"""
+import os
+import json
+import time
+import fcntl
+import shutil
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+from .utils import sanitize_for_json
+
+logger = logging.getLogger(__name__)
+
+# 工具实现或结果格式发生不兼容变化时递增，使旧缓存全部失效
+CACHE_VERSION = 1
+
+# 不参与缓存键计算的参数（只影响输出位置，不影响结果内容）
+_IGNORED_PARAMS = {"output_dir", "output_path"}
+
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+# 进程内文件哈希记忆的条目上限（LRU）；持久化的哈希索引上限
+_HASH_MEMO_SIZE = 4096
+_HASH_INDEX_MAX_ROWS = 100000
+
+# Linux FICLONE ioctl（btrfs / XFS 等支持 reflink 的文件系统）
+_FICLONE = 0x40049409
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    tool_id TEXT,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS file_hashes (
+    file_id TEXT PRIMARY KEY,
+    digest TEXT NOT NULL,
+    accessed_at REAL NOT NULL
+);
+"""
+
+
+def _link_or_clone(src: Path, dst: Path) -> bool:
+    """
+    以硬链接或 reflink 的方式让 dst 与 src 内容相同（不复制数据）
+
+    Returns:
+        是否成功；都不支持时返回 False（调用方自行复制）
+    """
+    try:
+        os.link(src, dst)
+        return True
+    except OSError:
+        pass
+    try:
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+        shutil.copystat(src, dst)
+        return True
+    except OSError:
+        Path(dst).unlink(missing_ok=True)
+        return False
+
+
+class _TargetOccupied(Exception):
+    """命中缓存时产物的目标路径已有其他文件（不覆盖）"""
+
+
+def _relocate(original_path: str, meta: Dict[str, Any], output_dir: str, output_path: Optional[str]) -> Optional[Path]:
+    """
+    产物在当前运行中的位置
+
+    依次尝试：原 output_path（文件或其下的文件）-> 当前 output_path；原 output_dir 下的
+    相对路径 -> 当前 output_dir。都不适用时返回 None（由调用方按文件名放入 output_dir）。
+    """
+    original = os.path.abspath(original_path)
+    bases = []
+    if meta.get("output_path") and output_path:
+        bases.append((os.path.abspath(meta["output_path"]), output_path))
+    if meta.get("output_dir"):
+        bases.append((os.path.abspath(meta["output_dir"]), output_dir))
+    for old_base, new_base in bases:
+        if original == old_base:
+            return Path(new_base)
+        if original.startswith(old_base + os.sep):
+            return Path(new_base) / os.path.relpath(original, old_base)
+    return None
+
+
+def _file_stat(path: Path) -> List[int]:
+    stat = path.stat()
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class StepResultCache:
+    """
+    工作流步骤结果缓存
+
+    文件哈希按 (设备, inode, 大小, mtime) 记忆：进程内为有界 LRU，跨进程共享 SQLite 索引。
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        """
+        初始化步骤结果缓存
+
+        Args:
+            cache_dir: 缓存根目录
+            max_bytes: 缓存总大小上限（字节）
+        """
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self._hash_memo: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._copier: Optional[ThreadPoolExecutor] = None
+        self._hash_writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.db_path = str(self.cache_dir / "index.sqlite")
+        conn = self._connect()
+        conn.executescript(_SCHEMA)
+        if conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0] == 0:
+            self._rebuild_index()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _rebuild_index(self) -> None:
+        """索引为空时（首次使用或旧版本缓存目录）扫描一次已有的缓存项"""
+        rows = []
+        for meta_file in self.cache_dir.glob("*/*/result.json"):
+            try:
+                with open(meta_file, "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+                mtime = meta_file.stat().st_mtime
+                rows.append((meta_file.parent.name, meta.get("tool_id"), meta.get("size", 0), meta.get("created_at", mtime), mtime))
+            except Exception:
+                continue
+        if rows:
+            self._connect().executemany(
+                "INSERT OR IGNORE INTO entries (key, tool_id, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            logger.info(f"🔍 [StepCache] 重建索引: {len(rows)} 个缓存项")
+
+    # ------------------------------------------------------------------
+    # 缓存键
+    # ------------------------------------------------------------------
+
+    def _file_digest(self, p: Path) -> str:
+        """文件内容的 sha256（依次查进程内记忆、共享索引、blob_store，最后才读取文件）"""
+        stat = p.stat()
+        file_id = f"{stat.st_dev}:{stat.st_ino}:{stat.st_size}:{stat.st_mtime_ns}"
+        with self._lock:
+            cached = self._hash_memo.get(file_id)
+            if cached:
+                self._hash_memo.move_to_end(file_id)
+                return cached
+
+        digest = None
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT digest FROM file_hashes WHERE file_id = ?", (file_id,)).fetchone()
+            digest = row[0] if row else None
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ [StepCache] 哈希索引读取失败: {e}")
+
+        if digest is None:
+            from .blob_store import get_blob_store
+            blob_store = get_blob_store()
+            if blob_store is not None:
+                digest = blob_store.digest_of(str(p))
+
+        if digest is None:
+            hasher = hashlib.sha256()
+            with open(p, "rb") as f:
+                for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b""):
+                    hasher.update(chunk)
+            digest = hasher.hexdigest()
+
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO file_hashes (file_id, digest, accessed_at) VALUES (?, ?, ?)",
+                (file_id, digest, time.time())
+            )
+            self._hash_writes += 1
+            if self._hash_writes % 1000 == 0:
+                # 偶尔裁剪索引，保留最近使用的条目
+                conn.execute(
+                    "DELETE FROM file_hashes WHERE file_id NOT IN "
+                    "(SELECT file_id FROM file_hashes ORDER BY accessed_at DESC LIMIT ?)",
+                    (_HASH_INDEX_MAX_ROWS,)
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ [StepCache] 哈希索引写入失败: {e}")
+
+        with self._lock:
+            self._hash_memo[file_id] = digest
+            while len(self._hash_memo) > _HASH_MEMO_SIZE:
+                self._hash_memo.popitem(last=False)
+        return digest
+
+    def hash_path(self, path: str) -> Optional[str]:
+        """
+        计算文件或目录的内容哈希（sha256）
+
+        Args:
+            path: 文件或目录路径
+
+        Returns:
+            十六进制哈希；路径不存在时返回 None
+        """
+        p = Path(path)
+        if p.is_file():
+            return self._file_digest(p)
+        if p.is_dir():
+            # 目录（如 10x 数据目录）：按相对路径排序后组合各文件哈希
+            digest = hashlib.sha256()
+            for child in sorted(c for c in p.rglob("*") if c.is_file()):
+                digest.update(str(child.relative_to(p)).encode("utf-8"))
+                digest.update(self._file_digest(child).encode("utf-8"))
+            return digest.hexdigest()
+        return None
+
+    def make_key(self, tool_id: str, params: Dict[str, Any]) -> str:
+        """
+        计算缓存键
+
+        Args:
+            tool_id: 工具 ID
+            params: 已完成数据流处理的参数
+
+        Returns:
+            缓存键（sha256 十六进制）
+        """
+        def normalize(value):
+            if isinstance(value, str) and len(value) < 4096 and os.path.exists(value):
+                return {"__content__": self.hash_path(value)}
+            if isinstance(value, dict):
+                return {str(k): normalize(v) for k, v in sorted(value.items(), key=lambda kv: str(kv[0]))}
+            if isinstance(value, (list, tuple)):
+                return [normalize(v) for v in value]
+            return value
+
+        payload = {
+            "version": CACHE_VERSION,
+            "tool_id": tool_id,
+            "params": normalize({k: v for k, v in params.items() if k not in _IGNORED_PARAMS})
+        }
+        encoded = json.dumps(payload, sort_keys=True, default=str, ensure_ascii=False)
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    # ------------------------------------------------------------------
+    # 读写
+    # ------------------------------------------------------------------
+
+    def _entry_dir(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / key
+
+    def _remove_entry(self, key: str) -> None:
+        shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+        try:
+            self._connect().execute("DELETE FROM entries WHERE key = ?", (key,))
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ [StepCache] 索引删除失败: {e}")
+
+    def get(self, key: str, output_dir: Optional[str] = None, output_path: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        读取缓存结果
+
+        产物文件以硬链接（或 reflink，都不支持时复制）的方式放入 output_dir（保持相对路径；
+        原 output_path 对应的产物放到 output_path），结果中的路径随之改写。
+        任一目标路径已有其他文件时不覆盖，按未命中处理（缓存项保留）。
+
+        Args:
+            key: 缓存键
+            output_dir: 当前运行的输出目录（为 None 时直接返回缓存内的路径）
+            output_path: 当前步骤请求的输出路径（可选）
+
+        Returns:
+            工具结果字典；未命中时返回 None
+        """
+        entry = self._entry_dir(key)
+        meta_file = entry / "result.json"
+        if not meta_file.exists():
+            self.misses += 1
+            return None
+
+        try:
+            with open(meta_file, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+
+            path_map = {}
+            placements: List[Tuple[Path, Path]] = []
+            artifact_stats = meta.get("artifact_stats", {})
+            for original_path, artifact_name in meta.get("artifacts", {}).items():
+                cached_path = entry / "artifacts" / artifact_name
+                if not cached_path.exists():
+                    raise FileNotFoundError(f"缓存产物缺失: {cached_path}")
+                expected = artifact_stats.get(artifact_name)
+                if expected and _file_stat(cached_path) != expected:
+                    # 共享的产物文件被原地改写过，内容已不可信
+                    raise ValueError(f"缓存产物已被修改: {cached_path}")
+                if not output_dir:
+                    path_map[original_path] = str(cached_path)
+                    continue
+                target = _relocate(original_path, meta, output_dir, output_path)
+                if target is None:
+                    # 原运行目录之外的产物（或旧版本缓存项）：按文件名放入 output_dir，重名时带编号
+                    target = Path(output_dir) / Path(original_path).name
+                    if str(target) in path_map.values():
+                        target = Path(output_dir) / artifact_name
+                if os.path.lexists(target) and not (target.exists() and os.path.samefile(target, cached_path)):
+                    raise _TargetOccupied(str(target))
+                placements.append((cached_path, target))
+                path_map[original_path] = str(target)
+
+            # 🔥 先确认所有目标路径可用，再放置产物（不覆盖本步骤之外产生的文件）
+            for cached_path, target in placements:
+                if os.path.lexists(target):
+                    continue
+                target.parent.mkdir(parents=True, exist_ok=True)
+                if not _link_or_clone(cached_path, target):
+                    shutil.copy2(cached_path, target)
+
+            try:
+                self._connect().execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            except sqlite3.Error as e:
+                logger.warning(f"⚠️ [StepCache] 索引更新失败: {e}")
+            self.hits += 1
+            return _replace_paths(meta["result"], path_map)
+        except _TargetOccupied as e:
+            logger.info(f"ℹ️ [StepCache] 目标路径已有其他文件，不使用缓存: {e}")
+            self.misses += 1
+            return None
+        except Exception as e:
+            logger.warning(f"⚠️ [StepCache] 读取缓存失败，将重新计算: {e}")
+            self._remove_entry(key)
+            self.misses += 1
+            return None
+
+    def put(
+        self,
+        key: str,
+        tool_id: str,
+        result: Dict[str, Any],
+        input_paths: Optional[set] = None,
+        output_dir: Optional[str] = None,
+        output_path: Optional[str] = None
+    ) -> None:
+        """
+        写入缓存结果（结果中引用的产物文件以硬链接/reflink 放入缓存，需要复制时在后台完成）
+
+        Args:
+            key: 缓存键
+            tool_id: 工具 ID（仅用于记录）
+            result: 工具返回的结果字典（仅缓存成功结果）
+            input_paths: 输入文件路径集合（这些路径不会被当作产物放入缓存）
+            output_dir: 本次运行的输出目录（命中时产物按相对它的路径放置）
+            output_path: 本步骤的输出路径参数（命中时对应的产物放到新的 output_path）
+        """
+        if result.get("status") == "error":
+            return
+
+        input_paths = {os.path.abspath(p) for p in (input_paths or set())}
+        locations = {"output_dir": output_dir, "output_path": output_path}
+        entry = self._entry_dir(key)
+        tmp_entry = entry.with_name(f"{entry.name}.tmp{os.getpid()}_{threading.get_ident()}")
+        try:
+            result = sanitize_for_json(result)
+            artifacts = {}
+            pending_copies: List[Tuple[str, Path]] = []
+            (tmp_entry / "artifacts").mkdir(parents=True, exist_ok=True)
+            for path in _collect_paths(result):
+                if os.path.abspath(path) in input_paths or path in artifacts:
+                    continue
+                artifact_name = f"{len(artifacts)}_{Path(path).name}"
+                artifacts[path] = artifact_name
+                if not _link_or_clone(Path(path), tmp_entry / "artifacts" / artifact_name):
+                    pending_copies.append((path, tmp_entry / "artifacts" / artifact_name))
+        except Exception as e:
+            logger.warning(f"⚠️ [StepCache] 写入缓存失败: {e}")
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+            return
+
+        if pending_copies:
+            # 无法链接（如缓存目录与运行目录不在同一文件系统）：复制不阻塞当前步骤
+            with self._lock:
+                if self._copier is None:
+                    self._copier = ThreadPoolExecutor(max_workers=1, thread_name_prefix="step-cache-copy")
+            self._copier.submit(self._finish_put, key, tool_id, result, artifacts, tmp_entry, pending_copies, locations)
+        else:
+            self._finish_put(key, tool_id, result, artifacts, tmp_entry, [], locations)
+
+    def _finish_put(
+        self,
+        key: str,
+        tool_id: str,
+        result: Dict[str, Any],
+        artifacts: Dict[str, str],
+        tmp_entry: Path,
+        pending_copies: List[Tuple[str, Path]],
+        locations: Dict[str, Optional[str]]
+    ) -> None:
+        """完成需要复制的产物、写入 result.json 并原子发布缓存项"""
+        entry = self._entry_dir(key)
+        try:
+            for src, dst in pending_copies:
+                shutil.copy2(src, dst)
+            artifact_stats = {
+                name: _file_stat(tmp_entry / "artifacts" / name) for name in artifacts.values()
+            }
+            size = sum(stat[0] for stat in artifact_stats.values())
+            meta = {
+                "tool_id": tool_id,
+                "created_at": time.time(),
+                "size": size,
+                "artifacts": artifacts,
+                "artifact_stats": artifact_stats,
+                **locations,
+                "result": result
+            }
+            with open(tmp_entry / "result.json", "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False)
+
+            # 原子替换：并发写入同一键时保留先完成的那一份
+            entry.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                os.rename(tmp_entry, entry)
+            except OSError:
+                shutil.rmtree(tmp_entry, ignore_errors=True)
+                return
+            now = time.time()
+            self._connect().execute(
+                "INSERT OR REPLACE INTO entries (key, tool_id, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, tool_id, size, now, now)
+            )
+            logger.info(f"💾 [StepCache] 已缓存 {tool_id} ({size / 1024 / 1024:.1f} MB)")
+        except Exception as e:
+            logger.warning(f"⚠️ [StepCache] 写入缓存失败: {e}")
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+            return
+
+        self.evict()
+
+    def total_bytes(self) -> int:
+        """缓存总大小（按索引）"""
+        return self._connect().execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def evict(self) -> None:
+        """按 LRU 淘汰缓存项，直到总大小不超过上限（只查索引，不扫描缓存目录）"""
+        with self._lock:
+            try:
+                total = self.total_bytes()
+                if total <= self.max_bytes:
+                    return
+                rows = self._connect().execute("SELECT key, size FROM entries ORDER BY accessed_at ASC").fetchall()
+            except sqlite3.Error as e:
+                logger.warning(f"⚠️ [StepCache] 索引读取失败，跳过淘汰: {e}")
+                return
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                self._remove_entry(key)
+                total -= size
+                logger.info(f"🗑️ [StepCache] LRU 淘汰: {key}")
+
+
+def _collect_paths(value: Any) -> list:
+    """递归收集结果中引用的已存在文件路径"""
+    if isinstance(value, str):
+        return [value] if len(value) < 4096 and os.path.isfile(value) else []
+    if isinstance(value, dict):
+        return [p for v in value.values() for p in _collect_paths(v)]
+    if isinstance(value, list):
+        return [p for v in value for p in _collect_paths(v)]
+    return []
+
+
+def _replace_paths(value: Any, path_map: Dict[str, str]) -> Any:
+    """递归改写结果中的产物路径"""
+    if isinstance(value, str):
+        return path_map.get(value, value)
+    if isinstance(value, dict):
+        return {k: _replace_paths(v, path_map) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_replace_paths(v, path_map) for v in value]
+    return value
+
+
+_step_cache: Optional[StepResultCache] = None
+_step_cache_lock = threading.Lock()
+
+
+def get_step_cache() -> Optional[StepResultCache]:
+    """
+    获取全局步骤结果缓存（由环境变量配置）
+
+    - STEP_CACHE_ENABLED: 是否启用（默认 true）
+    - STEP_CACHE_DIR: 缓存目录（默认 $RESULTS_DIR/.step_cache；与运行目录在同一文件系统时产物以硬链接共享）
+    - STEP_CACHE_MAX_GB: 缓存总大小上限（默认 20）
+
+    Returns:
+        StepResultCache 实例；禁用或初始化失败时返回 None
+    """
+    global _step_cache
+    if os.getenv("STEP_CACHE_ENABLED", "true").lower() not in ("1", "true", "yes"):
+        return None
+    if _step_cache is None:
+        with _step_cache_lock:
+            if _step_cache is None:
+                cache_dir = os.getenv(
+                    "STEP_CACHE_DIR",
+                    os.path.join(os.getenv("RESULTS_DIR", "./results"), ".step_cache")
+                )
+                max_bytes = int(float(os.getenv("STEP_CACHE_MAX_GB", "20")) * 1024 ** 3)
+                try:
+                    _step_cache = StepResultCache(cache_dir, max_bytes)
+                except (sqlite3.Error, OSError) as e:
+                    logger.warning(f"⚠️ [StepCache] 初始化失败，禁用步骤缓存: {e}")
+                    return None
+                logger.info(f"✅ [StepCache] 缓存目录: {cache_dir} (上限 {max_bytes / 1024 ** 3:.1f} GB)")
+    return _step_cache
@@ -0,0 +1,218 @@
+"""
+表格中间产物读写 - 代谢组学步骤之间的列式交接
+
+宽表 CSV 的解析是代谢组学步骤的主要耗时。中间产物默认写为未压缩的 Arrow IPC（.arrow，
+可内存映射；样本 × 数千特征的宽表上比 Parquet 快得多），通过 pandas 元数据保留索引、
+列顺序和元数据列的数据类型（如分组列的字符串/分类类型）；CSV 仅作为可选导出。
+
+- read_table(): 按扩展名选择读取方式；传入 CSV 路径时，若存在同名且不旧于它的
+  .arrow / .parquet 文件，自动走列式快速路径
+- read_table_columns(): 只读取列名（只读 schema，不读数据）
+- write_table(): 写出中间产物（METABOLOMICS_INTERMEDIATE_FORMAT: arrow / parquet / csv；
+  pyarrow 不可用时回退为 CSV；混合类型的 object 列转为字符串后写出，仍无法转换时回退为 CSV）
+"""
+import os
+import logging
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+PARQUET_SUFFIXES = (".parquet", ".pq")
+ARROW_SUFFIXES = (".arrow", ".feather", ".ipc")
+
+
+def _columnar_sibling(path: Path) -> Optional[Path]:
+    """CSV 旁边同名且不旧于它的列式文件"""
+    for suffix in ARROW_SUFFIXES + PARQUET_SUFFIXES:
+        sibling = path.with_suffix(suffix)
+        if sibling.is_file() and sibling.stat().st_mtime >= path.stat().st_mtime:
+            return sibling
+    return None
+
+
+def resolve_table_path(file_path: str) -> str:
+    """
+    返回实际读取的文件路径（CSV 有更新的列式副本时返回列式文件）
+
+    Args:
+        file_path: 表格文件路径
+
+    Returns:
+        实际读取的路径
+    """
+    path = Path(file_path)
+    if path.suffix.lower() == ".csv" and path.is_file():
+        sibling = _columnar_sibling(path)
+        if sibling is not None:
+            return str(sibling)
+    return str(path)
+
+
+def read_table(
+    file_path: str,
+    columns: Optional[List[str]] = None,
+    nrows: Optional[int] = None,
+    index_col: Optional[int] = 0
+) -> pd.DataFrame:
+    """
+    读取表格（默认第一列/索引为样本 ID）
+
+    Args:
+        file_path: .parquet / .arrow / .csv 文件路径
+        columns: 只读取这些列（列式格式下不会解析其他列）
+        nrows: 只读取前 N 行
+        index_col: CSV 的索引列；为 None 时读取长表（不设索引，列式文件中的索引列恢复为普通列）
+
+    Returns:
+        DataFrame
+    """
+    df = _read_table(Path(resolve_table_path(file_path)), columns, nrows, index_col)
+    if index_col is None and any(name is not None for name in df.index.names):
+        df = df.reset_index()
+    return df
+
+
+def _read_table(path: Path, columns: Optional[List[str]], nrows: Optional[int], index_col: Optional[int]) -> pd.DataFrame:
+    suffix = path.suffix.lower()
+
+    if suffix in PARQUET_SUFFIXES:
+        if nrows is not None:
+            import pyarrow.parquet as pq
+            parquet_file = pq.ParquetFile(path, memory_map=True)
+            batch = next(parquet_file.iter_batches(batch_size=nrows, columns=_with_index(parquet_file.schema_arrow, columns)), None)
+            if batch is None:
+                return pd.read_parquet(path, columns=columns)
+            return batch.to_pandas()
+        return pd.read_parquet(path, columns=columns, memory_map=True)
+
+    if suffix in ARROW_SUFFIXES:
+        import pyarrow.feather as feather
+        # 内存映射读取；pandas 元数据会恢复索引和列类型
+        table = feather.read_table(path, columns=_with_index(table_schema(path), columns), memory_map=True)
+        if nrows is not None:
+            table = table.slice(0, nrows)
+        return table.to_pandas()
+
+    df = pd.read_csv(path, index_col=index_col, nrows=nrows)
+    return df[columns] if columns is not None else df
+
+
+def table_schema(path: Path):
+    """读取 Arrow IPC 文件的 schema（不读取数据）"""
+    import pyarrow as pa
+    with pa.memory_map(str(path), "r") as source:
+        return pa.ipc.open_file(source).schema
+
+
+def _with_index(schema, columns: Optional[List[str]]) -> Optional[List[str]]:
+    """按列读取时补上 pandas 索引列，保证样本 ID 不丢失"""
+    if columns is None:
+        return None
+    metadata = schema.pandas_metadata or {}
+    index_columns = [c for c in metadata.get("index_columns", []) if isinstance(c, str)]
+    return index_columns + [c for c in columns if c not in index_columns]
+
+
+def read_table_columns(file_path: str) -> List[str]:
+    """
+    读取表格的列名（不含索引列）
+
+    Parquet 只读取文件尾部的 schema；CSV 只解析表头。
+    """
+    path = Path(resolve_table_path(file_path))
+    suffix = path.suffix.lower()
+    if suffix in PARQUET_SUFFIXES + ARROW_SUFFIXES:
+        if suffix in PARQUET_SUFFIXES:
+            import pyarrow.parquet as pq
+            schema = pq.read_schema(path)
+        else:
+            schema = table_schema(path)
+        index_columns = set((schema.pandas_metadata or {}).get("index_columns", []))
+        return [name for name in schema.names if name not in index_columns]
+    return list(pd.read_csv(path, index_col=0, nrows=0).columns)
+
+
+def intermediate_format() -> str:
+    """中间产物格式（METABOLOMICS_INTERMEDIATE_FORMAT: arrow / parquet / csv，默认 arrow）"""
+    return os.getenv("METABOLOMICS_INTERMEDIATE_FORMAT", "arrow").lower()
+
+
+def write_table(
+    df: pd.DataFrame,
+    output_stem: str,
+    export_csv: bool = False,
+    fmt: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    写出表格中间产物
+
+    Args:
+        df: 要保存的 DataFrame（索引为样本 ID）
+        output_stem: 不含扩展名的输出路径
+        export_csv: 是否同时导出 CSV（供用户下载）
+        fmt: arrow / parquet / csv（默认 METABOLOMICS_INTERMEDIATE_FORMAT）
+
+    Returns:
+        {"path": 中间产物路径, "format": "arrow"/"parquet"/"csv", "csv_path": CSV 路径或 None}
+    """
+    stem = Path(output_stem)
+    stem.parent.mkdir(parents=True, exist_ok=True)
+    csv_path = None
+    fmt = (fmt or intermediate_format()).lower()
+
+    table = None
+    if fmt in ("arrow", "parquet"):
+        try:
+            import pyarrow as pa
+        except ImportError:
+            pa = None
+            logger.warning("⚠️ pyarrow 未安装，中间产物回退为 CSV（pip install pyarrow）")
+        if pa is not None:
+            frame = df.copy(deep=False)
+            # 列式格式要求列名为字符串
+            frame.columns = [str(c) for c in frame.columns]
+            try:
+                table = pa.Table.from_pandas(frame, preserve_index=True)
+            except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError) as e:
+                # 混合类型的 object 列（如 Group=['a', 1, 'b']）无法推断 Arrow 类型：转为字符串重试
+                # （与 CSV 往返后的结果一致）
+                logger.warning(f"⚠️ {stem.name}: 存在混合类型的列，转为字符串后写出列式文件 ({e})")
+                try:
+                    table = pa.Table.from_pandas(_stringify_object_columns(frame), preserve_index=True)
+                except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError) as e:
+                    logger.warning(f"⚠️ {stem.name}: 无法转换为列式表，中间产物回退为 CSV ({e})")
+
+    if table is not None:
+        # 先写 CSV 导出，保证列式文件不旧于 CSV（read_table 读取 CSV 路径时会走列式快速路径）
+        if export_csv:
+            csv_path = f"{stem}.csv"
+            df.to_csv(csv_path)
+        if fmt == "parquet":
+            import pyarrow.parquet as pq
+            path = f"{stem}.parquet"
+            pq.write_table(table, path)
+        else:
+            import pyarrow.feather as feather
+            path = f"{stem}.arrow"
+            # 不压缩，读取时可直接内存映射
+            feather.write_feather(table, path, compression="uncompressed")
+        return {"path": path, "format": fmt, "csv_path": csv_path}
+
+    path = f"{stem}.csv"
+    df.to_csv(path)
+    return {"path": path, "format": "csv", "csv_path": path}
+
+
+def _stringify_object_columns(frame: pd.DataFrame) -> pd.DataFrame:
+    """把 object 列（和 object 索引）中的非缺失值转为字符串，缺失值保持为空"""
+    frame = frame.copy(deep=False)
+    for position in range(frame.shape[1]):
+        series = frame.iloc[:, position]
+        if series.dtype == object:
+            frame.isetitem(position, series.where(series.isna(), series.astype(str)))
+    if not isinstance(frame.index, pd.MultiIndex) and frame.index.dtype == object:
+        frame.index = frame.index.map(lambda v: v if pd.isna(v) else str(v))
+    return frame
@@ -0,0 +1,287 @@
+"""
+上传文件落盘 - 分块流式写入与可续传上传
+
+- stream_to_file(): 把上传流按固定大小分块写入同目录的临时文件，边写边累计大小
+  （超过上限立即中止）和计算 SHA-256，完成后原子重命名到目标路径；内存占用与文件大小无关
+- ResumableUploadStore: 按偏移量分块上传（PUT），用于多 GB 的 10x / FASTQ 输入；每个
+  分块是一次独立的短请求，不受 gunicorn --timeout 限制，断线后从已写入的偏移量继续。
+  会话状态保存在 <upload_dir>/.partial/ 下（JSON + .part 文件），多个 worker 进程共享
+- 传入 BlobStore 时，写完的文件按 SHA-256 存入内容寻址存储，目标路径是指向它的硬链接
+  （重复上传同一内容不占用新的磁盘空间，见 blob_store）
+
+环境变量：
+- UPLOAD_CHUNK_SIZE: 分块大小（字节，默认 1MB）
+- MAX_RESUMABLE_FILE_SIZE: 可续传上传的单文件上限（字节，默认 50GB）
+- RESUMABLE_UPLOAD_TTL_HOURS: 未完成会话的保留时间（默认 24 小时）
+"""
+import os
+import json
+import time
+import uuid
+import fcntl
+import hashlib
+import logging
+from pathlib import Path
+from typing import Dict, Any, Optional, BinaryIO, AsyncIterator
+
+from .blob_store import BlobStore
+
+logger = logging.getLogger(__name__)
+
+PARTIAL_DIRNAME = ".partial"
+
+
+def upload_chunk_size() -> int:
+    return int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+
+
+def max_resumable_file_size() -> int:
+    return int(os.getenv("MAX_RESUMABLE_FILE_SIZE", str(50 * 1024 ** 3)))
+
+
+class UploadTooLargeError(Exception):
+    """上传数据超过大小上限"""
+
+    def __init__(self, max_size: int):
+        super().__init__(f"超过最大大小限制 ({max_size / 1024 / 1024:.0f}MB)")
+        self.max_size = max_size
+
+
+class UploadConflictError(Exception):
+    """续传偏移量与已写入的数据不一致，或会话正被另一个请求写入"""
+
+    def __init__(self, message: str, offset: int):
+        super().__init__(message)
+        self.offset = offset
+
+
+def stream_to_file(
+    source: BinaryIO,
+    dest: Path,
+    max_size: int,
+    chunk_size: Optional[int] = None,
+    blob_store: Optional[BlobStore] = None
+) -> Dict[str, Any]:
+    """
+    分块写入上传流（同步函数，应在线程中调用）
+
+    Args:
+        source: 可读的二进制流（如 UploadFile.file）
+        dest: 目标路径
+        max_size: 大小上限（字节）
+        chunk_size: 分块大小（默认 UPLOAD_CHUNK_SIZE）
+        blob_store: 内容寻址存储（提供时目标路径为指向 blob 的硬链接）
+
+    Returns:
+        {"size": 字节数, "sha256": 十六进制摘要, "deduplicated": 内容是否已存在}
+
+    Raises:
+        UploadTooLargeError: 超过大小上限（临时文件已删除，目标文件不受影响）
+    """
+    chunk_size = chunk_size or upload_chunk_size()
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = dest.parent / f".{dest.name}.{uuid.uuid4().hex[:8]}.tmp"
+    hasher = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp_path, "wb") as f:
+            while True:
+                chunk = source.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise UploadTooLargeError(max_size)
+                hasher.update(chunk)
+                f.write(chunk)
+        digest = hasher.hexdigest()
+        deduplicated = False
+        if blob_store is not None:
+            deduplicated = blob_store.store(tmp_path, dest, digest)
+        else:
+            os.replace(tmp_path, dest)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    return {"size": size, "sha256": digest, "deduplicated": deduplicated}
+
+
+def file_sha256(path: Path, chunk_size: Optional[int] = None) -> str:
+    """分块计算文件的 SHA-256"""
+    chunk_size = chunk_size or upload_chunk_size()
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class ResumableUploadStore:
+    """
+    可续传上传会话（状态保存在磁盘上）
+
+    流程：create() 登记文件名、总大小和目标路径 -> 多次 append(offset, 数据流) ->
+    写满总大小后 finalize() 校验 SHA-256（可选）并原子移动到目标路径。
+    """
+
+    def __init__(self, upload_dir: str, blob_store: Optional[BlobStore] = None):
+        """
+        Args:
+            upload_dir: 上传目录（会话文件放在其下的 .partial/ 中）
+            blob_store: 内容寻址存储（提供时完成的文件链接到 blob）
+        """
+        self.root = Path(upload_dir) / PARTIAL_DIRNAME
+        self.blob_store = blob_store
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _meta_path(self, upload_id: str) -> Path:
+        return self.root / f"{upload_id}.json"
+
+    def _part_path(self, upload_id: str) -> Path:
+        return self.root / f"{upload_id}.part"
+
+    def create(self, target_path: Path, total_size: int, sha256: Optional[str] = None) -> Dict[str, Any]:
+        """
+        登记上传会话
+
+        Args:
+            target_path: 完成后的目标路径（调用方负责校验其在上传目录内）
+            total_size: 文件总大小（字节）
+            sha256: 客户端提供的 SHA-256（可选，完成时校验）
+
+        Returns:
+            会话状态
+
+        Raises:
+            UploadTooLargeError: 总大小超过 MAX_RESUMABLE_FILE_SIZE
+        """
+        if total_size > max_resumable_file_size():
+            raise UploadTooLargeError(max_resumable_file_size())
+        self._prune()
+        session = {
+            "upload_id": uuid.uuid4().hex,
+            "target_path": str(target_path),
+            "total_size": int(total_size),
+            "sha256": sha256.lower() if sha256 else None,
+            "created_at": time.time()
+        }
+        self._part_path(session["upload_id"]).touch()
+        self._meta_path(session["upload_id"]).write_text(json.dumps(session, ensure_ascii=False))
+        return self.status(session["upload_id"])
+
+    def status(self, upload_id: str) -> Optional[Dict[str, Any]]:
+        """
+        会话状态（offset 为已写入的字节数）
+
+        Returns:
+            会话状态；会话不存在时返回 None
+        """
+        meta_path = self._meta_path(upload_id)
+        if not upload_id.isalnum() or not meta_path.is_file():
+            return None
+        session = json.loads(meta_path.read_text())
+        part_path = self._part_path(upload_id)
+        session["offset"] = part_path.stat().st_size if part_path.exists() else 0
+        session["completed"] = session["offset"] >= session["total_size"]
+        return session
+
+    async def append(self, upload_id: str, offset: int, chunks: AsyncIterator[bytes]) -> Dict[str, Any]:
+        """
+        从 offset 处追加一段数据（流式写入，不在内存中缓存整段）
+
+        Args:
+            upload_id: 会话 ID
+            offset: 这段数据的起始偏移量（必须等于已写入的字节数）
+            chunks: 请求体数据流
+
+        Returns:
+            更新后的会话状态
+
+        Raises:
+            KeyError: 会话不存在
+            UploadConflictError: 偏移量不一致或会话正被另一个请求写入
+            UploadTooLargeError: 数据超出登记的总大小
+        """
+        session = self.status(upload_id)
+        if session is None:
+            raise KeyError(upload_id)
+
+        with open(self._part_path(upload_id), "ab") as f:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise UploadConflictError("该上传正被另一个请求写入", session["offset"])
+            current = os.fstat(f.fileno()).st_size
+            if offset != current:
+                raise UploadConflictError(f"偏移量不一致: 请求 {offset}，已写入 {current}", current)
+
+            written = current
+            try:
+                async for chunk in chunks:
+                    if not chunk:
+                        continue
+                    written += len(chunk)
+                    if written > session["total_size"]:
+                        raise UploadTooLargeError(session["total_size"])
+                    f.write(chunk)
+            except UploadTooLargeError:
+                # 丢弃本次写入的数据，客户端可从原偏移量重试
+                f.flush()
+                f.truncate(current)
+                raise
+            finally:
+                f.flush()
+        return self.status(upload_id)
+
+    def finalize(self, upload_id: str) -> Dict[str, Any]:
+        """
+        完成上传：校验 SHA-256（若登记了）并原子移动到目标路径（同步函数，应在线程中调用）
+
+        Returns:
+            {"file_path", "size", "sha256", "deduplicated"}
+
+        Raises:
+            KeyError: 会话不存在
+            ValueError: 数据未写满或 SHA-256 不一致
+        """
+        session = self.status(upload_id)
+        if session is None:
+            raise KeyError(upload_id)
+        if not session["completed"]:
+            raise ValueError(f"上传未完成: {session['offset']}/{session['total_size']} 字节")
+
+        part_path = self._part_path(upload_id)
+        digest = file_sha256(part_path)
+        if session["sha256"] and digest != session["sha256"]:
+            raise ValueError(f"SHA-256 校验失败: 期望 {session['sha256']}，实际 {digest}")
+
+        target = Path(session["target_path"])
+        target.parent.mkdir(parents=True, exist_ok=True)
+        deduplicated = False
+        if self.blob_store is not None:
+            deduplicated = self.blob_store.store(part_path, target, digest)
+        else:
+            os.replace(part_path, target)
+        self._meta_path(upload_id).unlink(missing_ok=True)
+        logger.info(f"✅ [Upload] 可续传上传完成: {target} ({session['total_size']} 字节)")
+        return {"file_path": str(target), "size": session["total_size"], "sha256": digest, "deduplicated": deduplicated}
+
+    def abort(self, upload_id: str) -> None:
+        """放弃上传并删除已写入的数据"""
+        self._part_path(upload_id).unlink(missing_ok=True)
+        self._meta_path(upload_id).unlink(missing_ok=True)
+
+    def _prune(self) -> None:
+        """删除超过 RESUMABLE_UPLOAD_TTL_HOURS 未更新的会话"""
+        ttl = float(os.getenv("RESUMABLE_UPLOAD_TTL_HOURS", "24")) * 3600
+        now = time.time()
+        for meta_path in self.root.glob("*.json"):
+            upload_id = meta_path.stem
+            part_path = self._part_path(upload_id)
+            last_update = max(
+                meta_path.stat().st_mtime,
+                part_path.stat().st_mtime if part_path.exists() else 0
+            )
+            if now - last_update > ttl:
+                logger.info(f"🗑️ [Upload] 清理过期的续传会话: {upload_id}")
+                self.abort(upload_id)
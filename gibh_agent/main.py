@@ -96,8 +96,11 @@ class GIBHAgent:
         
         if default_type == "local":
             local_config = llm_config.get("local", {})
-            clients["logic"] = LLMClientFactory.create_from_config(local_config.get("logic", {}))
-            clients["vision"] = LLMClientFactory.create_from_config(local_config.get("vision", {}))
+            logic_config = local_config.get("logic", {})
+            vision_config = local_config.get("vision", {})
+            clients["logic"] = LLMClientFactory.create_from_config(logic_config)
+            # 配置相同时共用同一个客户端
+            clients["vision"] = clients["logic"] if vision_config == logic_config else LLMClientFactory.create_from_config(vision_config)
         else:
             # 默认使用硅基流动 deepseek API
             cloud_config = llm_config.get("cloud", {})
@@ -116,7 +119,7 @@ class GIBHAgent:
                     raise ValueError(error_msg)
                 
                 clients["logic"] = LLMClientFactory.create_from_config(siliconflow_config)
-                clients["vision"] = LLMClientFactory.create_from_config(siliconflow_config)
+                clients["vision"] = clients["logic"]
             else:
                 # 回退到工厂方法
                 api_key = os.getenv("SILICONFLOW_API_KEY", "")
@@ -130,7 +133,7 @@ class GIBHAgent:
                     raise ValueError(error_msg)
                 
                 clients["logic"] = LLMClientFactory.create_cloud_siliconflow()
-                clients["vision"] = LLMClientFactory.create_cloud_siliconflow()
+                clients["vision"] = clients["logic"]
         
         return clients
     
@@ -17,6 +17,7 @@ import matplotlib.pyplot as plt
 import logging
 
 from ..core.tool_registry import registry
+from ..core.table_io import read_table
 
 logger = logging.getLogger(__name__)
 
@@ -56,7 +57,7 @@ def run_pca(
     """
     try:
         # 读取数据
-        df = pd.read_csv(file_path, index_col=0)
+        df = read_table(file_path)
         
         # 提取数值列（排除非数值列）
         numeric_cols = df.select_dtypes(include=[np.number]).columns
@@ -167,7 +168,7 @@ def run_differential_analysis(
         from statsmodels.stats.multitest import multipletests
         
         # 读取数据
-        df = pd.read_csv(file_path, index_col=0)
+        df = read_table(file_path)
         
         # 检查分组列是否存在
         if group_column not in df.columns:
@@ -285,7 +286,7 @@ def preprocess_metabolite_data(
     """
     try:
         # 读取数据
-        df = pd.read_csv(file_path, index_col=0)
+        df = read_table(file_path)
         
         # 提取数值列
         numeric_cols = df.select_dtypes(include=[np.number]).columns
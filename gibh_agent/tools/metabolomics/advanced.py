@@ -1,8 +1,9 @@
 """
 代谢组学高级分析工具 - PLS-DA 和通路富集分析
 """
+import os
 import logging
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
 from pathlib import Path
 import pandas as pd
 import numpy as np
@@ -11,6 +12,11 @@ matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 
 from ...core.tool_registry import registry
+from ...core.table_io import read_table
+from ...core.enrichment import (
+    load_pathway_library, normalize_feature, resolve_library_path, run_ora, run_rank_test
+)
+from .statistics import _two_group_tests
 
 logger = logging.getLogger(__name__)
 
@@ -26,17 +32,27 @@ def run_plsda(
     group_column: str,
     n_components: int = 2,
     scale: bool = True,
-    output_dir: Optional[str] = None
+    output_dir: Optional[str] = None,
+    cv_folds: int = 7,
+    n_permutations: int = 0,
+    n_jobs: Optional[int] = None,
+    random_state: int = 42
 ) -> Dict[str, Any]:
     """
     执行 PLS-DA 分析
     
     Args:
-        file_path: 输入数据文件路径（CSV，包含分组信息）
+        file_path: 输入数据文件路径（CSV / Arrow / Parquet，包含分组信息）
         group_column: 分组列名
         n_components: PLS 成分数量（默认 2）
         scale: 是否标准化数据（默认 True）
         output_dir: 输出目录（可选）
+        cv_folds: 分层 k 折交叉验证的折数（默认 7，不超过最小组样本数）
+        n_permutations: 置换检验次数（默认 0 即不做置换检验；需要模型显著性时设为 100-1000，
+            每次置换需要 cv_folds + 1 次 PLS 拟合）
+        n_jobs: 置换检验的并行进程数（None 时读取环境变量 PLSDA_N_JOBS，默认 -1 即全部核心；
+            在步骤进程池中执行时不超过该子进程的核数 STEP_WORKER_CPUS）
+        random_state: 随机种子（折划分与置换）
     
     Returns:
         包含以下键的字典:
@@ -44,14 +60,16 @@ def run_plsda(
         - vip_scores: VIP 分数（按降序排列）
         - pls_scores: PLS 得分
         - plot_path: PLS-DA 图路径（如果生成）
+        - cross_validation: 交叉验证结果（R2Y、Q2、准确率）
+        - permutation_test: 置换检验结果（Q2 / R2Y 的经验 P 值）
+        - permutation_plot_path: 置换分布图路径（如果生成）
         - error: 错误信息（如果失败）
     """
     try:
-        from sklearn.cross_decomposition import PLSRegression
-        from sklearn.preprocessing import StandardScaler, LabelEncoder
+        from sklearn.preprocessing import LabelEncoder
         
         # 读取数据
-        df = pd.read_csv(file_path, index_col=0)
+        df = read_table(file_path)
         
         # 🔥 修复：检查分组列是否存在，如果不存在则尝试模糊匹配
         if group_column not in df.columns:
@@ -122,51 +140,30 @@ def run_plsda(
             }
         
         # 准备数据
-        X = df[metabolite_cols].values
+        X = df[metabolite_cols].to_numpy(dtype=float)
         y = df[group_column].values
         
-        # 编码分类变量
+        # 编码分类变量（两组为单列 0/1，多组为 one-hot 的 PLS2）
         le = LabelEncoder()
         y_encoded = le.fit_transform(y)
+        Y = _encode_plsda_response(y_encoded, len(le.classes_))
         
-        # 标准化（如果需要）
-        if scale:
-            scaler = StandardScaler()
-            X_scaled = scaler.fit_transform(X)
-        else:
-            X_scaled = X
+        # 🔥 成分数不能超过 min(样本数 - 1, 特征数)
+        n_components = max(1, min(n_components, X.shape[0] - 1, X.shape[1]))
         
-        # 执行 PLS-DA
-        pls = PLSRegression(n_components=n_components, scale=False)
-        pls.fit(X_scaled, y_encoded)
+        # 执行 PLS-DA（标准化在模型内部完成，交叉验证时只在训练折上拟合）
+        model = _make_plsda_model(n_components, scale)
+        model.fit(X, Y)
+        pls = model[-1]
         
         # 计算 PLS 得分
         X_scores = pls.x_scores_
         
-        # 计算 VIP 分数
-        # VIP = sqrt(p * (w^2 * SSY) / SSY_total)
-        # 其中 p 是变量数，w 是权重，SSY 是 Y 的方差解释
-        T = pls.x_scores_  # 得分矩阵
-        W = pls.x_weights_  # 权重矩阵
-        Q = pls.y_loadings_  # Y 的载荷
-        
-        # 计算每个成分的方差解释
-        explained_variance = []
-        for i in range(n_components):
-            ssy = np.sum((T[:, i] @ Q[i]) ** 2)
-            explained_variance.append(ssy)
-        
-        total_ssy = sum(explained_variance)
-        
-        # 计算 VIP
-        vip_scores = []
-        for j in range(len(metabolite_cols)):
-            vip = 0
-            for i in range(n_components):
-                if total_ssy > 0:
-                    vip += (W[j, i] ** 2) * (explained_variance[i] / total_ssy)
-            vip = np.sqrt(len(metabolite_cols) * vip)
-            vip_scores.append(vip)
+        # 🔥 向量化 VIP：VIP_j = sqrt(p * Σ_a (w_ja / ||w_a||)^2 * SS_a / Σ_a SS_a)
+        # 其中 SS_a = ||t_a||^2 * ||q_a||^2 为第 a 个成分解释的 Y 平方和
+        explained_variance = np.sum(pls.x_scores_ ** 2, axis=0) * np.sum(pls.y_loadings_ ** 2, axis=0)
+        total_ssy = explained_variance.sum()
+        vip_scores = _vip_scores(pls.x_weights_, explained_variance)
         
         # 创建 VIP 分数 DataFrame
         vip_df = pd.DataFrame({
@@ -174,6 +171,57 @@ def run_plsda(
             'vip_score': vip_scores
         }).sort_values('vip_score', ascending=False)
         
+        # 🔥 k 折交叉验证（R2Y / Q2）+ 置换检验（并行）
+        r2y = _r2(Y, model.predict(X))
+        cv_result = None
+        permutation_result = None
+        permutation_plot_path = None
+        min_class_size = int(np.bincount(y_encoded).min())
+        cv_folds = min(cv_folds, min_class_size)
+        if cv_folds >= 2:
+            from sklearn.model_selection import StratifiedKFold
+            folds = list(StratifiedKFold(n_splits=cv_folds, shuffle=True, random_state=random_state).split(X, y_encoded))
+            q2, accuracy = _cross_validate_plsda(X, Y, n_components, scale, folds)
+            cv_result = {
+                "folds": cv_folds,
+                "r2y": float(r2y),
+                "q2": float(q2),
+                "accuracy": float(accuracy)
+            }
+            logger.info(f"✅ [PLS-DA] {cv_folds} 折交叉验证: R2Y={r2y:.3f}, Q2={q2:.3f}, 准确率={accuracy:.1%}")
+            
+            if n_permutations > 0:
+                null_r2y, null_q2 = _run_plsda_permutations(
+                    X, Y, n_components, scale, folds, n_permutations, random_state, n_jobs
+                )
+                permutation_result = {
+                    "n_permutations": int(n_permutations),
+                    "p_value_q2": float((np.sum(null_q2 >= q2) + 1) / (n_permutations + 1)),
+                    "p_value_r2y": float((np.sum(null_r2y >= r2y) + 1) / (n_permutations + 1)),
+                    "null_q2_mean": float(np.mean(null_q2)),
+                    "null_q2_95th": float(np.percentile(null_q2, 95)),
+                    "null_r2y_mean": float(np.mean(null_r2y))
+                }
+                logger.info(f"✅ [PLS-DA] 置换检验 ({n_permutations} 次): p(Q2)={permutation_result['p_value_q2']:.4f}")
+                
+                if output_dir:
+                    Path(output_dir).mkdir(parents=True, exist_ok=True)
+                    permutation_plot_path = str(Path(output_dir) / "plsda_permutation.png")
+                    plt.figure(figsize=(10, 6))
+                    plt.hist(null_q2, bins=30, alpha=0.6, color="gray", label="Permuted Q2")
+                    plt.hist(null_r2y, bins=30, alpha=0.4, color="steelblue", label="Permuted R2Y")
+                    plt.axvline(q2, color="red", linestyle="--", label=f"Q2 = {q2:.3f}")
+                    plt.axvline(r2y, color="blue", linestyle="--", label=f"R2Y = {r2y:.3f}")
+                    plt.xlabel("Value")
+                    plt.ylabel("Count")
+                    plt.title(f"PLS-DA Permutation Test (n={n_permutations}, p(Q2)={permutation_result['p_value_q2']:.3g})")
+                    plt.legend()
+                    plt.grid(True, alpha=0.3)
+                    plt.savefig(permutation_plot_path, dpi=150, bbox_inches='tight')
+                    plt.close()
+        else:
+            logger.warning(f"⚠️ [PLS-DA] 最小组样本数为 {min_class_size}，跳过交叉验证")
+        
         # 生成图片（如果指定了输出目录）
         plot_path = None
         if output_dir:
@@ -185,12 +233,13 @@ def run_plsda(
             unique_groups = le.classes_
             colors = plt.cm.Set3(np.linspace(0, 1, len(unique_groups)))
             
+            second = X_scores[:, 1] if n_components > 1 else np.zeros(len(X_scores))
             plt.figure(figsize=(10, 8))
             for i, group in enumerate(unique_groups):
                 mask = y == group
                 plt.scatter(
                     X_scores[mask, 0], 
-                    X_scores[mask, 1],
+                    second[mask],
                     label=group,
                     color=colors[i],
                     alpha=0.6,
@@ -198,7 +247,8 @@ def run_plsda(
                 )
             
             plt.xlabel(f"PLS Component 1 ({explained_variance[0]/total_ssy*100:.1f}%)")
-            plt.ylabel(f"PLS Component 2 ({explained_variance[1]/total_ssy*100:.1f}%)")
+            if n_components > 1:
+                plt.ylabel(f"PLS Component 2 ({explained_variance[1]/total_ssy*100:.1f}%)")
             plt.title("PLS-DA Score Plot")
             plt.legend()
             plt.grid(True, alpha=0.3)
@@ -214,7 +264,11 @@ def run_plsda(
                 for i, var in enumerate(explained_variance)
             },
             "plot_path": plot_path,
-            "n_components": n_components
+            "n_components": n_components,
+            "r2y": float(r2y),
+            "cross_validation": cv_result,
+            "permutation_test": permutation_result,
+            "permutation_plot_path": permutation_plot_path
         }
     
     except ImportError as e:
@@ -230,9 +284,121 @@ def run_plsda(
         }
 
 
+def _encode_plsda_response(y_encoded: np.ndarray, n_classes: int) -> np.ndarray:
+    """PLS-DA 响应矩阵：两组为单列 0/1，多组为 one-hot"""
+    if n_classes <= 2:
+        return y_encoded.reshape(-1, 1).astype(float)
+    return np.eye(n_classes)[y_encoded]
+
+
+def _make_plsda_model(n_components: int, scale: bool):
+    """标准化 + PLS 回归（Pipeline 保证交叉验证时标准化只在训练折上拟合）"""
+    from sklearn.cross_decomposition import PLSRegression
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import StandardScaler
+    
+    steps = [("scaler", StandardScaler())] if scale else []
+    steps.append(("pls", PLSRegression(n_components=n_components, scale=False)))
+    return Pipeline(steps)
+
+
+def _vip_scores(weights: np.ndarray, ss_per_component: np.ndarray) -> np.ndarray:
+    """
+    VIP 分数（单个矩阵表达式）
+    
+    Args:
+        weights: X 权重矩阵 W（特征 × 成分）
+        ss_per_component: 每个成分解释的 Y 平方和
+    
+    Returns:
+        每个特征的 VIP 分数
+    """
+    total = ss_per_component.sum()
+    if total <= 0:
+        return np.zeros(weights.shape[0])
+    normalized = weights / np.linalg.norm(weights, axis=0, keepdims=True)
+    return np.sqrt(weights.shape[0] * (normalized ** 2 @ ss_per_component) / total)
+
+
+def _r2(Y: np.ndarray, predicted: np.ndarray) -> float:
+    """1 - RSS / TSS（Y 按列中心化）"""
+    tss = np.sum((Y - Y.mean(axis=0)) ** 2)
+    return 1.0 - np.sum((Y - predicted) ** 2) / tss if tss > 0 else 0.0
+
+
+def _cross_validate_plsda(X: np.ndarray, Y: np.ndarray, n_components: int, scale: bool, folds: List) -> tuple:
+    """
+    k 折交叉验证
+    
+    Returns:
+        (Q2, 分类准确率)
+    """
+    predicted = np.zeros_like(Y, dtype=float)
+    for train, test in folds:
+        n_fold_components = min(n_components, len(train) - 1)
+        model = _make_plsda_model(n_fold_components, scale).fit(X[train], Y[train])
+        predicted[test] = model.predict(X[test]).reshape(len(test), -1)
+    
+    if Y.shape[1] == 1:
+        accuracy = np.mean((predicted[:, 0] > 0.5) == (Y[:, 0] > 0.5))
+    else:
+        accuracy = np.mean(predicted.argmax(axis=1) == Y.argmax(axis=1))
+    return _r2(Y, predicted), accuracy
+
+
+def _plsda_permutation_chunk(
+    X: np.ndarray, Y: np.ndarray, n_components: int, scale: bool, folds: List, seeds: List[int]
+) -> List[tuple]:
+    """一批置换：打乱 Y 后重新计算 R2Y 和 Q2（折划分保持不变）"""
+    results = []
+    for seed in seeds:
+        Y_perm = Y[np.random.default_rng(seed).permutation(len(Y))]
+        model = _make_plsda_model(n_components, scale).fit(X, Y_perm)
+        r2y = _r2(Y_perm, model.predict(X).reshape(Y_perm.shape))
+        q2, _ = _cross_validate_plsda(X, Y_perm, n_components, scale, folds)
+        results.append((r2y, q2))
+    return results
+
+
+def _run_plsda_permutations(
+    X: np.ndarray,
+    Y: np.ndarray,
+    n_components: int,
+    scale: bool,
+    folds: List,
+    n_permutations: int,
+    random_state: int,
+    n_jobs: Optional[int] = None
+) -> tuple:
+    """
+    并行执行置换检验（joblib，按批分发以减少调度开销；n_workers 为 1 时在当前进程中顺序执行）
+    
+    Returns:
+        (置换 R2Y 数组, 置换 Q2 数组)
+    """
+    from joblib import Parallel, delayed, effective_n_jobs
+    
+    if n_jobs is None:
+        n_jobs = int(os.getenv("PLSDA_N_JOBS", "-1"))
+    n_workers = max(1, min(effective_n_jobs(n_jobs), n_permutations))
+    worker_cpus = os.getenv("STEP_WORKER_CPUS")
+    if worker_cpus:
+        # 🔥 在步骤进程池中执行：其他步骤可能同时运行，只使用本子进程分到的核数
+        n_workers = min(n_workers, max(1, int(worker_cpus)))
+    seeds = np.random.SeedSequence(random_state).generate_state(n_permutations).tolist()
+    chunks = [seeds[i::n_workers] for i in range(n_workers)]
+    
+    chunk_results = Parallel(n_jobs=n_workers)(
+        delayed(_plsda_permutation_chunk)(X, Y, n_components, scale, folds, chunk)
+        for chunk in chunks
+    )
+    values = np.array([r for chunk in chunk_results for r in chunk])
+    return values[:, 0], values[:, 1]
+
+
 @registry.register(
     name="metabolomics_pathway_enrichment",
-    description="Performs KEGG pathway enrichment analysis on metabolite data using GSEApy. Identifies significantly enriched metabolic pathways based on metabolite abundance changes between groups.",
+    description="Performs KEGG pathway enrichment analysis on metabolite data. Uses the local offline enrichment engine (hypergeometric ORA plus a rank-based test) when the pathway library is available as a GMT/JSON file, otherwise falls back to GSEApy Enrichr. Identifies significantly enriched metabolic pathways based on metabolite abundance changes between groups.",
     category="Metabolomics",
     output_type="json"
 )
@@ -243,19 +409,27 @@ def run_pathway_enrichment(
     control_group: str,
     organism: str = "hsa",
     p_value_threshold: float = 0.05,
-    output_dir: Optional[str] = None
+    output_dir: Optional[str] = None,
+    gene_sets: str = "KEGG_2021_Human",
+    pathway_library: Optional[str] = None,
+    backend: str = "auto",
+    top_n: int = 100
 ) -> Dict[str, Any]:
     """
     执行通路富集分析
     
     Args:
-        file_path: 输入数据文件路径（CSV，包含分组信息）
+        file_path: 输入数据文件路径（CSV / Arrow / Parquet，包含分组信息）
         group_column: 分组列名
         case_group: 实验组名称
         control_group: 对照组名称
         organism: 物种代码（默认 "hsa" 人类，可选 "mmu" 小鼠等）
         p_value_threshold: P 值阈值（默认 0.05）
         output_dir: 输出目录（可选）
+        gene_sets: 通路库名称（默认 "KEGG_2021_Human"，本地后端在 PATHWAY_LIBRARY_DIR 中查找同名 GMT/JSON）
+        pathway_library: 用户提供的通路库文件路径（GMT/JSON，优先于 gene_sets）
+        backend: "auto"（本地通路库存在时离线计算，否则使用 Enrichr）、"local" 或 "enrichr"
+        top_n: 没有显著代谢物时，按差异统计量取前 N 个代谢物作为目标集合
     
     Returns:
         包含以下键的字典:
@@ -265,10 +439,8 @@ def run_pathway_enrichment(
         - error: 错误信息（如果失败）
     """
     try:
-        import gseapy as gp
-        
         # 读取数据
-        df = pd.read_csv(file_path, index_col=0)
+        df = read_table(file_path)
         
         # 🔥 修复：检查分组列是否存在，如果不存在则尝试模糊匹配
         if group_column not in df.columns:
@@ -280,7 +452,7 @@ def run_pathway_enrichment(
                 col_normalized = col.lower().replace(' ', '').replace('_', '').replace('-', '')
                 if col_normalized == group_column_normalized:
                     matched_column = col
-                    logger.info(f"🔄 [PLS-DA] 模糊匹配分组列: '{group_column}' -> '{col}'")
+                    logger.info(f"🔄 [Pathway Enrichment] 模糊匹配分组列: '{group_column}' -> '{col}'")
                     break
             
             if matched_column:
@@ -348,6 +520,16 @@ def run_pathway_enrichment(
             if col != group_column and pd.api.types.is_numeric_dtype(df[col])
         ]
         
+        # 🔥 本地离线富集引擎（通路库文件可用时优先使用，不访问远程服务）
+        library_ref = pathway_library or gene_sets
+        if backend == "local" or (backend == "auto" and resolve_library_path(library_ref) is not None):
+            return _run_local_enrichment(
+                df, metabolite_cols, case_mask, control_mask, library_ref,
+                p_value_threshold=p_value_threshold, top_n=top_n, output_dir=output_dir
+            )
+        
+        import gseapy as gp
+        
         # 计算 fold change（用于排序）
         case_mean = df.loc[case_mask, metabolite_cols].mean()
         control_mean = df.loc[control_mask, metabolite_cols].mean()
@@ -371,7 +553,7 @@ def run_pathway_enrichment(
             # 尝试使用 KEGG 数据库
             enr = gp.enrichr(
                 gene_list=metabolite_list[:100],  # 限制前100个
-                gene_sets=['KEGG_2021_Human'],  # KEGG 通路数据库
+                gene_sets=[gene_sets],  # KEGG 通路数据库
                 organism=organism,
                 outdir=None,  # 不保存文件
                 verbose=False
@@ -432,3 +614,112 @@ def run_pathway_enrichment(
         }
 
 
+def _select_enrichment_query(
+    metabolite_cols: List[str],
+    statistic: np.ndarray,
+    p_values: np.ndarray,
+    p_value_threshold: float,
+    top_n: int
+) -> Tuple[List[str], str]:
+    """
+    选择 ORA 的目标代谢物：P 值 < 阈值的代谢物；没有时取 |t| 最大的 top_n 个（上调和下调都参与）
+    
+    Returns:
+        (目标代谢物列表, 来源 "p_value" 或 "top_<n>")
+    """
+    query = [m for m, p in zip(metabolite_cols, p_values) if np.isfinite(p) and p < p_value_threshold]
+    if query:
+        return query, "p_value"
+    order = np.argsort(-np.nan_to_num(np.abs(statistic), nan=-np.inf), kind="stable")
+    logger.warning(f"⚠️ [Enrichment] 没有 P < {p_value_threshold} 的代谢物，使用差异统计量绝对值前 {top_n} 个代谢物")
+    return [metabolite_cols[i] for i in order[:top_n]], f"top_{top_n}"
+
+
+def _run_local_enrichment(
+    df: pd.DataFrame,
+    metabolite_cols: List[str],
+    case_mask: pd.Series,
+    control_mask: pd.Series,
+    library_ref: str,
+    p_value_threshold: float = 0.05,
+    top_n: int = 100,
+    output_dir: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    使用本地通路库执行富集分析（ORA + 秩检验）
+    
+    目标集合为两组比较 P 值 < 阈值的代谢物（没有时取差异统计量绝对值最大的 top_n 个）；
+    秩检验使用所有代谢物的 t 统计量。
+    
+    Returns:
+        与 Enrichr 后端相同结构的结果字典（enriched_pathways 同时包含 Enrichr 风格的列名）
+    """
+    try:
+        library = load_pathway_library(library_ref)
+    except FileNotFoundError as e:
+        return {
+            "status": "error",
+            "error": str(e)
+        }
+    
+    matrix = df[metabolite_cols].to_numpy(dtype=float)
+    tests = _two_group_tests(matrix[case_mask.to_numpy()], matrix[control_mask.to_numpy()])
+    statistic = tests["statistic"]
+    p_values = tests["p_value"]
+    
+    query, query_source = _select_enrichment_query(metabolite_cols, statistic, p_values, p_value_threshold, top_n)
+    
+    ora_results = run_ora(library, query, metabolite_cols)
+    rank_results = run_rank_test(library, metabolite_cols, statistic)
+    n_annotated = sum(1 for m in metabolite_cols if normalize_feature(m) in library.index)
+    
+    if n_annotated == 0:
+        return {
+            "status": "warning",
+            "message": f"通路库 {library.name} 中没有匹配的代谢物（请检查代谢物名称或 ID 是否与通路库一致）",
+            "enriched_pathways": [],
+            "backend": "local",
+            "library": library.name
+        }
+    
+    # 兼容 Enrichr 结果的列名（下游报告和前端使用）
+    for record in ora_results:
+        record.update({
+            "Term": record["pathway"],
+            "Overlap": f"{record['overlap']}/{record['pathway_size']}",
+            "P-value": record["p_value"],
+            "Adjusted P-value": record["fdr"],
+            "Genes": ";".join(record["metabolites"])
+        })
+    significant_pathways = [r for r in ora_results if r["fdr"] < p_value_threshold]
+    
+    output_csv = None
+    rank_csv = None
+    if output_dir:
+        output_path = Path(output_dir)
+        output_path.mkdir(parents=True, exist_ok=True)
+        output_csv = str(output_path / "pathway_enrichment.csv")
+        pd.DataFrame(significant_pathways).to_csv(output_csv, index=False)
+        rank_csv = str(output_path / "pathway_rank_test.csv")
+        pd.DataFrame(rank_results).to_csv(rank_csv, index=False)
+    
+    logger.info(
+        f"✅ [Enrichment] 本地富集完成: {library.name}, 目标 {len(query)} 个代谢物, "
+        f"{len(ora_results)} 个通路参与检验, {len(significant_pathways)} 个显著"
+    )
+    
+    return {
+        "status": "success",
+        "enriched_pathways": significant_pathways,
+        "n_significant": len(significant_pathways),
+        "n_total": len(ora_results),
+        "output_csv": output_csv,
+        "rank_test": rank_results[:20],
+        "rank_test_csv": rank_csv,
+        "backend": "local",
+        "library": library.name,
+        "n_query": len(query),
+        "query_source": query_source,
+        "n_annotated_metabolites": n_annotated,
+        "summary": f"发现 {len(significant_pathways)} 个显著富集通路（FDR < {p_value_threshold}，本地通路库 {library.name}）"
+    }
@@ -12,13 +12,15 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 
 from ...core.tool_registry import registry
+from ...core.table_io import read_table
+from ...core.result_payload import artifact_records
 
 logger = logging.getLogger(__name__)
 
 
 @registry.register(
     name="visualize_volcano",
-    description="Generates a volcano plot for differential analysis results. Shows log2 fold change vs -log10(p-value) with significance thresholds.",
+    description="Generates a volcano plot for differential analysis results. Shows log2 fold change vs -log10(p-value) with significance thresholds. For multi-group results, plots the selected contrast.",
     category="Metabolomics",
     output_type="image"
 )
@@ -26,31 +28,52 @@ def plot_volcano(
     diff_results: Dict[str, Any],
     output_path: Optional[str] = None,
     fdr_threshold: float = 0.05,
-    log2fc_threshold: float = 1.0
+    log2fc_threshold: float = 1.0,
+    contrast: Optional[str] = None
 ) -> Dict[str, Any]:
     """
     生成火山图
     
     Args:
-        diff_results: 差异分析结果（包含 results 列表）
+        diff_results: 差异分析结果（包含 results 列表；多组差异分析结果通过 output_path 读取长表）
         output_path: 输出文件路径（如果为 None，自动生成）
         fdr_threshold: FDR 阈值
         log2fc_threshold: Log2FC 阈值
+        contrast: 多组结果中要绘制的对比（如 "A_vs_B"，默认为第一个对比）
     
     Returns:
         包含图片路径的字典
     """
     try:
-        results = diff_results.get("results", [])
+        # 结果可能是产物引用（大表已落盘，见 core/result_payload.py）
+        results = artifact_records(diff_results.get("results", []))
+        results_file = diff_results.get("output_path") or diff_results.get("output_file")
         
-        if not results:
+        # 转换为 DataFrame（多组差异分析只返回长表文件，直接读取，不重新计算）
+        if results:
+            df = pd.DataFrame(results)
+        elif results_file and Path(results_file).exists():
+            df = read_table(results_file, index_col=None)
+        else:
+            df = pd.DataFrame()
+        
+        if df.empty:
             return {
                 "status": "error",
                 "error": "差异分析结果为空"
             }
         
-        # 转换为 DataFrame
-        df = pd.DataFrame(results)
+        # 🔥 多组结果：按 contrast 选择一个对比
+        if "contrast" in df.columns:
+            available_contrasts = list(dict.fromkeys(df["contrast"]))
+            if contrast is None:
+                contrast = diff_results.get("default_contrast") or available_contrasts[0]
+            if contrast not in available_contrasts:
+                return {
+                    "status": "error",
+                    "error": f"对比 '{contrast}' 不存在。可用对比: {available_contrasts}"
+                }
+            df = df[df["contrast"] == contrast].copy()
         
         # 提取必要的列
         if "log2fc" not in df.columns and "log2_fold_change" in df.columns:
@@ -91,7 +114,7 @@ def plot_volcano(
         
         plt.xlabel("Log2 Fold Change")
         plt.ylabel("-Log10 P-value")
-        plt.title("Volcano Plot")
+        plt.title(f"Volcano Plot ({contrast})" if contrast else "Volcano Plot")
         plt.legend()
         plt.grid(True, alpha=0.3)
         plt.tight_layout()
@@ -101,7 +124,8 @@ def plot_volcano(
         return {
             "status": "success",
             "plot_path": str(output_path_obj),
-            "n_significant": len(df[df["significance"] == "Both Significant"])
+            "n_significant": len(df[df["significance"] == "Both Significant"]),
+            "contrast": contrast
         }
     
     except Exception as e:
@@ -237,7 +261,7 @@ def plot_heatmap(
     生成热图
     
     Args:
-        file_path: 输入数据文件路径（CSV）
+        file_path: 输入数据文件路径（CSV / Arrow / Parquet）
         output_path: 输出文件路径（如果为 None，自动生成）
         top_n: 显示前 N 个代谢物（按方差排序）
         group_column: 可选的分组列名（用于添加分组注释）
@@ -247,7 +271,7 @@ def plot_heatmap(
     """
     try:
         # 读取数据
-        df = pd.read_csv(file_path, index_col=0)
+        df = read_table(file_path)
         
         # 提取数值列
         numeric_cols = df.select_dtypes(include=[np.number]).columns
@@ -10,13 +10,14 @@ import numpy as np
 from sklearn.preprocessing import StandardScaler
 
 from ...core.tool_registry import registry
+from ...core.table_io import read_table, write_table
 
 logger = logging.getLogger(__name__)
 
 
 @registry.register(
     name="preprocess_data",
-    description="Preprocesses metabolite data: handles missing values, applies log2 transformation, and standardizes the data. Returns preprocessed DataFrame and saves to CSV file.",
+    description="Preprocesses metabolite data: handles missing values, applies log2 transformation, and standardizes the data. Keeps metadata columns (e.g. group labels) and saves the result as a columnar Arrow intermediate (optional CSV export).",
     category="Metabolomics",
     output_type="json"
 )
@@ -25,33 +26,38 @@ def preprocess_metabolite_data(
     missing_imputation: str = "min",
     log_transform: bool = True,
     standardize: bool = True,
-    output_dir: Optional[str] = None
+    output_dir: Optional[str] = None,
+    export_csv: bool = False
 ) -> Dict[str, Any]:
     """
     预处理代谢物数据
     
     Args:
-        file_path: 输入数据文件路径（CSV）
+        file_path: 输入数据文件路径（CSV / Arrow / Parquet）
         missing_imputation: 缺失值填充方法（"min", "median", "mean", "zero"）
         log_transform: 是否进行 log2 转换（默认 True）
         standardize: 是否标准化（默认 True）
         output_dir: 输出目录（如果提供，将保存预处理后的数据）
+        export_csv: 是否同时导出 CSV（默认 False，中间产物为 Arrow IPC）
     
     Returns:
         包含以下键的字典:
         - status: "success" 或 "error"
-        - preprocessed_data: 预处理后的数据（JSON 格式）
+        - preview: 预处理后数据的预览（前几行/列；完整数据见 output_path）
         - output_path: 保存的文件路径（如果保存）
         - output_file: 保存的文件路径（别名，用于数据流传递）
+        - csv_path: 导出的 CSV 路径（如果导出）
         - error: 错误信息（如果失败）
     """
     try:
         # 读取数据
-        df = pd.read_csv(file_path, index_col=0)
+        df = read_table(file_path)
         
         # 提取数值列
         numeric_cols = df.select_dtypes(include=[np.number]).columns
         data = df[numeric_cols].copy()
+        # 🔥 元数据列（如分组列）原样保留在中间产物中，供后续差异分析等步骤使用
+        metadata_cols = [col for col in df.columns if col not in numeric_cols]
         
         # 1. 缺失值填充
         if missing_imputation == "min":
@@ -77,33 +83,28 @@ def preprocess_metabolite_data(
                 columns=data.columns
             )
         
-        # 4. 保存预处理后的数据到文件（用于数据流传递）
-        output_path = None
+        # 4. 保存预处理后的数据到文件（用于数据流传递，默认 Arrow IPC 列式格式）
         if output_dir:
-            # 确保输出目录存在
-            output_path_obj = Path(output_dir)
-            output_path_obj.mkdir(parents=True, exist_ok=True)
-            
             # 生成输出文件路径
             input_filename = Path(file_path).stem
-            output_path = str(output_path_obj / f"{input_filename}_preprocessed.csv")
-            
-            # 保存数据
-            data.to_csv(output_path)
-            logger.info(f"💾 预处理后的数据已保存: {output_path}")
+            output_stem = str(Path(output_dir) / f"{input_filename}_preprocessed")
         else:
             # 如果没有指定输出目录，尝试使用输入文件所在目录
-            input_dir = Path(file_path).parent
-            output_path = str(input_dir / "preprocessed_data.csv")
-            data.to_csv(output_path)
-            logger.info(f"💾 预处理后的数据已保存: {output_path}")
+            output_stem = str(Path(file_path).parent / "preprocessed_data")
+        
+        saved = write_table(pd.concat([df[metadata_cols], data], axis=1), output_stem, export_csv=export_csv)
+        output_path = saved["path"]
+        logger.info(f"💾 预处理后的数据已保存: {output_path} ({saved['format']})")
         
         return {
             "status": "success",
-            "preprocessed_data": data.to_dict(orient='index'),
+            # 🔥 完整矩阵已落盘，结果中只返回小预览（避免数 MB 的 JSON 载荷）
+            "preview": data.iloc[:5, :20].reset_index().to_dict(orient='records'),
             "output_path": output_path,
             "output_file": output_path,  # 别名，用于数据流传递
             "file_path": output_path,  # 另一个别名，确保兼容性
+            "csv_path": saved["csv_path"],
+            "metadata_columns": metadata_cols,
             "shape": {
                 "rows": len(data),
                 "columns": len(data.columns)
@@ -2,7 +2,7 @@
 代谢组学统计分析工具
 """
 import logging
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple
 from pathlib import Path
 import pandas as pd
 import numpy as np
@@ -15,10 +15,77 @@ from scipy import stats
 from statsmodels.stats.multitest import multipletests
 
 from ...core.tool_registry import registry
+from ...core.table_io import read_table
 
 logger = logging.getLogger(__name__)
 
 
+def _two_group_tests(
+    case: np.ndarray,
+    control: np.ndarray,
+    use_wilcoxon: bool = False
+) -> Dict[str, np.ndarray]:
+    """
+    对所有特征（列）同时执行两组检验（向量化，NaN 按列忽略）
+    
+    结果与逐列执行 dropna() + stats.ttest_ind / stats.ranksums 一致：
+    - t-test: Student t 检验（方差齐性，与 ttest_ind 默认一致）
+    - wilcoxon: 秩和检验的正态近似（不做结校正，与 ranksums 一致）
+    
+    Args:
+        case: 实验组矩阵（样本 × 特征）
+        control: 对照组矩阵（样本 × 特征）
+        use_wilcoxon: 是否使用秩和检验
+    
+    Returns:
+        {"n_case", "n_control", "case_mean", "control_mean", "statistic", "p_value"}，每项为长度等于特征数的数组
+    """
+    n1 = np.sum(~np.isnan(case), axis=0)
+    n2 = np.sum(~np.isnan(control), axis=0)
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        case_mean = np.nansum(case, axis=0) / n1
+        control_mean = np.nansum(control, axis=0) / n2
+        
+        if use_wilcoxon:
+            # 合并两组后按列排秩；NaN 替换为 +inf 排在最后，不影响有效值的秩
+            combined = np.vstack([case, control])
+            ranks = stats.rankdata(np.where(np.isnan(combined), np.inf, combined), axis=0)
+            rank_sum = np.sum(np.where(np.isnan(case), 0.0, ranks[:case.shape[0]]), axis=0)
+            expected = n1 * (n1 + n2 + 1) / 2.0
+            statistic = (rank_sum - expected) / np.sqrt(n1 * n2 * (n1 + n2 + 1) / 12.0)
+            p_value = 2 * stats.norm.sf(np.abs(statistic))
+        else:
+            case_ss = np.nansum((case - case_mean) ** 2, axis=0)
+            control_ss = np.nansum((control - control_mean) ** 2, axis=0)
+            dof = n1 + n2 - 2
+            pooled_var = (case_ss + control_ss) / dof
+            statistic = (case_mean - control_mean) / np.sqrt(pooled_var * (1.0 / n1 + 1.0 / n2))
+            p_value = 2 * stats.t.sf(np.abs(statistic), dof)
+    
+    return {
+        "n_case": n1,
+        "n_control": n2,
+        "case_mean": case_mean,
+        "control_mean": control_mean,
+        "statistic": statistic,
+        "p_value": p_value
+    }
+
+
+def _log2_fold_change(case_mean: np.ndarray, control_mean: np.ndarray, is_logged: bool) -> np.ndarray:
+    """
+    计算 log2 fold change（向量化）
+    
+    已Log2转换的数据使用减法：Log2FC = Mean_A - Mean_B；
+    原始数据使用除法：Log2FC = log2(Mean_A / Mean_B)（对照组均值 <= 0 时加 epsilon 避免除零）
+    """
+    if is_logged:
+        return case_mean - control_mean
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.log2(case_mean / np.where(control_mean > 0, control_mean, control_mean + 1e-9))
+
+
 @registry.register(
     name="pca_analysis",
     description="Performs Principal Component Analysis (PCA) on metabolite abundance data. Returns PCA coordinates, explained variance, and optionally a PCA plot.",
@@ -35,7 +102,7 @@ def run_pca(
     执行 PCA 分析
     
     Args:
-        file_path: 输入数据文件路径（CSV）
+        file_path: 输入数据文件路径（CSV / Arrow / Parquet）
         n_components: 主成分数量（默认 2）
         scale: 是否标准化数据（默认 True）
         output_dir: 输出目录（可选）
@@ -50,7 +117,7 @@ def run_pca(
     """
     try:
         # 读取数据
-        df = pd.read_csv(file_path, index_col=0)
+        df = read_table(file_path)
         
         # 提取数值列（排除非数值列）
         numeric_cols = df.select_dtypes(include=[np.number]).columns
@@ -152,7 +219,7 @@ def run_differential_analysis(
     执行差异代谢物分析
     
     Args:
-        file_path: 输入数据文件路径（CSV，包含分组信息）
+        file_path: 输入数据文件路径（CSV / Arrow / Parquet，包含分组信息）
         group_column: 分组列名
         case_group: 实验组名称（可选，如果为 None 则自动检测）
         control_group: 对照组名称（可选，如果为 None 则自动检测）
@@ -176,7 +243,7 @@ def run_differential_analysis(
     """
     try:
         # 读取数据
-        df = pd.read_csv(file_path, index_col=0)
+        df = read_table(file_path)
         
         # 🔥 修复：检查分组列是否存在，如果不存在则尝试模糊匹配
         if group_column not in df.columns:
@@ -255,6 +322,11 @@ def run_differential_analysis(
             case_group = unique_groups[0] if case_group is None else case_group
             control_group = unique_groups[1] if control_group is None else control_group
             logger.info(f"🔄 自动检测分组: case_group={case_group}, control_group={control_group}")
+            if len(unique_groups) > 2:
+                logger.warning(
+                    f"⚠️ 分组列 '{group_column}' 有 {len(unique_groups)} 个组，仅比较 {case_group} vs {control_group}；"
+                    f"多组比较请使用 multigroup_differential_analysis"
+                )
         
         # 🔥 将检测到的分组信息添加到返回结果中，供后续步骤使用
         detected_groups = {
@@ -286,68 +358,39 @@ def run_differential_analysis(
             if col != group_column and pd.api.types.is_numeric_dtype(df[col])
         ]
         
-        results = []
-        p_values = []
-        
         # 🔥 根据 method 参数选择统计方法
         use_wilcoxon = method.lower() in ["wilcoxon", "wilcox", "ranksum", "mann-whitney"]
         
-        for metabolite in metabolite_cols:
-            case_values = df.loc[case_mask, metabolite].dropna()
-            control_values = df.loc[control_mask, metabolite].dropna()
-            
-            if len(case_values) < 2 or len(control_values) < 2:
-                continue
-            
-            # 🔥 根据方法选择统计检验
-            if use_wilcoxon:
-                # Wilcoxon rank-sum test (Mann-Whitney U test)
-                try:
-                    u_stat, p_val = stats.ranksums(case_values, control_values)
-                except Exception as e:
-                    logger.warning(f"⚠️ Wilcoxon 检验失败 ({metabolite}): {e}，跳过")
-                    continue
-            else:
-                # T-test (默认)
-                try:
-                    t_stat, p_val = stats.ttest_ind(case_values, control_values)
-                except Exception as e:
-                    logger.warning(f"⚠️ T-test 失败 ({metabolite}): {e}，跳过")
-                    continue
-            
-            # 🔥 CRITICAL FIX: 计算 log2 fold change
-            # 对于已Log2转换的数据，使用减法：Log2FC = Mean_A - Mean_B
-            # 对于原始数据，使用除法：Log2FC = log2(Mean_A / Mean_B)
-            case_mean = case_values.mean()
-            control_mean = control_values.mean()
-            
-            if is_logged:
-                # 数据已Log2转换，使用减法
-                log2fc = case_mean - control_mean
-                logger.debug(f"✅ [Log2FC] 使用减法（数据已Log2转换）: {case_mean} - {control_mean} = {log2fc}")
-            else:
-                # 原始数据，使用除法
-                if control_mean > 0:
-                    log2fc = np.log2(case_mean / control_mean)
-                else:
-                    # 避免除零，使用小的epsilon
-                    log2fc = np.log2(case_mean / (control_mean + 1e-9))
-                logger.debug(f"✅ [Log2FC] 使用除法（原始数据）: log2({case_mean} / {control_mean}) = {log2fc}")
-            
+        # 🔥 向量化：在二维数值矩阵上一次性计算所有代谢物的均值、统计量和 P 值
+        matrix = df[metabolite_cols].to_numpy(dtype=float)
+        tests = _two_group_tests(
+            matrix[case_mask.to_numpy()],
+            matrix[control_mask.to_numpy()],
+            use_wilcoxon=use_wilcoxon
+        )
+        
+        # 🔥 CRITICAL FIX: 计算 log2 fold change（已Log2转换的数据使用减法，原始数据使用除法）
+        log2fc = _log2_fold_change(tests["case_mean"], tests["control_mean"], is_logged)
+        
+        # 每组至少 2 个有效值的代谢物才参与检验
+        testable = (tests["n_case"] >= 2) & (tests["n_control"] >= 2)
+        
+        results = []
+        for idx in np.flatnonzero(testable):
             results.append({
-                "metabolite": metabolite,
-                "p_value": float(p_val),
-                "log2fc": float(log2fc),
-                "log2_fold_change": float(log2fc),  # 别名，兼容 visualize_volcano
-                "case_mean": float(case_mean),
-                "control_mean": float(control_mean),
+                "metabolite": metabolite_cols[idx],
+                "p_value": float(tests["p_value"][idx]),
+                "log2fc": float(log2fc[idx]),
+                "log2_fold_change": float(log2fc[idx]),  # 别名，兼容 visualize_volcano
+                "case_mean": float(tests["case_mean"][idx]),
+                "control_mean": float(tests["control_mean"][idx]),
                 "case_group": case_group,
                 "control_group": control_group
             })
-            p_values.append(p_val)
+        p_values = tests["p_value"][testable]
         
         # FDR 校正
-        if p_values:
+        if len(p_values) > 0:
             _, p_adjusted, _, _ = multipletests(p_values, method=fdr_method)
             
             # 添加 FDR 校正后的 p 值
@@ -409,3 +452,265 @@ def run_differential_analysis(
             "error": str(e)
         }
 
+
+
+def _group_moments(matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    按列计算一组样本的有效值个数、均值和离差平方和（NaN 忽略）
+    
+    Returns:
+        (n, mean, ss)，每项为长度等于特征数的数组
+    """
+    n = np.sum(~np.isnan(matrix), axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.nansum(matrix, axis=0) / n
+    ss = np.nansum((matrix - mean) ** 2, axis=0)
+    return n, mean, ss
+
+
+def _kruskal_tests(group_matrices: List[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    对所有特征同时执行 Kruskal-Wallis 检验（含结校正，与 stats.kruskal 一致，NaN 按列忽略）
+    
+    Returns:
+        (H 统计量, P 值)
+    """
+    combined = np.vstack(group_matrices)
+    valid = ~np.isnan(combined)
+    filled = np.where(valid, combined, np.inf)
+    ranks = stats.rankdata(filled, axis=0)
+    n_total = valid.sum(axis=0)
+    
+    rank_term = np.zeros(combined.shape[1])
+    offset = 0
+    for matrix in group_matrices:
+        rows = slice(offset, offset + matrix.shape[0])
+        n_g = valid[rows].sum(axis=0)
+        rank_sum = np.where(valid[rows], ranks[rows], 0.0).sum(axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rank_term += np.where(n_g > 0, rank_sum ** 2 / n_g, 0.0)
+        offset += matrix.shape[0]
+    
+    # 结校正：每个元素所在结的大小 t = max_rank - min_rank + 1，sum(t^3 - t) = sum_elements(t^2 - 1)
+    tie_size = stats.rankdata(filled, axis=0, method='max') - stats.rankdata(filled, axis=0, method='min') + 1
+    tie_sum = np.where(valid, tie_size ** 2 - 1, 0.0).sum(axis=0)
+    
+    k = len(group_matrices)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        h = 12.0 / (n_total * (n_total + 1)) * rank_term - 3 * (n_total + 1)
+        h = h / (1 - tie_sum / (n_total ** 3 - n_total))
+    return h, stats.chi2.sf(h, k - 1)
+
+
+@registry.register(
+    name="multigroup_differential_analysis",
+    description="Performs multi-group differential analysis for studies with 3 or more groups: an omnibus test (one-way ANOVA or Kruskal-Wallis) across all groups plus every pairwise contrast (t-test or Wilcoxon rank-sum) in one pass. Writes a long-format table with per-contrast FDR; visualize_volcano can plot any contrast from it.",
+    category="Metabolomics",
+    output_type="json"
+)
+def run_multigroup_differential_analysis(
+    file_path: str,
+    group_column: str,
+    groups: Optional[List[str]] = None,
+    reference_group: Optional[str] = None,
+    method: str = "anova",
+    p_value_threshold: float = 0.05,
+    fold_change_threshold: float = 1.5,
+    fdr_method: str = "fdr_bh",
+    is_logged: bool = True,
+    output_dir: Optional[str] = None,
+    **kwargs  # 安全网：接受其他意外参数
+) -> Dict[str, Any]:
+    """
+    执行多组差异代谢物分析（总体检验 + 所有两两比较）
+    
+    组内统计量（有效值个数、均值、离差平方和）只计算一次，所有对比在此基础上向量化完成，
+    不需要按组对重复读取数据或重新运行工具。
+    
+    Args:
+        file_path: 输入数据文件路径（CSV / Arrow / Parquet，包含分组信息）
+        group_column: 分组列名
+        groups: 参与分析的组（可选，默认为分组列中的全部组，按名称排序）
+        reference_group: 参照组（可选；指定时只生成 "其他组 vs 参照组" 的对比，否则生成所有两两对比）
+        method: "anova"（单因素方差分析 + 两两 t 检验）或 "kruskal"（Kruskal-Wallis + 两两秩和检验）
+        p_value_threshold: FDR 阈值（默认 0.05）
+        fold_change_threshold: 倍数变化阈值（默认 1.5）
+        fdr_method: FDR 校正方法（默认 "fdr_bh"，每个对比单独校正）
+        is_logged: 数据是否已Log2转换（默认 True）
+        output_dir: 输出目录
+        **kwargs: 其他参数（安全网）
+    
+    Returns:
+        包含以下键的字典:
+        - status: "success" 或 "error"
+        - contrasts: 对比列表（每项包含 contrast、case_group、control_group、显著代谢物数）
+        - output_path / output_file: 长表 CSV（contrast, metabolite, p_value, fdr, log2fc, ...）
+        - omnibus_path: 总体检验结果 CSV
+        - summary: 统计摘要
+        - error: 错误信息（如果失败）
+    """
+    try:
+        df = read_table(file_path)
+        
+        if group_column not in df.columns:
+            metadata_cols = [col for col in df.columns if not pd.api.types.is_numeric_dtype(df[col])]
+            return {
+                "status": "error",
+                "error": f"分组列 '{group_column}' 不存在于数据中。可能的元数据列（非数值列）: {', '.join(metadata_cols[:10])}"
+            }
+        
+        available_groups = sorted(df[group_column].dropna().unique().tolist())
+        if groups is None:
+            groups = available_groups
+        else:
+            missing = [g for g in groups if g not in available_groups]
+            if missing:
+                return {
+                    "status": "error",
+                    "error": f"分组 {missing} 不存在于分组列中。可用组: {available_groups}"
+                }
+        if len(groups) < 2:
+            return {
+                "status": "error",
+                "error": f"分组列 '{group_column}' 中只有 {len(groups)} 个组，需要至少 2 个组"
+            }
+        if reference_group is not None and reference_group not in groups:
+            return {
+                "status": "error",
+                "error": f"参照组 '{reference_group}' 不存在。可用组: {groups}"
+            }
+        
+        use_rank = method.lower() in ["kruskal", "kruskal-wallis", "wilcoxon", "ranksum", "nonparametric"]
+        
+        metabolite_cols = [
+            col for col in df.columns
+            if col != group_column and pd.api.types.is_numeric_dtype(df[col])
+        ]
+        matrix = df[metabolite_cols].to_numpy(dtype=float)
+        group_labels = df[group_column].to_numpy()
+        group_matrices = [matrix[group_labels == g] for g in groups]
+        
+        # 组内统计量只计算一次，供总体检验和所有两两对比使用
+        moments = [_group_moments(m) for m in group_matrices]
+        n_per_group = np.vstack([n for n, _, _ in moments])
+        testable_omnibus = np.all(n_per_group >= 2, axis=0)
+        
+        # 总体检验
+        if use_rank:
+            omnibus_stat, omnibus_p = _kruskal_tests(group_matrices)
+            omnibus_test = "kruskal"
+        else:
+            n_total = n_per_group.sum(axis=0)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                grand_mean = sum(n * np.nan_to_num(mean) for n, mean, _ in moments) / n_total
+                ss_between = sum(n * (np.nan_to_num(mean) - grand_mean) ** 2 for n, mean, _ in moments)
+                ss_within = sum(ss for _, _, ss in moments)
+                df_between = len(groups) - 1
+                df_within = n_total - len(groups)
+                omnibus_stat = (ss_between / df_between) / (ss_within / df_within)
+            omnibus_p = stats.f.sf(omnibus_stat, df_between, df_within)
+            omnibus_test = "anova"
+        
+        omnibus_df = pd.DataFrame({
+            "metabolite": metabolite_cols,
+            "statistic": omnibus_stat,
+            "p_value": omnibus_p
+        })[testable_omnibus]
+        if len(omnibus_df) > 0:
+            omnibus_df["fdr"] = multipletests(omnibus_df["p_value"].values, method=fdr_method)[1]
+            omnibus_df["significant"] = omnibus_df["fdr"] < p_value_threshold
+        
+        # 两两对比
+        if reference_group is not None:
+            ref = groups.index(reference_group)
+            pairs = [(i, ref) for i in range(len(groups)) if i != ref]
+        else:
+            pairs = [(i, j) for i in range(len(groups)) for j in range(i + 1, len(groups))]
+        
+        log2fc_threshold = np.log2(fold_change_threshold)
+        contrast_tables = []
+        contrasts = []
+        for i, j in pairs:
+            n1, mean1, ss1 = moments[i]
+            n2, mean2, ss2 = moments[j]
+            if use_rank:
+                p_value = _two_group_tests(group_matrices[i], group_matrices[j], use_wilcoxon=True)["p_value"]
+            else:
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    dof = n1 + n2 - 2
+                    t_stat = (mean1 - mean2) / np.sqrt((ss1 + ss2) / dof * (1.0 / n1 + 1.0 / n2))
+                p_value = 2 * stats.t.sf(np.abs(t_stat), dof)
+            log2fc = _log2_fold_change(mean1, mean2, is_logged)
+            
+            testable = (n1 >= 2) & (n2 >= 2)
+            contrast_name = f"{groups[i]}_vs_{groups[j]}"
+            table = pd.DataFrame({
+                "contrast": contrast_name,
+                "metabolite": np.asarray(metabolite_cols, dtype=object)[testable],
+                "case_group": groups[i],
+                "control_group": groups[j],
+                "p_value": p_value[testable],
+                "log2fc": log2fc[testable],
+                "case_mean": mean1[testable],
+                "control_mean": mean2[testable]
+            })
+            if len(table) > 0:
+                # 🔥 每个对比单独做 FDR 校正
+                table["fdr"] = multipletests(table["p_value"].values, method=fdr_method)[1]
+            else:
+                table["fdr"] = []
+            table["log2_fold_change"] = table["log2fc"]  # 别名，兼容 visualize_volcano
+            table["fdr_corrected_pvalue"] = table["fdr"]  # 别名，兼容 visualize_volcano
+            table["significant"] = (table["fdr"] < p_value_threshold) & (table["log2fc"].abs() >= log2fc_threshold)
+            contrast_tables.append(table)
+            contrasts.append({
+                "contrast": contrast_name,
+                "case_group": groups[i],
+                "control_group": groups[j],
+                "tested_metabolites": int(len(table)),
+                "significant_count": int(table["significant"].sum())
+            })
+        
+        results_df = pd.concat(contrast_tables, ignore_index=True)
+        
+        # 保存长表和总体检验结果
+        output_path_obj = Path(output_dir) if output_dir else Path(file_path).parent
+        output_path_obj.mkdir(parents=True, exist_ok=True)
+        input_filename = Path(file_path).stem
+        output_path = str(output_path_obj / f"{input_filename}_multigroup_results.csv")
+        omnibus_path = str(output_path_obj / f"{input_filename}_omnibus_results.csv")
+        results_df.to_csv(output_path, index=False)
+        omnibus_df.to_csv(omnibus_path, index=False)
+        logger.info(f"💾 多组差异分析结果已保存: {output_path} ({len(contrasts)} 个对比)")
+        
+        omnibus_significant = int(omnibus_df["significant"].sum()) if "significant" in omnibus_df else 0
+        
+        return {
+            "status": "success",
+            "contrasts": contrasts,
+            "default_contrast": contrasts[0]["contrast"],
+            "output_path": output_path,
+            "output_file": output_path,  # 别名，用于数据流传递
+            "file_path": output_path,    # 另一个别名，确保兼容性
+            "omnibus_path": omnibus_path,
+            "top_omnibus": omnibus_df.sort_values("p_value").head(20).to_dict(orient="records"),
+            "summary": {
+                "groups": groups,
+                "n_groups": len(groups),
+                "n_contrasts": len(contrasts),
+                "total_metabolites": len(metabolite_cols),
+                "omnibus_test": omnibus_test,
+                "omnibus_significant_count": omnibus_significant,
+                "method": method,
+                "reference_group": reference_group,
+                "p_value_threshold": p_value_threshold,
+                "fold_change_threshold": fold_change_threshold
+            }
+        }
+    
+    except Exception as e:
+        logger.error(f"❌ 多组差异分析失败: {e}", exc_info=True)
+        return {
+            "status": "error",
+            "error": str(e)
+        }
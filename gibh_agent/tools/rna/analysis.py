@@ -11,6 +11,7 @@ matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 
 from ...core.tool_registry import registry
+from ...core.rna_utils import load_adata, save_adata
 
 logger = logging.getLogger(__name__)
 
@@ -47,7 +48,7 @@ def run_normalize(
             filtered_h5ad = os.path.join(adata_path, "filtered.h5ad")
             if os.path.exists(filtered_h5ad):
                 logger.info(f"📖 [Normalize] Reading filtered.h5ad from directory: {filtered_h5ad}")
-                adata = sc.read_h5ad(filtered_h5ad)
+                adata = load_adata(filtered_h5ad)
             else:
                 # 如果是 10x 目录，尝试读取
                 from ...core.rna_utils import read_10x_data
@@ -55,7 +56,7 @@ def run_normalize(
                 adata = read_10x_data(adata_path, var_names='gene_symbols', cache=False)
         elif adata_path.endswith('.h5ad'):
             # 标准 .h5ad 文件
-            adata = sc.read_h5ad(adata_path)
+            adata = load_adata(adata_path)
         else:
             # 其他格式
             adata = sc.read(adata_path)
@@ -83,7 +84,7 @@ def run_normalize(
         if output_dir_actual:
             os.makedirs(output_dir_actual, exist_ok=True)
         
-        adata.write(output_h5ad)
+        save_adata(adata, output_h5ad)
         logger.info(f"✅ [Normalize] Saved normalized data to: {output_h5ad}")
         
         return {
@@ -131,7 +132,7 @@ def run_hvg(
         import scanpy as sc
         
         # 加载数据
-        adata = sc.read_h5ad(adata_path)
+        adata = load_adata(adata_path)
         
         # 寻找高变基因
         sc.pp.highly_variable_genes(adata, n_top_genes=n_top_genes)
@@ -154,7 +155,7 @@ def run_hvg(
         output_h5ad = None
         if output_dir:
             output_h5ad = os.path.join(output_dir, "hvg_filtered.h5ad")
-            adata.write(output_h5ad)
+            save_adata(adata, output_h5ad)
         
         return {
             "status": "success",
@@ -203,7 +204,7 @@ def run_scale(
         import scanpy as sc
         
         # 加载数据
-        adata = sc.read_h5ad(adata_path)
+        adata = load_adata(adata_path)
         
         # 缩放
         sc.pp.scale(adata, max_value=max_value)
@@ -213,7 +214,7 @@ def run_scale(
         if output_dir:
             os.makedirs(output_dir, exist_ok=True)
             output_h5ad = os.path.join(output_dir, "scaled.h5ad")
-            adata.write(output_h5ad)
+            save_adata(adata, output_h5ad)
         
         return {
             "status": "success",
@@ -262,7 +263,7 @@ def run_pca(
         import scanpy as sc
         
         # 加载数据
-        adata = sc.read_h5ad(adata_path)
+        adata = load_adata(adata_path)
         
         # PCA
         sc.tl.pca(adata, n_comps=n_comps, svd_solver=svd_solver)
@@ -282,7 +283,7 @@ def run_pca(
         output_h5ad = None
         if output_dir:
             output_h5ad = os.path.join(output_dir, "pca.h5ad")
-            adata.write(output_h5ad)
+            save_adata(adata, output_h5ad)
         
         # 提取解释方差
         explained_variance = {}
@@ -341,7 +342,7 @@ def run_neighbors(
         import scanpy as sc
         
         # 加载数据
-        adata = sc.read_h5ad(adata_path)
+        adata = load_adata(adata_path)
         
         # 计算邻居
         sc.pp.neighbors(adata, n_neighbors=n_neighbors, n_pcs=n_pcs)
@@ -351,7 +352,7 @@ def run_neighbors(
         if output_dir:
             os.makedirs(output_dir, exist_ok=True)
             output_h5ad = os.path.join(output_dir, "neighbors.h5ad")
-            adata.write(output_h5ad)
+            save_adata(adata, output_h5ad)
         
         return {
             "status": "success",
@@ -402,7 +403,7 @@ def run_clustering(
         import scanpy as sc
         
         # 加载数据
-        adata = sc.read_h5ad(adata_path)
+        adata = load_adata(adata_path)
         
         # 聚类
         if algorithm == "leiden":
@@ -424,7 +425,7 @@ def run_clustering(
         if output_dir:
             os.makedirs(output_dir, exist_ok=True)
             output_h5ad = os.path.join(output_dir, f"{algorithm}_clustered.h5ad")
-            adata.write(output_h5ad)
+            save_adata(adata, output_h5ad)
         
         return {
             "status": "success",
@@ -475,7 +476,7 @@ def run_umap(
         import scanpy as sc
         
         # 加载数据
-        adata = sc.read_h5ad(adata_path)
+        adata = load_adata(adata_path)
         
         # 计算 UMAP
         sc.tl.umap(adata)
@@ -515,7 +516,7 @@ def run_umap(
         output_h5ad = None
         if output_dir:
             output_h5ad = os.path.join(output_dir, "umap.h5ad")
-            adata.write(output_h5ad)
+            save_adata(adata, output_h5ad)
         
         return {
             "status": "success",
@@ -563,7 +564,7 @@ def run_tsne(
         import scanpy as sc
         
         # 加载数据
-        adata = sc.read_h5ad(adata_path)
+        adata = load_adata(adata_path)
         
         # 检查细胞数（t-SNE 对大数据集较慢）
         if adata.n_obs > 5000:
@@ -609,7 +610,7 @@ def run_tsne(
         output_h5ad = None
         if output_dir:
             output_h5ad = os.path.join(output_dir, "tsne.h5ad")
-            adata.write(output_h5ad)
+            save_adata(adata, output_h5ad)
         
         return {
             "status": "success",
@@ -662,7 +663,7 @@ def run_find_markers(
         import pandas as pd
         
         # 加载数据
-        adata = sc.read_h5ad(adata_path)
+        adata = load_adata(adata_path)
         
         # 检查是否有聚类结果
         if cluster_key not in adata.obs.columns:
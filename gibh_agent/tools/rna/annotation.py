@@ -4,6 +4,7 @@
 import os
 import time
 import logging
+from functools import lru_cache
 from typing import Dict, Any, Optional
 from pathlib import Path
 import matplotlib
@@ -11,10 +12,23 @@ matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 
 from ...core.tool_registry import registry
+from ...core.rna_utils import load_adata, save_adata
 
 logger = logging.getLogger(__name__)
 
 
+@lru_cache(maxsize=4)
+def _load_celltypist_model(model_path: str, mtime_ns: int):
+    """
+    加载 CellTypist 模型（进程内缓存）
+    
+    模型只读，同一工作进程中的多次运行（如批量模式）共享已加载的模型；
+    mtime_ns 参与缓存键，模型文件被重新下载后会重新加载。
+    """
+    import celltypist
+    return celltypist.models.Model.load(model_path)
+
+
 @registry.register(
     name="rna_cell_annotation",
     description="Annotates cell types in single-cell RNA-seq data using CellTypist or marker-based methods. Cell type annotation is crucial for interpreting cell populations.",
@@ -45,7 +59,7 @@ def run_cell_annotation(
         import scanpy as sc
         
         # 加载数据
-        adata = sc.read_h5ad(adata_path)
+        adata = load_adata(adata_path)
         
         if method == "celltypist":
             try:
@@ -66,7 +80,7 @@ def run_cell_annotation(
                     models.download_models(model=model_name, folder=str(cache_path))
                 
                 # 加载模型
-                model = celltypist.models.Model.load(str(model_path))
+                model = _load_celltypist_model(str(model_path), model_path.stat().st_mtime_ns)
                 logger.info(f"✅ 模型加载成功: {model_name}")
                 
                 # 运行注释
@@ -114,7 +128,7 @@ def run_cell_annotation(
                 output_h5ad = None
                 if output_dir:
                     output_h5ad = os.path.join(output_dir, "annotated.h5ad")
-                    adata.write(output_h5ad)
+                    save_adata(adata, output_h5ad)
                 
                 return {
                     "status": "success",
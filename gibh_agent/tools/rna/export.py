@@ -8,6 +8,7 @@ from typing import Dict, Any, Optional, List
 from pathlib import Path
 
 from ...core.tool_registry import registry
+from ...core.rna_utils import load_adata
 
 logger = logging.getLogger(__name__)
 
@@ -45,7 +46,7 @@ def export_results(
         import pandas as pd
         
         # 加载数据
-        adata = sc.read_h5ad(adata_path)
+        adata = load_adata(adata_path)
         
         # 确保输出目录存在
         os.makedirs(output_dir, exist_ok=True)
@@ -11,6 +11,7 @@ matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 
 from ...core.tool_registry import registry
+from ...core.rna_utils import load_adata
 
 logger = logging.getLogger(__name__)
 
@@ -41,7 +42,7 @@ def visualize_qc(
         import scanpy as sc
         
         # 加载数据
-        adata = sc.read_h5ad(adata_path)
+        adata = load_adata(adata_path)
         
         # 默认指标
         if metrics is None:
@@ -113,7 +114,7 @@ def visualize_clustering(
         import scanpy as sc
         
         # 加载数据
-        adata = sc.read_h5ad(adata_path)
+        adata = load_adata(adata_path)
         
         # 检查降维结果是否存在
         if basis not in adata.obsm:
@@ -227,7 +228,7 @@ def visualize_markers(
         import scanpy as sc
         
         # 加载数据
-        adata = sc.read_h5ad(adata_path)
+        adata = load_adata(adata_path)
         
         # 检查分组列是否存在
         if groupby not in adata.obs.columns:
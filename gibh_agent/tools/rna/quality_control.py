@@ -11,7 +11,7 @@ matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 
 from ...core.tool_registry import registry
-from ...core.rna_utils import read_10x_data
+from ...core.rna_utils import read_10x_data, load_adata, save_adata
 
 logger = logging.getLogger(__name__)
 
@@ -57,7 +57,7 @@ def run_qc_filter(
             # 🔥 使用统一的10x数据读取函数，支持压缩和未压缩格式
             adata = read_10x_data(adata_path, var_names='gene_symbols', cache=False)
         elif adata_path.endswith('.h5ad'):
-            adata = sc.read_h5ad(adata_path)
+            adata = load_adata(adata_path)
         else:
             adata = sc.read(adata_path)
         
@@ -124,7 +124,7 @@ def run_qc_filter(
             os.makedirs(output_dir_actual, exist_ok=True)
         
         # 保存过滤后的数据
-        adata.write(output_h5ad)
+        save_adata(adata, output_h5ad)
         logger.info(f"✅ [QC Filter] Saved filtered data to: {output_h5ad}")
         
         return {
@@ -179,7 +179,7 @@ def run_doublet_detection(
         import scanpy as sc
         
         # 加载数据
-        adata = sc.read_h5ad(adata_path)
+        adata = load_adata(adata_path)
         
         if method == "scrublet":
             try:
@@ -201,7 +201,7 @@ def run_doublet_detection(
                 if output_dir:
                     os.makedirs(output_dir, exist_ok=True)
                     output_h5ad = os.path.join(output_dir, "doublet_detected.h5ad")
-                    adata.write(output_h5ad)
+                    save_adata(adata, output_h5ad)
                 
                 return {
                     "status": "success",
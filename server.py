@@ -5,16 +5,16 @@ GIBH-AGENT-V2 测试服务器
 import os
 import sys
 import json
+import time
 import logging
 import asyncio
 import re
 import secrets
 from pathlib import Path
-from typing import List, Optional, Set
+from typing import Any, AsyncIterator, Callable, List, Optional, Set
 from datetime import datetime
-from collections import deque
 
-from fastapi import FastAPI, UploadFile, File, HTTPException, Request
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Query
 from typing import Optional
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse, JSONResponse, HTMLResponse
@@ -25,7 +25,14 @@ from pydantic import BaseModel
 sys.path.insert(0, str(Path(__file__).parent))
 
 from gibh_agent import create_agent
-from gibh_agent.core.file_inspector import FileInspector
+from gibh_agent.core.file_inspector import get_file_inspector
+from gibh_agent.core.blob_store import get_blob_store
+from gibh_agent.core.event_log import bind_event_context, emit_event, new_request_id
+from gibh_agent.core.llm_cache import llm_cache_stats
+from gibh_agent.core.llm_transport import transport_stats
+from gibh_agent.core.uploads import (
+    ResumableUploadStore, UploadConflictError, UploadTooLargeError, stream_to_file, upload_chunk_size
+)
 
 # 配置日志
 logging.basicConfig(
@@ -187,7 +194,20 @@ def validate_file_path(file_path: Path, base_dir: Path) -> Path:
         )
 
 # 初始化文件检测器
-file_inspector = FileInspector(str(UPLOAD_DIR))
+file_inspector = get_file_inspector(str(UPLOAD_DIR))
+
+# 🔥 上传内容按 SHA-256 去重（UPLOAD_DIR/.blobs/，上传路径为硬链接；BLOB_STORE_ENABLED=false 关闭）
+blob_store = get_blob_store(str(UPLOAD_DIR))
+
+# 🔥 多 GB 文件的可续传分块上传（会话状态在 UPLOAD_DIR/.partial/ 中，多 worker 共享）
+resumable_uploads = ResumableUploadStore(str(UPLOAD_DIR), blob_store=blob_store)
+
+# 🔥 上传后的文件检查在后台线程池中并行执行，上传接口不等待检查结果
+from gibh_agent.core.inspection_queue import InspectionQueue
+inspection_queue = InspectionQueue(
+    str(UPLOAD_DIR),
+    max_workers=int(os.getenv("INSPECTION_WORKERS", "4"))
+)
 
 # 添加静态文件服务（用于访问结果图片）
 from fastapi.staticfiles import StaticFiles
@@ -294,6 +314,24 @@ async def sync_tools_on_startup():
         logger.warning("   继续启动，但工具检索功能可能不可用")
 
 
+@app.on_event("startup")
+async def gc_blob_store_on_startup():
+    """启动时清理没有上传路径引用的 blob（上传文件被删除后）及其派生缓存"""
+    if blob_store is None:
+        return
+    try:
+        await asyncio.to_thread(blob_store.gc)
+    except Exception as e:
+        logger.warning(f"⚠️ [BlobStore] 启动清理失败: {e}")
+
+
+@app.on_event("startup")
+async def init_step_pool_on_startup():
+    """启动时创建固定大小的步骤进程池（运行期间不再调整大小或关闭）"""
+    from gibh_agent.core.executor import init_step_pool
+    init_step_pool()
+
+
 # 请求模型
 class ChatRequest(BaseModel):
     message: str = ""
@@ -303,57 +341,129 @@ class ChatRequest(BaseModel):
     test_dataset_id: Optional[str] = None
 
 
-# 日志缓冲区（保留用于未来扩展）
-log_buffer = deque(maxlen=1000)
-log_listeners: Set[asyncio.Queue] = set()
+# 🔥 后台工作流执行：编排线程池 + 子进程步骤池，不阻塞事件循环
+# WORKFLOW_ASYNC=true 时 /api/execute 立即返回 run_id，进度通过 SSE / 轮询获取
+WORKFLOW_ASYNC = os.getenv("WORKFLOW_ASYNC", "true").lower() in ("1", "true", "yes")
+from gibh_agent.core.run_manager import WorkflowRunManager
+# 运行状态和事件日志写入 RESULTS_DIR 下的运行目录，多个 worker 之间共享
+workflow_run_manager = WorkflowRunManager(
+    max_concurrent_runs=int(os.getenv("WORKFLOW_CONCURRENCY", "2")),
+    results_dir=str(RESULTS_DIR)
+)
+_background_jobs: Set[asyncio.Task] = set()
 
 
-def log_handler(record):
-    """日志处理器，将日志发送到所有监听者"""
-    log_entry = {
-        "timestamp": datetime.now().isoformat(),
-        "level": record.levelname,
-        "message": record.getMessage(),
-        "module": record.name
-    }
-    log_buffer.append(log_entry)
+def start_background_job(job, name: str) -> asyncio.Task:
+    """
+    把协程作为后台任务启动（保持引用直到结束，异常写入日志）
+
+    Args:
+        job: 协程
+        name: 日志中使用的任务名称
+
+    Returns:
+        asyncio.Task
+    """
+    def on_done(task: asyncio.Task) -> None:
+        _background_jobs.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            exc = task.exception()
+            logger.error(f"❌ 后台任务 {name} 异常结束: {exc}", exc_info=(type(exc), exc, exc.__traceback__))
     
-    # 通知所有监听者
-    for listener in list(log_listeners):
-        try:
-            listener.put_nowait(log_entry)
-        except:
-            # 如果队列已满或已关闭，移除监听者
-            log_listeners.discard(listener)
+    task = asyncio.create_task(job)
+    _background_jobs.add(task)
+    task.add_done_callback(on_done)
+    return task
+
+
+def new_run_dir() -> Path:
+    """生成新的运行输出目录（时间戳 + 随机后缀，避免同一秒内提交的运行冲突）"""
+    return RESULTS_DIR / f"run_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{secrets.token_hex(3)}"
+
+
+# 🔥 流式响应公共部分：SSE 端点共用事件编码、心跳和响应头
+STREAMING_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no"
+}
+SSE_HEARTBEAT_SECONDS = 15.0
 
 
-# 添加自定义日志处理器
-class StreamLogHandler(logging.Handler):
-    def emit(self, record):
+async def queue_events(
+    subscribe: Callable[[], asyncio.Queue],
+    unsubscribe: Callable[[asyncio.Queue], None],
+    terminal_type: str
+) -> AsyncIterator[Optional[dict]]:
+    """
+    从订阅队列读取事件，收到 terminal_type 类型的事件后结束
+
+    Args:
+        subscribe: 创建订阅队列（队列中可先放入历史事件）
+        unsubscribe: 取消订阅
+        terminal_type: 结束事件类型
+
+    Returns:
+        事件迭代器；空闲 SSE_HEARTBEAT_SECONDS 秒时产出 None（心跳）
+    """
+    queue = subscribe()
+    try:
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=SSE_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield None
+                continue
+            yield event
+            if event.get("type") == terminal_type:
+                return
+    finally:
+        unsubscribe(queue)
+
+
+def sse_response(items: AsyncIterator[Any], name: str) -> StreamingResponse:
+    """
+    把事件迭代器包装为 Server-Sent Events 响应
+
+    Args:
+        items: 异步迭代器；dict 编码为 "event: <type>" + JSON data，str 原样发送，None 发送心跳注释
+        name: 日志中使用的事件流名称
+
+    Returns:
+        StreamingResponse
+    """
+    from gibh_agent.core.utils import sanitize_for_json
+
+    async def event_generator():
         try:
-            # 确保记录被格式化
-            self.format(record)
-            log_handler(record)
+            async for item in items:
+                if item is None:
+                    yield ": heartbeat\n\n"
+                elif isinstance(item, str):
+                    yield item
+                else:
+                    payload = json.dumps(sanitize_for_json(item), ensure_ascii=False, default=str)
+                    yield f"event: {item['type']}\ndata: {payload}\n\n"
+        except asyncio.CancelledError:
+            logger.info(f"📡 {name}连接已取消")
         except Exception as e:
-            # 避免日志处理器本身出错，但记录错误
-            print(f"日志处理器错误: {e}")
+            logger.error(f"❌ {name}错误: {e}", exc_info=True)
+        finally:
+            await items.aclose()
+
+    return StreamingResponse(event_generator(), media_type="text/event-stream", headers=STREAMING_HEADERS)
 
 
-stream_handler = StreamLogHandler()
-stream_handler.setLevel(logging.DEBUG)  # 降低级别以捕获更多日志
-stream_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+# 🔥 日志流水线：根日志记录器只挂入队处理器，格式化和向 /api/logs/stream 订阅者的分发在后台线程中完成
+from gibh_agent.core.log_stream import LogHub, sse_lines
+log_hub = LogHub.from_env()
 
 # 添加到根日志记录器，捕获所有模块的日志
 root_logger = logging.getLogger()
-root_logger.setLevel(logging.DEBUG)  # 降低级别
 # 移除现有的处理器，避免重复
 for handler in root_logger.handlers[:]:
     root_logger.removeHandler(handler)
-root_logger.addHandler(stream_handler)
-
-# 也添加到当前logger
-if stream_handler not in logger.handlers:
-    logger.addHandler(stream_handler)
+log_hub.install(root_logger)
 
 # 测试日志
 logger.info("📋 日志系统初始化完成")
@@ -1255,6 +1365,16 @@ async def index():
     return HTMLResponse(content=html_content)
 
 
+def _inspection_info(batch) -> dict:
+    """上传响应中的后台检查信息（批次 ID 与轮询 / SSE 地址）"""
+    return {
+        "batch_id": batch.batch_id,
+        "job_ids": [job["job_id"] for job in batch.jobs],
+        "status_url": f"/api/inspections/{batch.batch_id}",
+        "events_url": f"/api/inspections/{batch.batch_id}/events"
+    }
+
+
 @app.post("/api/upload")
 async def upload_file(files: List[UploadFile] = File(...)):
     """文件上传接口（支持多文件上传）"""
@@ -1320,20 +1440,16 @@ async def upload_file(files: List[UploadFile] = File(...)):
                     logger.error(f"❌ 文件路径验证失败: {file.filename} -> {e.detail}")
                     raise
                 
-                # 🔒 安全：检查文件大小
-                content = await file.read()
-                if len(content) > MAX_FILE_SIZE:
+                # 🔥 分块流式落盘（边写边检查大小上限、计算 SHA-256，完成后原子重命名）
+                try:
+                    saved = await asyncio.to_thread(
+                        stream_to_file, file.file, file_path, MAX_FILE_SIZE, blob_store=blob_store
+                    )
+                except UploadTooLargeError:
                     raise HTTPException(
                         status_code=413,
                         detail=f"文件 {file.filename} 超过最大大小限制 ({MAX_FILE_SIZE / 1024 / 1024:.0f}MB)"
                     )
-                
-                # 🔧 修复：确保父目录存在
-                file_path.parent.mkdir(parents=True, exist_ok=True)
-                
-                try:
-                    with open(file_path, "wb") as f:
-                        f.write(content)
                 except PermissionError as e:
                     logger.error(f"❌ 文件写入权限错误: {file_path} -> {e}")
                     raise HTTPException(status_code=500, detail=f"文件保存失败：权限不足 ({file.filename})")
@@ -1343,31 +1459,29 @@ async def upload_file(files: List[UploadFile] = File(...)):
                 
                 logger.info(f"✅ 10x文件保存成功: {file_path}")
                 
-                # 生成元数据
-                try:
-                    metadata = file_inspector.generate_metadata(str(file_path.relative_to(UPLOAD_DIR)))
-                except Exception as e:
-                    logger.warning(f"⚠️ 生成文件元数据失败: {e}")
-                    metadata = None
-                
                 uploaded_results.append({
                     "file_id": str(tenx_dir.relative_to(UPLOAD_DIR)),
                     "file_name": file.filename,
                     "file_path": str(file_path),
-                    "file_size": len(content),
-                    "metadata": metadata,
+                    "file_size": saved["size"],
+                    "sha256": saved["sha256"],
+                    "deduplicated": saved["deduplicated"],  # 内容已存在，未占用新的磁盘空间
+                    "metadata": None,  # 元数据由后台检查生成（见 inspection）
                     "is_10x": True,
                     "group_dir": str(tenx_dir.relative_to(UPLOAD_DIR))
                 })
             
             # 返回10x目录路径（而不是单个文件路径）
             file_paths = [str(tenx_dir.relative_to(UPLOAD_DIR))]
+            # 🔥 整个 10x 目录作为一个检查任务在后台执行
+            batch = inspection_queue.submit(file_paths)
             return {
                 "status": "success",
                 "is_10x_data": True,
                 "group_dir": str(tenx_dir.relative_to(UPLOAD_DIR)),
                 "files": uploaded_results,
                 "file_paths": file_paths,  # 🔥 添加 file_paths 数组
+                "inspection": _inspection_info(batch),
                 "message": f"10x数据已保存到: {tenx_dir.relative_to(UPLOAD_DIR)}"
             }
         
@@ -1391,20 +1505,16 @@ async def upload_file(files: List[UploadFile] = File(...)):
                 logger.error(f"❌ 文件路径验证失败: {file.filename} -> {e.detail}")
                 raise
             
-            # 🔒 安全：检查文件大小
-            content = await file.read()
-            if len(content) > MAX_FILE_SIZE:
+            # 🔥 分块流式落盘（边写边检查大小上限、计算 SHA-256，完成后原子重命名）
+            try:
+                saved = await asyncio.to_thread(
+                    stream_to_file, file.file, file_path, MAX_FILE_SIZE, blob_store=blob_store
+                )
+            except UploadTooLargeError:
                 raise HTTPException(
                     status_code=413,
                     detail=f"文件 {file.filename} 超过最大大小限制 ({MAX_FILE_SIZE / 1024 / 1024:.0f}MB)"
                 )
-            
-            # 🔧 修复：确保父目录存在
-            file_path.parent.mkdir(parents=True, exist_ok=True)
-            
-            try:
-                with open(file_path, "wb") as f:
-                    f.write(content)
             except PermissionError as e:
                 logger.error(f"❌ 文件写入权限错误: {file_path} -> {e}")
                 raise HTTPException(status_code=500, detail=f"文件保存失败：权限不足 ({file.filename})")
@@ -1414,21 +1524,14 @@ async def upload_file(files: List[UploadFile] = File(...)):
             
             logger.info(f"✅ 文件保存成功: {file_path}")
             
-            # 生成元数据
-            try:
-                metadata = file_inspector.generate_metadata(file.filename)
-                if metadata:
-                    logger.info(f"📊 文件元数据已生成: {metadata.get('file_type', 'unknown')}")
-            except Exception as e:
-                logger.warning(f"⚠️ 生成文件元数据失败: {e}")
-                metadata = None
-            
             uploaded_results.append({
                 "file_id": file.filename,
                 "file_name": file.filename,
                 "file_path": str(file_path),
-                "file_size": len(content),
-                "metadata": metadata,
+                "file_size": saved["size"],
+                "sha256": saved["sha256"],
+                "deduplicated": saved["deduplicated"],  # 内容已存在，未占用新的磁盘空间
+                "metadata": None,  # 元数据由后台检查生成（见 inspection）
                 "is_10x": False
             })
         
@@ -1453,12 +1556,16 @@ async def upload_file(files: List[UploadFile] = File(...)):
                 "path": rel_path  # 使用相对路径
             })
         
+        # 🔥 文件已落盘：检查任务提交到后台线程池并行执行，结果通过轮询 / SSE 获取
+        batch = inspection_queue.submit(file_paths)
+        
         # 🔥 统一返回格式：始终返回一致的 JSON 结构
         response = {
             "status": "success",
             "file_paths": file_paths,  # 文件路径数组（相对路径）
             "file_info": file_info,    # 文件信息数组
-            "count": len(uploaded_results)
+            "count": len(uploaded_results),
+            "inspection": _inspection_info(batch)
         }
         
         # 如果只有一个文件，添加单个文件的详细信息（向后兼容）
@@ -1503,22 +1610,122 @@ async def upload_file(files: List[UploadFile] = File(...)):
                 raise HTTPException(status_code=500, detail="文件上传失败，请稍后重试")
 
 
+class ResumableUploadRequest(BaseModel):
+    file_name: str
+    total_size: int
+    sha256: Optional[str] = None
+    group_dir: Optional[str] = None  # 同一 10x 数据集的多个文件放入同一子目录
+
+
+def _resumable_response(session: dict) -> dict:
+    """续传会话的响应格式（不暴露服务器上的目标路径）"""
+    return {
+        "upload_id": session["upload_id"],
+        "offset": session["offset"],
+        "total_size": session["total_size"],
+        "completed": session["completed"],
+        "chunk_size": upload_chunk_size(),
+        "upload_url": f"/api/uploads/resumable/{session['upload_id']}"
+    }
+
+
+@app.post("/api/uploads/resumable")
+async def create_resumable_upload(req: ResumableUploadRequest):
+    """
+    创建可续传上传会话（多 GB 的 10x / FASTQ 文件）
+    
+    之后用 PUT /api/uploads/resumable/{upload_id}?offset=N 依次上传分块（请求体为原始字节），
+    断线后用 GET 查询已写入的 offset 并继续。
+    """
+    safe_filename = sanitize_filename(req.file_name)
+    file_ext = Path(safe_filename).suffix.lower()
+    if file_ext and file_ext not in ALLOWED_EXTENSIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"不允许的文件类型: {file_ext}。允许的类型: {', '.join(ALLOWED_EXTENSIONS)}"
+        )
+    if req.total_size <= 0:
+        raise HTTPException(status_code=400, detail="total_size 必须大于 0")
+    
+    target_dir = UPLOAD_DIR / sanitize_filename(req.group_dir) if req.group_dir else UPLOAD_DIR
+    target_path = validate_file_path(target_dir / safe_filename, UPLOAD_DIR)
+    try:
+        session = resumable_uploads.create(target_path, req.total_size, req.sha256)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=f"文件 {safe_filename} {e}")
+    logger.info(f"📤 创建续传上传: {safe_filename} ({req.total_size} 字节) -> {session['upload_id']}")
+    return _resumable_response(session)
+
+
+@app.get("/api/uploads/resumable/{upload_id}")
+async def get_resumable_upload(upload_id: str):
+    """查询续传会话（offset 为服务器已写入的字节数）"""
+    session = resumable_uploads.status(upload_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"上传会话不存在: {upload_id}")
+    return _resumable_response(session)
+
+
+@app.put("/api/uploads/resumable/{upload_id}")
+async def put_resumable_chunk(upload_id: str, request: Request, offset: int = Query(..., ge=0)):
+    """
+    上传一个分块（请求体为原始字节，流式写入）
+    
+    offset 必须等于服务器已写入的字节数，否则返回 409（响应中带当前 offset）。
+    写满 total_size 后自动完成：校验 SHA-256（若创建时提供）、原子移动到上传目录并提交后台检查。
+    """
+    try:
+        session = await resumable_uploads.append(upload_id, offset, request.stream())
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"上传会话不存在: {upload_id}")
+    except UploadConflictError as e:
+        return JSONResponse(status_code=409, content={"status": "conflict", "detail": str(e), "offset": e.offset})
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=f"分块超出登记的文件大小: {e}")
+    
+    if not session["completed"]:
+        return _resumable_response(session)
+    
+    try:
+        saved = await asyncio.to_thread(resumable_uploads.finalize, upload_id)
+    except ValueError as e:
+        resumable_uploads.abort(upload_id)
+        raise HTTPException(status_code=422, detail=str(e))
+    
+    rel_path = str(Path(saved["file_path"]).relative_to(UPLOAD_DIR.resolve()))
+    # 放在 group_dir 中的文件（如 10x 数据集）按整个目录检查，与多文件上传一致
+    group_dir = Path(rel_path).parent
+    batch = inspection_queue.submit([str(group_dir) if group_dir != Path(".") else rel_path])
+    return {
+        "status": "success",
+        **_resumable_response({**session, "offset": saved["size"]}),
+        "file_name": Path(rel_path).name,
+        "file_path": saved["file_path"],
+        "file_size": saved["size"],
+        "sha256": saved["sha256"],
+        "deduplicated": saved["deduplicated"],  # 内容已存在，未占用新的磁盘空间
+        "file_paths": [rel_path],
+        "file_info": [{"name": Path(rel_path).name, "size": saved["size"], "path": rel_path}],
+        "inspection": _inspection_info(batch)
+    }
+
+
+@app.delete("/api/uploads/resumable/{upload_id}")
+async def abort_resumable_upload(upload_id: str):
+    """放弃续传上传并删除已写入的数据"""
+    if resumable_uploads.status(upload_id) is None:
+        raise HTTPException(status_code=404, detail=f"上传会话不存在: {upload_id}")
+    resumable_uploads.abort(upload_id)
+    return {"status": "success", "upload_id": upload_id}
+
+
 @app.post("/api/chat")
 async def chat_endpoint(req: ChatRequest):
     """聊天接口"""
-    # #region debug log - entry point
-    import json
     import traceback
-    # 🔧 修复：使用容器内的日志路径（统一使用 /app/debug.log）
-    debug_log_path = Path("/app/debug.log")
-    try:
-        # 确保目录存在
-        debug_log_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(debug_log_path, 'a') as f:
-            f.write(json.dumps({"location":"server.py:1112","message":"chat_endpoint entry","data":{"agent_is_none":agent is None,"req_message":req.message[:100] if req.message else None},"timestamp":int(__import__('time').time()*1000),"sessionId":"debug-session","runId":"run1","hypothesisId":"ENTRY"})+"\n")
-    except Exception as log_err:
-        pass  # 即使日志写入失败也不影响主流程
-    # #endregion
+    # 🔥 结构化事件日志：只入队，由后台线程批量写入（请求处理中不做文件 I/O）
+    bind_event_context(request_id=new_request_id())
+    emit_event("chat.entry", {"agent_is_none": agent is None, "req_message": req.message[:100] if req.message else None})
     
     if not agent:
         error_msg = "智能体未初始化，请检查配置和日志。可能的原因：1) 配置文件路径错误 2) API Key未设置 3) 依赖包缺失"
@@ -1703,15 +1910,8 @@ async def chat_endpoint(req: ChatRequest):
         logger.info(f"📂 文件路径列表: {[f['path'] for f in uploaded_files]}")
         
         # 处理查询
-        # #region debug log
-        try:
-            debug_log_path = Path("/app/debug.log")
-            debug_log_path.parent.mkdir(parents=True, exist_ok=True)
-            with open(debug_log_path, 'a') as f:
-                f.write(json.dumps({"location":"server.py:1161","message":"Before process_query","data":{"query":req.message,"uploaded_files_count":len(uploaded_files),"test_dataset_id":req.test_dataset_id},"timestamp":int(__import__('time').time()*1000),"sessionId":"debug-session","runId":"run1","hypothesisId":"A"})+"\n")
-        except Exception as log_err:
-            pass  # 日志写入失败不影响主流程
-        # #endregion
+        emit_event("chat.process_query.start", {"query": req.message, "uploaded_files_count": len(uploaded_files), "test_dataset_id": req.test_dataset_id})
+        process_started = time.perf_counter()
         try:
             result = await agent.process_query(
                 query=req.message,
@@ -1720,26 +1920,18 @@ async def chat_endpoint(req: ChatRequest):
                 test_dataset_id=req.test_dataset_id
             )
         except Exception as process_err:
-            # #region debug log
-            try:
-                debug_log_path = Path("/app/debug.log")
-                debug_log_path.parent.mkdir(parents=True, exist_ok=True)
-                with open(debug_log_path, 'a') as f:
-                    f.write(json.dumps({"location":"server.py:1156","message":"process_query exception","data":{"error_type":type(process_err).__name__,"error_message":str(process_err),"traceback":traceback.format_exc()},"timestamp":int(__import__('time').time()*1000),"sessionId":"debug-session","runId":"run1","hypothesisId":"PROCESS_QUERY"})+"\n")
-            except:
-                pass
-            # #endregion
+            emit_event("chat.process_query.error", {
+                "error_type": type(process_err).__name__,
+                "error_message": str(process_err),
+                "traceback": traceback.format_exc()
+            }, duration_ms=(time.perf_counter() - process_started) * 1000)
             raise  # 重新抛出异常，让外层异常处理捕获
         
-        # #region debug log
-        try:
-            debug_log_path = Path("/app/debug.log")
-            debug_log_path.parent.mkdir(parents=True, exist_ok=True)
-            with open(debug_log_path, 'a') as f:
-                f.write(json.dumps({"location":"server.py:1168","message":"After process_query","data":{"result_type":type(result).__name__,"result_keys":list(result.keys()) if isinstance(result,dict) else None,"result_type_value":result.get('type') if isinstance(result,dict) else None},"timestamp":int(__import__('time').time()*1000),"sessionId":"debug-session","runId":"run1","hypothesisId":"A"})+"\n")
-        except:
-            pass
-        # #endregion
+        emit_event("chat.process_query.done", {
+            "result_type": type(result).__name__,
+            "result_keys": list(result.keys()) if isinstance(result, dict) else None,
+            "result_type_value": result.get('type') if isinstance(result, dict) else None
+        }, duration_ms=(time.perf_counter() - process_started) * 1000)
         
         logger.info(f"✅ 处理完成，返回类型: {result.get('type', 'unknown')}")
         
@@ -1771,40 +1963,19 @@ async def chat_endpoint(req: ChatRequest):
         
         # 如果是测试数据选择请求，格式化为用户友好的文本
         if result.get("type") == "test_data_selection":
-            # #region debug log
-            import json
-            try:
-                debug_log_path = Path("/app/debug.log")
-                debug_log_path.parent.mkdir(parents=True, exist_ok=True)
-                with open(debug_log_path, 'a') as f:
-                    f.write(json.dumps({"location":"server.py:1178","message":"Entering test_data_selection handler","data":{"has_message":"message" in result,"has_options":"options" in result,"has_datasets_display":"datasets_display" in result,"has_datasets_json":"datasets_json" in result},"timestamp":int(__import__('time').time()*1000),"sessionId":"debug-session","runId":"run1","hypothesisId":"B"})+"\n")
-            except:
-                pass  # 日志写入失败不影响主流程
-            # #endregion
+            emit_event("chat.test_data_selection", {
+                "has_message": "message" in result,
+                "has_options": "options" in result,
+                "has_datasets_display": "datasets_display" in result,
+                "has_datasets_json": "datasets_json" in result
+            })
+            
             async def generate():
                 try:
-                    # #region debug log
-                    try:
-                        debug_log_path = Path("/app/debug.log")
-                        debug_log_path.parent.mkdir(parents=True, exist_ok=True)
-                        with open(debug_log_path, 'a') as f:
-                            f.write(json.dumps({"location":"server.py:1181","message":"Inside generate()","data":{},"timestamp":int(__import__('time').time()*1000),"sessionId":"debug-session","runId":"run1","hypothesisId":"C"})+"\n")
-                    except:
-                        pass
-                    # #endregion
                     # 构建用户友好的消息
                     message = result.get("message", "检测到您没有上传相关数据。请选择：")
                     options = result.get("options", [])
                     datasets_display = result.get("datasets_display", "")
-                    # #region debug log
-                    try:
-                        debug_log_path = Path("/app/debug.log")
-                        debug_log_path.parent.mkdir(parents=True, exist_ok=True)
-                        with open(debug_log_path, 'a') as f:
-                            f.write(json.dumps({"location":"server.py:1187","message":"Before datasets_json processing","data":{"message_type":type(message).__name__,"options_type":type(options).__name__,"datasets_display_type":type(datasets_display).__name__,"datasets_display_len":len(str(datasets_display)) if datasets_display else 0},"timestamp":int(__import__('time').time()*1000),"sessionId":"debug-session","runId":"run1","hypothesisId":"D"})+"\n")
-                    except:
-                        pass
-                    # #endregion
                     
                     response_text = f"{message}\n\n"
                     for option in options:
@@ -1819,69 +1990,25 @@ async def chat_endpoint(req: ChatRequest):
                     # 这里我们通过特殊标记来传递 JSON 数据
                     # 将 JSON 中的换行符替换为空格，避免破坏 HTML 注释
                     datasets_json_raw = result.get('datasets_json', '[]')
-                    # #region debug log
-                    try:
-                        debug_log_path = Path("/app/debug.log")
-                        debug_log_path.parent.mkdir(parents=True, exist_ok=True)
-                        with open(debug_log_path, 'a') as f:
-                            f.write(json.dumps({"location":"server.py:1200","message":"Before datasets_json replace","data":{"datasets_json_type":type(datasets_json_raw).__name__,"datasets_json_is_none":datasets_json_raw is None,"datasets_json_len":len(str(datasets_json_raw)) if datasets_json_raw else 0},"timestamp":int(__import__('time').time()*1000),"sessionId":"debug-session","runId":"run1","hypothesisId":"B"})+"\n")
-                    except:
-                        pass
-                    # #endregion
                     datasets_json = str(datasets_json_raw).replace('\n', ' ').replace('\r', '') if datasets_json_raw else '[]'
-                    # #region debug log
-                    try:
-                        debug_log_path = Path("/app/debug.log")
-                        debug_log_path.parent.mkdir(parents=True, exist_ok=True)
-                        with open(debug_log_path, 'a') as f:
-                            f.write(json.dumps({"location":"server.py:1203","message":"After datasets_json replace","data":{"datasets_json_len":len(datasets_json),"response_text_len":len(response_text)},"timestamp":int(__import__('time').time()*1000),"sessionId":"debug-session","runId":"run1","hypothesisId":"B"})+"\n")
-                    except:
-                        pass
-                    # #endregion
+                    emit_event("chat.test_data_selection.datasets_json", {
+                        "datasets_json_type": type(datasets_json_raw).__name__,
+                        "datasets_json_len": len(datasets_json),
+                        "response_text_len": len(response_text)
+                    })
                     response_text += f"\n<!-- DATASETS_JSON: {datasets_json} -->\n"
                     
-                    # #region debug log
-                    try:
-                        debug_log_path = Path("/app/debug.log")
-                        debug_log_path.parent.mkdir(parents=True, exist_ok=True)
-                        with open(debug_log_path, 'a') as f:
-                            f.write(json.dumps({"location":"server.py:1207","message":"Before yield","data":{"final_response_text_len":len(response_text)},"timestamp":int(__import__('time').time()*1000),"sessionId":"debug-session","runId":"run1","hypothesisId":"C"})+"\n")
-                    except:
-                        pass
-                    # #endregion
+                    emit_event("chat.test_data_selection.response", {"final_response_text_len": len(response_text)})
                     yield response_text
-                    # #region debug log
-                    try:
-                        debug_log_path = Path("/app/debug.log")
-                        debug_log_path.parent.mkdir(parents=True, exist_ok=True)
-                        with open(debug_log_path, 'a') as f:
-                            f.write(json.dumps({"location":"server.py:1209","message":"After yield","data":{},"timestamp":int(__import__('time').time()*1000),"sessionId":"debug-session","runId":"run1","hypothesisId":"C"})+"\n")
-                    except:
-                        pass
-                    # #endregion
                 except Exception as e:
-                    # #region debug log
-                    import traceback
-                    try:
-                        debug_log_path = Path("/app/debug.log")
-                        debug_log_path.parent.mkdir(parents=True, exist_ok=True)
-                        with open(debug_log_path, 'a') as f:
-                            f.write(json.dumps({"location":"server.py:1212","message":"Exception in generate()","data":{"error_type":type(e).__name__,"error_message":str(e),"traceback":traceback.format_exc()},"timestamp":int(__import__('time').time()*1000),"sessionId":"debug-session","runId":"run1","hypothesisId":"C"})+"\n")
-                    except:
-                        pass
-                    # #endregion
+                    emit_event("chat.test_data_selection.error", {
+                        "error_type": type(e).__name__,
+                        "error_message": str(e),
+                        "traceback": traceback.format_exc()
+                    })
                     logger.error(f"❌ 格式化测试数据选择响应错误: {e}", exc_info=True)
                     yield f"\n\n❌ 错误: {str(e)}"
             
-            # #region debug log
-            try:
-                debug_log_path = Path("/app/debug.log")
-                debug_log_path.parent.mkdir(parents=True, exist_ok=True)
-                with open(debug_log_path, 'a') as f:
-                    f.write(json.dumps({"location":"server.py:1218","message":"Before StreamingResponse","data":{},"timestamp":int(__import__('time').time()*1000),"sessionId":"debug-session","runId":"run1","hypothesisId":"E"})+"\n")
-            except:
-                pass
-            # #endregion
             return StreamingResponse(generate(), media_type="text/plain")
         
         # 如果是聊天响应，返回流式
@@ -1903,36 +2030,150 @@ async def chat_endpoint(req: ChatRequest):
                     logger.error(f"详细错误: {traceback.format_exc()}")
                     yield f"\n\n❌ 错误: {str(e)}"
             
-            return StreamingResponse(
-                generate(), 
-                media_type="text/plain",
-                headers={
-                    "Cache-Control": "no-cache",
-                    "Connection": "keep-alive",
-                    "X-Accel-Buffering": "no"
-                }
-            )
+            return StreamingResponse(generate(), media_type="text/plain", headers=STREAMING_HEADERS)
         
         # 其他情况返回 JSON
         return JSONResponse(content=result)
         
     except Exception as e:
-        # #region debug log
-        import traceback
-        try:
-            debug_log_path = Path("/app/debug.log")
-            debug_log_path.parent.mkdir(parents=True, exist_ok=True)
-            with open(debug_log_path, 'a') as f:
-                f.write(json.dumps({"location":"server.py:1210","message":"Exception in chat_endpoint","data":{"error_type":type(e).__name__,"error_message":str(e),"traceback":traceback.format_exc()},"timestamp":int(__import__('time').time()*1000),"sessionId":"debug-session","runId":"run1","hypothesisId":"ALL"})+"\n")
-        except:
-            pass  # 日志写入失败不影响主流程
-        # #endregion
+        emit_event("chat.error", {
+            "error_type": type(e).__name__,
+            "error_message": str(e),
+            "traceback": traceback.format_exc()
+        })
         error_detail = f"{type(e).__name__}: {str(e)}"
         logger.error(f"❌ 处理失败: {error_detail}", exc_info=True)
         logger.error(f"详细错误: {traceback.format_exc()}")
         raise HTTPException(status_code=500, detail=error_detail)
 
 
+async def run_workflow_job(
+    run_id: str,
+    output_dir: str,
+    workflow_data: dict,
+    file_paths: List[str],
+    target_agent=None,
+    resume: bool = False
+) -> dict:
+    """
+    在后台执行工作流并生成 AI Expert Diagnosis
+    
+    工作流编排在 workflow_run_manager 的线程池中进行，步骤在子进程中执行；
+    进度事件实时发布到 workflow_run_manager（供 SSE 和状态轮询使用）。
+    
+    Args:
+        run_id: 运行 ID（输出目录名）
+        output_dir: 输出目录
+        workflow_data: 工作流配置
+        file_paths: 输入文件路径列表
+        target_agent: 用于生成诊断的 Agent 实例
+        resume: 是否从运行清单续跑
+    
+    Returns:
+        执行报告（report_data）
+    """
+    from gibh_agent.core.executor import WorkflowExecutor
+    
+    def on_event(event: dict):
+        workflow_run_manager.publish(run_id, event)
+    
+    bind_event_context(run_id=run_id)
+    emit_event("workflow.start", {
+        "resume": resume,
+        "n_files": len(file_paths or []),
+        "n_steps": len((workflow_data or {}).get("steps", []))
+    })
+    workflow_started = time.perf_counter()
+    try:
+        # 创建执行器并执行（传递 agent 实例以生成诊断）
+        executor = WorkflowExecutor(output_dir=output_dir)
+        if resume:
+            report_data = await workflow_run_manager.run_in_background(
+                executor.resume_workflow,
+                output_dir,
+                agent=target_agent,
+                on_event=on_event,
+                isolate_steps=True
+            )
+        else:
+            report_data = await workflow_run_manager.run_in_background(
+                executor.execute_workflow,
+                workflow_data=workflow_data,
+                file_paths=file_paths,
+                output_dir=output_dir,
+                agent=target_agent,  # 🔥 传递 agent 实例以生成 AI Expert Diagnosis
+                on_event=on_event,
+                isolate_steps=True
+            )
+        # run_id 用于失败后通过 resume_run_id 续跑
+        report_data["run_id"] = run_id
+        
+        logger.info("✅ 通用执行器执行完成")
+        
+        # 🔥 生成 AI Expert Diagnosis（如果提供了 Agent 实例）
+        if target_agent and hasattr(target_agent, '_generate_analysis_summary'):
+            try:
+                logger.info("📝 [Server] 生成 AI Expert Diagnosis...")
+                
+                # 检测组学类型
+                omics_type = "Metabolomics"  # 默认
+                steps = workflow_data.get("steps", [])
+                if any("rna" in step.get("id", "").lower() or "rna" in step.get("tool_id", "").lower() for step in steps):
+                    omics_type = "scRNA"
+                elif any("metabolomics" in step.get("id", "").lower() or "metabolomics" in step.get("tool_id", "").lower() for step in steps):
+                    omics_type = "Metabolomics"
+                
+                # 调用异步方法生成诊断
+                # 报告超过 REPORT_MAX_BYTES 时 steps_results 可能被省略（内容与 steps_details 重复）
+                steps_results = report_data.get("steps_results") or [
+                    d.get("step_result") for d in report_data.get("steps_details", []) if d.get("step_result")
+                ]
+                workflow_name = report_data.get("workflow_name", "Analysis Pipeline")
+                diagnosis = await target_agent._generate_analysis_summary(
+                    steps_results, 
+                    omics_type, 
+                    workflow_name
+                )
+                
+                if diagnosis:
+                    logger.info(f"✅ [Server] AI Expert Diagnosis 生成成功，长度: {len(diagnosis)}")
+                    report_data["diagnosis"] = diagnosis
+                else:
+                    logger.warning("⚠️ [Server] AI Expert Diagnosis 生成失败或返回空")
+            except Exception as diag_err:
+                logger.error(f"❌ [Server] 生成 AI Expert Diagnosis 失败: {diag_err}", exc_info=True)
+                # 不中断工作流，继续执行
+        
+        failed_step = next(
+            (d for d in report_data.get("steps_details", []) if d.get("status") == "error"),
+            None
+        )
+        workflow_run_manager.publish(run_id, {
+            "type": "workflow_finished",
+            "status": report_data.get("status", "error"),
+            "error": failed_step.get("summary") if failed_step else None,
+            "report_data": report_data
+        })
+        emit_event("workflow.finished", {
+            "status": report_data.get("status", "error"),
+            "failed_step": failed_step.get("step_id") if failed_step else None
+        }, duration_ms=(time.perf_counter() - workflow_started) * 1000)
+        return report_data
+    
+    except Exception as e:
+        emit_event("workflow.error", {
+            "error_type": type(e).__name__,
+            "error_message": str(e)
+        }, duration_ms=(time.perf_counter() - workflow_started) * 1000)
+        logger.error(f"❌ 工作流 {run_id} 执行失败: {e}", exc_info=True)
+        workflow_run_manager.publish(run_id, {
+            "type": "workflow_finished",
+            "status": "error",
+            "error": f"{type(e).__name__}: {str(e)}"
+        })
+        raise
+
+
 @app.post("/api/execute")
 async def execute_workflow(request: dict):
     """执行工作流接口"""
@@ -1943,6 +2184,26 @@ async def execute_workflow(request: dict):
         workflow_data = request.get("workflow_data")
         file_paths = request.get("file_paths", [])
         
+        # 🔥 断点续跑：{"resume_run_id": "run_xxx"} 从该运行的清单继续执行（复用原输出目录）
+        resume_run_id = request.get("resume_run_id")
+        resume_dir = None
+        if resume_run_id:
+            from gibh_agent.core.executor import WorkflowExecutor
+            resume_dir = validate_file_path(RESULTS_DIR / resume_run_id, RESULTS_DIR)
+            manifest = WorkflowExecutor.load_manifest(str(resume_dir))
+            if not manifest:
+                return JSONResponse(
+                    status_code=404,
+                    content={
+                        "status": "error",
+                        "error": f"运行清单不存在: {resume_run_id}",
+                        "message": f"无法续跑：未找到运行 {resume_run_id} 的清单"
+                    }
+                )
+            workflow_data = manifest["workflow_data"]
+            file_paths = manifest.get("file_paths") or []
+            logger.info(f"🔁 续跑工作流: {resume_run_id}")
+        
         logger.info(f"🚀 开始执行工作流: {len(file_paths)} 个文件")
         
         # 🔧 修复：优先检查 workflow_name 中是否包含代谢组关键词
@@ -2026,57 +2287,39 @@ async def execute_workflow(request: dict):
             logger.info("🔧 使用通用执行器执行工作流...")
             
             # 设置输出目录
-            output_dir = str(RESULTS_DIR / f"run_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+            output_dir = str(resume_dir) if resume_dir else str(new_run_dir())
+            run_id = os.path.basename(output_dir)
+            workflow_run_manager.create_run(run_id, output_dir, workflow_data.get("workflow_name", ""))
             
-            # 创建执行器并执行（传递 agent 实例以生成诊断）
-            executor = WorkflowExecutor(output_dir=output_dir)
-            report_data = executor.execute_workflow(
+            job = run_workflow_job(
+                run_id=run_id,
+                output_dir=output_dir,
                 workflow_data=workflow_data,
                 file_paths=file_paths,
-                output_dir=output_dir,
-                agent=target_agent  # 🔥 传递 agent 实例以生成 AI Expert Diagnosis
+                target_agent=target_agent,
+                resume=bool(resume_dir)
             )
             
-            logger.info("✅ 通用执行器执行完成")
-            
-            # 🔥 生成 AI Expert Diagnosis（如果提供了 Agent 实例）
-            if target_agent and hasattr(target_agent, '_generate_analysis_summary'):
-                try:
-                    logger.info("📝 [Server] 生成 AI Expert Diagnosis...")
-                    
-                    # 检测组学类型
-                    omics_type = "Metabolomics"  # 默认
-                    steps = workflow_data.get("steps", [])
-                    if any("rna" in step.get("id", "").lower() or "rna" in step.get("tool_id", "").lower() for step in steps):
-                        omics_type = "scRNA"
-                    elif any("metabolomics" in step.get("id", "").lower() or "metabolomics" in step.get("tool_id", "").lower() for step in steps):
-                        omics_type = "Metabolomics"
-                    
-                    # 调用异步方法生成诊断
-                    steps_results = report_data.get("steps_results", [])
-                    workflow_name = report_data.get("workflow_name", "Analysis Pipeline")
-                    diagnosis = await target_agent._generate_analysis_summary(
-                        steps_results, 
-                        omics_type, 
-                        workflow_name
-                    )
-                    
-                    if diagnosis:
-                        logger.info(f"✅ [Server] AI Expert Diagnosis 生成成功，长度: {len(diagnosis)}")
-                        report_data["diagnosis"] = diagnosis
-                    else:
-                        logger.warning("⚠️ [Server] AI Expert Diagnosis 生成失败或返回空")
-                except Exception as diag_err:
-                    logger.error(f"❌ [Server] 生成 AI Expert Diagnosis 失败: {diag_err}", exc_info=True)
-                    # 不中断工作流，继续执行
+            # 🔥 同步模式（wait=true）：等待执行完成后返回完整报告（执行仍在后台线程中，不阻塞事件循环）
+            if request.get("wait", not WORKFLOW_ASYNC):
+                report_data = await job
+                return JSONResponse(content={
+                    "type": "analysis_report",
+                    "status": "success",
+                    "report_data": report_data,
+                    "reply": "✅ 工作流执行完成（使用动态执行引擎）",
+                    "thought": "[THOUGHT] 使用 ToolRegistry 动态执行，工具无关"
+                })
             
-            # 构建返回结果（符合前端格式）
+            # 🔥 异步模式：立即返回 run_id，前端通过 SSE 或轮询获取进度和最终报告
+            start_background_job(job, name=run_id)
             return JSONResponse(content={
-                "type": "analysis_report",
-                "status": "success",
-                "report_data": report_data,
-                "reply": "✅ 工作流执行完成（使用动态执行引擎）",
-                "thought": "[THOUGHT] 使用 ToolRegistry 动态执行，工具无关"
+                "type": "workflow_started",
+                "status": "running",
+                "run_id": run_id,
+                "reply": "🚀 工作流已提交后台执行，步骤完成后将实时更新进度",
+                "events_url": f"/api/workflow/events/{run_id}",
+                "status_url": f"/api/workflow/status/{run_id}"
             })
         
         except ImportError:
@@ -2269,55 +2512,379 @@ async def execute_workflow(request: dict):
         )
 
 
+async def run_batch_job(
+    batch_id: str,
+    output_dir: str,
+    workflow_data: dict,
+    file_paths: List[str],
+    max_concurrent_runs: Optional[int] = None
+) -> dict:
+    """
+    在后台批量执行工作流（同一计划 × 多个输入文件）
+    
+    批次中的每个文件在批次进度中表现为一个"步骤"，因此可复用 /api/workflow/events 和
+    /api/workflow/status 查看进度。批量模式不为每个文件生成 AI Expert Diagnosis。
+    
+    Args:
+        batch_id: 批次 ID（输出目录名）
+        output_dir: 批次输出目录
+        workflow_data: 工作流配置
+        file_paths: 输入文件路径列表
+        max_concurrent_runs: 同时进行的运行数上限
+    
+    Returns:
+        批次汇总
+    """
+    from gibh_agent.core.executor import WorkflowExecutor
+    
+    def on_event(event: dict):
+        workflow_run_manager.publish(batch_id, event)
+    
+    try:
+        executor = WorkflowExecutor(output_dir=output_dir)
+        summary = await workflow_run_manager.run_in_background(
+            executor.execute_batch,
+            workflow_data=workflow_data,
+            file_paths=file_paths,
+            output_dir=output_dir,
+            max_concurrent_runs=max_concurrent_runs,
+            on_event=on_event,
+            isolate_steps=True
+        )
+        summary["batch_id"] = batch_id
+        logger.info(f"✅ 批次 {batch_id} 执行完成: {summary.get('succeeded')}/{summary.get('total')}")
+        
+        workflow_run_manager.publish(batch_id, {
+            "type": "workflow_finished",
+            # 部分成功视为完成（失败的文件记录在 runs 中）
+            "status": "error" if summary.get("status") == "error" else "success",
+            "error": None if summary.get("status") == "success" else f"{summary.get('failed')} 个文件执行失败",
+            "report_data": summary
+        })
+        return summary
+    
+    except Exception as e:
+        logger.error(f"❌ 批次 {batch_id} 执行失败: {e}", exc_info=True)
+        workflow_run_manager.publish(batch_id, {
+            "type": "workflow_finished",
+            "status": "error",
+            "error": f"{type(e).__name__}: {str(e)}"
+        })
+        raise
+
+
+@app.post("/api/execute/batch")
+async def execute_workflow_batch(request: dict):
+    """
+    批量执行工作流接口：同一个已验证的计划应用到多个输入文件
+    
+    请求体:
+        workflow_data: 工作流配置（计划中的输入文件路径会被替换为每个文件）
+        file_paths: 输入文件（或 10x 目录）路径列表
+        max_concurrent_runs: 同时进行的运行数上限（可选）
+        wait: 是否等待执行完成后返回批次汇总（默认与 WORKFLOW_ASYNC 相反）
+    """
+    workflow_data = request.get("workflow_data")
+    file_paths = request.get("file_paths") or []
+    if not workflow_data or not workflow_data.get("steps"):
+        raise HTTPException(status_code=400, detail="缺少 workflow_data 或工作流没有步骤")
+    if not file_paths:
+        raise HTTPException(status_code=400, detail="file_paths 不能为空")
+    
+    # 🔒 安全：与 /api/execute 一致，相对路径相对于 UPLOAD_DIR，且所有路径必须位于 UPLOAD_DIR 内
+    resolved_paths = []
+    rejected = []
+    for file_path in file_paths:
+        path = Path(file_path)
+        if not path.is_absolute():
+            path = UPLOAD_DIR / path
+        try:
+            resolved_paths.append(str(validate_file_path(path, UPLOAD_DIR)))
+        except HTTPException:
+            rejected.append(file_path)
+    if rejected:
+        raise HTTPException(status_code=403, detail=f"文件路径不安全（不在上传目录内）: {rejected[:5]}")
+    file_paths = resolved_paths
+    
+    missing = [p for p in file_paths if not os.path.exists(p)]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"输入文件不存在: {missing[:5]}")
+    
+    batch_dir = RESULTS_DIR / f"batch_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{secrets.token_hex(3)}"
+    batch_id = batch_dir.name
+    workflow_run_manager.create_run(batch_id, str(batch_dir), workflow_data.get("workflow_name", ""))
+    logger.info(f"📦 提交批次 {batch_id}: {len(file_paths)} 个文件")
+    
+    job = run_batch_job(
+        batch_id=batch_id,
+        output_dir=str(batch_dir),
+        workflow_data=workflow_data,
+        file_paths=file_paths,
+        max_concurrent_runs=request.get("max_concurrent_runs")
+    )
+    
+    if request.get("wait", not WORKFLOW_ASYNC):
+        try:
+            summary = await job
+        except Exception as e:
+            return JSONResponse(
+                status_code=500,
+                content={
+                    "status": "error",
+                    "error": f"{type(e).__name__}: {str(e)}",
+                    "message": f"批量执行失败: {str(e)}"
+                }
+            )
+        return JSONResponse(content={
+            "type": "batch_report",
+            "status": summary.get("status"),
+            "report_data": summary,
+            "reply": f"✅ 批量执行完成：成功 {summary.get('succeeded')}/{summary.get('total')}"
+        })
+    
+    start_background_job(job, name=batch_id)
+    return JSONResponse(content={
+        "type": "workflow_started",
+        "status": "running",
+        "run_id": batch_id,
+        "batch_id": batch_id,
+        "total": len(file_paths),
+        "reply": f"🚀 批量任务已提交后台执行（{len(file_paths)} 个文件）",
+        "events_url": f"/api/workflow/events/{batch_id}",
+        "status_url": f"/api/workflow/status/{batch_id}"
+    })
+
+
+@app.get("/api/results/table")
+async def get_result_table(
+    path: str,
+    offset: int = 0,
+    limit: int = 100,
+    columns: Optional[str] = None,
+    sort_by: Optional[str] = None,
+    order: str = "asc",
+    filter: Optional[List[str]] = Query(None)
+):
+    """
+    查询步骤产生的表格产物（服务端分页、排序、阈值过滤、列投影）
+    
+    报告中的产物引用只包含预览，完整数据通过此接口获取；也可直接查询运行目录中的
+    CSV / Arrow / Parquet 表（如 differential_analysis 的结果、markers.csv、cell_metadata.csv）。
+    
+    Args:
+        path: 表格路径（必须位于 RESULTS_DIR 内，可为相对 RESULTS_DIR 的路径）
+        offset: 起始行（过滤、排序之后）
+        limit: 每页行数（最大 1000）
+        columns: 逗号分隔的列名（可选）
+        sort_by: 排序列（可选）
+        order: asc / desc
+        filter: 过滤条件，可重复，格式 "列:操作符:值"（如 fdr:lt:0.05、log2fc:abs_ge:1）
+    """
+    from gibh_agent.core.results_service import query_table
+    from gibh_agent.core.utils import sanitize_for_json
+    
+    table_path = Path(path)
+    if not table_path.is_absolute():
+        table_path = RESULTS_DIR / table_path
+    table_path = validate_file_path(table_path, RESULTS_DIR)
+    if not table_path.is_file():
+        return JSONResponse(status_code=404, content={"status": "error", "error": f"表格不存在: {path}"})
+    if order not in ("asc", "desc"):
+        return JSONResponse(status_code=400, content={"status": "error", "error": "order 只能为 asc 或 desc"})
+    
+    column_list = [c.strip() for c in columns.split(",") if c.strip()] if columns else None
+    try:
+        result = await asyncio.to_thread(
+            query_table,
+            str(table_path),
+            max(0, offset),
+            max(1, min(limit, 1000)),
+            column_list,
+            sort_by,
+            order == "desc",
+            filter
+        )
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"status": "error", "error": str(e)})
+    except Exception as e:
+        logger.error(f"❌ 查询表格失败: {e}", exc_info=True)
+        return JSONResponse(status_code=500, content={"status": "error", "error": str(e)})
+    
+    return JSONResponse(content=sanitize_for_json({"status": "success", "path": str(table_path), **result}))
+
+
+@app.get("/api/results/{run_id}/tables")
+async def list_result_tables(run_id: str):
+    """列出运行目录中的表格产物（可用 /api/results/table 查询）"""
+    from gibh_agent.core.results_service import list_tables
+    
+    run_dir = validate_file_path(RESULTS_DIR / run_id, RESULTS_DIR)
+    if not run_dir.is_dir():
+        return JSONResponse(status_code=404, content={"status": "error", "error": f"运行不存在: {run_id}"})
+    tables = await asyncio.to_thread(list_tables, str(run_dir))
+    return JSONResponse(content={"status": "success", "run_id": run_id, "tables": tables})
+
+
+@app.get("/api/profiles/tools")
+async def get_tool_profiles(max_runs: int = 500):
+    """
+    按工具汇总最近运行的资源画像（耗时分位数、耗时直方图、峰值内存增量等）
+    
+    数据来自 RESULTS_DIR/run_*/profile.json 和 batch_*/NNN_*/profile.json，用于确定 worker 内存上限和定位慢工具。
+    """
+    from gibh_agent.core.profiling import aggregate_tool_profiles
+    
+    try:
+        summary = await asyncio.to_thread(aggregate_tool_profiles, str(RESULTS_DIR), max_runs)
+        return JSONResponse(content=summary)
+    except Exception as e:
+        logger.error(f"❌ 汇总工具画像失败: {e}", exc_info=True)
+        return JSONResponse(
+            status_code=500,
+            content={"status": "error", "error": str(e)}
+        )
+
+
+@app.get("/api/workflow/events/{run_id}")
+async def stream_workflow_events(run_id: str):
+    """
+    工作流进度事件流（Server-Sent Events）
+    
+    事件类型：workflow_started / step_started / step_finished / workflow_finished。
+    连接建立时先补发该运行的历史事件，收到 workflow_finished 后关闭。
+    运行在其他 worker 中执行时，从运行目录的事件日志读取。
+    """
+    if workflow_run_manager.get_run(run_id) is not None:
+        events = queue_events(
+            lambda: workflow_run_manager.subscribe(run_id),
+            lambda q: workflow_run_manager.unsubscribe(run_id, q),
+            "workflow_finished"
+        )
+    elif workflow_run_manager.load_status(run_id) is not None:
+        events = workflow_run_manager.follow_events(run_id, heartbeat_interval=SSE_HEARTBEAT_SECONDS)
+    else:
+        return JSONResponse(
+            status_code=404,
+            content={"status": "not_found", "message": f"运行不存在: {run_id}"}
+        )
+    
+    return sse_response(events, name=f"工作流事件流 {run_id} ")
+
+
+@app.get("/api/inspections/{batch_id}")
+async def get_inspection_batch(batch_id: str):
+    """查询上传文件的后台检查状态（轮询）"""
+    from gibh_agent.core.utils import sanitize_for_json
+    
+    # 批次可能由其他 worker 检查：本进程没有时读取共享的状态文件
+    status = inspection_queue.get_status(batch_id)
+    if status is None:
+        return JSONResponse(
+            status_code=404,
+            content={"status": "not_found", "message": f"检查批次不存在: {batch_id}"}
+        )
+    return JSONResponse(content=sanitize_for_json(status))
+
+
+@app.get("/api/inspections/{batch_id}/events")
+async def stream_inspection_events(batch_id: str):
+    """
+    上传文件检查结果事件流（Server-Sent Events）
+    
+    事件类型：inspection_finished（每个文件，含元数据）/ batch_finished。
+    连接建立时先补发该批次的历史事件，收到 batch_finished 后关闭。
+    批次在其他 worker 中检查时，轮询共享的状态文件生成事件。
+    """
+    if inspection_queue.get_batch(batch_id) is not None:
+        events = queue_events(
+            lambda: inspection_queue.subscribe(batch_id),
+            lambda q: inspection_queue.unsubscribe(batch_id, q),
+            "batch_finished"
+        )
+    elif inspection_queue.load_status(batch_id) is not None:
+        events = inspection_queue.follow_events(batch_id, heartbeat_interval=SSE_HEARTBEAT_SECONDS)
+    else:
+        return JSONResponse(
+            status_code=404,
+            content={"status": "not_found", "message": f"检查批次不存在: {batch_id}"}
+        )
+    
+    return sse_response(events, name=f"检查事件流 {batch_id} ")
+
+
 @app.get("/api/logs/stream")
-async def stream_logs():
-    """实时日志流接口（Server-Sent Events）"""
+async def stream_logs(
+    level: str = "DEBUG",
+    modules: Optional[str] = None,
+    exclude: Optional[str] = None,
+    history: int = 100
+):
+    """
+    实时日志流接口（Server-Sent Events）
+    
+    Args:
+        level: 最低日志级别
+        modules: 只推送这些 logger 前缀的日志（逗号分隔，如 gibh_agent,server）
+        exclude: 排除这些 logger 前缀（逗号分隔）
+        history: 连接时先发送的历史日志条数
+    """
+    try:
+        history_logs = log_hub.recent(history, level=level, modules=modules, exclude=exclude)
+        subscription = log_hub.subscribe(level=level, modules=modules, exclude=exclude)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     logger.info("📡 新的日志流连接")
     
-    async def event_generator():
-        q = asyncio.Queue(maxsize=100)
-        log_listeners.add(q)
-        
+    async def log_events():
         try:
             # 先发送历史日志
-            history_logs = list(log_buffer)[-100:]  # 最近100条
-            logger.info(f"📤 发送历史日志: {len(history_logs)} 条")
-            for entry in history_logs:
-                yield f"data: {json.dumps(entry, ensure_ascii=False)}\\n\\n"
+            if history_logs:
+                yield sse_lines(history_logs)
             
-            # 实时发送新日志
+            # 实时发送新日志（分发线程批量放入，一次取出全部待发送条目）
             while True:
-                try:
-                    entry = await asyncio.wait_for(q.get(), timeout=1.0)
-                    yield f"data: {json.dumps(entry, ensure_ascii=False)}\\n\\n"
-                except asyncio.TimeoutError:
-                    # 发送心跳保持连接
-                    yield f"data: {json.dumps({'type': 'heartbeat', 'timestamp': datetime.now().isoformat()})}\\n\\n"
-        except asyncio.CancelledError:
-            logger.info("📡 日志流连接已取消")
-        except Exception as e:
-            logger.error(f"❌ 日志流错误: {e}", exc_info=True)
+                entries = await subscription.get(timeout=SSE_HEARTBEAT_SECONDS)
+                dropped = subscription.take_dropped()
+                if dropped:
+                    # 客户端读取太慢时只丢弃它自己的条目，并告知丢弃数量
+                    yield sse_lines([{"type": "dropped", "count": dropped, "timestamp": datetime.now().isoformat()}])
+                if entries:
+                    yield sse_lines(entries)
+                elif not dropped:
+                    # 心跳保持连接
+                    yield None
         finally:
-            log_listeners.discard(q)
+            log_hub.unsubscribe(subscription)
             logger.info("📡 日志流连接已关闭")
     
-    return StreamingResponse(
-        event_generator(),
-        media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no"
-        }
-    )
+    return sse_response(log_events(), name="日志流")
 
 
 @app.get("/api/logs")
-async def get_logs(limit: int = 100):
-    """获取历史日志"""
+async def get_logs(
+    limit: int = 100,
+    level: str = "DEBUG",
+    modules: Optional[str] = None,
+    exclude: Optional[str] = None
+):
+    """获取历史日志（可按级别和 logger 前缀过滤）"""
+    try:
+        logs = log_hub.recent(limit, level=level, modules=modules, exclude=exclude)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return JSONResponse(content={
+        "logs": logs,
+        "total": len(log_hub.buffer),
+        "stats": log_hub.stats()
+    })
+
+
+@app.get("/api/llm/stats")
+async def get_llm_stats():
+    """LLM 调用统计：响应缓存命中率（按调用点）和各 provider 的并发/限流状态"""
     return JSONResponse(content={
-        "logs": list(log_buffer)[-limit:],
-        "total": len(log_buffer)
+        "cache": llm_cache_stats(),
+        "transports": transport_stats()
     })
 
 
@@ -2421,13 +2988,25 @@ async def get_tool_schema(tool_name: str):
 async def get_workflow_status(run_id: str):
     """
     查询工作流状态（兼容旧架构）
-    如果使用 Celery，查询 Celery 任务状态
-    如果使用同步执行，返回 not_found（因为同步执行没有任务ID）
+    后台运行（任意 worker 中）从运行管理器查询；否则查询 Celery 任务状态。
+    排队中的 Celery 任务（PENDING）按 running 返回；既不是后台运行、也没有提交过的 ID 返回 not_found。
     """
+    # 🔥 优先查询后台运行（本进程内存，或其他 worker 写入运行目录的状态）
+    status = workflow_run_manager.get_status(run_id)
+    if status is not None:
+        return JSONResponse(content=status)
+    
+    if run_id.startswith(("run_", "batch_")):
+        # 后台运行的 ID（输出目录名）不会是 Celery 任务
+        return JSONResponse(
+            status_code=404,
+            content={"status": "not_found", "message": f"运行不存在: {run_id}"}
+        )
+    
     try:
         # 尝试从 Celery 查询任务状态
         from celery.result import AsyncResult
-        from gibh_agent.core.celery_app import celery_app
+        from gibh_agent.core.celery_app import celery_app, was_submitted
         
         task_result = AsyncResult(run_id, app=celery_app)
         
@@ -2439,7 +3018,13 @@ async def get_workflow_status(run_id: str):
         }
         
         if task_result.state == 'PENDING':
-            response["status"] = "running"
+            # Celery 对未知 ID 和排队中尚未开始的任务都返回 PENDING：只有确认未提交过才返回 not_found
+            if was_submitted(run_id) is False:
+                return JSONResponse(
+                    status_code=404,
+                    content={"status": "not_found", "message": f"运行不存在: {run_id}"}
+                )
+            response["queued"] = True
         elif task_result.state == 'SUCCESS':
             response["status"] = "success"
             response["completed"] = True
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+内容寻址上传存储测试脚本
+1. 两次上传同一内容 -> 共享一个 blob（硬链接），第二次为去重，内容键相同
+2. gc 删除无引用的 blob 及其派生缓存，保留仍被引用的 blob；之后再次上传同一内容仍成功
+3. 上传路径被原地改写（共享 inode）-> 新上传不复用被改写的 blob，改写过的路径不再有内容键
+4. store 持有共享锁期间 gc 等待（gc 不会在去重检查和链接之间删除 blob）
+
+用法:
+    python test_blob_store.py
+"""
+import os
+import sys
+import time
+import fcntl
+import hashlib
+import tempfile
+import threading
+import traceback
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent))
+
+from gibh_agent.core.blob_store import BlobStore
+
+
+def _upload(store: BlobStore, upload_dir: Path, name: str, content: bytes) -> bool:
+    """模拟上传：写临时文件后存入 blob 存储"""
+    tmp_path = upload_dir / f".{name}.part"
+    tmp_path.write_bytes(content)
+    return store.store(tmp_path, upload_dir / name, hashlib.sha256(content).hexdigest())
+
+
+def test_dedup():
+    """同一内容上传两次只保存一份"""
+    with tempfile.TemporaryDirectory() as tmp:
+        upload_dir = Path(tmp)
+        store = BlobStore(str(upload_dir / ".blobs"))
+        content = b"gene,count\nA,1\n"
+        digest = hashlib.sha256(content).hexdigest()
+
+        assert _upload(store, upload_dir, "a.csv", content) is False
+        assert _upload(store, upload_dir, "b.csv", content) is True
+        assert os.path.samefile(upload_dir / "a.csv", upload_dir / "b.csv")
+        assert store.refcount(digest) == 2
+        assert store.content_key(str(upload_dir / "a.csv")) == store.content_key(str(upload_dir / "b.csv")) == f"sha256:{digest}"
+        assert store.stats()["blobs"] == 1
+        assert not list(upload_dir.glob(".*.part"))
+    print("✅ 内容去重")
+
+
+def test_gc():
+    """gc 只删除无引用的 blob 和对应的派生缓存"""
+    with tempfile.TemporaryDirectory() as tmp:
+        upload_dir = Path(tmp)
+        store = BlobStore(str(upload_dir / ".blobs"))
+        kept, dropped = b"kept\n", b"dropped\n"
+        _upload(store, upload_dir, "kept.csv", kept)
+        _upload(store, upload_dir, "dropped.csv", dropped)
+
+        key = store.content_key(str(upload_dir / "dropped.csv"))
+        derived = upload_dir / "derived.h5ad"
+        derived.write_bytes(b"h5ad")
+        store.put_derived(key, "matrix.h5ad", str(derived), str(upload_dir / "dropped.csv"))
+        assert store.get_derived(key, "matrix.h5ad") is not None
+
+        (upload_dir / "dropped.csv").unlink()
+        stats = store.gc()
+        assert stats["blobs_removed"] == 1 and stats["links_removed"] == 1 and stats["derived_removed"] == 1, stats
+        assert store.get_derived(key, "matrix.h5ad") is None
+        assert store.blob_path(hashlib.sha256(kept).hexdigest()).exists()
+        assert not store.blob_path(hashlib.sha256(dropped).hexdigest()).exists()
+
+        # blob 被清理后再次上传同一内容：重新存入
+        assert _upload(store, upload_dir, "again.csv", dropped) is False
+        assert (upload_dir / "again.csv").read_bytes() == dropped
+        assert store.content_key(str(upload_dir / "again.csv")) == key
+    print("✅ gc 清理")
+
+
+def test_modified_blob_not_reused():
+    """上传路径被原地改写后，新上传不链接到被改写的内容"""
+    with tempfile.TemporaryDirectory() as tmp:
+        upload_dir = Path(tmp)
+        store = BlobStore(str(upload_dir / ".blobs"))
+        content = b"x,y\n1,2\n"
+        _upload(store, upload_dir, "first.csv", content)
+
+        time.sleep(0.01)
+        # 只读权限挡不住 root，模拟工具改写输入文件（与 blob 共享 inode）
+        os.chmod(upload_dir / "first.csv", 0o644)
+        (upload_dir / "first.csv").write_bytes(b"x,y\n9,9\n")
+
+        assert _upload(store, upload_dir, "second.csv", content) is False
+        assert (upload_dir / "second.csv").read_bytes() == content
+        assert store.content_key(str(upload_dir / "first.csv")) is None
+        assert store.content_key(str(upload_dir / "second.csv")) == f"sha256:{hashlib.sha256(content).hexdigest()}"
+        # 替换后的 blob 之后正常去重
+        assert _upload(store, upload_dir, "third.csv", content) is True
+    print("✅ 被改写的 blob 不再复用")
+
+
+def test_gc_waits_for_store():
+    """store 的共享锁存在时 gc 阻塞，释放后执行"""
+    with tempfile.TemporaryDirectory() as tmp:
+        upload_dir = Path(tmp)
+        store = BlobStore(str(upload_dir / ".blobs"))
+        finished = threading.Event()
+
+        def run_gc():
+            store.gc()
+            finished.set()
+
+        with store._locked(fcntl.LOCK_SH):
+            worker = threading.Thread(target=run_gc)
+            worker.start()
+            assert not finished.wait(0.3), "store 持有锁时 gc 应等待"
+        assert finished.wait(5)
+        worker.join()
+    print("✅ gc 与上传互斥")
+
+
+def main() -> int:
+    tests = [test_dedup, test_gc, test_modified_blob_not_reused, test_gc_waits_for_store]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+        except Exception:
+            failed += 1
+            print(f"❌ {test.__name__}")
+            traceback.print_exc()
+    print(f"\n📊 通过: {len(tests) - failed}/{len(tests)}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
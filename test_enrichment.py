@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+本地通路富集测试脚本
+1. 没有显著代谢物时按 |t| 取 top_n：显著下调的代谢物进入 ORA 目标集合
+2. GMT / JSON 通路库解析为相同的倒排索引（大小写和首尾空白归一化，空通路跳过）
+3. 向量化 ORA 的 P 值与逐通路 scipy.stats.hypergeom.sf 一致，FDR 与 multipletests 一致
+4. 秩检验的 z 值与逐通路的秩和正态近似一致
+
+用法:
+    python test_enrichment.py
+"""
+import sys
+import json
+import tempfile
+import traceback
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent))
+
+import numpy as np
+from scipy import stats
+from statsmodels.stats.multitest import multipletests
+
+from gibh_agent.core.enrichment import load_pathway_library, run_ora, run_rank_test
+from gibh_agent.tools.metabolomics.advanced import _select_enrichment_query
+from gibh_agent.tools.metabolomics.statistics import _two_group_tests
+
+
+def test_top_n_includes_down_regulated():
+    """差异最大的代谢物均为下调时，top_n 目标集合仍选中它们"""
+    rng = np.random.default_rng(0)
+    columns = [f"M{i}" for i in range(10)]
+    control = rng.normal(10.0, 1.0, size=(8, 10))
+    case = rng.normal(10.0, 1.0, size=(8, 10))
+    case[:, :3] -= 6.0           # M0-M2 强烈下调
+    case[:, 3:6] += 0.3          # M3-M5 轻微上调
+    case[0, 9] = np.nan
+
+    tests = _two_group_tests(case, control)
+    assert np.all(tests["statistic"][:3] < -5)
+
+    # 阈值极小，没有代谢物达到显著，退回到 top_n
+    query, source = _select_enrichment_query(columns, tests["statistic"], tests["p_value"], 1e-300, top_n=3)
+    assert source == "top_3"
+    assert sorted(query) == ["M0", "M1", "M2"], query
+
+    # NaN 统计量排在最后
+    statistic = tests["statistic"].copy()
+    statistic[:] = np.nan
+    statistic[4] = -1.0
+    query, _ = _select_enrichment_query(columns, statistic, tests["p_value"], 1e-300, top_n=1)
+    assert query == ["M4"]
+
+    query, source = _select_enrichment_query(columns, tests["statistic"], tests["p_value"], 0.05, top_n=3)
+    assert source == "p_value" and {"M0", "M1", "M2"} <= set(query)
+    print("✅ top_n 按 |t| 选择目标代谢物")
+
+
+_PATHWAYS = {
+    "P1": ["Glucose", "Lactate", "Pyruvate", "Citrate"],
+    "P2": ["citrate", " Succinate ", "Fumarate", "Malate", "Alanine"],
+    "P3": ["Alanine", "Glycine", "Serine"],
+    "P4": ["Tryptophan", "Kynurenine", "NotMeasured"],
+    "EMPTY": [],
+}
+
+_MEASURED = ["Glucose", "Lactate", "Pyruvate", "Citrate", "Succinate", "Fumarate", "Malate",
+             "Alanine", "Glycine", "Serine", "Tryptophan", "Kynurenine", "Unannotated"]
+
+
+def _write_libraries(tmp: Path) -> tuple:
+    gmt = tmp / "tiny.gmt"
+    gmt.write_text("".join(f"{name}\tdesc\t" + "\t".join(members) + "\n" for name, members in _PATHWAYS.items()))
+    js = tmp / "tiny.json"
+    js.write_text(json.dumps({name: {"name": name, "members": members} for name, members in _PATHWAYS.items()}))
+    return gmt, js
+
+
+def test_library_parsing():
+    """GMT 与 JSON 解析为相同的倒排索引"""
+    with tempfile.TemporaryDirectory() as tmp:
+        gmt, js = _write_libraries(Path(tmp))
+        libraries = [load_pathway_library(str(gmt)), load_pathway_library(str(js))]
+        for library in libraries:
+            # 空通路（EMPTY；GMT 中没有成员列）被跳过
+            assert library.pathway_ids == ["P1", "P2", "P3", "P4"], library.pathway_ids
+            assert library.index["citrate"].tolist() == [0, 1]
+            assert library.index["succinate"].tolist() == [1]
+            assert library.index["alanine"].tolist() == [1, 2]
+            assert "unannotated" not in library.index
+            counts = library.pathway_counts(["citrate", "alanine", "glycine"])
+            assert counts.tolist() == [1, 2, 2, 0]
+            assert library.pathway_members(1, ["citrate", "alanine", "glycine"]) == ["Citrate", "Alanine"]
+        assert {f: n.tolist() for f, n in libraries[0].index.items()} == {f: n.tolist() for f, n in libraries[1].index.items()}
+    print("✅ 通路库解析与倒排索引")
+
+
+def test_ora_matches_scipy():
+    """ORA 的 P 值和 FDR 与逐通路计算一致"""
+    with tempfile.TemporaryDirectory() as tmp:
+        gmt, _ = _write_libraries(Path(tmp))
+        library = load_pathway_library(str(gmt))
+        query = ["lactate", "Pyruvate", "Citrate", "Malate", "Glycine", "Unannotated"]
+        results = run_ora(library, query, _MEASURED, min_size=2)
+
+        # 背景：被注释的已检测代谢物（12 个）；目标：其中的 5 个
+        universe = {m.lower() for m in _MEASURED} - {"unannotated"}
+        hits = {q.strip().lower() for q in query} & universe
+        expected = {}
+        for name, members in _PATHWAYS.items():
+            members = {m.strip().lower() for m in members} & universe
+            k = len(members & hits)
+            if len(members) >= 2 and k > 0:
+                expected[name] = (k, len(members), stats.hypergeom.sf(k - 1, len(universe), len(members), len(hits)))
+        assert {r["pathway_id"] for r in results} == set(expected)
+
+        names = list(expected)
+        fdr = dict(zip(names, multipletests([expected[n][2] for n in names], method="fdr_bh")[1]))
+        for record in results:
+            k, size, p_value = expected[record["pathway_id"]]
+            assert (record["overlap"], record["pathway_size"]) == (k, size)
+            assert np.isclose(record["p_value"], p_value, rtol=1e-12)
+            assert np.isclose(record["fdr"], fdr[record["pathway_id"]], rtol=1e-12)
+        assert [r["p_value"] for r in results] == sorted(r["p_value"] for r in results)
+        assert run_ora(library, ["Unannotated"], _MEASURED) == []
+    print("✅ ORA 与 scipy.stats.hypergeom.sf 一致")
+
+
+def test_rank_test_matches_loop():
+    """秩检验的 z 值与逐通路的秩和正态近似一致"""
+    with tempfile.TemporaryDirectory() as tmp:
+        gmt, _ = _write_libraries(Path(tmp))
+        library = load_pathway_library(str(gmt))
+        scores = np.linspace(-3, 3, len(_MEASURED))
+        scores[5] = np.nan
+        results = {r["pathway_id"]: r for r in run_rank_test(library, _MEASURED, scores, min_size=2)}
+
+        scored = {m.lower(): s for m, s in zip(_MEASURED, scores) if m.lower() in library.index and np.isfinite(s)}
+        ranks = dict(zip(scored, stats.rankdata(list(scored.values()))))
+        n = len(ranks)
+        for name, members in _PATHWAYS.items():
+            members = {m.strip().lower() for m in members} & set(ranks)
+            if len(members) < 2:
+                assert name not in results
+                continue
+            size = len(members)
+            z = (sum(ranks[m] for m in members) - size * (n + 1) / 2) / np.sqrt(size * (n - size) * (n + 1) / 12)
+            assert np.isclose(results[name]["z_score"], z)
+            assert results[name]["direction"] == ("up" if z > 0 else "down")
+    print("✅ 秩检验与逐通路计算一致")
+
+
+def main() -> int:
+    tests = [test_top_n_includes_down_regulated, test_library_parsing, test_ora_matches_scipy, test_rank_test_matches_loop]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+        except Exception:
+            failed += 1
+            print(f"❌ {test.__name__}")
+            traceback.print_exc()
+    print(f"\n📊 通过: {len(tests) - failed}/{len(tests)}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+LLM 传输层并发上限测试脚本
+1. 多个线程各自运行事件循环（如 Celery 任务）时，同时持有名额的请求数不超过 max_concurrency
+2. 同步请求与异步请求共享同一个上限
+3. 排队中被取消的请求不占用名额；所有请求结束后名额全部归还
+
+用法:
+    python test_llm_transport.py
+"""
+import sys
+import time
+import asyncio
+import threading
+import traceback
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent))
+
+from gibh_agent.core.llm_transport import ProviderTransport
+
+
+class _Peak:
+    """记录同时进行的请求数峰值"""
+
+    def __init__(self):
+        self.current = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def enter(self):
+        with self._lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+
+    def exit(self):
+        with self._lock:
+            self.current -= 1
+
+
+async def _async_request(transport: ProviderTransport, peak: _Peak, seconds: float = 0.05):
+    async with transport.slot():
+        peak.enter()
+        await asyncio.sleep(seconds)
+        peak.exit()
+
+
+def _sync_request(transport: ProviderTransport, peak: _Peak, seconds: float = 0.05):
+    with transport.sync_slot():
+        peak.enter()
+        time.sleep(seconds)
+        peak.exit()
+
+
+def _run_loop(transport: ProviderTransport, peak: _Peak, n_requests: int):
+    async def main():
+        await asyncio.gather(*[_async_request(transport, peak) for _ in range(n_requests)])
+    asyncio.run(main())
+
+
+def test_cap_across_event_loops():
+    """4 个事件循环各发 5 个请求，峰值不超过上限"""
+    transport = ProviderTransport("http://example.invalid", max_concurrency=3, rate_limit_rps=0)
+    peak = _Peak()
+    threads = [threading.Thread(target=_run_loop, args=(transport, peak, 5)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak.peak == 3, peak.peak
+    assert transport.requests == 20 and transport.in_flight == 0
+    assert transport._active == 0 and not transport._waiters
+    print("✅ 跨事件循环的并发上限")
+
+
+def test_cap_shared_by_sync_and_async():
+    """同步与异步请求共享上限"""
+    transport = ProviderTransport("http://example.invalid", max_concurrency=2, rate_limit_rps=0)
+    peak = _Peak()
+    threads = [threading.Thread(target=_sync_request, args=(transport, peak)) for _ in range(4)]
+    threads.append(threading.Thread(target=_run_loop, args=(transport, peak, 4)))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak.peak == 2, peak.peak
+    assert transport._active == 0 and not transport._waiters
+    print("✅ 同步与异步共享上限")
+
+
+def test_cancelled_waiter_releases():
+    """排队中被取消的请求退出队列，不占用名额"""
+    transport = ProviderTransport("http://example.invalid", max_concurrency=1, rate_limit_rps=0)
+    peak = _Peak()
+
+    async def main():
+        holder = asyncio.create_task(_async_request(transport, peak, 0.1))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.create_task(_async_request(transport, peak))
+        await asyncio.sleep(0.01)
+        assert transport.waiting == 1
+        waiter.cancel()
+        await asyncio.gather(holder, waiter, return_exceptions=True)
+        # 名额已全部归还，新请求立即获得名额
+        await asyncio.wait_for(_async_request(transport, peak, 0), timeout=1)
+
+    asyncio.run(main())
+    assert transport._active == 0 and not transport._waiters
+    assert transport.requests == 2
+    print("✅ 取消的请求不占用名额")
+
+
+def main() -> int:
+    tests = [test_cap_across_event_loops, test_cap_shared_by_sync_and_async, test_cancelled_waiter_releases]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+        except Exception:
+            failed += 1
+            print(f"❌ {test.__name__}")
+            traceback.print_exc()
+    print(f"\n📊 通过: {len(tests) - failed}/{len(tests)}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+多组差异分析测试脚本（3 组合成数据，含缺失值和结）
+1. ANOVA：总体检验 P 值与逐列 scipy.stats.f_oneway 一致，两两 t 检验与 ttest_ind 一致
+2. Kruskal-Wallis：总体检验 P 值与逐列 scipy.stats.kruskal 一致（含结校正），两两秩和检验与 ranksums 一致
+3. 每个对比单独做 BH-FDR 校正，与 statsmodels multipletests 一致；指定参照组时只生成对参照组的对比
+
+用法:
+    python test_multigroup_analysis.py
+"""
+import sys
+import tempfile
+import traceback
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent))
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+from statsmodels.stats.multitest import multipletests
+
+from gibh_agent.tools.metabolomics.statistics import run_multigroup_differential_analysis
+
+GROUPS = ["A", "B", "C"]
+
+
+def _dataset() -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    n_per_group, n_features = 6, 10
+    labels = np.repeat(GROUPS, n_per_group)
+    values = rng.normal(10.0, 1.0, size=(len(labels), n_features))
+    values[labels == "B", :3] += 1.5
+    values[labels == "C", :3] += 3.0
+    values[:, 4] = np.round(values[:, 4])  # 大量结
+    values[[0, 7, 15], 5] = np.nan          # 缺失值
+    df = pd.DataFrame(values, columns=[f"M{i}" for i in range(n_features)])
+    df.insert(0, "Group", labels)
+    df.insert(0, "Sample", [f"S{i}" for i in range(len(df))])
+    return df
+
+
+def _columns(df: pd.DataFrame, metabolite: str) -> list:
+    return [df.loc[df["Group"] == g, metabolite].dropna().to_numpy() for g in GROUPS]
+
+
+def _run(df: pd.DataFrame, tmp: Path, **kwargs) -> tuple:
+    path = tmp / "data.csv"
+    df.to_csv(path, index=False)
+    result = run_multigroup_differential_analysis(str(path), "Group", output_dir=str(tmp / "out"), **kwargs)
+    assert result["status"] == "success", result.get("error")
+    return result, pd.read_csv(result["omnibus_path"]), pd.read_csv(result["output_path"])
+
+
+def _check_contrasts(df: pd.DataFrame, long_table: pd.DataFrame, pairwise) -> None:
+    for contrast, table in long_table.groupby("contrast"):
+        case, control = contrast.split("_vs_")
+        expected_p = []
+        for metabolite in table["metabolite"]:
+            x = df.loc[df["Group"] == case, metabolite].dropna()
+            y = df.loc[df["Group"] == control, metabolite].dropna()
+            expected_p.append(pairwise(x, y).pvalue)
+        assert np.allclose(table["p_value"], expected_p, rtol=1e-9), contrast
+        expected_fdr = multipletests(table["p_value"].to_numpy(), method="fdr_bh")[1]
+        assert np.allclose(table["fdr"], expected_fdr, rtol=1e-12), contrast
+
+
+def test_anova():
+    """ANOVA 与两两 t 检验"""
+    df = _dataset()
+    with tempfile.TemporaryDirectory() as tmp:
+        result, omnibus, long_table = _run(df, Path(tmp), method="anova")
+    assert result["summary"]["omnibus_test"] == "anova"
+    for _, row in omnibus.iterrows():
+        expected = stats.f_oneway(*_columns(df, row["metabolite"]))
+        assert np.isclose(row["statistic"], expected.statistic, rtol=1e-9), row["metabolite"]
+        assert np.isclose(row["p_value"], expected.pvalue, rtol=1e-9), row["metabolite"]
+    assert np.allclose(omnibus["fdr"], multipletests(omnibus["p_value"].to_numpy(), method="fdr_bh")[1])
+    assert sorted(long_table["contrast"].unique()) == ["A_vs_B", "A_vs_C", "B_vs_C"]
+    _check_contrasts(df, long_table, stats.ttest_ind)
+    print("✅ ANOVA 与两两 t 检验")
+
+
+def test_kruskal():
+    """Kruskal-Wallis（含结校正）与两两秩和检验"""
+    df = _dataset()
+    with tempfile.TemporaryDirectory() as tmp:
+        result, omnibus, long_table = _run(df, Path(tmp), method="kruskal")
+    assert result["summary"]["omnibus_test"] == "kruskal"
+    for _, row in omnibus.iterrows():
+        expected = stats.kruskal(*_columns(df, row["metabolite"]))
+        assert np.isclose(row["statistic"], expected.statistic, rtol=1e-9), row["metabolite"]
+        assert np.isclose(row["p_value"], expected.pvalue, rtol=1e-9), row["metabolite"]
+    _check_contrasts(df, long_table, stats.ranksums)
+    print("✅ Kruskal-Wallis 与两两秩和检验")
+
+
+def test_reference_group():
+    """指定参照组时只生成对参照组的对比"""
+    df = _dataset()
+    with tempfile.TemporaryDirectory() as tmp:
+        result, _, long_table = _run(df, Path(tmp), reference_group="A")
+    assert [c["contrast"] for c in result["contrasts"]] == ["B_vs_A", "C_vs_A"]
+    _check_contrasts(df, long_table, stats.ttest_ind)
+    print("✅ 参照组对比")
+
+
+def main() -> int:
+    tests = [test_anova, test_kruskal, test_reference_group]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+        except Exception:
+            failed += 1
+            print(f"❌ {test.__name__}")
+            traceback.print_exc()
+    print(f"\n📊 通过: {len(tests) - failed}/{len(tests)}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+PLS-DA VIP 分数测试脚本
+1. 向量化 VIP（_vip_scores）与逐特征、逐成分的双重循环公式一致（两组与三组 PLS2，固定随机种子）
+2. VIP 的平方和等于特征数（VIP 的定义性质）
+3. run_plsda 返回的 VIP 与循环公式一致（默认不做置换检验）
+
+循环公式为旧实现的双重循环：VIP_j = sqrt(p * Σ_a w_ja^2 * SS_a / Σ_a SS_a)，
+其中 w_a 按列归一化，SS_a = ||t_a||^2 * ||q_a||^2。旧实现用 Q[i]（按行）取第 i 个成分的
+Y 载荷，只对单列 Y 且样本数等于成分数时可运行，这里按列 Q[:, a] 取值。
+
+用法:
+    python test_plsda.py
+"""
+import sys
+import tempfile
+import traceback
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent))
+
+import numpy as np
+import pandas as pd
+
+from gibh_agent.tools.metabolomics.advanced import (
+    _encode_plsda_response,
+    _make_plsda_model,
+    _vip_scores,
+    run_plsda,
+)
+
+
+def _vip_loop(T: np.ndarray, W: np.ndarray, Q: np.ndarray) -> np.ndarray:
+    """逐特征、逐成分的 VIP（参考实现）"""
+    n_features, n_components = W.shape
+    explained_variance = []
+    for a in range(n_components):
+        explained_variance.append(np.sum(T[:, a] ** 2) * np.sum(Q[:, a] ** 2))
+    total_ssy = sum(explained_variance)
+
+    vip_scores = []
+    for j in range(n_features):
+        vip = 0.0
+        for a in range(n_components):
+            if total_ssy > 0:
+                w_norm = np.sqrt(np.sum(W[:, a] ** 2))
+                vip += (W[j, a] / w_norm) ** 2 * (explained_variance[a] / total_ssy)
+        vip_scores.append(np.sqrt(n_features * vip))
+    return np.array(vip_scores)
+
+
+def _dataset(n_classes: int, seed: int = 0) -> tuple:
+    rng = np.random.default_rng(seed)
+    n_per_class, n_features = 8, 15
+    y = np.repeat(np.arange(n_classes), n_per_class)
+    X = rng.normal(size=(len(y), n_features))
+    X[:, :3] += y[:, None] * 1.5
+    return X, y
+
+
+def test_vip_matches_loop():
+    """两组（单列 Y）和三组（one-hot PLS2）下向量化 VIP 与循环公式一致"""
+    for n_classes, n_components in [(2, 2), (2, 3), (3, 2)]:
+        X, y = _dataset(n_classes)
+        Y = _encode_plsda_response(y, n_classes)
+        pls = _make_plsda_model(n_components, scale=True).fit(X, Y)[-1]
+
+        explained_variance = np.sum(pls.x_scores_ ** 2, axis=0) * np.sum(pls.y_loadings_ ** 2, axis=0)
+        vectorized = _vip_scores(pls.x_weights_, explained_variance)
+        expected = _vip_loop(pls.x_scores_, pls.x_weights_, pls.y_loadings_)
+        assert np.allclose(vectorized, expected, rtol=1e-10, atol=1e-12), (n_classes, n_components)
+        assert np.isclose(np.sum(vectorized ** 2), X.shape[1])
+    print("✅ 向量化 VIP 与循环公式一致")
+
+
+def test_run_plsda_vip():
+    """run_plsda 返回的 VIP 与循环公式一致"""
+    X, y = _dataset(2, seed=1)
+    columns = [f"M{i}" for i in range(X.shape[1])]
+    df = pd.DataFrame(X, columns=columns)
+    df.insert(0, "Group", np.where(y == 0, "Case", "Control"))
+    df.insert(0, "Sample", [f"S{i}" for i in range(len(df))])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "data.csv"
+        df.to_csv(path, index=False)
+        result = run_plsda(str(path), "Group", n_components=2)
+    assert result["status"] == "success", result.get("error")
+    assert result["permutation_test"] is None
+
+    Y = _encode_plsda_response(y, 2)
+    pls = _make_plsda_model(2, scale=True).fit(X, Y)[-1]
+    expected = dict(zip(columns, _vip_loop(pls.x_scores_, pls.x_weights_, pls.y_loadings_)))
+    for record in result["vip_scores"]:
+        assert np.isclose(record["vip_score"], expected[record["metabolite"]], rtol=1e-10)
+    print("✅ run_plsda 的 VIP")
+
+
+def main() -> int:
+    tests = [test_vip_matches_loop, test_run_plsda_vip]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+        except Exception:
+            failed += 1
+            print(f"❌ {test.__name__}")
+            traceback.print_exc()
+    print(f"\n📊 通过: {len(tests) - failed}/{len(tests)}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+结果表查询服务测试脚本
+1. CSV 首次查询时转换为同名 .arrow，之后直接复用；CSV 更新后重新转换
+2. 同一文件的并发查询只转换一次，不留下临时文件
+3. TSV 转换；分页、排序、过滤
+
+用法:
+    python test_results_service.py
+"""
+import os
+import sys
+import time
+import logging
+import tempfile
+import traceback
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent))
+
+import numpy as np
+import pandas as pd
+
+from gibh_agent.core import results_service
+from gibh_agent.core.results_service import columnar_path, list_tables, query_table
+
+
+class _ConversionCounter(logging.Handler):
+    """统计转换日志的条数"""
+
+    def __init__(self):
+        super().__init__()
+        self.count = 0
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if "转换为列式文件" in record.getMessage():
+            self.count += 1
+
+
+def _results_table(n: int = 1000) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        "metabolite": [f"m{i}" for i in range(n)],
+        "log2fc": rng.normal(size=n),
+        "fdr": rng.uniform(size=n)
+    })
+
+
+def _count_conversions():
+    counter = _ConversionCounter()
+    results_service.logger.addHandler(counter)
+    results_service.logger.setLevel(logging.INFO)
+    return counter
+
+
+def test_csv_conversion_reused():
+    """CSV 转换一次后复用；源文件更新后重新转换"""
+    counter = _count_conversions()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            csv_path = Path(tmp) / "differential.csv"
+            _results_table().to_csv(csv_path, index=False)
+
+            arrow_path = columnar_path(str(csv_path))
+            assert arrow_path == str(csv_path.with_suffix(".arrow"))
+            inode = os.stat(arrow_path).st_ino
+            assert columnar_path(str(csv_path)) == arrow_path
+            assert os.stat(arrow_path).st_ino == inode
+            assert counter.count == 1
+
+            time.sleep(0.01)
+            _results_table(10).to_csv(csv_path, index=False)
+            os.utime(csv_path, ns=(time.time_ns() + 10 ** 9,) * 2)
+            columnar_path(str(csv_path))
+            assert counter.count == 2
+            assert query_table(str(csv_path))["total_rows"] == 10
+            # 转换出的 .arrow 不重复列出
+            assert [t["name"] for t in list_tables(tmp)] == ["differential.csv"]
+    finally:
+        results_service.logger.removeHandler(counter)
+    print("✅ CSV 转换与复用")
+
+
+def test_concurrent_conversion():
+    """并发查询同一个 CSV 只转换一次，不留下临时文件"""
+    counter = _count_conversions()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            csv_path = Path(tmp) / "markers.csv"
+            _results_table(20000).to_csv(csv_path, index=False)
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                paths = set(pool.map(lambda _: columnar_path(str(csv_path)), range(8)))
+            assert paths == {str(csv_path.with_suffix(".arrow"))}
+            assert counter.count == 1
+            assert sorted(p.name for p in Path(tmp).iterdir()) == ["markers.arrow", "markers.csv"]
+    finally:
+        results_service.logger.removeHandler(counter)
+    print("✅ 并发转换只执行一次")
+
+
+def test_tsv_and_query():
+    """TSV 转换后分页、排序、过滤"""
+    with tempfile.TemporaryDirectory() as tmp:
+        tsv_path = Path(tmp) / "table.tsv"
+        df = _results_table()
+        df.to_csv(tsv_path, sep="\t", index=False)
+
+        page = query_table(str(tsv_path), offset=0, limit=5, sort_by="fdr", filters=["log2fc:abs_ge:1"])
+        expected = df[df["log2fc"].abs() >= 1].sort_values("fdr", kind="mergesort")
+        assert page["matched_rows"] == len(expected)
+        assert [row["metabolite"] for row in page["rows"]] == list(expected["metabolite"][:5])
+        assert Path(columnar_path(str(tsv_path))).suffix == ".arrow"
+    print("✅ TSV 转换与查询")
+
+
+def main() -> int:
+    tests = [test_csv_conversion_reused, test_concurrent_conversion, test_tsv_and_query]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+        except Exception:
+            failed += 1
+            print(f"❌ {test.__name__}")
+            traceback.print_exc()
+    print(f"\n📊 通过: {len(tests) - failed}/{len(tests)}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+可续传上传测试脚本
+1. 偏移量不一致 -> UploadConflictError，携带已写入的偏移量；从该偏移量续传后完成
+2. 同一会话正被另一个请求写入 -> UploadConflictError
+3. 超出登记的总大小 -> 丢弃本次写入的数据；SHA-256 不一致时 finalize 失败
+4. stream_to_file 超过大小上限时中止，不留下临时文件和目标文件
+
+用法:
+    python test_resumable_upload.py
+"""
+import io
+import sys
+import fcntl
+import asyncio
+import hashlib
+import tempfile
+import traceback
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent))
+
+from gibh_agent.core.uploads import (
+    ResumableUploadStore,
+    UploadConflictError,
+    UploadTooLargeError,
+    stream_to_file,
+)
+
+
+async def _chunks(data: bytes, size: int = 4):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+def _append(store: ResumableUploadStore, upload_id: str, offset: int, data: bytes) -> dict:
+    return asyncio.run(store.append(upload_id, offset, _chunks(data)))
+
+
+def test_offset_conflict_and_resume():
+    """偏移量不一致时返回当前偏移量，从该处续传后完成并校验 SHA-256"""
+    with tempfile.TemporaryDirectory() as tmp:
+        upload_dir = Path(tmp)
+        store = ResumableUploadStore(str(upload_dir))
+        content = b"0123456789abcdefghij"
+        session = store.create(upload_dir / "big.csv", len(content), sha256=hashlib.sha256(content).hexdigest())
+        upload_id = session["upload_id"]
+        assert session["offset"] == 0 and not session["completed"]
+
+        assert _append(store, upload_id, 0, content[:8])["offset"] == 8
+        # 客户端重发了已写入的数据（例如没收到上次的响应）
+        try:
+            _append(store, upload_id, 4, content[4:12])
+            raise AssertionError("偏移量不一致时应抛出 UploadConflictError")
+        except UploadConflictError as e:
+            assert e.offset == 8
+        assert store.status(upload_id)["offset"] == 8
+
+        try:
+            store.finalize(upload_id)
+            raise AssertionError("未写满时 finalize 应失败")
+        except ValueError:
+            pass
+
+        assert _append(store, upload_id, 8, content[8:])["completed"]
+        result = store.finalize(upload_id)
+        assert result["sha256"] == hashlib.sha256(content).hexdigest()
+        assert (upload_dir / "big.csv").read_bytes() == content
+        assert store.status(upload_id) is None
+    print("✅ 偏移量冲突与续传")
+
+
+def test_concurrent_append_conflict():
+    """另一个请求持有写锁时追加失败"""
+    with tempfile.TemporaryDirectory() as tmp:
+        store = ResumableUploadStore(tmp)
+        upload_id = store.create(Path(tmp) / "x.bin", 16)["upload_id"]
+        with open(store._part_path(upload_id), "ab") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                _append(store, upload_id, 0, b"abcd")
+                raise AssertionError("会话被占用时应抛出 UploadConflictError")
+            except UploadConflictError as e:
+                assert e.offset == 0
+        assert _append(store, upload_id, 0, b"abcd")["offset"] == 4
+    print("✅ 并发写入冲突")
+
+
+def test_size_limits_and_checksum():
+    """超出总大小时回滚本次写入；SHA-256 不一致时 finalize 失败"""
+    with tempfile.TemporaryDirectory() as tmp:
+        store = ResumableUploadStore(tmp)
+        upload_id = store.create(Path(tmp) / "y.bin", 8, sha256="0" * 64)["upload_id"]
+        _append(store, upload_id, 0, b"abcd")
+        try:
+            _append(store, upload_id, 4, b"efghijkl")
+            raise AssertionError("超出总大小时应抛出 UploadTooLargeError")
+        except UploadTooLargeError:
+            pass
+        assert store.status(upload_id)["offset"] == 4
+
+        _append(store, upload_id, 4, b"efgh")
+        try:
+            store.finalize(upload_id)
+            raise AssertionError("SHA-256 不一致时 finalize 应失败")
+        except ValueError:
+            pass
+        assert not (Path(tmp) / "y.bin").exists()
+    print("✅ 大小上限与 SHA-256 校验")
+
+
+def test_stream_to_file_limit():
+    """stream_to_file 超过上限时中止并清理临时文件"""
+    with tempfile.TemporaryDirectory() as tmp:
+        dest = Path(tmp) / "upload.csv"
+        result = stream_to_file(io.BytesIO(b"a" * 10), dest, max_size=10, chunk_size=3)
+        assert result["size"] == 10 and result["sha256"] == hashlib.sha256(b"a" * 10).hexdigest()
+
+        too_large = Path(tmp) / "too_large.csv"
+        try:
+            stream_to_file(io.BytesIO(b"a" * 11), too_large, max_size=10, chunk_size=3)
+            raise AssertionError("超过上限时应抛出 UploadTooLargeError")
+        except UploadTooLargeError:
+            pass
+        assert not too_large.exists()
+        assert sorted(p.name for p in Path(tmp).iterdir()) == ["upload.csv"]
+    print("✅ 分块上传大小上限")
+
+
+def main() -> int:
+    tests = [
+        test_offset_conflict_and_resume,
+        test_concurrent_append_conflict,
+        test_size_limits_and_checksum,
+        test_stream_to_file_limit,
+    ]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+        except Exception:
+            failed += 1
+            print(f"❌ {test.__name__}")
+            traceback.print_exc()
+    print(f"\n📊 通过: {len(tests) - failed}/{len(tests)}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
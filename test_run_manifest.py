@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+运行清单断点续跑测试脚本
+1. 第二步因输入文件缺失失败 -> run_manifest.json 记录第一步成功、第二步失败
+2. 补齐输入后续跑 -> 第一步从清单恢复（不重新执行），其余步骤执行成功
+3. 已完成步骤的产物被删除 -> 续跑时该步骤重新执行
+4. 上游步骤的大表（超过 RESULT_INLINE_MAX_ROWS）在清单中为产物引用 -> 续跑时下游步骤读到完整数据
+
+用法:
+    python test_run_manifest.py
+"""
+import os
+import sys
+import json
+import tempfile
+import traceback
+from pathlib import Path
+
+# 步骤缓存会让重新执行的步骤直接命中，这里只测试清单恢复
+os.environ["STEP_CACHE_ENABLED"] = "false"
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent))
+
+import numpy as np
+import pandas as pd
+
+from gibh_agent import tools  # noqa: F401  导入即注册所有工具
+from gibh_agent.core.executor import WorkflowExecutor, MANIFEST_FILENAME
+from gibh_agent.core.result_payload import is_artifact_ref
+from gibh_agent.core.tool_registry import registry
+
+
+@registry.register(name="test_emit_table", description="测试工具：返回 300 行的记录表", category="Test")
+def _emit_table(n_rows: int = 300, output_dir: str = None) -> dict:
+    return {"status": "success", "table": [{"feature": f"F{i}", "value": i * 2} for i in range(n_rows)]}
+
+
+@registry.register(name="test_consume_table", description="测试工具：读取上游步骤的记录表", category="Test")
+def _consume_table(upstream: dict, ready_flag: str, output_dir: str = None) -> dict:
+    if not os.path.exists(ready_flag):
+        return {"status": "error", "error": f"缺少输入: {ready_flag}"}
+    table = upstream["table"]
+    return {"status": "success", "n_rows": len(table), "last_value": table[-1]["value"]}
+
+
+def _write_dataset(path: Path) -> None:
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(rng.lognormal(size=(20, 12)), columns=[f"M{i}" for i in range(12)])
+    df.insert(0, "Group", ["Case"] * 10 + ["Control"] * 10)
+    df.insert(0, "Sample", [f"S{i}" for i in range(20)])
+    df.to_csv(path, index=False)
+
+
+def _workflow(data: Path, second_input: Path) -> dict:
+    return {
+        "workflow_name": "resume test",
+        "steps": [
+            {"step_id": "preprocess_data", "tool_id": "preprocess_data", "params": {"file_path": str(data)}},
+            {"step_id": "differential_analysis", "tool_id": "differential_analysis",
+             "params": {"file_path": str(second_input), "group_column": "Group"}},
+            {"step_id": "pca_analysis", "tool_id": "pca_analysis", "params": {"file_path": "<preprocess_data>"}}
+        ]
+    }
+
+
+def test_resume_after_failure():
+    """失败后续跑：已成功的步骤从清单恢复，失败及之后的步骤重新执行"""
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        data = tmp / "data.csv"
+        second_input = tmp / "late.csv"
+        _write_dataset(data)
+        run_dir = tmp / "run"
+
+        report = WorkflowExecutor().execute_workflow(_workflow(data, second_input), [str(data)], output_dir=str(run_dir))
+        assert report["status"] == "error"
+        manifest = json.loads((run_dir / MANIFEST_FILENAME).read_text())
+        assert manifest["status"] == "error"
+        assert manifest["steps"]["preprocess_data"]["status"] == "success"
+        assert manifest["steps"]["differential_analysis"]["status"] == "error"
+        assert "pca_analysis" not in manifest["steps"]
+
+        _write_dataset(second_input)
+        report = WorkflowExecutor().resume_workflow(str(run_dir))
+        assert report["status"] == "success", [d.get("error") for d in report["steps_details"]]
+        assert report.get("resumed_steps") == ["preprocess_data"]
+        assert [d["step_id"] for d in report["steps_details"]] == ["preprocess_data", "differential_analysis", "pca_analysis"]
+        assert json.loads((run_dir / MANIFEST_FILENAME).read_text())["status"] == "success"
+
+        # 已完成步骤的产物被删除时不能恢复，必须重新执行
+        preprocessed = manifest["steps"]["preprocess_data"]["output_path"]
+        assert preprocessed and os.path.exists(preprocessed)
+        os.remove(preprocessed)
+        report = WorkflowExecutor().resume_workflow(str(run_dir))
+        assert report["status"] == "success"
+        assert "preprocess_data" not in (report.get("resumed_steps") or [])
+        assert os.path.exists(preprocessed)
+    print("✅ 断点续跑")
+
+
+def test_resume_without_manifest():
+    """没有运行清单时 resume_workflow 报错"""
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            WorkflowExecutor().resume_workflow(tmp)
+        except FileNotFoundError:
+            print("✅ 缺少清单时报错")
+            return
+        raise AssertionError("缺少运行清单时应抛出 FileNotFoundError")
+
+
+def test_resume_rehydrates_artifacts():
+    """清单中为产物引用的上游大表，续跑时以完整数据传给下游步骤"""
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        ready_flag = tmp / "ready"
+        run_dir = tmp / "run"
+        workflow = {
+            "workflow_name": "artifact resume test",
+            "steps": [
+                {"step_id": "emit", "tool_id": "test_emit_table", "params": {"n_rows": 300}},
+                {"step_id": "consume", "tool_id": "test_consume_table",
+                 "params": {"upstream": "<emit>", "ready_flag": str(ready_flag)}}
+            ]
+        }
+        report = WorkflowExecutor().execute_workflow(workflow, [], output_dir=str(run_dir))
+        assert report["status"] == "error"
+        manifest = json.loads((run_dir / MANIFEST_FILENAME).read_text())
+        assert is_artifact_ref(manifest["steps"]["emit"]["step_result"]["result"]["table"])
+
+        ready_flag.touch()
+        report = WorkflowExecutor().resume_workflow(str(run_dir))
+        assert report["status"] == "success", [d.get("error") for d in report["steps_details"]]
+        assert report.get("resumed_steps") == ["emit"]
+        consumed = json.loads((run_dir / MANIFEST_FILENAME).read_text())["steps"]["consume"]["step_result"]["result"]
+        assert (consumed["n_rows"], consumed["last_value"]) == (300, 598), consumed
+
+        # 产物文件丢失时不能恢复，上游步骤重新执行
+        os.remove(manifest["steps"]["emit"]["step_result"]["result"]["table"]["path"])
+        report = WorkflowExecutor().resume_workflow(str(run_dir))
+        assert report["status"] == "success"
+        assert "emit" not in (report.get("resumed_steps") or [])
+    print("✅ 续跑时还原上游产物引用")
+
+
+def main() -> int:
+    tests = [test_resume_after_failure, test_resume_without_manifest, test_resume_rehydrates_artifacts]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+        except Exception:
+            failed += 1
+            print(f"❌ {test.__name__}")
+            traceback.print_exc()
+    print(f"\n📊 通过: {len(tests) - failed}/{len(tests)}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+步骤结果缓存测试脚本
+1. 未命中 -> 写入 -> 命中（产物以硬链接放入新的运行目录，路径被改写）
+2. 输入内容变化 -> 未命中；相同内容换路径 -> 命中
+3. 产物被原地改写 -> 缓存项失效
+4. 超过大小上限 -> 按 LRU 淘汰（只依据索引）
+5. 命中时产物保持子目录结构、同名产物不互相覆盖、使用当前步骤的 output_path；
+   目标位置已有其他文件时不覆盖（按未命中处理）
+
+用法:
+    python test_step_cache.py
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import traceback
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent))
+
+from gibh_agent.core.step_cache import StepResultCache
+
+
+def _run_tool(input_path: Path, output_dir: Path) -> dict:
+    """模拟工具：读取输入，写出一个产物"""
+    output_dir.mkdir(parents=True, exist_ok=True)
+    output = output_dir / "result.csv"
+    output.write_text(input_path.read_text().upper())
+    return {"status": "success", "output_file": str(output), "n": 1}
+
+
+def test_hit_and_miss():
+    """未命中后写入，再次查询命中，产物链接到新的运行目录"""
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        cache = StepResultCache(str(tmp / "cache"), max_bytes=1024 ** 3)
+        data = tmp / "input.csv"
+        data.write_text("a,b\n1,2\n")
+
+        params = {"file_path": str(data), "threshold": 0.5, "output_dir": str(tmp / "run1")}
+        key = cache.make_key("demo_tool", params)
+        assert cache.get(key, str(tmp / "run1")) is None
+
+        result = _run_tool(data, tmp / "run1")
+        cache.put(key, "demo_tool", result, input_paths={str(data)})
+
+        # output_dir 不参与缓存键
+        key2 = cache.make_key("demo_tool", {**params, "output_dir": str(tmp / "run2")})
+        assert key2 == key
+        cached = cache.get(key2, str(tmp / "run2"))
+        assert cached is not None and cached["n"] == 1
+        assert cached["output_file"] == str(tmp / "run2" / "result.csv")
+        assert os.path.samefile(cached["output_file"], result["output_file"]), "产物应为硬链接"
+        assert (cache.hits, cache.misses) == (1, 1)
+
+        # 相同内容换路径仍命中；内容变化则未命中
+        copy = tmp / "copy.csv"
+        copy.write_text(data.read_text())
+        assert cache.make_key("demo_tool", {**params, "file_path": str(copy)}) == key
+        time.sleep(0.01)
+        data.write_text("a,b\n1,3\n")
+        assert cache.make_key("demo_tool", params) != key
+        # 参数变化未命中
+        assert cache.make_key("demo_tool", {**params, "file_path": str(copy), "threshold": 0.6}) != key
+    print("✅ 命中/未命中")
+
+
+def test_modified_artifact_invalidates_entry():
+    """运行目录中的产物被原地改写（共享 inode）后，缓存项失效"""
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        cache = StepResultCache(str(tmp / "cache"), max_bytes=1024 ** 3)
+        data = tmp / "input.csv"
+        data.write_text("x\n1\n")
+        key = cache.make_key("demo_tool", {"file_path": str(data)})
+        result = _run_tool(data, tmp / "run1")
+        cache.put(key, "demo_tool", result, input_paths={str(data)})
+
+        time.sleep(0.01)
+        with open(result["output_file"], "w") as f:
+            f.write("CHANGED IN PLACE\n")
+        assert cache.get(key, str(tmp / "run2")) is None
+        assert cache.total_bytes() == 0
+    print("✅ 原地改写的产物使缓存项失效")
+
+
+def test_lru_eviction():
+    """总大小超过上限时淘汰最久未访问的缓存项"""
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        cache = StepResultCache(str(tmp / "cache"), max_bytes=2500)
+        keys = []
+        for i in range(3):
+            data = tmp / f"input{i}.csv"
+            data.write_text(f"{i}\n" + "x" * 1000)
+            key = cache.make_key("demo_tool", {"file_path": str(data)})
+            if i == 2:
+                # 访问第一个缓存项，使第二个成为最久未使用
+                assert cache.get(keys[0]) is not None
+            cache.put(key, "demo_tool", _run_tool(data, tmp / f"run{i}"), input_paths={str(data)})
+            keys.append(key)
+            time.sleep(0.01)
+
+        assert cache.total_bytes() <= 2500
+        assert cache.get(keys[0]) is not None
+        assert cache.get(keys[1]) is None, "最久未使用的缓存项应被淘汰"
+        assert cache.get(keys[2]) is not None
+
+        # 没有索引的缓存目录（旧版本）：首次打开时扫描一次重建索引
+        shutil.copytree(tmp / "cache", tmp / "legacy", ignore=shutil.ignore_patterns("index.sqlite*"))
+        rebuilt = StepResultCache(str(tmp / "legacy"), max_bytes=2500)
+        assert rebuilt.total_bytes() == cache.total_bytes()
+    print("✅ LRU 淘汰")
+
+
+def test_artifact_placement():
+    """产物按相对原 output_dir 的路径放置，output_path 对应当前步骤的 output_path，不覆盖已有文件"""
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        cache = StepResultCache(str(tmp / "cache"), max_bytes=1024 ** 3)
+        run1 = tmp / "run1"
+        (run1 / "a").mkdir(parents=True)
+        (run1 / "b").mkdir(parents=True)
+        (run1 / "a" / "table.csv").write_text("a\n")
+        (run1 / "b" / "table.csv").write_text("b\n")
+        (run1 / "plot.png").write_text("png\n")
+        result = {
+            "status": "success",
+            "tables": [str(run1 / "a" / "table.csv"), str(run1 / "b" / "table.csv")],
+            "plot_path": str(run1 / "plot.png")
+        }
+        key = cache.make_key("demo_tool", {"threshold": 1})
+        cache.put(key, "demo_tool", result, output_dir=str(run1), output_path=str(run1 / "plot.png"))
+
+        run2 = tmp / "run2"
+        cached = cache.get(key, str(run2), output_path=str(run2 / "figures" / "volcano.png"))
+        assert cached["tables"] == [str(run2 / "a" / "table.csv"), str(run2 / "b" / "table.csv")]
+        assert [Path(p).read_text() for p in cached["tables"]] == ["a\n", "b\n"]
+        assert cached["plot_path"] == str(run2 / "figures" / "volcano.png")
+        assert Path(cached["plot_path"]).read_text() == "png\n"
+
+        # 再次命中同一目录：已是同一文件，直接复用
+        assert cache.get(key, str(run2), output_path=str(run2 / "figures" / "volcano.png")) is not None
+
+        # 目标位置已有本步骤之外产生的文件：不覆盖，按未命中处理，缓存项保留
+        run3 = tmp / "run3"
+        (run3 / "b").mkdir(parents=True)
+        (run3 / "b" / "table.csv").write_text("other step\n")
+        assert cache.get(key, str(run3)) is None
+        assert (run3 / "b" / "table.csv").read_text() == "other step\n"
+        assert not (run3 / "a" / "table.csv").exists(), "不应放置部分产物"
+        assert cache.get(key, str(tmp / "run4")) is not None
+    print("✅ 产物放置位置")
+
+
+def main() -> int:
+    tests = [test_hit_and_miss, test_modified_artifact_invalidates_entry, test_lru_eviction, test_artifact_placement]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+        except Exception:
+            failed += 1
+            print(f"❌ {test.__name__}")
+            traceback.print_exc()
+    print(f"\n📊 通过: {len(tests) - failed}/{len(tests)}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+表格中间产物读写测试脚本
+1. 数值宽表写出为 Arrow IPC，读回后索引、列顺序、数据类型不变
+2. 混合类型的 object 列（Group=['a', 1, 'b']）转为字符串后仍写出列式文件
+3. 读取 CSV 路径时使用更新的同名列式文件；长表（index_col=None）不丢失首列
+
+用法:
+    python test_table_io.py
+"""
+import sys
+import tempfile
+import traceback
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent))
+
+import numpy as np
+import pandas as pd
+
+from gibh_agent.core.table_io import read_table, read_table_columns, resolve_table_path, write_table
+
+
+def _wide_table() -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(rng.lognormal(size=(6, 4)), columns=[f"M{i}" for i in range(4)],
+                      index=pd.Index([f"S{i}" for i in range(6)], name="Sample"))
+    df.insert(0, "Group", ["Case"] * 3 + ["Control"] * 3)
+    return df
+
+
+def test_arrow_roundtrip():
+    """Arrow IPC 往返：索引、列顺序和数据类型保持不变"""
+    with tempfile.TemporaryDirectory() as tmp:
+        df = _wide_table()
+        saved = write_table(df, str(Path(tmp) / "wide"), fmt="arrow")
+        assert saved["format"] == "arrow" and saved["path"].endswith(".arrow")
+        pd.testing.assert_frame_equal(read_table(saved["path"]), df)
+        assert read_table_columns(saved["path"]) == list(df.columns)
+        assert list(read_table(saved["path"], columns=["M2"]).columns) == ["M2"]
+    print("✅ Arrow 往返")
+
+
+def test_mixed_dtypes():
+    """混合类型的 object 列转为字符串写出，缺失值保持为空"""
+    with tempfile.TemporaryDirectory() as tmp:
+        df = pd.DataFrame({"Group": ["a", 1, "b"], "Batch": [1.5, "x", None], "M1": [0.1, 0.2, 0.3]},
+                          index=pd.Index(["S1", 2, "S3"], name="Sample"))
+        for fmt in ("arrow", "parquet"):
+            saved = write_table(df, str(Path(tmp) / f"mixed_{fmt}"), fmt=fmt)
+            assert saved["format"] == fmt, saved
+            loaded = read_table(saved["path"])
+            assert list(loaded["Group"]) == ["a", "1", "b"]
+            assert list(loaded["Batch"][:2]) == ["1.5", "x"] and pd.isna(loaded["Batch"].iloc[2])
+            assert list(loaded.index) == ["S1", "2", "S3"]
+            assert loaded["M1"].dtype == float
+        # 原 DataFrame 不被修改
+        assert df["Group"].tolist() == ["a", 1, "b"]
+    print("✅ 混合类型列")
+
+
+def test_csv_sibling_and_long_table():
+    """CSV 路径自动使用更新的列式文件；长表读取保留首列"""
+    with tempfile.TemporaryDirectory() as tmp:
+        long_df = pd.DataFrame({"contrast": ["A_vs_B", "A_vs_C"], "metabolite": ["m1", "m2"], "fdr": [0.01, 0.2]})
+        csv_path = Path(tmp) / "long.csv"
+        long_df.to_csv(csv_path, index=False)
+        pd.testing.assert_frame_equal(read_table(str(csv_path), index_col=None), long_df)
+
+        # 以 CSV 的第一列为索引转换为列式文件（与结果表服务的转换方式一致）
+        write_table(read_table(str(csv_path)), str(csv_path.with_suffix("")), fmt="arrow")
+        assert resolve_table_path(str(csv_path)).endswith(".arrow")
+        pd.testing.assert_frame_equal(read_table(str(csv_path), index_col=None), long_df)
+    print("✅ CSV 同名列式文件与长表")
+
+
+def main() -> int:
+    tests = [test_arrow_roundtrip, test_mixed_dtypes, test_csv_sibling_and_long_table]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+        except Exception:
+            failed += 1
+            print(f"❌ {test.__name__}")
+            traceback.print_exc()
+    print(f"\n📊 通过: {len(tests) - failed}/{len(tests)}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())